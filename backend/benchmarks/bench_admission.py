@@ -0,0 +1,130 @@
+"""
+Benchmark: control de admisión ante un pico de tráfico y un número que envía spam.
+
+Levanta la app en proceso contra dobles locales (PostgREST, Twilio y un OpenAI
+falso que responde 429 por encima de `--llm-capacity` peticiones en curso, como
+el límite de una cuenta) y envía de golpe un mensaje de cada uno de `--users`
+números más `--spam` mensajes de un mismo número. Se ejecuta sin control de
+admisión, con él, y con el descarte por carga a `--shed-in-flight` mensajes en
+curso, y compara:
+  - respuestas reales del modelo, avisos de ocupado y respuestas de respaldo
+  - latencia del webhook (modo inline: incluye el modelo y el envío)
+  - llamadas al modelo, 429 recibidos y máximo de llamadas simultáneas
+  - mensajes del número con spam que llegaron al modelo
+
+Uso (desde backend/):
+    python -m benchmarks.bench_admission --users 150 --spam 60 --llm-capacity 16
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import uuid
+
+from benchmarks.fakes import (
+    DEFAULT_COMPLETION,
+    create_fake_openai_app,
+    create_fake_postgrest_app,
+    create_fake_twilio_app,
+    serve_in_thread,
+)
+from benchmarks.loadtest import percentile, replay
+
+SPAM_NUMBER = "5215559999999"
+
+
+def forms(numbers, body: str):
+    return [{"From": f"whatsapp:+{number}", "Body": body, "MessageSid": f"SM{uuid.uuid4().hex}"} for number in numbers]
+
+
+def run_scenario(label: str, enabled: bool, max_in_flight: int, args, app_url: str, openai_app, twilio_app,
+                 prefix: str) -> None:
+    from src.utils import admission
+    from src.utils.redis import redis_conn
+
+    admission.ADMISSION_ENABLED = enabled
+    admission.ADMISSION_MAX_IN_FLIGHT = max_in_flight
+    users = [f"52155{prefix}{index:05d}" for index in range(args.users)]
+    # Primer mensaje de cada número (bienvenida, sin modelo) fuera de la medición
+    asyncio.run(replay(app_url, forms(users + [SPAM_NUMBER], "Hola"), 32, 0))
+    for key in redis_conn.scan_iter(f"{admission.RATE_KEY_PREFIX}:*"):
+        redis_conn.delete(key)
+
+    sent_before = len(twilio_app.state.messages)
+    calls, rejected = openai_app.state.requests, openai_app.state.rejected
+    openai_app.state.peak_in_flight = 0
+    traffic = forms(users, "¿Qué ofrecen?") + forms([SPAM_NUMBER] * args.spam, "promo promo promo")
+    latencies, statuses, elapsed = asyncio.run(replay(app_url, traffic, len(traffic), 0))
+
+    replies = twilio_app.state.messages[sent_before:]
+    to_users = [m for m in replies if m["to"] != f"whatsapp:+{SPAM_NUMBER}"]
+    real = sum(m["body"] == DEFAULT_COMPLETION for m in to_users)
+    busy = sum(m["body"] == admission.BUSY_MESSAGE for m in to_users)
+    spam_real = sum(m["body"] == DEFAULT_COMPLETION for m in replies if m not in to_users)
+    print(f"{label}: {len(traffic)} mensajes en {elapsed:.1f}s, estados {dict(sorted(statuses.items()))}")
+    print(f"  usuarios: {real}/{args.users} con respuesta del modelo, {busy} con aviso de ocupado, "
+          f"{len(to_users) - real - busy} con respuesta de respaldo")
+    print(f"  webhook: p50={percentile(latencies, 0.5) * 1000:.0f}ms p95={percentile(latencies, 0.95) * 1000:.0f}ms "
+          f"p99={percentile(latencies, 0.99) * 1000:.0f}ms")
+    print(f"  modelo: {openai_app.state.requests - calls} llamadas, {openai_app.state.rejected - rejected} con 429, "
+          f"máximo {openai_app.state.peak_in_flight} simultáneas")
+    print(f"  número con spam: {spam_real}/{args.spam} mensajes llegaron al modelo")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=150, help="números distintos en el pico")
+    parser.add_argument("--spam", type=int, default=60, help="mensajes del número con spam")
+    parser.add_argument("--llm-capacity", type=int, default=16, help="peticiones simultáneas que admite el OpenAI falso")
+    parser.add_argument("--shed-in-flight", type=int, default=60,
+                        help="mensajes en curso a partir de los que se descarta en el tercer escenario")
+    parser.add_argument("--tokens-per-second", type=float, default=100.0, help="velocidad del OpenAI falso")
+    args = parser.parse_args()
+
+    postgrest_server = serve_in_thread(create_fake_postgrest_app())
+    openai_app = create_fake_openai_app(tokens_per_second=args.tokens_per_second, capacity=args.llm_capacity)
+    openai_server = serve_in_thread(openai_app)
+    twilio_app = create_fake_twilio_app()
+    twilio_server = serve_in_thread(twilio_app)
+    servers = [postgrest_server, openai_server, twilio_server]
+
+    # La configuración se lee al importar los módulos: apuntarlos a los servidores falsos
+    os.environ.update({
+        "SUPABASE_URL": postgrest_server.base_url,
+        "OPENAI_BASE_URL": f"{openai_server.base_url}/v1",
+        "TWILIO_API_BASE_URL": twilio_server.base_url,
+        "CONVERSATION_STORAGE": "messages",
+        "LLM_GLOBAL_CONCURRENCY": str(args.llm_capacity),
+        "LLM_HEDGING_ENABLED": "false",
+        "WHATSAPP_DEBOUNCE_ENABLED": "false",
+        "ADMISSION_LLM_WAIT_SECONDS": "30",
+        "TWILIO_MESSAGES_PER_SECOND": "10000",
+    })
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "token")
+    os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "+15550000000")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_admission.log"))
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    from main import app
+
+    app_server = serve_in_thread(app)
+    servers.append(app_server)
+    try:
+        unlimited = (args.users + args.spam) * 2
+        for label, enabled, max_in_flight, prefix in (
+            ("sin control de admisión", False, unlimited, "1"),
+            ("con control de admisión", True, unlimited, "2"),
+            (f"con descarte a {args.shed_in_flight} en curso", True, args.shed_in_flight, "3"),
+        ):
+            run_scenario(label, enabled, max_in_flight, args, app_server.base_url, openai_app, twilio_app, prefix)
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+"""
+Benchmark: circuit breakers ante caídas de Supabase y de Twilio.
+
+Levanta la app en proceso contra dobles locales y, con `--users` números que ya
+tienen historial, envía un mensaje de cada uno (`--concurrency` a la vez) en
+cada fase, sin y con circuit breakers:
+  1. Supabase colgado: cada petición tarda más que SUPABASE_TIMEOUT y falla.
+  2. Twilio caído: todos los envíos devuelven 503.
+  3. Recuperación: sin fallos, después de CIRCUIT_OPEN_SECONDS.
+Por fase: latencia del webhook, respuestas entregadas, peticiones que llegaron a
+la dependencia caída y estado de los breakers. Al final, `--ready-checks`
+llamadas a /health/ready durante la caída y cuántas llegaron a Supabase.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_breakers --users 64 --concurrency 16
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+import uuid
+
+import httpx
+
+from benchmarks.fakes import (
+    FaultInjector,
+    create_fake_openai_app,
+    create_fake_postgrest_app,
+    create_fake_twilio_app,
+    serve_in_thread,
+)
+from benchmarks.loadtest import percentile, replay
+
+
+def forms(numbers, body: str):
+    return [{"From": f"whatsapp:+{number}", "Body": body, "MessageSid": f"SM{uuid.uuid4().hex}"} for number in numbers]
+
+
+def reset_breakers() -> None:
+    from src.utils import circuit_breaker
+
+    for breaker in circuit_breaker._breakers.values():
+        if breaker.state != circuit_breaker.CLOSED:
+            breaker._transition(circuit_breaker.CLOSED)
+        breaker._buckets.clear()
+
+
+def run_phase(label: str, args, app_url: str, users, faults: FaultInjector, twilio_app) -> None:
+    from src.utils.circuit_breaker import get_breaker_states
+
+    calls_before, sent_before = faults.calls, len(twilio_app.state.messages)
+    latencies, statuses, elapsed = asyncio.run(replay(app_url, forms(users, "¿Qué ofrecen?"), args.concurrency, 0))
+    delivered = len(twilio_app.state.messages) - sent_before
+    states = {name: state["state"] for name, state in get_breaker_states().items()}
+    print(f"  {label}: {len(users)} mensajes en {elapsed:.1f}s, estados {dict(sorted(statuses.items()))}, "
+          f"{delivered} respuestas entregadas")
+    print(f"    webhook p50={percentile(latencies, 0.5) * 1000:.0f}ms p95={percentile(latencies, 0.95) * 1000:.0f}ms, "
+          f"{faults.calls - calls_before} peticiones a la dependencia, breakers {states}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=64, help="mensajes por fase (uno por número)")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--db-timeout", type=float, default=2.0, help="SUPABASE_TIMEOUT")
+    parser.add_argument("--open-seconds", type=float, default=3.0, help="CIRCUIT_OPEN_SECONDS")
+    parser.add_argument("--ready-checks", type=int, default=200, help="llamadas a /health/ready durante la caída")
+    args = parser.parse_args()
+
+    db_faults = FaultInjector()
+    twilio_faults = FaultInjector()
+    postgrest_server = serve_in_thread(create_fake_postgrest_app(db_faults))
+    openai_server = serve_in_thread(create_fake_openai_app(tokens_per_second=1000))
+    twilio_app = create_fake_twilio_app(twilio_faults)
+    twilio_server = serve_in_thread(twilio_app)
+    servers = [postgrest_server, openai_server, twilio_server]
+
+    # La configuración se lee al importar los módulos: apuntarlos a los servidores falsos
+    os.environ.update({
+        "SUPABASE_URL": postgrest_server.base_url,
+        "OPENAI_BASE_URL": f"{openai_server.base_url}/v1",
+        "TWILIO_API_BASE_URL": twilio_server.base_url,
+        "CONVERSATION_STORAGE": "messages",
+        "SUPABASE_TIMEOUT": str(args.db_timeout),
+        "CIRCUIT_OPEN_SECONDS": str(args.open_seconds),
+        "TWILIO_RETRY_BACKOFF": "0.25",
+        "TWILIO_MESSAGES_PER_SECOND": "10000",
+        "WHATSAPP_DEBOUNCE_ENABLED": "false",
+        "LLM_CACHE_ENABLED": "false",
+        "ADMISSION_ENABLED": "false",
+    })
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "token")
+    os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "+15550000000")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "bench_breakers.log"))
+    os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+    from main import app
+    from src.utils import circuit_breaker
+
+    app_server = serve_in_thread(app)
+    servers.append(app_server)
+    try:
+        for label, enabled, prefix in (("sin circuit breakers", False, "1"), ("con circuit breakers", True, "2")):
+            circuit_breaker.CIRCUIT_BREAKERS_ENABLED = enabled
+            reset_breakers()
+            users = [f"52155{prefix}{index:05d}" for index in range(args.users)]
+            # Primer mensaje de cada número (bienvenida) con todo sano: los números ya tienen historial
+            asyncio.run(replay(app_server.base_url, forms(users, "Hola"), args.concurrency, 0))
+            # La caída empieza con la ventana de fallos vacía, no justo después del tráfico sano
+            reset_breakers()
+            print(label)
+
+            db_faults.latency_ms, db_faults.error_rate = args.db_timeout * 1000 + 1000, 1.0
+            run_phase("Supabase colgado", args, app_server.base_url, users, db_faults, twilio_app)
+            db_faults.latency_ms, db_faults.error_rate = 0.0, 0.0
+
+            reset_breakers()
+            twilio_faults.error_rate = 1.0
+            run_phase("Twilio caído    ", args, app_server.base_url, users, twilio_faults, twilio_app)
+            twilio_faults.error_rate = 0.0
+
+            time.sleep(args.open_seconds)
+            run_phase("recuperación    ", args, app_server.base_url, users, db_faults, twilio_app)
+
+        # Readiness durante una caída de Supabase: los sondeos están en caché
+        db_faults.error_rate = 1.0
+        calls_before = db_faults.calls
+        started = time.perf_counter()
+        codes = {}
+        with httpx.Client(base_url=app_server.base_url, timeout=30) as client:
+            for _ in range(args.ready_checks):
+                response = client.get("/api/v1/health/ready")
+                codes[response.status_code] = codes.get(response.status_code, 0) + 1
+            body = response.json()
+        elapsed = time.perf_counter() - started
+        print(f"readiness: {args.ready_checks} llamadas en {elapsed:.2f}s ({elapsed / args.ready_checks * 1000:.1f} ms "
+              f"por llamada), códigos {codes}, {db_faults.calls - calls_before} peticiones a Supabase, "
+              f"estado '{body['status']}', supabase {body['dependencies']['supabase']['detail']}")
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Benchmark: throughput de las difusiones contra un Twilio falso.
+
+Crea una difusión de N destinatarios y la envía con distintos niveles de
+concurrencia (1 equivale al envío número por número de `respond()`). Después
+interrumpe una difusión a la mitad, la reanuda y comprueba que ningún número
+recibió el mensaje dos veces.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_broadcast --recipients 2000 --latency-ms 120
+"""
+import argparse
+import asyncio
+import collections
+import os
+import time
+
+from benchmarks.fakes import FaultInjector, create_fake_postgrest_app, create_fake_twilio_app, serve_in_thread
+
+
+async def chunks_of(text: str, size: int = 64 * 1024):
+    data = text.encode()
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+async def new_broadcast(recipients: int) -> str:
+    from src.api.v1.endpoints.webhook import normalize_phone_number
+    from src.utils.broadcast import create_broadcast
+    from src.utils.redis import redis_conn
+
+    body = "phone,nombre\n" + "\n".join(f"55{index:08d},Cliente {index}" for index in range(recipients))
+    result = await create_broadcast(redis_conn, chunks_of(body), "csv", "Hola $nombre, tenemos novedades", normalize_phone_number)
+    return result["broadcast_id"]
+
+
+async def run_levels(recipients: int, levels, twilio_messages: list):
+    from src.utils.broadcast import run_broadcast
+    from src.utils.redis import redis_conn
+
+    for concurrency in levels:
+        broadcast_id = await new_broadcast(recipients)
+        sent_before = len(twilio_messages)
+        started = time.perf_counter()
+        status = await run_broadcast(redis_conn, broadcast_id, concurrency=concurrency, messages_per_second=100000)
+        elapsed = time.perf_counter() - started
+        sent = len(twilio_messages) - sent_before
+        print(f"concurrencia {concurrency:>3}: {sent} enviados en {elapsed:6.2f}s -> {sent / elapsed:7.1f} msg/s "
+              f"(fallidos={status['failed']})")
+
+
+async def run_resume(recipients: int, twilio_messages: list):
+    from src.utils.broadcast import get_broadcast_status, run_broadcast
+    from src.utils.redis import redis_conn
+
+    broadcast_id = await new_broadcast(recipients)
+    sent_before = len(twilio_messages)
+    # Simula la caída del proceso a la mitad de la difusión
+    task = asyncio.create_task(run_broadcast(redis_conn, broadcast_id, concurrency=32, messages_per_second=100000))
+    while len(twilio_messages) - sent_before < recipients // 2:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    interrupted = await get_broadcast_status(redis_conn, broadcast_id)
+
+    status = await run_broadcast(redis_conn, broadcast_id, concurrency=32, messages_per_second=100000)
+    delivered = collections.Counter(message["to"] for message in twilio_messages[sent_before:])
+    repeated = sum(1 for count in delivered.values() if count > 1)
+    print(f"reanudación: {interrupted['sent']} enviados antes de la caída, {status['sent']} al terminar, "
+          f"{status['unknown']} sin estado, {len(delivered)} números distintos, {repeated} repetidos")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--recipients", type=int, default=2000)
+    parser.add_argument("--latency-ms", type=float, default=120.0, help="latencia del Twilio falso")
+    parser.add_argument("--levels", default="1,8,32,64")
+    args = parser.parse_args()
+
+    twilio_app = create_fake_twilio_app(FaultInjector(latency_ms=args.latency_ms, jitter_ms=args.latency_ms / 2))
+    twilio_server = serve_in_thread(twilio_app)
+    postgrest_server = serve_in_thread(create_fake_postgrest_app())
+
+    # La configuración se lee al importar los módulos: apuntarlos a los servidores falsos
+    os.environ["TWILIO_API_BASE_URL"] = twilio_server.base_url
+    os.environ["SUPABASE_URL"] = postgrest_server.base_url
+    # Sin el límite por número emisor: se mide el pipeline, no el token bucket
+    os.environ["TWILIO_MESSAGES_PER_SECOND"] = "100000"
+    os.environ["TWILIO_MAX_CONNECTIONS"] = "64"
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "token")
+    os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "+15550000000")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+
+    levels = [int(level) for level in args.levels.split(",")]
+    try:
+        asyncio.run(run_levels(args.recipients, levels, twilio_app.state.messages))
+        asyncio.run(run_resume(args.recipients, twilio_app.state.messages))
+    finally:
+        twilio_server.should_exit = True
+        postgrest_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Benchmark: codec de payloads de conversación (src/utils/codec.py).
+
+Genera conversaciones de `--sizes` mensajes (roles alternados, textos de largo
+variable y timestamps con zona horaria, como los que escribe el webhook) y, para
+cada combinación de codec y compresión, mide:
+  - bytes en Redis / en el archivo (antes de base64) y proporción frente al JSON actual
+  - tiempo de codificación y de decodificación por conversación
+Cada resultado se decodifica y se compara con el original (sin pérdida).
+
+Uso (desde backend/):
+    python -m benchmarks.bench_codec --sizes 10,50,200,1000
+"""
+import argparse
+import json
+import os
+import random
+import time
+from datetime import timedelta
+
+PHRASES = [
+    "Hola, ¿qué servicios ofrecen?",
+    "Quiero información sobre la prueba gratis de 7 días.",
+    "¡Claro! Danil AI crea agentes de WhatsApp para tu negocio y se integran con tu catálogo.",
+    "¿Cuánto cuesta el plan mensual para una tienda con dos sucursales?",
+    "Para la prueba necesito el nombre de tu negocio, tus horarios y los productos que ofreces.",
+    "Perfecto, gracias",
+    "Te comparto el enlace para agendar una demo virtual con nuestro equipo: https://danil.ai/demo",
+]
+
+
+def conversation(size: int, seed: int):
+    from src.utils.calendar import now_local
+
+    rng = random.Random(seed)
+    start = now_local() - timedelta(days=30)
+    messages = []
+    for index in range(size):
+        text = " ".join(rng.choice(PHRASES) for _ in range(rng.randint(1, 4)))
+        moment = start + timedelta(seconds=index * rng.randint(5, 600), microseconds=rng.randint(0, 999999))
+        messages.append({"role": "user" if index % 2 else "assistant", "content": text, "timestamp": moment.isoformat()})
+    return messages
+
+
+def timed(function, repeat: int) -> float:
+    started = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return (time.perf_counter() - started) / repeat
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10,50,200,1000", help="mensajes por conversación")
+    parser.add_argument("--min-seconds", type=float, default=0.3, help="tiempo mínimo de medición por variante")
+    args = parser.parse_args()
+
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    from src.utils import codec
+
+    variants = [("json (actual)", "json", "none"), ("json+zlib", "json", "zlib"),
+                ("msgpack", "msgpack", "none"), ("msgpack+zlib", "msgpack", "zlib")]
+    if codec.zstandard is not None:
+        variants += [("json+zstd", "json", "zstd"), ("msgpack+zstd", "msgpack", "zstd")]
+    else:
+        print("(zstandard no está instalado: se omiten las variantes zstd)")
+
+    for size in (int(value) for value in args.sizes.split(",")):
+        # La caché de Redis guarda {"complete", "messages"}
+        payload = {"complete": True, "messages": conversation(size, size)}
+        baseline = len(codec.encode_payload(payload, "json", "none"))
+        print(f"{size} mensajes")
+        for label, name, compression in variants:
+            encoded = codec.encode_payload(payload, name, compression, compress_min_bytes=0)
+            assert codec.decode_payload(encoded) == payload, f"{label} no reconstruye la conversación"
+            repeat = max(1, int(args.min_seconds / max(timed(lambda: codec.decode_payload(encoded), 1), 1e-6)))
+            encode_time = timed(lambda: codec.encode_payload(payload, name, compression, compress_min_bytes=0), repeat)
+            decode_time = timed(lambda: codec.decode_payload(encoded), repeat)
+            print(f"  {label:>14}: {len(encoded):>8} bytes ({len(encoded) / baseline:6.1%}), "
+                  f"codificar {encode_time * 1e6:8.1f} µs, decodificar {decode_time * 1e6:8.1f} µs, "
+                  f"{len(encoded) / size:6.1f} bytes/mensaje")
+        # Referencia: json.dumps/json.loads como lo hacía src/utils/cookies.py
+        plain = json.dumps(payload)
+        repeat = max(1, int(args.min_seconds / max(timed(lambda: json.loads(plain), 1), 1e-6)))
+        print(f"  {'cookies antes':>14}: {len(plain.encode()):>8} bytes (json.dumps con ensure_ascii), "
+              f"codificar {timed(lambda: json.dumps(payload), repeat) * 1e6:8.1f} µs, "
+              f"decodificar {timed(lambda: json.loads(plain), repeat) * 1e6:8.1f} µs")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Benchmark: arranque en frío de la API.
+
+Mide, en procesos nuevos:
+  - "import": tiempo de `import main` (también comprueba que importar no falla sin variables de entorno)
+  - "uvicorn": desde lanzar `uvicorn main:app` hasta el primer 200 de /api/v1/health
+  - "gunicorn" / "gunicorn --preload" (si gunicorn está instalado): desde lanzar el
+    master hasta que los N workers terminan su arranque
+
+Uso (desde backend/):
+    python -m benchmarks.bench_cold_start --runs 5 --workers 4
+"""
+import argparse
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.fakes import free_port
+
+HEALTH_PATH = "/api/v1/health"
+READY_LINE = "Application startup complete"
+
+# Credenciales ficticias: el arranque no debe conectarse a ningún servicio
+ENVIRONMENT = {
+    "OPENAI_API_KEY": "sk-benchmark",
+    "TWILIO_ACCOUNT_SID": "ACbenchmark",
+    "TWILIO_AUTH_TOKEN": "token",
+    "TWILIO_WHATSAPP_NUMBER": "+15550000000",
+    "SUPABASE_URL": "http://127.0.0.1:9",
+    "SUPABASE_ANON_KEY": "benchmark",
+    "REDIS_FAKE": "1",
+    "LOG_CONSOLE": "false",
+}
+
+
+def child_env(extra: dict = None) -> dict:
+    env = {"PATH": os.environ.get("PATH", ""), "HOME": os.environ.get("HOME", ""),
+           "LOG_FILE": os.path.join(tempfile.gettempdir(), "bench_cold_start.log")}
+    env.update(extra or {})
+    return env
+
+
+def time_import(env: dict) -> float:
+    script = "import time; t = time.perf_counter(); import main; print(time.perf_counter() - t)"
+    result = subprocess.run([sys.executable, "-c", script], env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"import main falló:\n{result.stderr[-2000:]}")
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def time_uvicorn() -> float:
+    port = free_port()
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=child_env(ENVIRONMENT), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{port}{HEALTH_PATH}", timeout=1).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            if process.poll() is not None:
+                raise RuntimeError("uvicorn terminó antes de responder")
+            time.sleep(0.01)
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def time_gunicorn(workers: int, preload: bool) -> float:
+    command = ["gunicorn", "main:app", "-w", str(workers), "-k", "uvicorn.workers.UvicornWorker",
+               "--bind", f"127.0.0.1:{free_port()}", "--log-level", "info"]
+    if preload:
+        command.append("--preload")
+    started = time.perf_counter()
+    process = subprocess.Popen(command, env=child_env(ENVIRONMENT), stderr=subprocess.PIPE, text=True)
+    ready = 0
+    try:
+        for line in process.stderr:
+            if READY_LINE in line:
+                ready += 1
+                if ready == workers:
+                    return time.perf_counter() - started
+        raise RuntimeError("gunicorn terminó antes de que arrancaran todos los workers")
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def report(label: str, samples) -> None:
+    samples = [s * 1000 for s in samples]
+    print(f"{label:>20}: p50={statistics.median(samples):7.0f}ms  min={min(samples):7.0f}ms  max={max(samples):7.0f}ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    try:
+        time_import(child_env())
+        print("import sin variables de entorno: OK")
+    except RuntimeError as e:
+        print(f"import sin variables de entorno: FALLA\n{e}")
+
+    report("import", [time_import(child_env(ENVIRONMENT)) for _ in range(args.runs)])
+    report("uvicorn", [time_uvicorn() for _ in range(args.runs)])
+    if shutil.which("gunicorn"):
+        report(f"gunicorn -w {args.workers}", [time_gunicorn(args.workers, False) for _ in range(args.runs)])
+        report(f"--preload -w {args.workers}", [time_gunicorn(args.workers, True) for _ in range(args.runs)])
+    else:
+        print("gunicorn no está instalado; se omite la comparación con --preload")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark: lectura del historial antes y después de la compactación.
+
+Llena un PostgREST falso con conversaciones largas, mide la lectura del webhook
+(los últimos CONTEXT_MAX_MESSAGES mensajes) y el tamaño de lo que viaja por la
+red, compacta, y repite la medición. Comprueba además que archivo + final
+caliente reconstruyen el historial original y que una segunda ejecución no
+vuelve a revisar conversaciones sin cambios.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_compaction --conversations 200 --messages 600 --storage legacy
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from benchmarks.fakes import create_fake_postgrest_app, serve_in_thread
+
+WORDS = ("hola quisiera saber horario atención servicio domicilio fin semana precio pedido envío "
+         "gracias cita mañana tarde disponible confirmar dirección pago tarjeta efectivo factura").split()
+
+
+def seed(tables: dict, storage: str, conversations: int, messages: int) -> None:
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    rng = random.Random(0)
+    rows, message_rows = [], []
+    for index in range(conversations):
+        phone_number = f"52155{index:08d}"
+        history = [
+            {"role": "user" if i % 2 == 0 else "assistant",
+             "content": " ".join(rng.choices(WORDS, k=rng.randint(5, 40))),
+             "timestamp": (start + timedelta(minutes=i)).isoformat()}
+            for i in range(messages)
+        ]
+        modified_at = (start + timedelta(seconds=index)).isoformat()
+        if storage == "legacy":
+            rows.append({"id": index + 1, "phone_number": phone_number, "messages": history, "modified_at": modified_at})
+        else:
+            rows.append({"id": index + 1, "phone_number": phone_number, "messages": [], "modified_at": modified_at})
+            message_rows.extend({"id": len(message_rows) + 1, "phone_number": phone_number, **m} for m in history)
+    tables["conversations"] = rows
+    tables["conversation_messages"] = message_rows
+
+
+def wire_bytes(tables: dict, storage: str, phone_number: str, limit: int) -> int:
+    """Bytes de la respuesta que el webhook recibe de PostgREST para leer el historial."""
+    if storage == "legacy":
+        row = next(r for r in tables["conversations"] if r["phone_number"] == phone_number)
+        return len(json.dumps([{"messages": row["messages"]}]))
+    rows = [r for r in tables["conversation_messages"] if r["phone_number"] == phone_number][-limit:]
+    return len(json.dumps([{k: r[k] for k in ("role", "content", "timestamp")} for r in rows]))
+
+
+async def measure_reads(tables: dict, storage: str, phones: list) -> str:
+    from src.api.v1.endpoints.webhook import get_conversation_history
+    from src.utils.context import CONTEXT_MAX_MESSAGES
+
+    started = time.perf_counter()
+    for phone_number in phones:
+        await get_conversation_history(phone_number, limit=CONTEXT_MAX_MESSAGES)
+    elapsed_ms = (time.perf_counter() - started) * 1000 / len(phones)
+    size = sum(wire_bytes(tables, storage, p, CONTEXT_MAX_MESSAGES) for p in phones) / len(phones)
+    return f"{elapsed_ms:6.2f} ms/lectura, {size / 1024:8.1f} KiB por lectura"
+
+
+async def run(args, tables: dict) -> None:
+    from src.db import run_db
+    from src.db.archive import COMPACTION_HOT_MESSAGES, compact_conversations, load_full_history
+    from src.utils.redis import redis_conn
+
+    phones = [row["phone_number"] for row in tables["conversations"]][:args.reads]
+    original = {p: await run_db(load_full_history, p) for p in phones[:5]}
+    print(f"antes:   {await measure_reads(tables, args.storage, phones)}")
+
+    started = time.perf_counter()
+    stats = await compact_conversations(redis_conn, full=True)
+    elapsed = time.perf_counter() - started
+    archive = tables.get("conversation_archive", [])
+    raw = sum(len(json.dumps(m)) for p in original for m in original[p]) / len(original)
+    packed = sum(len(r["payload"]) for r in archive if r["phone_number"] in original) / len(original)
+    print(f"compactación: {stats['conversations']} conversaciones, {stats['messages']} mensajes en {elapsed:.2f}s; "
+          f"{len(archive)} bloques, archivo {packed / 1024:.1f} KiB por conversación "
+          f"(JSON original {raw / 1024:.1f} KiB) con final caliente de {COMPACTION_HOT_MESSAGES}")
+    print(f"después: {await measure_reads(tables, args.storage, phones)}")
+
+    intact = all([await run_db(load_full_history, p) == original[p] for p in original])
+    print(f"historial completo reconstruido: {'sí' if intact else 'NO'}")
+    again = await compact_conversations(redis_conn)
+    print(f"segunda ejecución: {again['conversations']} conversaciones revisadas")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=600, help="mensajes por conversación")
+    parser.add_argument("--reads", type=int, default=100, help="conversaciones leídas en cada medición")
+    parser.add_argument("--storage", choices=("legacy", "messages"), default="legacy")
+    args = parser.parse_args()
+
+    postgrest_app = create_fake_postgrest_app()
+    postgrest_server = serve_in_thread(postgrest_app)
+    seed(postgrest_app.state.tables, args.storage, args.conversations, args.messages)
+
+    # La configuración se lee al importar los módulos: apuntarlos al PostgREST falso
+    os.environ["SUPABASE_URL"] = postgrest_server.base_url
+    os.environ["CONVERSATION_STORAGE"] = args.storage
+    # Sin la caché de Redis: se mide la lectura contra la base de datos
+    os.environ["CONVERSATION_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    try:
+        asyncio.run(run(args, postgrest_app.state.tables))
+    finally:
+        postgrest_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Benchmark: throughput de peticiones concurrentes con llamadas bloqueantes a Supabase.
+
+Simula una consulta de PostgREST bloqueante (time.sleep) y compara:
+  - "blocking": la llamada síncrona dentro de la corrutina (comportamiento anterior)
+  - "executor": la misma llamada a través de src.db.run_db (pool de hilos acotado)
+
+Uso (desde backend/):
+    python -m benchmarks.bench_db_executor --requests 200 --concurrency 50 --latency-ms 40
+"""
+import argparse
+import asyncio
+import time
+
+from src.db import SUPABASE_MAX_WORKERS, run_db
+
+
+def blocking_query(latency: float) -> list:
+    time.sleep(latency)
+    return []
+
+
+async def handle_blocking(latency: float) -> None:
+    blocking_query(latency)
+
+
+async def handle_executor(latency: float) -> None:
+    await run_db(blocking_query, latency)
+
+
+async def run(handler, total: int, concurrency: int, latency: float) -> float:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one():
+        async with semaphore:
+            await handler(latency)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    return time.perf_counter() - start
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--latency-ms", type=float, default=40.0)
+    args = parser.parse_args()
+
+    latency = args.latency_ms / 1000
+    print(f"requests={args.requests} concurrency={args.concurrency} "
+          f"latency={args.latency_ms}ms SUPABASE_MAX_WORKERS={SUPABASE_MAX_WORKERS}")
+    for name, handler in (("blocking", handle_blocking), ("executor", handle_executor)):
+        elapsed = asyncio.run(run(handler, args.requests, args.concurrency, latency))
+        print(f"{name:>9}: {elapsed:7.3f}s  {args.requests / elapsed:8.1f} req/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Benchmark: trabajo de análisis por lotes (enrich.py) contra servidores falsos.
+
+  1. Throughput con distintos niveles de ENRICHMENT_CONCURRENCY (el OpenAI falso
+     falla el `--error-rate` de las peticiones para ejercitar los reintentos).
+  2. Re-ejecución incremental: sin cambios no se revisa ninguna conversación.
+  3. Cambios en el 10% de las conversaciones: solo esas se vuelven a analizar.
+  4. --full: se revisan todas, pero el hash evita llamar al modelo.
+  5. Ejecución interrumpida a la mitad y reanudada: llamadas totales al modelo.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_enrichment --conversations 300 --levels 1,4,16
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import datetime, timezone
+
+from benchmarks.bench_compaction import seed
+from benchmarks.fakes import FaultInjector, create_fake_openai_app, create_fake_postgrest_app, serve_in_thread
+
+
+def reset(tables: dict, redis_client) -> None:
+    from src.utils.enrichment import CHECKPOINT_KEY, INSIGHTS_TABLE
+
+    tables[INSIGHTS_TABLE] = []
+    redis_client.delete(CHECKPOINT_KEY)
+
+
+async def run(args, tables: dict, openai_app) -> None:
+    from src.utils import enrichment
+    from src.utils.redis import redis_conn
+
+    for level in (int(value) for value in args.levels.split(",")):
+        reset(tables, redis_conn)
+        enrichment.ENRICHMENT_CONCURRENCY = level
+        calls = openai_app.state.requests
+        started = time.perf_counter()
+        stats = await enrichment.enrich_conversations(redis_conn)
+        elapsed = time.perf_counter() - started
+        print(f"concurrencia {level:>3}: {stats['analysed']} analizadas en {elapsed:6.2f}s -> "
+              f"{stats['analysed'] / elapsed:6.1f} conv/s ({openai_app.state.requests - calls} llamadas, "
+              f"errores={stats['errors']})")
+
+    calls = openai_app.state.requests
+    stats = await enrichment.enrich_conversations(redis_conn)
+    print(f"sin cambios: {stats['conversations']} revisadas, {openai_app.state.requests - calls} llamadas")
+
+    changed = tables["conversations"][::10]
+    for row in changed:
+        row["messages"].append({"role": "user", "content": "¿Siguen disponibles?",
+                                "timestamp": datetime.now(timezone.utc).isoformat()})
+        row["modified_at"] = datetime.now(timezone.utc).isoformat()
+    calls = openai_app.state.requests
+    stats = await enrichment.enrich_conversations(redis_conn)
+    print(f"{len(changed)} modificadas: {stats['conversations']} revisadas, {stats['analysed']} analizadas, "
+          f"{openai_app.state.requests - calls} llamadas")
+
+    calls = openai_app.state.requests
+    stats = await enrichment.enrich_conversations(redis_conn, full=True)
+    print(f"--full: {stats['conversations']} revisadas, {stats['unchanged']} sin cambios, "
+          f"{openai_app.state.requests - calls} llamadas")
+
+    reset(tables, redis_conn)
+    calls = openai_app.state.requests
+    task = asyncio.create_task(enrichment.enrich_conversations(redis_conn))
+    while len(tables[enrichment.INSIGHTS_TABLE]) < args.conversations // 2:
+        await asyncio.sleep(0.01)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    saved = len(tables[enrichment.INSIGHTS_TABLE])
+    stats = await enrichment.enrich_conversations(redis_conn)
+    print(f"reanudación: {saved} guardadas antes de la interrupción, {stats['conversations']} revisadas al reanudar, "
+          f"{len(tables[enrichment.INSIGHTS_TABLE])} en total con {openai_app.state.requests - calls} llamadas")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=300)
+    parser.add_argument("--messages", type=int, default=30, help="mensajes por conversación")
+    parser.add_argument("--levels", default="1,4,16")
+    parser.add_argument("--tokens-per-second", type=float, default=150.0, help="velocidad del OpenAI falso")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    args = parser.parse_args()
+
+    postgrest_app = create_fake_postgrest_app()
+    openai_app = create_fake_openai_app(FaultInjector(error_rate=args.error_rate),
+                                        tokens_per_second=args.tokens_per_second)
+    postgrest_server = serve_in_thread(postgrest_app)
+    openai_server = serve_in_thread(openai_app)
+    seed(postgrest_app.state.tables, "legacy", args.conversations, args.messages)
+
+    # La configuración se lee al importar los módulos: apuntarlos a los servidores falsos
+    os.environ["SUPABASE_URL"] = postgrest_server.base_url
+    os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+    os.environ["ENRICHMENT_BATCH_SIZE"] = "50"
+    os.environ["ENRICHMENT_RETRY_BACKOFF"] = "0.05"
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("LLM_PROVIDER_OPENAI_MAX_CONCURRENCY", "64")
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    try:
+        asyncio.run(run(args, postgrest_app.state.tables, openai_app))
+    finally:
+        postgrest_server.should_exit = True
+        openai_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+Benchmark: memoria de la exportación NDJSON de conversaciones.
+
+Llena un PostgREST falso con conversaciones de distintos tamaños totales,
+descarga /api/v1/conversations/export en streaming y mide el pico de memoria
+asignada por el proceso durante la descarga (tracemalloc). Con la lectura
+por páginas el pico debe mantenerse plano aunque la exportación crezca; como
+referencia se mide también cargar todos los historiales en una lista, que es
+lo que permitía get_conversation_history.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_export --sizes 250,1000,4000 --messages 60
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+import httpx
+
+from benchmarks.bench_compaction import seed
+from benchmarks.fakes import create_fake_postgrest_app, serve_in_thread
+
+
+async def stream_export(base_url: str) -> tuple:
+    lines = 0
+    headers = {"Authorization": f"Bearer {os.environ['CONVERSATIONS_API_TOKEN']}"}
+    async with httpx.AsyncClient(base_url=base_url, timeout=None, headers=headers) as client:
+        async with client.stream("GET", "/api/v1/conversations/export") as response:
+            response.raise_for_status()
+            async for line in response.aiter_lines():
+                lines += bool(line)
+    return lines
+
+
+async def load_everything(phones: list) -> int:
+    from src.api.v1.endpoints.webhook import get_conversation_history
+
+    histories = [await get_conversation_history(phone_number) for phone_number in phones]
+    return sum(len(history) for history in histories)
+
+
+def measure(coroutine) -> tuple:
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = asyncio.run(coroutine)
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="250,1000,4000", help="número de conversaciones de cada medición")
+    parser.add_argument("--messages", type=int, default=60, help="mensajes por conversación")
+    args = parser.parse_args()
+
+    postgrest_app = create_fake_postgrest_app()
+    postgrest_server = serve_in_thread(postgrest_app)
+    os.environ["SUPABASE_URL"] = postgrest_server.base_url
+    os.environ["CONVERSATION_CACHE_ENABLED"] = "false"
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("CONVERSATIONS_API_TOKEN", "benchmark")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+
+    from main import app
+
+    app_server = serve_in_thread(app)
+    try:
+        for size in (int(value) for value in args.sizes.split(",")):
+            # El PostgREST falso comparte el proceso: se llena antes de empezar a medir
+            seed(postgrest_app.state.tables, "legacy", size, args.messages)
+            phones = [row["phone_number"] for row in postgrest_app.state.tables["conversations"]]
+            lines, elapsed, peak = measure(stream_export(app_server.base_url))
+            loaded, _, loaded_peak = measure(load_everything(phones))
+            print(f"{size:>6} conversaciones: exportación {lines} líneas en {elapsed:6.2f}s, pico {peak:6.1f} MiB | "
+                  f"cargar todo {loaded} mensajes, pico {loaded_peak:6.1f} MiB")
+    finally:
+        app_server.should_exit = True
+        postgrest_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
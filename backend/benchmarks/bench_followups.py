@@ -0,0 +1,187 @@
+"""
+Benchmark: despacho de seguimientos programados con un backlog grande.
+
+Programa `--backlog` seguimientos futuros en fakeredis (con `--redis-rtt-ms` de
+latencia simulada por ida a Redis) y, con ese backlog pendiente, despacha `--due`
+seguimientos vencidos en cada medición:
+  1. Programación en pipelines: seguimientos por segundo e idas a Redis.
+  2. Reclamo de vencidos sin enviar: por lotes con ZPOPMIN frente a uno por uno.
+  3. Despacho por lotes (src/utils/calendar.py) contra un Twilio falso, con
+     distintas concurrencias: mensajes por segundo e idas a Redis por mensaje.
+  4. Referencia: un despachador que reclama los vencidos de uno en uno.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_followups --backlog 200000 --due 2000 --levels 1,16,64
+"""
+import argparse
+import asyncio
+import os
+import time
+from datetime import timedelta
+
+from benchmarks.fakes import FaultInjector, create_fake_twilio_app, serve_in_thread
+
+
+class SlowRedis:
+    """Cliente de Redis con latencia por ida (cada comando o cada pipeline) y contador de idas."""
+
+    def __init__(self, client, rtt_ms: float):
+        self.client = client
+        self.rtt = rtt_ms / 1000
+        self.round_trips = 0
+
+    def _round_trip(self):
+        self.round_trips += 1
+        if self.rtt:
+            time.sleep(self.rtt)
+
+    def pipeline(self, *args, **kwargs):
+        slow = self
+        pipe = self.client.pipeline(*args, **kwargs)
+
+        class SlowPipeline:
+            def __getattr__(self, name):
+                return getattr(pipe, name)
+
+            def execute(self):
+                slow._round_trip()
+                return pipe.execute()
+
+        return SlowPipeline()
+
+    def __getattr__(self, name):
+        attribute = getattr(self.client, name)
+        if not callable(attribute):
+            return attribute
+
+        def call(*args, **kwargs):
+            self._round_trip()
+            return attribute(*args, **kwargs)
+
+        return call
+
+
+async def naive_dispatch(redis_client, total: int) -> None:
+    """Un vencido por iteración: ZRANGEBYSCORE LIMIT 1, ZREM, HGET, envío y HDEL."""
+    import json
+
+    from starlette.concurrency import run_in_threadpool
+
+    from src.utils.calendar import DUE_KEY, PAYLOAD_KEY
+    from src.utils.whatsapp import get_whatsapp_sender
+
+    sent = 0
+    while sent < total:
+        head = await run_in_threadpool(redis_client.zrangebyscore, DUE_KEY, "-inf", time.time(), start=0, num=1)
+        if not head:
+            break
+        if not await run_in_threadpool(redis_client.zrem, DUE_KEY, head[0]):
+            continue
+        payload = json.loads(await run_in_threadpool(redis_client.hget, PAYLOAD_KEY, head[0]))
+        await get_whatsapp_sender().send(payload["phone_number"], message=payload["message"])
+        await run_in_threadpool(redis_client.hdel, PAYLOAD_KEY, head[0])
+        sent += 1
+
+
+async def run(args, twilio_app) -> None:
+    import fakeredis
+    from starlette.concurrency import run_in_threadpool
+
+    from src.utils import calendar
+
+    now = calendar.now_local()
+    redis_client = SlowRedis(fakeredis.FakeStrictRedis(), args.redis_rtt_ms)
+
+    def due_now(prefix: str, count: int):
+        return ({"phone_number": f"52166{prefix}{index:07d}", "message": f"Recordatorio {index}",
+                 "due_at": now - timedelta(seconds=1)} for index in range(count))
+
+    # El backlog vence dentro de 1 a 720 horas: sigue pendiente durante todas las mediciones
+    future = ({"phone_number": f"52155{index:08d}", "message": f"Recordatorio {index}",
+               "due_at": now + timedelta(hours=1 + index % 720)} for index in range(args.backlog))
+    started = time.perf_counter()
+    await calendar.schedule_followups(redis_client, future)
+    elapsed = time.perf_counter() - started
+    print(f"programación: {args.backlog} en {elapsed:.1f}s -> {args.backlog / elapsed:,.0f}/s, "
+          f"{redis_client.round_trips} idas a Redis")
+
+    # Solo el reclamo de los vencidos, sin enviar: lotes frente a uno por uno
+    claim_count = args.due * 5
+    await calendar.schedule_followups(redis_client, due_now("7", claim_count))
+    redis_client.round_trips = 0
+    started = time.perf_counter()
+    claimed = 0
+    while batch := await run_in_threadpool(calendar._claim_due, redis_client, time.time(), args.batch):
+        claimed += len(batch)
+    elapsed = time.perf_counter() - started
+    redis_client.client.delete(calendar.INFLIGHT_KEY)
+    print(f"reclamo por lotes: {claimed} en {elapsed:.2f}s -> {claimed / elapsed:,.0f}/s, "
+          f"{redis_client.round_trips} idas a Redis")
+    await calendar.schedule_followups(redis_client, due_now("8", claim_count))
+    redis_client.round_trips = 0
+    started = time.perf_counter()
+    claimed = 0
+    while head := await run_in_threadpool(redis_client.zrangebyscore, calendar.DUE_KEY, "-inf", time.time(), start=0, num=1):
+        claimed += await run_in_threadpool(redis_client.zrem, calendar.DUE_KEY, head[0])
+    elapsed = time.perf_counter() - started
+    print(f"reclamo uno a uno: {claimed} en {elapsed:.2f}s -> {claimed / elapsed:,.0f}/s, "
+          f"{redis_client.round_trips} idas a Redis")
+
+    for position, level in enumerate(int(value) for value in args.levels.split(",")):
+        await calendar.schedule_followups(redis_client, due_now(str(position), args.due))
+        redis_client.round_trips = 0
+        sent_before = len(twilio_app.state.messages)
+        started = time.perf_counter()
+        while (await calendar.dispatch_due(redis_client, batch_size=args.batch, concurrency=level))["claimed"]:
+            pass
+        elapsed = time.perf_counter() - started
+        sent = len(twilio_app.state.messages) - sent_before
+        print(f"lotes de {args.batch}, concurrencia {level:>3}: {sent} enviados en {elapsed:6.2f}s -> "
+              f"{sent / elapsed:7.1f} msg/s, {redis_client.round_trips / max(1, sent):.2f} idas a Redis por mensaje, "
+              f"pendientes {calendar.get_followup_stats(redis_client.client)}")
+
+    await calendar.schedule_followups(redis_client, due_now("9", args.naive_sample))
+    redis_client.round_trips = 0
+    sent_before = len(twilio_app.state.messages)
+    started = time.perf_counter()
+    await naive_dispatch(redis_client, args.naive_sample)
+    elapsed = time.perf_counter() - started
+    sent = len(twilio_app.state.messages) - sent_before
+    print(f"uno a uno (referencia): {sent} enviados en {elapsed:6.2f}s -> {sent / elapsed:7.1f} msg/s, "
+          f"{redis_client.round_trips / max(1, sent):.2f} idas a Redis por mensaje")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backlog", type=int, default=200000, help="seguimientos programados")
+    parser.add_argument("--due", type=int, default=2000, help="seguimientos vencidos que se despachan en cada medición")
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--levels", default="1,16,64")
+    parser.add_argument("--naive-sample", type=int, default=500, help="mensajes del despachador uno a uno")
+    parser.add_argument("--redis-rtt-ms", type=float, default=0.5)
+    parser.add_argument("--twilio-latency-ms", type=float, default=50.0)
+    args = parser.parse_args()
+
+    twilio_app = create_fake_twilio_app(FaultInjector(latency_ms=args.twilio_latency_ms))
+    twilio_server = serve_in_thread(twilio_app)
+
+    # La configuración se lee al importar los módulos: apuntarlos al Twilio falso
+    os.environ["TWILIO_API_BASE_URL"] = twilio_server.base_url
+    os.environ["TWILIO_MESSAGES_PER_SECOND"] = "100000"
+    os.environ["TWILIO_MAX_CONNECTIONS"] = "64"
+    os.environ["FOLLOWUP_RECORD_HISTORY"] = "false"
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "token")
+    os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "+15550000000")
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    try:
+        asyncio.run(run(args, twilio_app))
+    finally:
+        twilio_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
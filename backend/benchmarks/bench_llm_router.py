@@ -0,0 +1,81 @@
+"""
+Benchmark: latencia de cola del router de modelos contra endpoints falsos locales.
+
+El endpoint primario tiene una cola larga (un porcentaje de respuestas muy lentas);
+el secundario es algo más lento en promedio pero estable. Compara:
+  - "sin duplicar": solo el endpoint primario, sin peticiones duplicadas (comportamiento anterior)
+  - "single": solo el endpoint primario, con un duplicado en la misma ruta tras el p95
+  - "router": primario + respaldo con peticiones duplicadas tras el p95
+
+Uso (desde backend/):
+    python -m benchmarks.bench_llm_router --calls 600 --slow-rate 0.02 --slow-ms 3000
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+from benchmarks.fakes import FaultInjector, create_fake_openai_app, serve_in_thread
+from src.utils import llm_router
+from src.utils.llm_router import LLMRouter, Provider, Route
+
+MESSAGES = [{"role": "user", "content": "¿Cuánto cuesta?"}]
+
+
+def percentile(samples, pct: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))]
+
+
+async def run(router: LLMRouter, calls: int, concurrency: int, hedge: bool = True):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            start = time.perf_counter()
+            await router.complete(MESSAGES, hedge=hedge, max_tokens=50)
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(one() for _ in range(calls)))
+    for route in router.routes:
+        await route.provider.client.close()
+    return latencies
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=600)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--slow-rate", type=float, default=0.02)
+    parser.add_argument("--slow-ms", type=float, default=3000.0)
+    args = parser.parse_args()
+
+    # Respuestas cortas: la latencia la domina el FaultInjector
+    primary = serve_in_thread(create_fake_openai_app(
+        FaultInjector(args.latency_ms, jitter_ms=40, slow_rate=args.slow_rate, slow_ms=args.slow_ms),
+        completion="Cuesta 10 USD al mes.", tokens_per_second=10_000))
+    secondary = serve_in_thread(create_fake_openai_app(
+        FaultInjector(args.latency_ms * 1.5, jitter_ms=40),
+        completion="Cuesta 10 USD al mes.", tokens_per_second=10_000))
+
+    llm_router.LLM_LATENCY_MIN_SAMPLES = 10
+    try:
+        variants = (("sin duplicar", [primary], False), ("single", [primary], True), ("router", [primary, secondary], True))
+        for name, providers, hedge in variants:
+            routes = [
+                Route(Provider(f"fake{index}", f"{server.base_url}/v1", "sk-bench", 64), "gpt-fake")
+                for index, server in enumerate(providers)
+            ]
+            latencies = asyncio.run(run(LLMRouter(routes), args.calls, args.concurrency, hedge))
+            print(f"{name:>12}: p50={statistics.median(latencies) * 1000:7.1f}ms "
+                  f"p95={percentile(latencies, 0.95) * 1000:7.1f}ms "
+                  f"p99={percentile(latencies, 0.99) * 1000:7.1f}ms")
+    finally:
+        primary.should_exit = True
+        secondary.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Benchmark: costo de logging por petición del webhook, medido en el hilo que atiende la petición.
+
+  - "anterior": RotatingFileHandler + consola síncronos a nivel DEBUG, con los ~15
+    registros por petición que hacía whatsapp_endpoint (headers y formulario completos)
+  - "actual": src.utils.loggers (cola + hilo escritor, JSON, nivel INFO, payloads
+    muestreados y recortados) con los registros que hace ahora el endpoint
+
+Uso (desde backend/):
+    python -m benchmarks.bench_logging --requests 5000
+"""
+import argparse
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+from logging.handlers import RotatingFileHandler
+
+TMP_DIR = tempfile.mkdtemp(prefix="bench-logging-")
+os.environ["LOG_FILE"] = os.path.join(TMP_DIR, "actual.log")
+os.environ["LOG_CONSOLE"] = "false"
+os.environ.setdefault("LOG_LEVEL", "INFO")
+
+from src.utils.loggers import log_payload, logger, stop_log_listener  # noqa: E402
+
+HEADERS = {f"x-twilio-header-{i}": "v" * 40 for i in range(20)}
+FORM = {
+    "SmsMessageSid": "SM" + "a" * 32, "NumMedia": "0", "ProfileName": "Cliente", "WaId": "5215512345678",
+    "Body": "Hola, quiero información sobre la prueba gratuita de 7 días " * 3,
+    "From": "whatsapp:+5215512345678", "To": "whatsapp:+15550000000", "AccountSid": "AC" + "b" * 32,
+}
+
+
+def old_logger() -> logging.Logger:
+    legacy = logging.getLogger("bench-anterior")
+    legacy.setLevel(logging.DEBUG)
+    legacy.propagate = False
+    formatter = logging.Formatter(fmt='%(asctime)s pid/%(process)d [%(filename)s:%(lineno)d] %(message)s')
+    file_handler = RotatingFileHandler(os.path.join(TMP_DIR, "anterior.log"), maxBytes=1024 * 1024, backupCount=10)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler(open(os.devnull, "w"))
+    console_handler.setFormatter(formatter)
+    legacy.addHandler(file_handler)
+    legacy.addHandler(console_handler)
+    return legacy
+
+
+def request_old(log: logging.Logger) -> None:
+    log.info("=" * 50)
+    log.info("🔔 NUEVA SOLICITUD RECIBIDA")
+    log.info("URL: http://localhost/api/v1/whatsapp-endpoint")
+    log.info("Método: POST")
+    log.info(f"Headers: {HEADERS}")
+    log.info(f"Datos del formulario: {FORM}")
+    log.info("📞 Número normalizado: 5215512345678")
+    log.info(f"💬 Mensaje recibido: {FORM['Body']}")
+    log.info("📚 Historial de conversación obtenido: 9 mensajes")
+    log.info("🔧 INICIANDO GUARDADO DE MENSAJES PARA 5215512345678")
+    log.info("📝 Cantidad de mensajes a guardar: 10")
+    log.info("✅ Mensajes guardados exitosamente para 5215512345678")
+    log.info("Mensaje enviado a whatsapp:+5215512345678")
+    log.info("🏁 FIN DE LA SOLICITUD")
+    log.info("=" * 50 + "\n")
+
+
+def request_new() -> None:
+    log_payload("Headers de la solicitud", HEADERS)
+    log_payload("Datos del formulario", FORM)
+    logger.info(f"🔔 Mensaje entrante de 5215512345678 ({len(FORM['Body'])} caracteres)")
+    logger.debug(f"💬 Mensaje recibido: {FORM['Body']}")
+    logger.debug("📚 Historial de conversación obtenido: 9 mensajes")
+    logger.debug("Mensaje enviado a whatsapp:+5215512345678")
+    logger.info("🏁 Fin de la solicitud (12.3 ms)")
+
+
+def measure(fn, requests: int) -> list:
+    samples = []
+    for _ in range(requests):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1e6)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    args = parser.parse_args()
+
+    legacy = old_logger()
+    results = {
+        "anterior": measure(lambda: request_old(legacy), args.requests),
+        "actual": measure(request_new, args.requests),
+    }
+    stop_log_listener()
+
+    for name, samples in results.items():
+        ordered = sorted(samples)
+        print(f"{name:>8}: p50={statistics.median(samples):8.1f}µs  "
+              f"p99={ordered[int(len(ordered) * 0.99)]:8.1f}µs  por petición", file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
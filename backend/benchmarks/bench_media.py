@@ -0,0 +1,140 @@
+"""
+Benchmark: ingesta de adjuntos entrantes (src/utils/media.py).
+
+Contra un servidor de adjuntos falso (con la redirección de Twilio) mide:
+  1. Memoria máxima (tracemalloc) al descargar archivos de `--sizes` MB en
+     streaming a disco frente a leer la respuesta completa (`response.content`),
+     de uno en uno y `--parallel` a la vez.
+  2. Límites: un archivo mayor que MEDIA_MAX_BYTES con y sin Content-Length y
+     un servidor lento frente al límite de tiempo.
+  3. Deduplicación: `--repeats` mensajes con el mismo archivo en URLs distintas
+     (como reenvíos de varios clientes) y la misma URL repetida (reintentos del
+     trabajo), con un procesador de ejemplo que tarda `--processor-ms`.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_media --sizes 1,4,15 --parallel 8 --repeats 50
+"""
+import argparse
+import asyncio
+import os
+import time
+import tracemalloc
+
+from benchmarks.fakes import create_fake_media_app, serve_in_thread
+
+MB = 1024 * 1024
+
+
+async def measure(label: str, coroutine_factory) -> None:
+    tracemalloc.start()
+    started = time.perf_counter()
+    try:
+        await coroutine_factory()
+    finally:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    print(f"  {label}: {time.perf_counter() - started:5.2f}s, memoria máxima {peak / MB:6.2f} MB")
+
+
+async def run(args, base_url: str, media_app) -> None:
+    import fakeredis
+    import httpx
+
+    from src.utils import media
+
+    downloader = media.get_media_downloader()
+
+    async def streamed(url: str):
+        result = await downloader.download(url)
+        os.remove(result.path)
+
+    async def naive(client: httpx.AsyncClient, url: str):
+        response = await client.get(url)
+        return len(response.content)
+
+    print("1. memoria por descarga")
+    async with httpx.AsyncClient(follow_redirects=True, timeout=60) as client:
+        for size in (float(value) for value in args.sizes.split(",")):
+            url = f"{base_url}/redirect/size{size}?size={int(size * MB)}"
+            await measure(f"{size:>4.0f} MB en streaming      ", lambda: streamed(url))
+            await measure(f"{size:>4.0f} MB con .content      ", lambda: naive(client, url))
+        largest = max(float(value) for value in args.sizes.split(","))
+        urls = [f"{base_url}/media/p{index}?size={int(largest * MB)}" for index in range(args.parallel)]
+        await measure(f"{args.parallel} x {largest:.0f} MB en streaming  ",
+                      lambda: asyncio.gather(*(streamed(url) for url in urls)))
+        await measure(f"{args.parallel} x {largest:.0f} MB con .content  ",
+                      lambda: asyncio.gather(*(naive(client, url) for url in urls)))
+
+    print(f"2. límites (MEDIA_MAX_BYTES={media.MEDIA_MAX_BYTES / MB:.0f} MB, "
+          f"MEDIA_DOWNLOAD_TIMEOUT_SECONDS={media.MEDIA_DOWNLOAD_TIMEOUT_SECONDS:.0f})")
+    for label, query in (("con Content-Length", ""), ("sin Content-Length", "&chunked=true")):
+        started = time.perf_counter()
+        try:
+            await streamed(f"{base_url}/media/huge?size={64 * MB}{query}")
+            outcome = "descargado"
+        except media.MediaError as e:
+            outcome = f"rechazado ({e})"
+        print(f"  64 MB {label}: {outcome} en {time.perf_counter() - started:.2f}s")
+    started = time.perf_counter()
+    try:
+        await streamed(f"{base_url}/media/slow?size={4 * MB}&delay_ms=200")
+        outcome = "descargado"
+    except media.MediaError as e:
+        outcome = f"rechazado ({e})"
+    print(f"  servidor lento (4 MB a 320 KB/s): {outcome} en {time.perf_counter() - started:.2f}s")
+
+    print("3. deduplicación")
+    calls = {"ocr": 0}
+
+    async def fake_ocr(media_file):
+        calls["ocr"] += 1
+        await asyncio.sleep(args.processor_ms / 1000)
+        return f"[Texto de la imagen: {media_file.sha256[:8]}]"
+
+    media.register_processor("ocr", ("image/",), fake_ocr)
+    redis_client = fakeredis.FakeStrictRedis()
+    for label, make_url in (
+        ("mismo archivo, URLs distintas", lambda index: f"{base_url}/redirect/flyer?size={MB}&message={index}"),
+        ("misma URL repetida           ", lambda index: f"{base_url}/redirect/menu?size={MB}"),
+    ):
+        calls["ocr"], requests_before = 0, media_app.state.requests
+        started = time.perf_counter()
+        for index in range(args.repeats):
+            await media.attach_media(redis_client, "", [{"url": make_url(index), "content_type": "image/jpeg"}])
+        elapsed = time.perf_counter() - started
+        print(f"  {label}: {args.repeats} mensajes en {elapsed:.2f}s ({elapsed / args.repeats * 1000:.0f} ms por mensaje), "
+              f"{media_app.state.requests - requests_before} peticiones al servidor, {calls['ocr']} llamadas al procesador "
+              f"(sin deduplicar: {args.repeats} llamadas, {args.repeats * args.processor_ms / 1000:.1f}s de procesador)")
+    await media.close_media_downloader()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1,4,15", help="tamaños de archivo en MB")
+    parser.add_argument("--parallel", type=int, default=8, help="descargas simultáneas del archivo más grande")
+    parser.add_argument("--repeats", type=int, default=50, help="mensajes con el mismo archivo")
+    parser.add_argument("--processor-ms", type=float, default=200.0, help="duración del procesador de ejemplo")
+    parser.add_argument("--timeout", type=float, default=3.0, help="MEDIA_DOWNLOAD_TIMEOUT_SECONDS")
+    args = parser.parse_args()
+
+    media_app = create_fake_media_app()
+    media_server = serve_in_thread(media_app)
+
+    # La configuración se lee al importar los módulos
+    os.environ["MEDIA_DOWNLOAD_TIMEOUT_SECONDS"] = str(args.timeout)
+    os.environ["MEDIA_CONCURRENCY"] = str(args.parallel)
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "token")
+    os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "+15550000000")
+    os.environ.setdefault("SUPABASE_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("SUPABASE_ANON_KEY", "benchmark")
+    os.environ.setdefault("REDIS_FAKE", "1")
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    try:
+        asyncio.run(run(args, media_server.base_url, media_app))
+    finally:
+        media_server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Benchmark: tasa de aciertos de la caché de respuestas (src/utils/response_cache.py).
+
+Simula `--conversations` conversaciones de hasta `--turns` turnos. Cada pregunta es,
+con probabilidad `--faq-share`, una pregunta frecuente (con variantes de acentos,
+puntuación y mayúsculas, elegidas con una distribución de Zipf) o un mensaje propio
+de la conversación. El contexto de cada turno se arma como en el webhook (system
+prompt, bienvenida e historial) y solo se consulta la caché si `is_context_free`.
+
+Reporta:
+  - turnos elegibles: los que pueden usar la caché (en la práctica, el primero)
+  - aciertos sobre los turnos elegibles y sobre todos los turnos
+  - cota superior: aciertos si todos los turnos fueran elegibles (lo que ganaría
+    ampliar la clave, p. ej. a preguntas frecuentes en cualquier turno)
+
+Uso (desde backend/):
+    python -m benchmarks.bench_response_cache --conversations 1000 --turns 6 --faq-share 0.4
+"""
+import argparse
+import os
+import random
+
+import fakeredis
+
+SYSTEM = {"role": "system", "content": "Eres Danil, asistente de ventas de Danil AI."}
+WELCOME = "¡Hola! Soy Danil, tu asistente virtual de Danil AI. ¿En qué puedo ayudarte hoy? 😊"
+
+FAQ = [
+    "¿Qué servicios ofrecen?",
+    "¿Cuánto cuesta el plan mensual?",
+    "¿Tienen prueba gratis?",
+    "¿Cuáles son sus horarios de atención?",
+    "¿Cómo agendo una demo?",
+    "¿Se integra con mi catálogo de productos?",
+    "¿Funciona con WhatsApp Business?",
+    "¿Qué formas de pago aceptan?",
+    "¿Dónde están ubicados?",
+    "¿Puedo cancelar cuando quiera?",
+    "¿Atienden en inglés?",
+    "¿Cuánto tarda la configuración?",
+]
+
+
+# Mensajes propios de cada conversación: nombres, pedidos y fechas
+PERSONAL = [
+    "Soy {name}, ¿ya salió mi pedido {order}?",
+    "Me llamo {name} y quiero cambiar la cita del día {day}",
+    "¿Me pueden mandar la factura del pedido {order}? Soy {name}",
+    "Hola, soy {name}, tengo una tienda de ropa con {day} empleados",
+]
+NAMES = ["Ana", "Luis", "Eva", "Juan", "Sofía", "Carlos", "Lucía", "Pedro", "Marta", "Jorge"]
+
+
+def personal_message(rng: random.Random) -> str:
+    return rng.choice(PERSONAL).format(name=rng.choice(NAMES), order=rng.randint(100, 99999), day=rng.randint(1, 30))
+
+
+def variant(question: str, rng: random.Random) -> str:
+    """La misma pregunta escrita de otra forma: sin acentos, sin signos o en minúsculas."""
+    text = question
+    if rng.random() < 0.4:
+        text = text.translate(str.maketrans("áéíóú", "aeiou"))
+    if rng.random() < 0.4:
+        text = text.strip("¿?")
+    if rng.random() < 0.4:
+        text = text.lower()
+    return text
+
+
+def faq_weights(count: int, exponent: float = 1.1):
+    return [1 / (rank + 1) ** exponent for rank in range(count)]
+
+
+def run(conversations: int, turns: int, faq_share: float, seed: int) -> None:
+    from src.utils.response_cache import ResponseCache, is_context_free
+
+    rng = random.Random(seed)
+    weights = faq_weights(len(FAQ))
+    cache = ResponseCache(fakeredis.FakeStrictRedis(), "bench")
+    # Caché de referencia sin la restricción de contexto: cota superior de aciertos
+    unrestricted = ResponseCache(fakeredis.FakeStrictRedis(), "bench")
+
+    totals = {"turns": 0, "eligible": 0, "hits": 0, "faq": 0, "upper_hits": 0}
+    for conversation in range(conversations):
+        history = [{"role": "assistant", "content": WELCOME}]
+        for turn in range(rng.randint(1, turns)):
+            if rng.random() < faq_share:
+                question = variant(rng.choices(FAQ, weights)[0], rng)
+                totals["faq"] += 1
+            else:
+                question = personal_message(rng)
+            messages = [SYSTEM] + history + [{"role": "user", "content": question}]
+            answer = f"Respuesta a: {question}"
+            totals["turns"] += 1
+
+            if is_context_free(messages, (WELCOME,)):
+                totals["eligible"] += 1
+                if cache.lookup(question) is not None:
+                    totals["hits"] += 1
+                else:
+                    cache.store(question, answer, 900)
+            if unrestricted.lookup(question) is not None:
+                totals["upper_hits"] += 1
+            else:
+                unrestricted.store(question, answer, 900)
+
+            history += [{"role": "user", "content": question}, {"role": "assistant", "content": answer}]
+
+    turns_total = totals["turns"]
+    eligible = totals["eligible"]
+    print(f"turnos: {turns_total} ({totals['faq'] / turns_total:.1%} preguntas frecuentes)")
+    print(f"turnos elegibles: {eligible} ({eligible / turns_total:.1%})")
+    print(f"aciertos: {totals['hits']} -> {totals['hits'] / max(eligible, 1):.1%} de los elegibles, "
+          f"{totals['hits'] / turns_total:.1%} de todos los turnos")
+    print(f"cota superior (todos los turnos elegibles): {totals['upper_hits'] / turns_total:.1%}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--conversations", type=int, default=1000)
+    parser.add_argument("--turns", type=int, default=6, help="turnos máximos por conversación")
+    parser.add_argument("--faq-share", type=float, default=0.4, help="proporción de preguntas frecuentes")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+    os.environ.setdefault("LOG_CONSOLE", "false")
+    run(args.conversations, args.turns, args.faq_share, args.seed)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark: tiempo hasta el primer mensaje de WhatsApp con y sin streaming.
+
+Levanta un OpenAI falso (SSE) y un Twilio falso locales y mide, por turno:
+  - "completo": gpt_without_functions + un solo envío (comportamiento anterior)
+  - "streaming": gpt_stream_chunks con envío de cada fragmento al completarse
+
+Uso (desde backend/):
+    python -m benchmarks.bench_streaming --turns 10 --tokens-per-second 40
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+from benchmarks.fakes import create_fake_openai_app, create_fake_twilio_app, serve_in_thread
+
+MESSAGES = [
+    {"role": "system", "content": "Eres Danil, asistente de Danil AI."},
+    {"role": "user", "content": "Hola, ¿qué ofrecen?"},
+]
+
+
+async def run_turns(turns: int, twilio_messages: list):
+    from src.utils.model import gpt_stream_chunks, gpt_without_functions
+    from src.utils.whatsapp import send_message
+
+    results = {"completo": [], "streaming": []}
+    for _ in range(turns):
+        sent_before = len(twilio_messages)
+        start = time.perf_counter()
+        response = await gpt_without_functions(messages=MESSAGES)
+        await send_message("5215550000000", response)
+        results["completo"].append((time.perf_counter() - start, time.perf_counter() - start))
+
+        start = time.perf_counter()
+        first = None
+        async for chunk in gpt_stream_chunks(messages=MESSAGES):
+            await send_message("5215550000000", chunk)
+            first = first or time.perf_counter() - start
+        results["streaming"].append((first, time.perf_counter() - start))
+        assert len(twilio_messages) > sent_before + 1
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=10)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    args = parser.parse_args()
+
+    openai_server = serve_in_thread(create_fake_openai_app(tokens_per_second=args.tokens_per_second))
+    twilio_app = create_fake_twilio_app()
+    twilio_server = serve_in_thread(twilio_app)
+
+    # La configuración se lee al importar los módulos: apuntarlos a los servidores falsos
+    os.environ["OPENAI_BASE_URL"] = f"{openai_server.base_url}/v1"
+    os.environ["TWILIO_API_BASE_URL"] = twilio_server.base_url
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    os.environ.setdefault("TWILIO_ACCOUNT_SID", "ACbenchmark")
+    os.environ.setdefault("TWILIO_AUTH_TOKEN", "token")
+    os.environ.setdefault("TWILIO_WHATSAPP_NUMBER", "+15550000000")
+
+    try:
+        results = asyncio.run(run_turns(args.turns, twilio_app.state.messages))
+    finally:
+        openai_server.should_exit = True
+        twilio_server.should_exit = True
+
+    for mode, samples in results.items():
+        first = statistics.median(s[0] for s in samples) * 1000
+        total = statistics.median(s[1] for s in samples) * 1000
+        print(f"{mode:>9}: primer mensaje p50={first:7.1f}ms  turno completo p50={total:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
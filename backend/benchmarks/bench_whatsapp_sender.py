@@ -0,0 +1,115 @@
+"""
+Benchmark: envío de mensajes de WhatsApp contra un Twilio falso local.
+
+Compara, con la misma concurrencia y el mismo límite por número emisor (token
+bucket compartido en Redis):
+  - "per-message": un cliente HTTP nuevo (y una conexión nueva) por mensaje y
+    sin reintentos, como hacía respond() al crear un twilio.rest.Client en cada envío
+  - "sender": WhatsAppSender con sesión keep-alive y reintentos
+La diferencia entre ambos mide solo la reutilización de conexiones y los reintentos.
+
+Después envía desde el mismo número con --processes emisores independientes (como
+varios workers de gunicorn o shards de RQ): juntos no deben pasar de --mps una vez
+agotada la ráfaga inicial. Con más mensajes que --burst el límite se ejercita.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_whatsapp_sender --messages 400 --mps 80 --latency-ms 20 --error-rate 0.05
+"""
+import argparse
+import asyncio
+import time
+
+import fakeredis
+import httpx
+
+from benchmarks.fakes import FaultInjector, create_fake_twilio_app, serve_in_thread
+from src.utils.whatsapp import RATE_KEY_PREFIX, SharedTokenBucket, WhatsAppSender, format_whatsapp_number
+
+ACCOUNT_SID = "ACbenchmark"
+FROM_NUMBER = "+15550000000"
+
+
+async def send_per_message(base_url: str, total: int, concurrency: int, bucket: SharedTokenBucket) -> int:
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> bool:
+        async with semaphore:
+            await bucket.acquire()
+            try:
+                async with httpx.AsyncClient(base_url=base_url, auth=(ACCOUNT_SID, "token")) as client:
+                    response = await client.post(
+                        f"/2010-04-01/Accounts/{ACCOUNT_SID}/Messages.json",
+                        data={"From": f"whatsapp:{FROM_NUMBER}", "To": format_whatsapp_number(f"55{index:08d}"), "Body": "hola"},
+                    )
+                return response.status_code == 201
+            except httpx.HTTPError:
+                return False
+
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    return sum(results)
+
+
+async def send_with_senders(base_url: str, total: int, concurrency: int, mps: float, burst: int,
+                            redis_client, processes: int = 1) -> int:
+    """Reparte los mensajes entre `processes` emisores que comparten el límite en Redis."""
+    senders = [
+        WhatsAppSender(ACCOUNT_SID, "token", FROM_NUMBER, base_url=base_url, messages_per_second=mps,
+                       burst=burst, retry_backoff=0.05, redis_client=redis_client)
+        for _ in range(processes)
+    ]
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(index: int) -> bool:
+        async with semaphore:
+            try:
+                await senders[index % processes].send(f"55{index:08d}", "hola")
+                return True
+            except Exception:
+                return False
+
+    results = await asyncio.gather(*(one(i) for i in range(total)))
+    for sender in senders:
+        await sender.aclose()
+    return sum(results)
+
+
+def report(name: str, delivered: int, total: int, elapsed: float, floor: float) -> None:
+    print(f"{name:>14}: {delivered}/{total} entregados en {elapsed:.2f}s "
+          f"({total / elapsed:.1f} msg/s; mínimo por el límite {floor:.2f}s)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--messages", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--latency-ms", type=float, default=20.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--mps", type=float, default=80.0, help="mensajes por segundo por número emisor")
+    parser.add_argument("--burst", type=int, default=80, help="ráfaga inicial del token bucket")
+    parser.add_argument("--processes", type=int, default=4, help="emisores independientes desde el mismo número")
+    args = parser.parse_args()
+    if args.messages <= args.burst:
+        parser.error("--messages debe superar --burst para que el límite intervenga")
+
+    redis_client = fakeredis.FakeStrictRedis()
+    # Tiempo mínimo que impone el límite: la ráfaga sale de inmediato y el resto a --mps
+    floor = (args.messages - args.burst) / args.mps
+    server = serve_in_thread(create_fake_twilio_app(FaultInjector(args.latency_ms, error_rate=args.error_rate)))
+    try:
+        bucket = SharedTokenBucket(redis_client, f"{RATE_KEY_PREFIX}:per-message", args.mps, args.burst)
+        start = time.perf_counter()
+        delivered = asyncio.run(send_per_message(server.base_url, args.messages, args.concurrency, bucket))
+        report("per-message", delivered, args.messages, time.perf_counter() - start, floor)
+
+        for processes in (1, args.processes):
+            redis_client.flushall()
+            start = time.perf_counter()
+            delivered = asyncio.run(send_with_senders(server.base_url, args.messages, args.concurrency, args.mps,
+                                                      args.burst, redis_client, processes))
+            report(f"sender x{processes}", delivered, args.messages, time.perf_counter() - start, floor)
+    finally:
+        server.should_exit = True
+
+
+if __name__ == "__main__":
+    main()
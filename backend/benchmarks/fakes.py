@@ -0,0 +1,370 @@
+"""
+Servidores falsos locales para los benchmarks.
+
+Cada fábrica devuelve una app FastAPI que imita la API real con latencia y
+tasa de errores configurables. `serve_in_thread` la levanta con uvicorn en un
+hilo para usarla desde el mismo proceso del benchmark.
+"""
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+
+class FaultInjector:
+    """
+    Latencia (ms) y tasa de errores inyectadas en cada petición.
+    `slow_rate` de las peticiones tarda además `slow_ms` (cola larga de latencia).
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                 error_status: int = 503, slow_rate: float = 0.0, slow_ms: float = 0.0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.slow_rate = slow_rate
+        self.slow_ms = slow_ms
+        self.calls = 0
+
+    async def apply(self) -> Optional[JSONResponse]:
+        self.calls += 1
+        delay = self.latency_ms + random.uniform(0, self.jitter_ms)
+        if self.slow_rate and random.random() < self.slow_rate:
+            delay += self.slow_ms
+        if delay:
+            await asyncio.sleep(delay / 1000)
+        if self.error_rate and random.random() < self.error_rate:
+            return JSONResponse({"message": "injected failure"}, status_code=self.error_status)
+        return None
+
+
+def create_fake_twilio_app(faults: Optional[FaultInjector] = None) -> FastAPI:
+    """API de mensajes de Twilio: POST /2010-04-01/Accounts/{sid}/Messages.json."""
+    faults = faults or FaultInjector()
+    app = FastAPI()
+    app.state.messages: List[dict] = []
+
+    @app.post("/2010-04-01/Accounts/{account_sid}/Messages.json")
+    async def create_message(account_sid: str, request: Request):
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        form = await request.form()
+        message = {
+            "sid": f"SM{uuid.uuid4().hex}",
+            "account_sid": account_sid,
+            "from": form.get("From"),
+            "to": form.get("To"),
+            "body": form.get("Body"),
+            "status": "queued",
+            "received_at": time.time(),
+        }
+        app.state.messages.append(message)
+        return JSONResponse(message, status_code=201)
+
+    return app
+
+
+def create_fake_media_app() -> FastAPI:
+    """
+    Adjuntos de Twilio: GET /media/{name}?size=&content_type=&chunked=&delay_ms=.
+    El contenido depende solo de `name` y `size` (URLs distintas con el mismo
+    nombre sirven el mismo archivo) y se genera por fragmentos, sin tenerlo en memoria.
+    /redirect/{name} responde 307 hacia /media/{name}, como la URL firmada de Twilio.
+    """
+    from fastapi.responses import RedirectResponse
+
+    app = FastAPI()
+    app.state.requests = 0
+    chunk_size = 64 * 1024
+
+    @app.get("/media/{name}")
+    async def media(name: str, size: int = 1024, content_type: str = "image/jpeg", chunked: bool = False,
+                    delay_ms: float = 0.0):
+        app.state.requests += 1
+        block = (name.encode() * (chunk_size // max(1, len(name)) + 1))[:chunk_size]
+
+        async def body():
+            remaining = size
+            while remaining > 0:
+                if delay_ms:
+                    await asyncio.sleep(delay_ms / 1000)
+                piece = block[:min(chunk_size, remaining)]
+                remaining -= len(piece)
+                yield piece
+
+        headers = {} if chunked else {"Content-Length": str(size)}
+        return StreamingResponse(body(), media_type=content_type, headers=headers)
+
+    @app.get("/redirect/{name}")
+    async def redirect(name: str, request: Request):
+        return RedirectResponse(f"/media/{name}?{request.url.query}", status_code=307)
+
+    return app
+
+
+DEFAULT_COMPLETION = (
+    "¡Hola! Con gusto te ayudo. Danil AI crea agentes de WhatsApp para tu negocio. "
+    "Puedes probarlo gratis durante 7 días o agendar una demo virtual.\n\n"
+    "Para la prueba necesito el nombre de tu negocio, tus horarios y los productos que ofreces. "
+    "¿Qué opción te interesa más?"
+)
+
+
+def create_fake_openai_app(
+    faults: Optional[FaultInjector] = None,
+    completion: str = DEFAULT_COMPLETION,
+    tokens_per_second: float = 50.0,
+    capacity: Optional[int] = None,
+) -> FastAPI:
+    """
+    API de chat completions de OpenAI: POST /v1/chat/completions.
+    Con `stream=true` emite la respuesta por SSE a `tokens_per_second` palabras por segundo;
+    sin streaming espera el tiempo total de generación y devuelve la respuesta completa
+    (un objeto JSON fijo si se pide response_format=json_object).
+    Con `capacity`, las peticiones por encima de ese número en curso (sin streaming) reciben 429
+    (límite de la cuenta); `rejected` y `peak_in_flight` quedan en app.state.
+    """
+    faults = faults or FaultInjector()
+    app = FastAPI()
+    app.state.requests = 0
+    app.state.rejected = 0
+    app.state.in_flight = 0
+    app.state.peak_in_flight = 0
+    words = completion.split(" ")
+
+    def usage() -> dict:
+        return {"prompt_tokens": 100, "completion_tokens": len(words), "total_tokens": 100 + len(words)}
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        app.state.requests += 1
+        if capacity is not None and app.state.in_flight >= capacity:
+            app.state.rejected += 1
+            return JSONResponse({"error": {"message": "Rate limit reached", "type": "requests",
+                                           "code": "rate_limit_exceeded"}}, status_code=429)
+        app.state.in_flight += 1
+        app.state.peak_in_flight = max(app.state.peak_in_flight, app.state.in_flight)
+        try:
+            return await complete(request)
+        finally:
+            app.state.in_flight -= 1
+
+    async def complete(request: Request):
+        payload = await request.json()
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = payload.get("model", "gpt-fake")
+
+        if not payload.get("stream"):
+            await asyncio.sleep(len(words) / tokens_per_second)
+            content = completion
+            if (payload.get("response_format") or {}).get("type") == "json_object":
+                content = json.dumps({"summary": completion, "intent": "informacion",
+                                      "tags": ["demo", "prueba"], "lead_score": 60})
+            return {
+                "id": completion_id, "object": "chat.completion", "created": created, "model": model,
+                "choices": [{"index": 0, "finish_reason": "stop",
+                             "message": {"role": "assistant", "content": content}}],
+                "usage": usage(),
+            }
+
+        async def events():
+            for index, word in enumerate(words):
+                await asyncio.sleep(1 / tokens_per_second)
+                delta = {"content": word if index == 0 else f" {word}"}
+                chunk = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                         "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk)}\n\n"
+            done = {"id": completion_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                    "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(done)}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return app
+
+
+def _coerce(value: str, like: Any) -> Any:
+    if isinstance(like, bool):
+        return value == "true"
+    if isinstance(like, int):
+        return int(value)
+    if isinstance(like, float):
+        return float(value)
+    return value
+
+
+def _matches(row: Dict[str, Any], column: str, condition: str) -> bool:
+    operator, _, value = condition.partition(".")
+    current = row.get(column)
+    if operator == "is":
+        return current is None if value == "null" else current is not None
+    if current is None:
+        return False
+    if operator == "in":
+        options = value.strip("()").split(",")
+        return str(current) in options
+    value = _coerce(value, current)
+    return {
+        "eq": current == value, "neq": current != value,
+        "gt": current > value, "gte": current >= value,
+        "lt": current < value, "lte": current <= value,
+    }.get(operator, False)
+
+
+def create_fake_postgrest_app(faults: Optional[FaultInjector] = None, max_rows: Optional[int] = None) -> FastAPI:
+    """
+    PostgREST en memoria (/rest/v1) con el subconjunto que usa la app: select de
+    columnas, filtros eq/neq/gt/gte/lt/lte/in/is, order, limit/offset, insert,
+    upsert (on_conflict, ignore-duplicates), update, delete y la RPC
+    append_conversation_message. Con `max_rows` los select se cortan como con el
+    max-rows de PostgREST (1000 en Supabase).
+    """
+    faults = faults or FaultInjector()
+    app = FastAPI()
+    tables: Dict[str, List[Dict[str, Any]]] = {}
+    sequences: Dict[str, int] = {}
+    app.state.tables = tables
+    app.state.max_rows = max_rows
+
+    def now() -> str:
+        return datetime.now(timezone.utc).isoformat()
+
+    def insert_row(table: str, row: Dict[str, Any]) -> Dict[str, Any]:
+        sequences[table] = sequences.get(table, 0) + 1
+        stored = {"id": sequences[table], "created_at": now(), **row}
+        for key, value in stored.items():
+            if value == "now()":
+                stored[key] = now()
+        tables.setdefault(table, []).append(stored)
+        return stored
+
+    def select_rows(table: str, params) -> List[Dict[str, Any]]:
+        rows = tables.get(table, [])
+        for column, condition in params.multi_items():
+            if column in ("select", "order", "limit", "offset", "columns", "on_conflict"):
+                continue
+            rows = [row for row in rows if _matches(row, column, condition)]
+        if "order" in params:
+            for part in reversed(params["order"].split(",")):
+                column, *modifiers = part.split(".")
+                rows = sorted(rows, key=lambda row: (row.get(column) is None, row.get(column)),
+                              reverse="desc" in modifiers)
+        offset = int(params.get("offset", 0))
+        rows = rows[offset:]
+        if "limit" in params:
+            rows = rows[:int(params["limit"])]
+        return rows
+
+    def project(rows: List[Dict[str, Any]], params) -> List[Dict[str, Any]]:
+        columns = params.get("select", "*")
+        if columns == "*":
+            return [dict(row) for row in rows]
+        names = [name.strip() for name in columns.split(",")]
+        return [{name: row.get(name) for name in names} for row in rows]
+
+    @app.post("/rest/v1/rpc/append_conversation_message")
+    async def append_conversation_message(request: Request):
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        args = await request.json()
+        phone_number = args["p_phone_number"]
+        stored = insert_row("conversation_messages", {
+            "phone_number": phone_number, "role": args["p_role"],
+            "content": args["p_content"], "timestamp": args.get("p_timestamp"),
+        })
+        conversations = [row for row in tables.get("conversations", []) if row["phone_number"] == phone_number]
+        if conversations:
+            conversations[0]["modified_at"] = now()
+        else:
+            insert_row("conversations", {"phone_number": phone_number, "messages": [], "modified_at": now()})
+        return stored["id"]
+
+    @app.get("/rest/v1/{table}")
+    async def select(table: str, request: Request):
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        rows = select_rows(table, request.query_params)
+        if app.state.max_rows:
+            rows = rows[:app.state.max_rows]
+        return project(rows, request.query_params)
+
+    @app.post("/rest/v1/{table}")
+    async def insert(table: str, request: Request):
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        payload = await request.json()
+        rows = payload if isinstance(payload, list) else [payload]
+        conflict = request.query_params.get("on_conflict")
+        ignore_duplicates = "resolution=ignore-duplicates" in request.headers.get("prefer", "")
+        stored = []
+        for row in rows:
+            existing = None
+            if conflict:
+                keys = conflict.split(",")
+                existing = next((r for r in tables.get(table, []) if all(r.get(k) == row.get(k) for k in keys)), None)
+            if existing is not None:
+                if not ignore_duplicates:
+                    existing.update(row)
+                    stored.append(existing)
+            else:
+                stored.append(insert_row(table, row))
+        return JSONResponse(stored, status_code=201)
+
+    @app.patch("/rest/v1/{table}")
+    async def update(table: str, request: Request):
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        changes = {k: (now() if v == "now()" else v) for k, v in (await request.json()).items()}
+        rows = select_rows(table, request.query_params)
+        for row in rows:
+            row.update(changes)
+        return rows
+
+    @app.delete("/rest/v1/{table}")
+    async def delete(table: str, request: Request):
+        failure = await faults.apply()
+        if failure is not None:
+            return failure
+        rows = select_rows(table, request.query_params)
+        ids = {id(row) for row in rows}
+        tables[table] = [row for row in tables.get(table, []) if id(row) not in ids]
+        return rows
+
+    return app
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def serve_in_thread(app: FastAPI, port: Optional[int] = None) -> uvicorn.Server:
+    """Levanta `app` en 127.0.0.1 en un hilo daemon y espera a que acepte conexiones."""
+    port = port or free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.01)
+    server.base_url = f"http://127.0.0.1:{port}"
+    return server
@@ -0,0 +1,301 @@
+"""
+Prueba de carga offline del webhook de WhatsApp.
+
+Levanta dobles locales de todas las dependencias (PostgREST/Supabase, OpenAI y
+Twilio, con latencia y errores configurables; Redis con fakeredis), reproduce
+tráfico del webhook de Twilio contra la app y reporta el throughput, la latencia
+extremo a extremo y p50/p95/p99 por etapa a partir de /metrics.
+
+Uso (desde backend/):
+    python -m benchmarks.loadtest --requests 500 --concurrency 20
+    python -m benchmarks.loadtest --rate 30 --duration 20 --llm-tokens-per-second 80
+    python -m benchmarks.loadtest --replay trafico.ndjson --max-p95-ms 3000
+
+Dimensionar workers de gunicorn contra los mismos dobles:
+    python -m benchmarks.loadtest --serve-fakes          # imprime las variables de entorno
+    <exportar las variables> gunicorn -c gunicorn.conf.py -w 4 -k uvicorn.workers.UvicornWorker main:app
+    python -m benchmarks.loadtest --app-url http://127.0.0.1:8000
+
+`--replay` acepta un archivo NDJSON con un formulario de Twilio por línea
+(al menos From y Body). Sale con código 1 si se supera --max-p95-ms o
+--max-error-rate, para usarlo como control de regresiones.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import statistics
+import tempfile
+import time
+import uuid
+from typing import Dict, List, Optional
+
+import httpx
+from prometheus_client.parser import text_string_to_metric_families
+
+from benchmarks.fakes import (
+    FaultInjector,
+    create_fake_openai_app,
+    create_fake_postgrest_app,
+    create_fake_twilio_app,
+    serve_in_thread,
+)
+
+WEBHOOK_PATH = "/api/v1/whatsapp-endpoint"
+METRICS_PATH = "/api/v1/metrics"
+STAGE_METRIC = "whatsapp_stage_latency_seconds"
+
+SAMPLE_BODIES = [
+    "Hola",
+    "¿Qué ofrecen?",
+    "Quiero probar el agente gratis",
+    "¿Cuánto cuesta?",
+    "Mi negocio es una panadería, abrimos de 8 a 20",
+    "Vendemos pan dulce, pasteles y café",
+    "¿Puedo agendar una demo el jueves?",
+    "Gracias",
+]
+
+
+def percentile(samples: List[float], q: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = min(len(ordered) - 1, max(0, round(q * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def synthetic_traffic(requests: int, numbers: int, prefix: str = "+521555",
+                      retry_rate: float = 0.0) -> List[Dict[str, str]]:
+    """
+    Formularios de Twilio repartidos entre `numbers` conversaciones.
+    Con `retry_rate`, esa fracción de mensajes se vuelve a enviar con el mismo
+    MessageSid unos lugares después, como los reintentos de Twilio.
+    """
+    phones = [f"whatsapp:{prefix}{index:07d}" for index in range(numbers)]
+    traffic = [
+        {
+            "From": random.choice(phones),
+            "Body": random.choice(SAMPLE_BODIES),
+            "MessageSid": f"SM{uuid.uuid4().hex}",
+            "NumMedia": "0",
+        }
+        for _ in range(requests)
+    ]
+    for form in [form for form in traffic if random.random() < retry_rate]:
+        position = min(len(traffic), traffic.index(form) + random.randint(1, 10))
+        traffic.insert(position, dict(form))
+    return traffic
+
+
+def load_replay(path: str) -> List[Dict[str, str]]:
+    with open(path, encoding="utf-8") as handle:
+        return [json.loads(line) for line in handle if line.strip()]
+
+
+def scrape_stage_buckets(text: str) -> Dict[str, Dict[float, float]]:
+    """Conteos acumulados por bucket del histograma de etapas: {stage: {le: count}}."""
+    stages: Dict[str, Dict[float, float]] = {}
+    for family in text_string_to_metric_families(text):
+        if family.name != STAGE_METRIC:
+            continue
+        for sample in family.samples:
+            if sample.name == f"{STAGE_METRIC}_bucket":
+                stage = sample.labels["stage"]
+                upper = float(sample.labels["le"])
+                stages.setdefault(stage, {})
+                stages[stage][upper] = stages[stage].get(upper, 0.0) + sample.value
+    return stages
+
+
+def histogram_quantile(buckets: Dict[float, float], q: float) -> Optional[float]:
+    """Igual que histogram_quantile de Prometheus: interpolación lineal dentro del bucket."""
+    bounds = sorted(buckets)
+    total = buckets[bounds[-1]] if bounds else 0
+    if not total:
+        return None
+    rank = q * total
+    lower_bound, lower_count = 0.0, 0.0
+    for upper in bounds:
+        count = buckets[upper]
+        if count >= rank:
+            if upper == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return upper
+            return lower_bound + (upper - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = upper, count
+    return lower_bound
+
+
+def stage_report(before: Dict[str, Dict[float, float]], after: Dict[str, Dict[float, float]]) -> List[str]:
+    lines = []
+    for stage in sorted(after):
+        delta = {upper: count - before.get(stage, {}).get(upper, 0.0) for upper, count in after[stage].items()}
+        observed = delta.get(float("inf"), 0)
+        if not observed:
+            continue
+        quantiles = [histogram_quantile(delta, q) * 1000 for q in (0.5, 0.95, 0.99)]
+        lines.append(f"  {stage:>15}: n={int(observed):6d}  p50={quantiles[0]:8.1f}ms  "
+                     f"p95={quantiles[1]:8.1f}ms  p99={quantiles[2]:8.1f}ms")
+    return lines
+
+
+async def replay(app_url: str, traffic: List[Dict[str, str]], concurrency: int, rate: float):
+    """
+    Envía el tráfico al webhook. Con `rate` > 0 las llegadas siguen un proceso de
+    Poisson (carga abierta); si no, `concurrency` clientes envían sin pausa.
+    """
+    latencies: List[float] = []
+    statuses: Dict[int, int] = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=app_url, limits=limits, timeout=120) as client:
+        async def send(form: Dict[str, str]) -> None:
+            async with semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await client.post(WEBHOOK_PATH, data=form)
+                    status = response.status_code
+                except httpx.HTTPError:
+                    status = 0
+                latencies.append(time.perf_counter() - started)
+                statuses[status] = statuses.get(status, 0) + 1
+
+        started = time.perf_counter()
+        tasks = []
+        for form in traffic:
+            tasks.append(asyncio.create_task(send(form)))
+            if rate > 0:
+                await asyncio.sleep(random.expovariate(rate))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return latencies, statuses, elapsed
+
+
+def start_fakes(args):
+    postgrest = serve_in_thread(create_fake_postgrest_app(FaultInjector(
+        latency_ms=args.db_latency_ms, jitter_ms=args.db_latency_ms / 2, error_rate=args.db_error_rate)))
+    openai = serve_in_thread(create_fake_openai_app(
+        FaultInjector(latency_ms=args.llm_latency_ms, error_rate=args.llm_error_rate,
+                      slow_rate=args.llm_slow_rate, slow_ms=args.llm_slow_ms),
+        tokens_per_second=args.llm_tokens_per_second))
+    twilio_app = create_fake_twilio_app(FaultInjector(
+        latency_ms=args.twilio_latency_ms, jitter_ms=args.twilio_latency_ms / 2, error_rate=args.twilio_error_rate))
+    twilio = serve_in_thread(twilio_app)
+
+    environment = {
+        "SUPABASE_URL": postgrest.base_url,
+        "SUPABASE_ANON_KEY": "loadtest",
+        "OPENAI_BASE_URL": f"{openai.base_url}/v1",
+        "OPENAI_API_KEY": "sk-loadtest",
+        "TWILIO_API_BASE_URL": twilio.base_url,
+        "TWILIO_ACCOUNT_SID": "ACloadtest",
+        "TWILIO_AUTH_TOKEN": "loadtest",
+        "TWILIO_WHATSAPP_NUMBER": "+15550000000",
+        "TWILIO_MESSAGES_PER_SECOND": "10000",
+        "REDIS_FAKE": "1",
+    }
+    return [postgrest, openai, twilio], twilio_app, environment
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="mensajes sintéticos a enviar")
+    parser.add_argument("--numbers", type=int, default=50, help="conversaciones distintas en el tráfico sintético")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--rate", type=float, default=0.0, help="llegadas por segundo (0 = carga cerrada)")
+    parser.add_argument("--duration", type=float, default=0.0, help="con --rate, fija --requests = rate * duración")
+    parser.add_argument("--retry-rate", type=float, default=0.0,
+                        help="fracción de mensajes sintéticos reenviados con el mismo MessageSid")
+    parser.add_argument("--warmup", type=int, default=20,
+                        help="peticiones previas (con otros números) que no cuentan en el reporte")
+    parser.add_argument("--replay", help="NDJSON con formularios de Twilio a reproducir")
+    parser.add_argument("--app-url", help="app ya levantada (p. ej. gunicorn con N workers); si no, se levanta en proceso")
+    parser.add_argument("--serve-fakes", action="store_true", help="solo levantar los dobles e imprimir su configuración")
+    parser.add_argument("--storage", choices=["legacy", "messages"], default="messages")
+    parser.add_argument("--db-latency-ms", type=float, default=15.0)
+    parser.add_argument("--db-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=400.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-slow-rate", type=float, default=0.0)
+    parser.add_argument("--llm-slow-ms", type=float, default=0.0)
+    parser.add_argument("--twilio-latency-ms", type=float, default=80.0)
+    parser.add_argument("--twilio-error-rate", type=float, default=0.0)
+    parser.add_argument("--max-p95-ms", type=float, help="falla si el p95 extremo a extremo lo supera")
+    parser.add_argument("--max-error-rate", type=float, help="falla si la fracción de respuestas no 2xx lo supera")
+    args = parser.parse_args()
+
+    servers, twilio_app, environment = start_fakes(args)
+    environment["CONVERSATION_STORAGE"] = args.storage
+
+    if args.serve_fakes:
+        for key, value in environment.items():
+            print(f"export {key}={value}")
+        print("# Ctrl+C para detener los dobles")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            return
+
+    app_url = args.app_url
+    if not app_url:
+        # La configuración se lee al importar los módulos: apuntarlos a los dobles antes de importar la app
+        os.environ.update(environment)
+        os.environ.setdefault("LOG_CONSOLE", "false")
+        os.environ.setdefault("LOG_FILE", os.path.join(tempfile.gettempdir(), "loadtest.log"))
+        os.environ.pop("PROMETHEUS_MULTIPROC_DIR", None)
+        from main import app
+
+        app_server = serve_in_thread(app)
+        servers.append(app_server)
+        app_url = app_server.base_url
+
+    if args.replay:
+        traffic = load_replay(args.replay)
+    else:
+        requests = int(args.rate * args.duration) if args.rate and args.duration else args.requests
+        traffic = synthetic_traffic(requests, args.numbers, retry_rate=args.retry_rate)
+
+    try:
+        if args.warmup:
+            # Arranque en frío (clientes, pools, imports perezosos) fuera de las mediciones
+            asyncio.run(replay(app_url, synthetic_traffic(args.warmup, args.warmup, prefix="+521999"),
+                               args.concurrency, 0))
+        before = scrape_stage_buckets(httpx.get(f"{app_url}{METRICS_PATH}").text)
+        latencies, statuses, elapsed = asyncio.run(replay(app_url, traffic, args.concurrency, args.rate))
+        after = scrape_stage_buckets(httpx.get(f"{app_url}{METRICS_PATH}").text)
+    finally:
+        for server in servers:
+            server.should_exit = True
+
+    errors = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    error_rate = errors / len(traffic) if traffic else 0.0
+    p95_ms = percentile(latencies, 0.95) * 1000
+
+    print(f"Peticiones: {len(traffic)} en {elapsed:.1f}s -> {len(traffic) / elapsed:.1f} req/s "
+          f"(concurrencia {args.concurrency}{f', llegada {args.rate}/s' if args.rate else ''})")
+    print(f"Estados: {dict(sorted(statuses.items()))}  errores={error_rate:.1%}")
+    print(f"Extremo a extremo: p50={percentile(latencies, 0.5) * 1000:.1f}ms  p95={p95_ms:.1f}ms  "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f}ms  media={statistics.fmean(latencies) * 1000:.1f}ms")
+    print(f"Mensajes enviados al Twilio falso: {len(twilio_app.state.messages)}")
+    print("Por etapa (diferencia de /metrics durante la prueba):")
+    for line in stage_report(before, after):
+        print(line)
+
+    failed = []
+    if args.max_p95_ms is not None and p95_ms > args.max_p95_ms:
+        failed.append(f"p95 {p95_ms:.1f}ms > {args.max_p95_ms}ms")
+    if args.max_error_rate is not None and error_rate > args.max_error_rate:
+        failed.append(f"errores {error_rate:.1%} > {args.max_error_rate:.1%}")
+    if failed:
+        print(f"❌ Regresión: {'; '.join(failed)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
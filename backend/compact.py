@@ -0,0 +1,47 @@
+"""
+Compactación del historial: mueve los mensajes viejos de cada conversación al
+archivo frío y deja solo el final caliente en la tabla principal (ver src/db/archive.py).
+
+Pensado para ejecutarse periódicamente (cron); cada ejecución solo revisa las
+conversaciones modificadas desde la anterior.
+
+Uso:
+    python compact.py [--dry-run] [--full] [--limit N] [--phone NUMERO]
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.db import close_db
+from src.db.archive import compact_conversation, compact_conversations
+from src.utils.loggers import flush_logs, logger
+from src.utils.redis import redis_conn
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.phone:
+        moved = await compact_conversation(redis_conn, args.phone, dry_run=args.dry_run)
+        logger.info(f"🗜️ {args.phone}: {moved} mensajes {'por archivar' if args.dry_run else 'archivados'}")
+        return
+    await compact_conversations(redis_conn, dry_run=args.dry_run, full=args.full, limit=args.limit)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="solo contar lo que se archivaría")
+    parser.add_argument("--full", action="store_true", help="revisar todas las conversaciones, no solo las recientes")
+    parser.add_argument("--limit", type=int, help="máximo de conversaciones a revisar")
+    parser.add_argument("--phone", help="compactar solo este número (normalizado)")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        close_db()
+        flush_logs()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""
+Análisis nocturno de conversaciones: resumen, intención, etiquetas y puntuación
+de lead de cada conversación modificada desde la ejecución anterior
+(ver src/utils/enrichment.py).
+
+Uso:
+    python enrich.py [--dry-run] [--full] [--limit N]
+"""
+import argparse
+import asyncio
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.db import close_db
+from src.utils.enrichment import enrich_conversations
+from src.utils.llm_router import close_llm_router
+from src.utils.loggers import flush_logs
+from src.utils.redis import redis_conn
+
+
+async def run(args: argparse.Namespace) -> None:
+    try:
+        await enrich_conversations(redis_conn, full=args.full, limit=args.limit, dry_run=args.dry_run)
+    finally:
+        await close_llm_router()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="solo contar las conversaciones que se analizarían")
+    parser.add_argument("--full", action="store_true",
+                        help="revisar todas las conversaciones (las que no cambiaron se saltan por su hash)")
+    parser.add_argument("--limit", type=int, help="máximo de conversaciones a revisar")
+    args = parser.parse_args()
+    try:
+        asyncio.run(run(args))
+    finally:
+        close_db()
+        flush_logs()
+
+
+if __name__ == "__main__":
+    main()
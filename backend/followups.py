@@ -0,0 +1,45 @@
+"""
+Despachador de seguimientos programados (ver src/utils/calendar.py).
+
+Corre de forma continua junto a la API y los workers; se pueden levantar varios
+sobre el mismo Redis para repartir la carga. Se detiene con SIGINT o SIGTERM
+después de terminar el lote en curso.
+
+Uso:
+    python followups.py
+"""
+import asyncio
+import signal
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from src.db import close_db
+from src.utils.calendar import run_dispatcher
+from src.utils.loggers import flush_logs
+from src.utils.redis import redis_conn
+from src.utils.whatsapp import close_whatsapp_sender
+
+
+async def run() -> None:
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+    try:
+        await run_dispatcher(redis_conn, stop)
+    finally:
+        await close_whatsapp_sender()
+
+
+def main() -> None:
+    try:
+        asyncio.run(run())
+    finally:
+        close_db()
+        flush_logs()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+"""Configuración de gunicorn (se carga automáticamente desde el directorio de trabajo)."""
+import os
+import shutil
+
+
+def on_starting(server):
+    # Métricas multiproceso: el directorio debe empezar vacío en cada arranque
+    multiproc_dir = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+    if multiproc_dir:
+        shutil.rmtree(multiproc_dir, ignore_errors=True)
+        os.makedirs(multiproc_dir, exist_ok=True)
+
+
+def when_ready(server):
+    # Con --preload la app ya se importó en el master: cargar aquí el estado inmutable
+    # (SDKs, system prompt, tiktoken) para que los workers lo compartan copy-on-write.
+    # Los clientes de red se crean en cada worker después del fork (src/core/lifespan.py)
+    if server.cfg.preload_app:
+        from src.core.lifespan import preload_shared_state
+
+        preload_shared_state()
+
+
+def child_exit(server, worker):
+    # Descartar los gauges "live" del worker que terminó
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)
@@ -1,15 +1,18 @@
 import uvicorn
 from fastapi import FastAPI
 from src.api.v1 import router as api_v1_router
-from src.core.config import configure_cors
+from src.core.config import configure_cors, configure_request_id
+from src.core.lifespan import lifespan
 
 from dotenv import load_dotenv
 
 load_dotenv()
-app = FastAPI()
+# Clientes y estado pesado se crean en el lifespan de cada worker, no al importar
+app = FastAPI(lifespan=lifespan)
 
 # Apply CORS configuration
 configure_cors(app)
+configure_request_id(app)
 
 # Include routers
 app.include_router(api_v1_router)
@@ -0,0 +1,84 @@
+-- Historial de conversaciones con una fila por mensaje (CONVERSATION_STORAGE=messages).
+--
+-- Migración desde conversations.messages:
+--   1. Ejecutar este script (crea la tabla, la RPC y copia el historial existente).
+--   2. Desplegar con CONVERSATION_STORAGE=messages.
+--   3. Cuando ya no queden instancias con CONVERSATION_STORAGE=legacy, volver a
+--      ejecutar solo el bloque de copia. Cada fila copiada guarda su posición en el
+--      arreglo (source_position) y la copia solo toma las posiciones posteriores a
+--      la última copiada de cada número: recoge los mensajes que las instancias
+--      antiguas agregaron durante el despliegue, también en números ya copiados,
+--      sin duplicar los anteriores. Se puede repetir las veces que haga falta.
+--      Esos mensajes quedan después (por id) de los que las instancias nuevas
+--      escribieron en el mismo número durante el despliegue.
+-- Durante el despliegue no ejecutar la compactación (compact.py) ni reescrituras
+-- completas del historial en modo legacy: cambian las posiciones del arreglo.
+-- La columna conversations.messages no se borra; se puede vaciar cuando ya no
+-- haya instancias con CONVERSATION_STORAGE=legacy.
+
+create table if not exists conversation_messages (
+    id bigserial primary key,
+    phone_number text not null,
+    role text not null,
+    content text not null,
+    "timestamp" text,
+    created_at timestamptz not null default now(),
+    -- Posición (desde 1) en conversations.messages de las filas copiadas; null en las nuevas
+    source_position integer
+);
+
+alter table conversation_messages add column if not exists source_position integer;
+
+-- Lectura de los últimos N mensajes de un número sin recorrer todo el historial
+create index if not exists conversation_messages_phone_id_idx
+    on conversation_messages (phone_number, id desc);
+
+-- Última posición copiada de cada número
+create index if not exists conversation_messages_source_position_idx
+    on conversation_messages (phone_number, source_position)
+    where source_position is not null;
+
+-- La RPC hace upsert sobre conversations por número de teléfono
+create unique index if not exists conversations_phone_number_key
+    on conversations (phone_number);
+
+create or replace function append_conversation_message(
+    p_phone_number text,
+    p_role text,
+    p_content text,
+    p_timestamp text
+) returns bigint
+language plpgsql
+as $$
+declare
+    new_id bigint;
+begin
+    insert into conversation_messages (phone_number, role, content, "timestamp")
+    values (p_phone_number, p_role, p_content, p_timestamp)
+    returning id into new_id;
+
+    insert into conversations (phone_number, messages, created_at, modified_at)
+    values (p_phone_number, '[]'::jsonb, now(), now())
+    on conflict (phone_number) do update set modified_at = now();
+
+    return new_id;
+end;
+$$;
+
+-- Copia del historial existente, conservando el orden del arreglo. Solo copia las
+-- posiciones posteriores a la última ya copiada de cada número (ver paso 3)
+insert into conversation_messages (phone_number, role, content, "timestamp", created_at, source_position)
+select c.phone_number,
+       m.value ->> 'role',
+       m.value ->> 'content',
+       m.value ->> 'timestamp',
+       coalesce(c.created_at, now()),
+       m.position
+from conversations c
+cross join lateral jsonb_array_elements(coalesce(c.messages::jsonb, '[]'::jsonb)) with ordinality as m(value, position)
+where m.position > coalesce((
+    select max(cm.source_position)
+    from conversation_messages cm
+    where cm.phone_number = c.phone_number and cm.source_position is not null
+), 0)
+order by c.phone_number, m.position;
@@ -0,0 +1,5 @@
+-- Resumen acumulado de la conversación usado por el constructor de contexto.
+-- summary_until es el timestamp del último mensaje incluido en el resumen.
+
+alter table conversations add column if not exists summary text;
+alter table conversations add column if not exists summary_until text;
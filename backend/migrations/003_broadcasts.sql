@@ -0,0 +1,25 @@
+-- Difusiones salientes (POST /api/v1/broadcasts).
+-- El progreso en vivo y la reanudación usan Redis; estas tablas guardan el registro
+-- de cada difusión y el estado final de cada destinatario.
+
+create table if not exists broadcasts (
+    id text primary key,
+    template text not null,
+    total integer not null,
+    status text not null default 'pending',
+    created_at timestamptz not null default now()
+);
+
+create table if not exists broadcast_recipients (
+    broadcast_id text not null references broadcasts (id) on delete cascade,
+    phone_number text not null,
+    status text not null,
+    message_sid text,
+    error text,
+    updated_at timestamptz not null default now(),
+    -- Destino del upsert por lotes (on_conflict=broadcast_id,phone_number)
+    primary key (broadcast_id, phone_number)
+);
+
+create index if not exists broadcast_recipients_status_idx
+    on broadcast_recipients (broadcast_id, status);
@@ -0,0 +1,25 @@
+-- Archivo frío del historial (src/db/archive.py, compact.py).
+-- Cada fila es un bloque de mensajes consecutivos de un número, serializado y
+-- comprimido (codec json+zlib, base64). first_at/last_at son el rango de tiempo del
+-- bloque: las lecturas por rango solo descargan los bloques que se solapan.
+
+create table if not exists conversation_archive (
+    id bigserial primary key,
+    phone_number text not null,
+    chunk_hash text not null,
+    first_at timestamptz,
+    last_at timestamptz,
+    message_count integer not null,
+    codec text not null,
+    payload text not null,
+    created_at timestamptz not null default now(),
+    -- Repetir una compactación interrumpida no duplica bloques (upsert ignore-duplicates)
+    unique (phone_number, chunk_hash)
+);
+
+create index if not exists conversation_archive_phone_time_idx
+    on conversation_archive (phone_number, first_at, last_at);
+
+-- La compactación recorre las conversaciones por modified_at desde su punto de control
+create index if not exists conversations_modified_at_idx
+    on conversations (modified_at);
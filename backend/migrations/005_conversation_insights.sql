@@ -0,0 +1,19 @@
+-- Análisis por lotes de las conversaciones (enrich.py, src/utils/enrichment.py).
+-- Una fila por número; cada ejecución la reemplaza con upsert (on_conflict=phone_number).
+-- content_hash identifica lo que se envió al modelo: si no cambió, la conversación
+-- no se vuelve a analizar.
+
+create table if not exists conversation_insights (
+    phone_number text primary key,
+    summary text,
+    intent text,
+    tags jsonb not null default '[]'::jsonb,
+    lead_score integer,
+    model text,
+    message_count integer,
+    content_hash text not null,
+    analyzed_at timestamptz not null default now()
+);
+
+create index if not exists conversation_insights_intent_idx
+    on conversation_insights (intent, lead_score desc);
@@ -1,12 +1,20 @@
 from fastapi import APIRouter
 
+from .broadcast import router as broadcast_router
+from .conversations import router as conversations_router
+from .followups import router as followups_router
 from .health import router as health_router
+from .metrics import router as metrics_router
 from .webhook import router as webhook
 
 router = APIRouter()
 
 # Marked for removal
 router.include_router(health_router, tags=["Health"])
+router.include_router(metrics_router, tags=["Metrics"])
 router.include_router(webhook, tags=["whatspapp webhook"])
+router.include_router(broadcast_router, tags=["Broadcasts"])
+router.include_router(conversations_router, tags=["Conversations"])
+router.include_router(followups_router, tags=["Follow-ups"])
 
 
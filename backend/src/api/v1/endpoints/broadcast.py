@@ -0,0 +1,60 @@
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request
+
+from src.api.v1.endpoints.webhook import normalize_phone_number
+from src.core.security import require_admin_token
+from src.utils.broadcast import BroadcastError, create_broadcast, get_broadcast_status, run_broadcast
+from src.utils.loggers import logger
+from src.utils.redis import redis_conn
+
+# Envían mensajes a números arbitrarios con la cuenta de Twilio: siempre con token
+router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+NDJSON_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+
+async def _run_in_background(broadcast_id: str) -> None:
+    try:
+        await run_broadcast(redis_conn, broadcast_id)
+    except Exception as e:
+        logger.error(f"❌ La difusión {broadcast_id} se detuvo: {str(e)}", exc_info=True)
+
+
+@router.post("/broadcasts", status_code=202)
+async def create_broadcast_endpoint(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    template: str = Query(..., description="Mensaje con variables $columna tomadas de cada destinatario"),
+):
+    """
+    Crea y lanza una difusión. El cuerpo es la lista de destinatarios en CSV con
+    encabezado (text/csv) o NDJSON (application/x-ndjson), con una columna
+    phone_number/phone/number/to y cualquier otra columna usable en la plantilla.
+    """
+    content_type = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    fmt = "ndjson" if content_type in NDJSON_TYPES else "csv"
+    try:
+        result = await create_broadcast(redis_conn, request.stream(), fmt, template, normalize_phone_number)
+    except BroadcastError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    background_tasks.add_task(_run_in_background, result["broadcast_id"])
+    return {"status": "accepted", **result}
+
+
+@router.get("/broadcasts/{broadcast_id}")
+async def broadcast_status(broadcast_id: str):
+    try:
+        return await get_broadcast_status(redis_conn, broadcast_id)
+    except BroadcastError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/broadcasts/{broadcast_id}/resume", status_code=202)
+async def resume_broadcast(broadcast_id: str, background_tasks: BackgroundTasks):
+    """Reanuda una difusión interrumpida; los números ya intentados no se vuelven a enviar."""
+    try:
+        status = await get_broadcast_status(redis_conn, broadcast_id)
+    except BroadcastError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    background_tasks.add_task(_run_in_background, broadcast_id)
+    return {"status": "accepted", "pending": status["pending"]}
@@ -0,0 +1,200 @@
+import base64
+import binascii
+import json
+import os
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
+
+from src.api.v1.endpoints.webhook import normalize_phone_number
+from src.core.security import bearer_token
+from src.db import run_db
+from src.db.archive import archive_blocks, parse_timestamp
+from src.db.conversations import get_backing_store, list_conversations
+from src.utils.loggers import logger
+
+load_dotenv()
+
+CONVERSATIONS_PAGE_MAX = int(os.getenv("CONVERSATIONS_PAGE_MAX", "500"))
+# Conversaciones por consulta durante la exportación y bytes acumulados antes de enviar
+EXPORT_PAGE_SIZE = int(os.getenv("CONVERSATIONS_EXPORT_PAGE_SIZE", "100"))
+EXPORT_FLUSH_BYTES = 64 * 1024
+ARCHIVE_PAGE_BLOCKS = 10
+
+# Clave de orden de los mensajes sin timestamp al inicio del historial
+EARLIEST = datetime.min.replace(tzinfo=timezone.utc)
+
+router = APIRouter()
+
+
+# Los historiales contienen datos personales: CONVERSATIONS_API_TOKEN es obligatorio (sin él, 503)
+require_token = bearer_token("CONVERSATIONS_API_TOKEN")
+
+
+def encode_cursor(position: Dict[str, Any]) -> str:
+    return base64.urlsafe_b64encode(json.dumps(position, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: Optional[str]) -> Dict[str, Any]:
+    if not cursor:
+        return {}
+    try:
+        position = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    if not isinstance(position, dict):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+    return position
+
+
+def _utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None:
+        return None
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+async def iter_history(phone_number: str, include_archived: bool, since: Optional[datetime] = None,
+                       hot: Optional[List[Dict[str, Any]]] = None) -> AsyncIterator[Tuple[datetime, Dict[str, Any]]]:
+    """
+    Mensajes de un número en orden cronológico (archivo y después final caliente),
+    cada uno con su clave de orden: su timestamp, o el del mensaje anterior si no
+    trae uno o si es menor. Las claves nunca retroceden, lo que permite paginar por
+    (clave, posición entre los mensajes con la misma clave).
+    En memoria solo hay una página de bloques del archivo o el final caliente
+    (`hot` si ya se leyó junto con otras conversaciones).
+    """
+    async def chronological():
+        if include_archived:
+            # El rango de tiempo solo ubica el primer bloque: si los timestamps no son
+            # monótonos, un bloque posterior puede terminar antes de `since`
+            after_id = 0
+            if since:
+                first = await run_db(archive_blocks, phone_number, 0, since, None, 1)
+                after_id = first[0]["id"] - 1 if first else None
+            while after_id is not None and (
+                blocks := await run_db(archive_blocks, phone_number, after_id, None, None, ARCHIVE_PAGE_BLOCKS)
+            ):
+                for block in blocks:
+                    for message in block["messages"]:
+                        yield message
+                after_id = blocks[-1]["id"]
+        # El final caliente está acotado por la compactación (src/db/archive.py)
+        for message in hot if hot is not None else await run_db(get_backing_store().recent, phone_number):
+            yield message
+
+    previous = EARLIEST
+    async for message in chronological():
+        previous = max(previous, parse_timestamp(message.get("timestamp")) or EARLIEST)
+        yield previous, message
+
+
+@router.get("/conversations", dependencies=[Depends(require_token)])
+async def conversations_page(
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=CONVERSATIONS_PAGE_MAX),
+    modified_since: Optional[datetime] = None,
+    modified_until: Optional[datetime] = None,
+):
+    """Conversaciones ordenadas por número, paginadas con `next_cursor`."""
+    after = decode_cursor(cursor).get("p")
+    rows = await run_db(
+        list_conversations, after, limit + 1,
+        _utc(modified_since).isoformat() if modified_since else None,
+        _utc(modified_until).isoformat() if modified_until else None,
+    )
+    next_cursor = encode_cursor({"p": rows[limit - 1]["phone_number"]}) if len(rows) > limit else None
+    return {"conversations": rows[:limit], "next_cursor": next_cursor}
+
+
+@router.get("/conversations/export", dependencies=[Depends(require_token)])
+async def export_conversations(
+    modified_since: Optional[datetime] = None,
+    modified_until: Optional[datetime] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_archived: bool = False,
+):
+    """
+    Exporta los mensajes como NDJSON (una línea por mensaje con su phone_number).
+    Las conversaciones se leen por páginas de EXPORT_PAGE_SIZE (el final caliente
+    de cada página con `recent_many`, paginado por debajo del max-rows de PostgREST)
+    y se envían a medida que se leen: la memoria no depende del tamaño de la exportación.
+    """
+    since, until = _utc(since), _utc(until)
+    modified_range = (_utc(modified_since).isoformat() if modified_since else None,
+                      _utc(modified_until).isoformat() if modified_until else None)
+
+    async def lines() -> AsyncIterator[bytes]:
+        after, exported, buffer, size = None, 0, [], 0
+        try:
+            while page := await run_db(list_conversations, after, EXPORT_PAGE_SIZE, *modified_range):
+                # El final caliente de toda la página junto
+                hot = await run_db(get_backing_store().recent_many, [row["phone_number"] for row in page])
+                for row in page:
+                    history = iter_history(row["phone_number"], include_archived, since, hot.get(row["phone_number"], []))
+                    async for key, message in history:
+                        if until and key > until:
+                            break
+                        if since and key < since:
+                            continue
+                        line = json.dumps({"phone_number": row["phone_number"], **message}, ensure_ascii=False)
+                        buffer.append(line)
+                        size += len(line) + 1
+                        exported += 1
+                        if size >= EXPORT_FLUSH_BYTES:
+                            yield ("\n".join(buffer) + "\n").encode()
+                            buffer, size = [], 0
+                after = page[-1]["phone_number"]
+            if buffer:
+                yield ("\n".join(buffer) + "\n").encode()
+            logger.info(f"📤 Exportación completada: {exported} mensajes")
+        except Exception as e:
+            # La respuesta ya empezó: cortar la conexión para que el cliente note la exportación incompleta
+            logger.error(f"❌ Exportación interrumpida tras {exported} mensajes: {str(e)}", exc_info=True)
+            raise
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="conversations.ndjson"'},
+    )
+
+
+@router.get("/conversations/{phone_number}/messages", dependencies=[Depends(require_token)])
+async def conversation_messages(
+    phone_number: str,
+    cursor: Optional[str] = None,
+    limit: int = Query(50, ge=1, le=CONVERSATIONS_PAGE_MAX),
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    include_archived: bool = False,
+):
+    """
+    Mensajes de una conversación en orden cronológico, paginados con `next_cursor`.
+    Con `include_archived` también se leen los mensajes compactados al archivo.
+    """
+    phone_number = normalize_phone_number(phone_number)
+    position = decode_cursor(cursor)
+    after = parse_timestamp(position.get("t")) or EARLIEST
+    skip = int(position.get("n", 0))
+    since, until = _utc(since), _utc(until)
+
+    messages, next_cursor = [], None
+    last_key, index = None, 0
+    async for key, message in iter_history(phone_number, include_archived, max(since or EARLIEST, after)):
+        # Posición del mensaje entre los que comparten su clave de orden
+        index = index + 1 if key == last_key else 0
+        last_key = key
+        if until and key > until:
+            break
+        if key < after or (key == after and index < skip) or (since and key < since):
+            continue
+        if len(messages) == limit:
+            next_cursor = encode_cursor({"t": key.isoformat(), "n": index})
+            break
+        messages.append(message)
+
+    return {"phone_number": phone_number, "messages": messages, "next_cursor": next_cursor}
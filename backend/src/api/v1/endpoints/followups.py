@@ -0,0 +1,52 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from fastapi import APIRouter, Body, Depends, HTTPException
+
+from src.api.v1.endpoints.webhook import normalize_phone_number
+from src.core.security import require_admin_token
+from src.utils.calendar import FollowupError, cancel_followup, get_followup, localize, now_local, schedule_followup
+from src.utils.redis import redis_conn
+
+# Programan y cancelan mensajes salientes: el mismo token que las difusiones
+router = APIRouter(dependencies=[Depends(require_admin_token)])
+
+
+@router.post("/followups", status_code=201)
+async def create_followup(
+    phone_number: str = Body(...),
+    message: str = Body(...),
+    due_at: Optional[datetime] = Body(None, description="Hora de envío; sin zona se interpreta en `timezone`"),
+    delay_seconds: Optional[int] = Body(None, ge=0, description="Alternativa a due_at: segundos desde ahora"),
+    timezone: Optional[str] = Body(None, description="Zona IANA del cliente (America/Mexico_City por defecto)"),
+    followup_id: Optional[str] = Body(None, description="Id propio; reprogramar el mismo id lo reemplaza"),
+):
+    """Programa un mensaje de seguimiento para un número."""
+    if not message.strip():
+        raise HTTPException(status_code=400, detail="El mensaje está vacío")
+    if (due_at is None) == (delay_seconds is None):
+        raise HTTPException(status_code=400, detail="Indicar due_at o delay_seconds")
+    try:
+        when = localize(due_at, timezone) if due_at else now_local(timezone) + timedelta(seconds=delay_seconds)
+        followup_id = await schedule_followup(
+            redis_conn, normalize_phone_number(phone_number), message.strip(), when, followup_id
+        )
+    except FollowupError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"followup_id": followup_id, "due_at": when.isoformat()}
+
+
+@router.get("/followups/{followup_id}")
+async def followup_status(followup_id: str):
+    try:
+        return await get_followup(redis_conn, followup_id)
+    except FollowupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.delete("/followups/{followup_id}")
+async def delete_followup(followup_id: str):
+    """Cancela un seguimiento que todavía no se ha enviado."""
+    if not await cancel_followup(redis_conn, followup_id):
+        raise HTTPException(status_code=404, detail=f"No existe el seguimiento pendiente {followup_id}")
+    return {"status": "cancelled", "followup_id": followup_id}
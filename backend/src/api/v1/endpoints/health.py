@@ -1,6 +1,15 @@
 import logging
 
 from fastapi import APIRouter, status
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.conversation_cache import get_cache_stats
+from src.utils.circuit_breaker import get_breaker_states
+from src.utils.debounce import get_debounce_stats
+from src.utils.readiness import get_readiness
+from src.utils.redis import redis_conn
+from src.utils.response_cache import get_response_cache_stats
 
 logger = logging.getLogger(__name__)
 
@@ -9,4 +18,33 @@ router = APIRouter()
 
 @router.get("/health")
 async def health_check():
-    return {"status": status.HTTP_200_OK}
\ No newline at end of file
+    return {"status": status.HTTP_200_OK}
+
+
+@router.get("/health/ready")
+async def readiness_check():
+    """Sondeos de dependencias en caché y circuit breakers; 503 si falta una dependencia obligatoria."""
+    readiness = await get_readiness()
+    code = status.HTTP_503_SERVICE_UNAVAILABLE if readiness["status"] == "unavailable" else status.HTTP_200_OK
+    return JSONResponse(readiness, status_code=code)
+
+
+@router.get("/health/breakers")
+async def breaker_states():
+    return get_breaker_states()
+
+
+# El cliente de Redis es síncrono: las lecturas de estadísticas van al pool de hilos
+@router.get("/health/conversation-cache")
+async def conversation_cache_stats():
+    return await run_in_threadpool(get_cache_stats, redis_conn)
+
+
+@router.get("/health/debounce")
+async def debounce_stats():
+    return await run_in_threadpool(get_debounce_stats, redis_conn)
+
+
+@router.get("/health/llm-cache")
+async def llm_cache_stats():
+    return await run_in_threadpool(get_response_cache_stats, redis_conn)
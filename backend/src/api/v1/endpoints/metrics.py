@@ -0,0 +1,18 @@
+import logging
+
+from fastapi import APIRouter, Response
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.metrics import render_metrics
+from src.utils.redis import redis_conn
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def metrics():
+    # Leer los archivos de métricas y Redis fuera del event loop
+    content, content_type = await run_in_threadpool(render_metrics, redis_conn)
+    return Response(content=content, media_type=content_type)
\ No newline at end of file
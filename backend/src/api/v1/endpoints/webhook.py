@@ -1,52 +1,76 @@
-from fastapi import APIRouter, Request, HTTPException
-from datetime import datetime, timezone, timedelta
+from fastapi import APIRouter, BackgroundTasks, Request, HTTPException
+from starlette.concurrency import run_in_threadpool
+from functools import lru_cache
 from typing import List, Dict, Optional
 import os
 import json
+import time
 from pathlib import Path
 from dotenv import load_dotenv
-from src.db import get_supabase
-from src.utils.loggers import logger
-from src.utils.model import gpt_without_functions
-from src.utils.whatsapp import respond as send_whatsapp_message
+from src.db import run_db
+from src.db.archive import load_full_history
+from src.db.conversations import get_conversation_store
+from src.utils.admission import BUSY_MESSAGE, RATE_LIMITED_MESSAGE, allow_sender, claim_notice, should_shed, track_in_flight
+from src.utils.calendar import now_local
+from src.utils.circuit_breaker import CircuitOpenError
+from src.utils.context import (
+    CONTEXT_MAX_MESSAGES,
+    SUMMARY_LOOKBACK_MESSAGES,
+    SUMMARY_MIN_NEW_MESSAGES,
+    build_context,
+    unsummarized,
+)
+from src.utils.debounce import DEBOUNCE_ENABLED, collect_burst
+from src.utils.media import MEDIA_ENABLED, attach_media, extract_media
+from src.utils.idempotency import claim_message, release_message
+from src.utils.loggers import log_payload, logger
+from src.utils.metrics import track_stage
+from src.utils.model import FALLBACK_RESPONSES, gpt_stream_chunks, gpt_without_functions, summarise_conversation
+from src.utils.ordering import conversation_lease
+from src.utils.pipeline_state import (
+    RESPONSE,
+    RESPONSE_SAVED,
+    SENT,
+    SENT_CHUNKS,
+    USER_MESSAGE,
+    PipelineCheckpoint,
+    history_before,
+)
+from src.utils.queue import enqueue_whatsapp_message, queue_enabled
+from src.utils.redis import redis_conn
+from src.utils.response_cache import LLM_CACHE_ENABLED, ResponseCache, is_context_free, prompt_version
+from src.utils.whatsapp import send_message as send_whatsapp_message
 
 # Cargar variables de entorno
 load_dotenv()
 
+# Enviar la respuesta del modelo por fragmentos a medida que se genera
+LLM_STREAMING_ENABLED = os.getenv("LLM_STREAMING_ENABLED", "false").lower() in ("1", "true", "yes")
+
 router = APIRouter()
 
 def get_current_timestamp() -> str:
-    """Obtiene la hora actual en la zona horaria de México (UTC-6 o UTC-5)."""
-    # Obtener la hora UTC
-    utc_now = datetime.now(timezone.utc)
-    
-    # Ajustar a la zona horaria de México (UTC-6)
-    mexico_offset = timedelta(hours=-6)
-    
-    # Verificar si estamos en horario de verano (aproximado)
-    # En México, el horario de verano es de abril a octubre
-    if 4 <= utc_now.month <= 10:
-        mexico_offset = timedelta(hours=-5)  # UTC-5 en horario de verano
-    
-    # Aplicar el desplazamiento
-    mexico_time = utc_now + mexico_offset
-    
-    return mexico_time.isoformat()
+    """Obtiene la hora actual en la zona horaria del negocio (America/Mexico_City por defecto)."""
+    return now_local().isoformat()
 
-async def get_conversation_history(phone_number: str) -> List[Dict[str, str]]:
+async def read_conversation_history(phone_number: str, limit: Optional[int] = None,
+                                    include_archived: bool = False) -> List[Dict[str, str]]:
     """
-    Obtiene el historial de mensajes desde Supabase.
+    Obtiene el historial de mensajes desde Supabase; los errores se propagan.
+    Con `limit` solo se leen los últimos N mensajes. Los mensajes compactados al
+    archivo frío solo se incluyen con `include_archived` (lectura más costosa).
     """
+    if include_archived:
+        messages = await run_db(load_full_history, phone_number)
+        return messages[-limit:] if limit else messages
+    with track_stage("history_read"):
+        return await run_db(get_conversation_store().recent, phone_number, limit)
+
+async def get_conversation_history(phone_number: str, limit: Optional[int] = None,
+                                   include_archived: bool = False) -> List[Dict[str, str]]:
+    """Como `read_conversation_history`, pero devuelve una lista vacía si no se puede leer."""
     try:
-        supabase = get_supabase()
-        response = supabase.table('conversations') \
-                        .select('messages') \
-                        .eq('phone_number', phone_number) \
-                        .execute()
-        
-        if response.data and len(response.data) > 0:
-            return response.data[0].get('messages', [])
-        return []
+        return await read_conversation_history(phone_number, limit, include_archived)
     except Exception as e:
         logger.error(f"Error al obtener historial de Supabase: {str(e)}")
         return []
@@ -54,69 +78,115 @@ async def get_conversation_history(phone_number: str) -> List[Dict[str, str]]:
 async def save_conversation_history(phone_number: str, messages: List[Dict[str, str]]):
     """
     Guarda el historial de mensajes en Supabase.
-    Si ya existe una conversación para el número, la actualiza.
+    Si ya existe una conversación para el número, la reemplaza.
     Si no existe, crea una nueva.
     """
     try:
         logger.info(f"🔧 INICIANDO GUARDADO DE MENSAJES PARA {phone_number}")
         logger.info(f"📝 Cantidad de mensajes a guardar: {len(messages)}")
-        
-        # Obtener el cliente de Supabase
-        supabase = get_supabase()
-        
-        # Buscar si ya existe una conversación para este número
-        existing = supabase.table('conversations') \
-            .select('*') \
-            .eq('phone_number', phone_number) \
-            .execute()
-            
-        if existing.data:
-            # Actualizar conversación existente
-            logger.info(f"🔄 Actualizando conversación existente para {phone_number}")
-            result = supabase.table('conversations') \
-                .update({
-                    'messages': messages,
-                    'modified_at': 'now()'  # Usando la función now() de PostgreSQL
-                }) \
-                .eq('phone_number', phone_number) \
-                .execute()
-        else:
-            # Crear nueva conversación
-            logger.info(f"🆕 Creando nueva conversación para {phone_number}")
-            result = supabase.table('conversations') \
-                .insert({
-                    'phone_number': phone_number,
-                    'messages': messages,
-                    'created_at': 'now()',
-                    'modified_at': 'now()'
-                }) \
-                .execute()
-                
+        await run_db(get_conversation_store().replace, phone_number, messages)
         logger.info(f"✅ Mensajes guardados exitosamente para {phone_number}")
-        return result
-        
     except Exception as e:
         logger.error(f"❌ Error al guardar en Supabase: {str(e)}")
         raise
 
-async def add_message_to_conversation(phone_number: str, role: str, message: str) -> List[Dict[str, str]]:
+async def add_message_to_conversation(phone_number: str, role: str, message: str) -> Dict[str, str]:
     """
     Agrega un nuevo mensaje a la conversación existente o crea una nueva si no existe.
+    Solo escribe el mensaje nuevo; no reescribe el historial completo.
     """
     try:
-        messages = await get_conversation_history(phone_number)
         new_message = {
             "role": role,
             "content": message,
             "timestamp": get_current_timestamp()
         }
-        messages.append(new_message)
-        await save_conversation_history(phone_number, messages)
-        return messages
+        with track_stage("history_append"):
+            await run_db(get_conversation_store().append, phone_number, new_message)
+        return new_message
     except Exception as e:
         logger.error(f"Error al agregar mensaje a la conversación: {str(e)}")
         raise
 
+async def get_conversation_summary(phone_number: str) -> Dict[str, Optional[str]]:
+    """Obtiene el resumen acumulado de la conversación (vacío si no se puede leer)."""
+    try:
+        return await run_db(get_conversation_store().get_summary, phone_number)
+    except Exception as e:
+        logger.error(f"Error al obtener el resumen de la conversación: {str(e)}")
+        return {"summary": None, "summary_until": None}
+
+def messages_leaving_context(recent: List[Dict[str, str]], summary: Optional[str]) -> List[Dict[str, str]]:
+    """
+    Mensajes que ya no entran en el contexto del siguiente turno: los de `recent`
+    (el historial leído al inicio del turno más los mensajes nuevos) anteriores a la
+    ventana de CONTEXT_MAX_MESSAGES y los de la ventana que no caben en el
+    presupuesto de tokens, en orden cronológico.
+    """
+    window = recent[-CONTEXT_MAX_MESSAGES:]
+    _, overflow = build_context(get_system_prompt(), window, summary)
+    return recent[:-CONTEXT_MAX_MESSAGES] + overflow
+
+async def update_rolling_summary(phone_number: str, summary_state: Dict[str, Optional[str]], overflow: List[Dict[str, str]]):
+    """
+    Incorpora al resumen los mensajes que quedaron fuera del contexto (por la
+    ventana de mensajes o por el presupuesto de tokens).
+    Solo se resumen los mensajes nuevos, y únicamente cuando se acumulan suficientes.
+    """
+    pending = unsummarized(overflow, summary_state.get("summary_until"))
+    if len(pending) < SUMMARY_MIN_NEW_MESSAGES:
+        return
+    try:
+        summary = await summarise_conversation(pending, previous_summary=summary_state.get("summary"))
+        if summary in FALLBACK_RESPONSES:
+            return
+        await run_db(get_conversation_store().save_summary, phone_number, summary, pending[-1].get("timestamp"))
+        logger.info(f"📝 Resumen actualizado para {phone_number} con {len(pending)} mensajes nuevos")
+    except Exception as e:
+        logger.error(f"Error al actualizar el resumen de la conversación: {str(e)}")
+
+async def get_cached_response(message: str) -> Optional[str]:
+    """Busca una respuesta previa para una pregunta igual o casi igual."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    try:
+        return await run_in_threadpool(get_response_cache().lookup, message)
+    except Exception as e:
+        logger.warning(f"⚠️ Error consultando la caché de respuestas: {str(e)}")
+        return None
+
+async def store_cached_response(message: str, response: str, latency_ms: float):
+    """Guarda la respuesta del modelo en la caché (nunca las respuestas de respaldo)."""
+    if not LLM_CACHE_ENABLED or response in FALLBACK_RESPONSES:
+        return
+    try:
+        await run_in_threadpool(get_response_cache().store, message, response, latency_ms)
+    except Exception as e:
+        logger.warning(f"⚠️ Error guardando en la caché de respuestas: {str(e)}")
+
+async def stream_response_to_whatsapp(phone_number: str, messages: List[Dict[str, str]],
+                                      checkpoint: Optional[PipelineCheckpoint] = None) -> str:
+    """
+    Envía la respuesta del modelo por WhatsApp fragmento a fragmento mientras se genera.
+    Cada fragmento enviado se registra en `checkpoint`: si el envío se corta, el
+    reintento no vuelve a mandar lo que el usuario ya recibió.
+
+    Returns:
+        str: La respuesta completa, para guardarla una sola vez en el historial
+    """
+    chunks = []
+    async for chunk in gpt_stream_chunks(
+        model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+        messages=messages
+    ):
+        if not chunks:
+            logger.info("⚡ Primer fragmento listo, enviando por WhatsApp")
+        await send_whatsapp_message(to_number=phone_number, message=chunk)
+        chunks.append(chunk)
+        if checkpoint is not None:
+            await checkpoint.mark(SENT_CHUNKS, chunks)
+    return "\n\n".join(chunks)
+
 def normalize_phone_number(phone_number: str) -> str:
     """Normaliza el número de teléfono al formato internacional."""
     # Eliminar cualquier carácter que no sea dígito
@@ -147,38 +217,231 @@ def load_system_prompt() -> str:
         # Mensaje de respaldo en caso de error
         return "Eres Danil, un asistente virtual amigable y profesional que trabaja para Danil AI. Tu objetivo es ayudar a los usuarios con sus consultas de manera útil y profesional. Responde siempre en el mismo idioma que el mensaje del usuario."
 
-# Obtener el system prompt
-SYSTEM_PROMPT = {
-    "role": "system",
-    "content": load_system_prompt()
-}
+# Obtener el system prompt: se lee una sola vez, en el arranque (src/core/lifespan.py)
+# o con la primera petición, nunca al importar el módulo
+@lru_cache(maxsize=1)
+def get_system_prompt() -> Dict[str, str]:
+    return {
+        "role": "system",
+        "content": load_system_prompt()
+    }
+
+_response_cache: Optional[ResponseCache] = None
+
+def get_response_cache() -> ResponseCache:
+    """Caché de respuestas del modelo, ligada a la versión del system prompt."""
+    global _response_cache
+    if _response_cache is None:
+        _response_cache = ResponseCache(redis_conn, prompt_version(get_system_prompt()["content"]))
+    return _response_cache
+
+async def persist_message(phone_number: str, role: str, message: str, history_available: bool = True) -> Dict[str, str]:
+    """
+    Guarda un mensaje del pipeline. Con el circuito de Supabase abierto, o si el historial
+    ya no se pudo leer, el mensaje no se guarda y la respuesta sigue adelante.
+    """
+    try:
+        return await add_message_to_conversation(phone_number=phone_number, role=role, message=message)
+    except Exception as e:
+        if history_available and not isinstance(e, CircuitOpenError):
+            raise
+        logger.warning(f"⚠️ Mensaje de {role} sin guardar para {phone_number}: {str(e)}")
+        return {"role": role, "content": message, "timestamp": get_current_timestamp()}
 
 # Mensaje de bienvenida
 WELCOME_MESSAGE = "¡Hola! Soy Danil, tu asistente virtual de Danil AI. ¿En qué puedo ayudarte hoy? 😊"
 
+async def process_whatsapp_message(normalized_number: str, body: str,
+                                   pipeline_id: Optional[str] = None) -> Dict[str, object]:
+    """
+    Pipeline completo para un mensaje entrante: historial, modelo y respuesta por WhatsApp.
+    Se ejecuta dentro de la petición (modo inline) o en un worker de RQ (modo queue).
+    Con `pipeline_id` (id del trabajo o MessageSid) los pasos hechos se registran y
+    un reintento continúa desde el primer paso pendiente.
+    """
+    logger.debug(f"💬 Mensaje recibido: {body}")
+    checkpoint = PipelineCheckpoint(redis_conn, pipeline_id)
+    done = await checkpoint.load()
+
+    # Obtener el historial de la conversación. Si Supabase no responde (o su circuito
+    # está abierto) se contesta sin historial: sin bienvenida y sin guardar mensajes.
+    # Se leen también SUMMARY_LOOKBACK_MESSAGES anteriores a la ventana del contexto
+    # para el resumen del final del turno (la lectura cabe en la caché de historial)
+    history_available = True
+    try:
+        recent_history = await read_conversation_history(
+            normalized_number, limit=CONTEXT_MAX_MESSAGES + SUMMARY_LOOKBACK_MESSAGES
+        )
+        logger.debug(f"📚 Historial de conversación obtenido: {len(recent_history)} mensajes")
+    except Exception as e:
+        logger.error(f"❌ Historial no disponible, se responde sin historial: {str(e)}")
+        recent_history = []
+        history_available = False
+    conversation_history = recent_history[-CONTEXT_MAX_MESSAGES:]
+
+    # Si es un nuevo usuario, enviar mensaje de bienvenida
+    if not conversation_history and history_available:
+        logger.info("👤 Nuevo usuario detectado, enviando mensaje de bienvenida")
+        try:
+            await add_message_to_conversation(
+                phone_number=normalized_number,
+                role="assistant",
+                message=WELCOME_MESSAGE
+            )
+            try:
+                await send_whatsapp_message(
+                    to_number=normalized_number,
+                    message=WELCOME_MESSAGE
+                )
+                logger.info("✅ Mensaje de bienvenida enviado con éxito")
+            except Exception as e:
+                logger.error(f"⚠️ No se pudo enviar el mensaje de WhatsApp: {str(e)}")
+                # Continuar aunque falle el envío del mensaje
+
+            return {
+                "status": "success",
+                "message": "Welcome message processed",
+                "is_new_user": True
+            }
+        except Exception as e:
+            logger.error(f"❌ Error al procesar nuevo usuario: {str(e)}", exc_info=True)
+            # Continuar con el flujo normal en lugar de fallar
+            pass
+
+    # Agregar el mensaje del usuario a la conversación (una sola vez aunque se reintente)
+    if USER_MESSAGE in done:
+        user_message = done[USER_MESSAGE]
+        recent_history = history_before(recent_history, user_message)
+        conversation_history = recent_history[-CONTEXT_MAX_MESSAGES:]
+    else:
+        user_message = await persist_message(normalized_number, "user", body, history_available)
+        await checkpoint.mark(USER_MESSAGE, user_message)
+
+    # Preparar mensajes para el modelo dentro del presupuesto de tokens.
+    # El resumen solo se lee si hay mensajes que no caben o historial más antiguo sin leer.
+    context_history = conversation_history + [user_message]
+    summary_state = None
+    messages_for_model, overflow = build_context(get_system_prompt(), context_history)
+    if history_available and (overflow or len(conversation_history) >= CONTEXT_MAX_MESSAGES):
+        summary_state = await get_conversation_summary(normalized_number)
+        messages_for_model, overflow = build_context(get_system_prompt(), context_history, summary_state["summary"])
+    logger.debug(f"🧮 Contexto: {len(messages_for_model)} mensajes, {len(overflow)} fuera del presupuesto")
+
+    # Obtener respuesta del modelo (o de la caché de respuestas). La caché se comparte
+    # entre usuarios: solo se usa si el contexto no tiene nada propio de la conversación
+    bot_response = done.get(RESPONSE)
+    already_sent = bool(done.get(SENT))
+    if bot_response is None and done.get(SENT_CHUNKS):
+        # Un envío por fragmentos se cortó: lo que el usuario ya recibió queda como respuesta
+        logger.warning(f"⚠️ Respuesta por fragmentos incompleta para {normalized_number}, no se reenvía")
+        bot_response = "\n\n".join(done[SENT_CHUNKS])
+        already_sent = True
+        await checkpoint.mark(RESPONSE, bot_response)
+        await checkpoint.mark(SENT)
+    if bot_response is None:
+        cacheable = is_context_free(messages_for_model, (WELCOME_MESSAGE,))
+        bot_response = await get_cached_response(body) if cacheable else None
+        if bot_response is None:
+            started = time.perf_counter()
+            if LLM_STREAMING_ENABLED:
+                # Cada fragmento se envía en cuanto está completo; el historial guarda el texto entero
+                with track_stage("llm_stream"):
+                    bot_response = await stream_response_to_whatsapp(normalized_number, messages_for_model, checkpoint)
+                already_sent = True
+            else:
+                bot_response = await gpt_without_functions(
+                    model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
+                    messages=messages_for_model
+                )
+            if cacheable:
+                await store_cached_response(body, bot_response, (time.perf_counter() - started) * 1000)
+        await checkpoint.mark(RESPONSE, bot_response)
+        if already_sent:
+            await checkpoint.mark(SENT)
+
+    # Agregar la respuesta del bot a la conversación
+    if done.get(RESPONSE_SAVED):
+        assistant_message = {"role": "assistant", "content": bot_response}
+    else:
+        assistant_message = await persist_message(normalized_number, "assistant", bot_response, history_available)
+        await checkpoint.mark(RESPONSE_SAVED)
+
+    # Enviar respuesta por WhatsApp
+    if not already_sent:
+        await send_whatsapp_message(
+            to_number=normalized_number,
+            message=bot_response
+        )
+        await checkpoint.mark(SENT)
+
+    # Actualizar el resumen después de responder, para no sumar latencia a la respuesta.
+    # Con la ventana llena también se resumen los mensajes que acaban de salir de ella
+    # (sin otra lectura): en conversaciones de mensajes cortos nunca se llega al presupuesto
+    if summary_state is not None and len(conversation_history) >= CONTEXT_MAX_MESSAGES:
+        overflow = messages_leaving_context(
+            recent_history + [user_message, assistant_message], summary_state["summary"]
+        )
+    if overflow and summary_state is not None:
+        await update_rolling_summary(normalized_number, summary_state, overflow)
+
+    await checkpoint.clear()
+    return {"status": "success", "message": "Message processed successfully"}
+
+async def handle_inbound_message(normalized_number: str, body: str,
+                                 media: Optional[List[Dict[str, str]]] = None,
+                                 debounce: bool = True, pipeline_id: Optional[str] = None) -> Dict[str, object]:
+    """
+    Punto de entrada del pipeline para un mensaje entrante.
+    Los adjuntos se descargan y se convierten en texto antes de agrupar el mensaje.
+    Con la ventana de agrupación activa, solo la última llamada de una ráfaga
+    procesa los mensajes combinados; el resto termina sin llamar al modelo.
+    `debounce=False` indica una ráfaga ya agrupada (modo cola). `pipeline_id` identifica
+    el mensaje entre reintentos (id del trabajo de RQ o MessageSid).
+    El lease por conversación evita que dos workers procesen el mismo número a la vez.
+    """
+    with track_in_flight():
+        if media:
+            body = await attach_media(redis_conn, body, media)
+            if not body:
+                return {"status": "success", "message": "Media could not be processed"}
+        if DEBOUNCE_ENABLED and debounce:
+            body = await collect_burst(redis_conn, normalized_number, body)
+            if body is None:
+                return {"status": "success", "message": "Message merged into pending burst"}
+        async with conversation_lease(redis_conn, normalized_number):
+            return await process_whatsapp_message(normalized_number, body, pipeline_id)
+
+async def send_admission_notice(normalized_number: str, message: str):
+    """Envía el aviso de ocupado o de límite, como mucho uno por número en ADMISSION_NOTICE_SECONDS."""
+    try:
+        if await claim_notice(redis_conn, normalized_number):
+            await send_whatsapp_message(to_number=normalized_number, message=message)
+    except Exception as e:
+        logger.error(f"⚠️ No se pudo enviar el aviso de admisión a {normalized_number}: {str(e)}")
+
 @router.post("/whatsapp-endpoint")
-async def whatsapp_endpoint(request: Request):
+async def whatsapp_endpoint(request: Request, background_tasks: BackgroundTasks):
+    started = time.perf_counter()
     try:
-        # Log de inicio de la solicitud
-        logger.info("="*50)
-        logger.info("🔔 NUEVA SOLICITUD RECIBIDA")
-        logger.info(f"URL: {request.url}")
-        logger.info(f"Método: {request.method}")
-        logger.info(f"Headers: {dict(request.headers)}")
+        # Headers completos solo para una muestra de las peticiones
+        log_payload("Headers de la solicitud", dict(request.headers))
         
         # Parsear los datos del formulario
         try:
-            form_data = await request.form()
-            logger.info(f"Datos del formulario: {dict(form_data)}")
+            with track_stage("form_parse"):
+                form_data = await request.form()
+            log_payload("Datos del formulario", dict(form_data))
             
             from_number = form_data.get('From', '')
             body = form_data.get('Body', '').strip()
+            media = extract_media(form_data) if MEDIA_ENABLED else []
             
             if not from_number:
                 logger.error("❌ Error: Falta el campo 'From' en la solicitud")
                 raise HTTPException(status_code=400, detail="Missing 'From' field")
                 
-            if not body:
+            # Una imagen o nota de voz sin texto llega con Body vacío
+            if not body and not media:
                 logger.error("❌ Error: Falta el campo 'Body' en la solicitud")
                 raise HTTPException(status_code=400, detail="Missing 'Body' field")
                 
@@ -186,91 +449,47 @@ async def whatsapp_endpoint(request: Request):
             logger.error(f"❌ Error al procesar los datos del formulario: {str(e)}", exc_info=True)
             raise HTTPException(status_code=400, detail=f"Error processing form data: {str(e)}")
         
+        # Reintentos de Twilio del mismo mensaje: se confirman sin volver a procesarlos
+        message_sid = form_data.get('MessageSid')
+        if not await claim_message(redis_conn, message_sid):
+            logger.info(f"🔁 Reintento de Twilio ignorado (MessageSid {message_sid})")
+            return {"status": "success", "message": "Duplicate message ignored"}
+
         # Normalizar el número de teléfono
         try:
             normalized_number = normalize_phone_number(from_number)
-            logger.info(f"📞 Número normalizado: {normalized_number}")
+            logger.info(f"🔔 Mensaje entrante de {normalized_number} ({len(body)} caracteres, {len(media)} adjuntos)")
         except Exception as e:
             logger.error(f"❌ Error al normalizar el número de teléfono: {str(e)}")
             raise HTTPException(status_code=400, detail="Invalid phone number format")
+
+        # Control de admisión: los mensajes rechazados no se reintentan (Twilio recibe 200)
+        if not await allow_sender(redis_conn, normalized_number):
+            logger.warning(f"🚦 {normalized_number} superó su límite de mensajes, mensaje descartado")
+            background_tasks.add_task(send_admission_notice, normalized_number, RATE_LIMITED_MESSAGE)
+            return {"status": "rejected", "message": "Rate limited"}
+        if await should_shed(redis_conn):
+            logger.warning(f"🚦 Sistema saturado, mensaje de {normalized_number} descartado con aviso de ocupado")
+            background_tasks.add_task(send_admission_notice, normalized_number, BUSY_MESSAGE)
+            return {"status": "rejected", "message": "Server busy"}
         
-        logger.info(f"💬 Mensaje recibido: {body}")
-        
-        # Obtener el historial de la conversación
         try:
-            conversation_history = await get_conversation_history(normalized_number)
-            logger.info(f"📚 Historial de conversación obtenido: {len(conversation_history)} mensajes")
-        except Exception as e:
-            logger.error(f"❌ Error al obtener el historial de la conversación: {str(e)}", exc_info=True)
-            # Continuar con una lista vacía en caso de error
-            conversation_history = []
-        
-        # Si es un nuevo usuario, enviar mensaje de bienvenida
-        if not conversation_history:
-            logger.info("👤 Nuevo usuario detectado, enviando mensaje de bienvenida")
-            try:
-                await add_message_to_conversation(
-                    phone_number=normalized_number,
-                    role="assistant",
-                    message=WELCOME_MESSAGE
-                )
-                try:
-                    send_whatsapp_message(
-                        to_number=normalized_number,
-                        message=WELCOME_MESSAGE
-                    )
-                    logger.info("✅ Mensaje de bienvenida enviado con éxito")
-                except Exception as e:
-                    logger.error(f"⚠️ No se pudo enviar el mensaje de WhatsApp: {str(e)}")
-                    # Continuar aunque falle el envío del mensaje
-                    
-                return {
-                    "status": "success", 
-                    "message": "Welcome message processed",
-                    "is_new_user": True
-                }
-            except Exception as e:
-                logger.error(f"❌ Error al procesar nuevo usuario: {str(e)}", exc_info=True)
-                # Continuar con el flujo normal en lugar de fallar
-                pass
-        
-        # Agregar el mensaje del usuario a la conversación
-        await add_message_to_conversation(
-            phone_number=normalized_number,
-            role="user",
-            message=body
-        )
-        
-        # Preparar mensajes para el modelo, comenzando con el system prompt
-        messages_for_model = [SYSTEM_PROMPT]
-        
-        # Agregar el historial de la conversación (últimos 9 mensajes para no exceder el límite de tokens)
-        for msg in conversation_history[-9:]:
-            messages_for_model.append({
-                "role": msg["role"],
-                "content": msg["content"]
-            })
-        
-        # Obtener respuesta del modelo
-        bot_response = await gpt_without_functions(
-            model=os.getenv("LLM_MODEL", "gpt-3.5-turbo"),
-            messages=messages_for_model
-        )
-        
-        # Agregar la respuesta del bot a la conversación
-        await add_message_to_conversation(
-            phone_number=normalized_number,
-            role="assistant",
-            message=bot_response
-        )
-        
-        # Enviar respuesta por WhatsApp (llamada síncrona sin await)
-        send_whatsapp_message(
-            to_number=normalized_number,
-            message=bot_response
-        )
-        
-        return {"status": "success", "message": "Message processed successfully"}
+            # Modo asíncrono: encolar el trabajo y responder a Twilio de inmediato
+            if queue_enabled():
+                job_id = await run_in_threadpool(enqueue_whatsapp_message, normalized_number, body, media)
+                return {"status": "accepted", "message": "Message queued", "job_id": job_id}
+
+            # Con la ventana de agrupación activa o con adjuntos (descargas de hasta
+            # MEDIA_DOWNLOAD_TIMEOUT_SECONDS) se responde a Twilio antes de procesar
+            if DEBOUNCE_ENABLED or media:
+                background_tasks.add_task(handle_inbound_message, normalized_number, body, media, pipeline_id=message_sid)
+                return {"status": "accepted", "message": "Message scheduled"}
+
+            return await handle_inbound_message(normalized_number, body, pipeline_id=message_sid)
+        except Exception:
+            # Si el mensaje no se procesó, el reintento de Twilio debe poder hacerlo
+            await release_message(redis_conn, message_sid)
+            raise
         
     except HTTPException as he:
         # Re-lanzar las excepciones HTTP
@@ -281,5 +500,4 @@ async def whatsapp_endpoint(request: Request):
         logger.error(f"❌ Error inesperado en el webhook: {str(e)}", exc_info=True)
         raise HTTPException(status_code=500, detail="Internal server error")
     finally:
-        logger.info("🏁 FIN DE LA SOLICITUD")
-        logger.info("="*50 + "\n")
\ No newline at end of file
+        logger.info(f"🏁 Fin de la solicitud ({(time.perf_counter() - started) * 1000:.1f} ms)")
\ No newline at end of file
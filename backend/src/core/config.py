@@ -1,5 +1,9 @@
+import uuid
+
 from fastapi.middleware.cors import CORSMiddleware
 
+from src.utils.loggers import request_id_var
+
 def configure_cors(app):
     app.add_middleware(
         CORSMiddleware,
@@ -7,4 +11,22 @@ def configure_cors(app):
         allow_credentials=True,
         allow_methods=["*"],  # Allows all HTTP methods (POST, GET, etc.)
         allow_headers=["*"],
-    )
\ No newline at end of file
+    )
+
+def configure_request_id(app):
+    """Asigna un ID a cada petición para correlacionar sus logs (X-Request-ID)."""
+
+    @app.middleware("http")
+    async def request_id_middleware(request, call_next):
+        request_id = (
+            request.headers.get("X-Request-ID")
+            or request.headers.get("I-Twilio-Idempotency-Token")
+            or uuid.uuid4().hex
+        )
+        token = request_id_var.set(request_id)
+        try:
+            response = await call_next(request)
+        finally:
+            request_id_var.reset(token)
+        response.headers["X-Request-ID"] = request_id
+        return response
\ No newline at end of file
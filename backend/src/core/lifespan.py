@@ -0,0 +1,77 @@
+"""
+Arranque y apagado de cada worker de la API.
+
+Importar la app no abre conexiones ni valida credenciales. El trabajo se divide en:
+  - `preload_shared_state`: módulos pesados y datos inmutables (SDKs, system prompt,
+    vocabulario de tiktoken). Con `gunicorn --preload` se ejecuta en el master antes
+    del fork (ver gunicorn.conf.py) y los workers lo comparten copy-on-write.
+  - `lifespan`: por worker, después del fork. Reporta la configuración faltante,
+    crea los clientes de red del proceso y los cierra al apagar.
+"""
+import time
+from contextlib import asynccontextmanager
+
+from starlette.concurrency import run_in_threadpool
+
+from src.core.settings import get_settings
+from src.utils.loggers import flush_logs, logger
+
+_preloaded = False
+
+
+def preload_shared_state() -> None:
+    """Carga lo que es seguro compartir entre procesos. No abre conexiones."""
+    global _preloaded
+    if _preloaded:
+        return
+    started = time.perf_counter()
+
+    # SDKs que los módulos importan de forma diferida; httpcore lo carga httpx con el primer cliente
+    import httpcore  # noqa: F401
+    import openai  # noqa: F401
+    import supabase  # noqa: F401
+
+    from src.api.v1.endpoints.webhook import get_system_prompt
+    from src.utils.context import get_encoder
+
+    get_system_prompt()
+    get_encoder()
+    _preloaded = True
+    logger.info(f"📦 Estado compartido cargado en {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+@asynccontextmanager
+async def lifespan(app):
+    from src.db import close_db, get_supabase, run_db
+    from src.utils.llm_router import close_llm_router, get_llm_router
+    from src.utils.model import MODEL_NAME
+    from src.utils.media import close_media_downloader
+    from src.utils.whatsapp import close_whatsapp_sender, get_whatsapp_sender
+
+    started = time.perf_counter()
+    # Toda la configuración faltante en un solo reporte; la API arranca igual
+    # (health y métricas siguen disponibles) y cada cliente falla al usarse
+    for problem in get_settings().problems():
+        logger.error(f"❌ Configuración: {problem}")
+
+    # Sin --preload, cada worker carga aquí lo que el master no cargó
+    await run_in_threadpool(preload_shared_state)
+
+    # Clientes de red propios del worker, creados después del fork
+    for name, create in (("Supabase", lambda: run_db(get_supabase)),
+                         ("WhatsApp", lambda: run_in_threadpool(get_whatsapp_sender)),
+                         ("modelo", lambda: run_in_threadpool(get_llm_router, MODEL_NAME))):
+        try:
+            await create()
+        except Exception as e:
+            logger.warning(f"⚠️ Cliente de {name} no inicializado: {str(e)}")
+
+    logger.info(f"🚀 Worker listo en {(time.perf_counter() - started) * 1000:.0f} ms")
+    try:
+        yield
+    finally:
+        await close_whatsapp_sender()
+        await close_media_downloader()
+        await close_llm_router()
+        close_db()
+        flush_logs()
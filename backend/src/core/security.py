@@ -0,0 +1,36 @@
+"""
+Autenticación de los endpoints de administración (difusiones, seguimientos, historiales).
+
+Cada grupo de endpoints exige `Authorization: Bearer <token>` con el valor de
+una variable de entorno. Si la variable no está configurada los endpoints
+responden 503: nunca quedan abiertos por omisión (la política de CORS es "*").
+"""
+import hmac
+import os
+from typing import Callable, Optional
+
+from dotenv import load_dotenv
+from fastapi import Header, HTTPException
+
+from src.utils.loggers import logger
+
+load_dotenv()
+
+
+def bearer_token(setting: str) -> Callable[..., None]:
+    """Dependencia de FastAPI que valida el token de la variable `setting` (se lee en cada petición)."""
+
+    def require(authorization: Optional[str] = Header(None)) -> None:
+        token = os.getenv(setting, "").strip()
+        if not token:
+            logger.error(f"🔒 {setting} no está configurado: se rechaza la petición")
+            raise HTTPException(status_code=503, detail=f"{setting} no está configurado")
+        expected = f"Bearer {token}".encode()
+        if not hmac.compare_digest((authorization or "").encode(), expected):
+            raise HTTPException(status_code=401, detail="Token inválido", headers={"WWW-Authenticate": "Bearer"})
+
+    return require
+
+
+# Envío de mensajes salientes: difusiones y seguimientos programados
+require_admin_token = bearer_token("ADMIN_API_TOKEN")
@@ -0,0 +1,48 @@
+"""
+Credenciales de la aplicación leídas de forma perezosa.
+
+Importar este módulo no valida nada ni abre conexiones: `get_settings()` lee el
+entorno la primera vez que se llama. El arranque (src/core/lifespan.py) reporta
+de una vez todo lo que falta y cada cliente exige solo lo que necesita con
+`Settings.require` al crearse.
+"""
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List
+
+from dotenv import load_dotenv
+
+
+@dataclass(frozen=True)
+class Settings:
+    openai_api_key: str
+    twilio_account_sid: str
+    twilio_auth_token: str
+    twilio_whatsapp_number: str
+    supabase_url: str
+    supabase_anon_key: str
+
+    @classmethod
+    def from_env(cls) -> "Settings":
+        return cls(**{field: os.getenv(field.upper(), "").strip() for field in cls.__dataclass_fields__})
+
+    def problems(self) -> List[str]:
+        """Variables faltantes o con formato inválido."""
+        problems = [f"{field.upper()} no está configurada" for field in self.__dataclass_fields__ if not getattr(self, field)]
+        if self.twilio_whatsapp_number and not self.twilio_whatsapp_number.startswith(("+1", "+52")):
+            problems.append("TWILIO_WHATSAPP_NUMBER debe comenzar con +1 o +52")
+        return problems
+
+    def require(self, *names: str) -> None:
+        """Lanza ValueError si falta alguna de las variables `names`."""
+        missing = [name for name in names if not getattr(self, name.lower())]
+        if missing:
+            raise ValueError(f"Variables de entorno no configuradas: {', '.join(missing)}")
+
+
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Carga .env (sin sobrescribir el entorno del proceso) y lee las credenciales una sola vez."""
+    load_dotenv()
+    return Settings.from_env()
@@ -1,8 +1,18 @@
+import asyncio
+import functools
 import os
-from typing import Optional
-from supabase import create_client, Client
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Optional
+
+import httpx
 from dotenv import load_dotenv
 
+from src.utils.circuit_breaker import CircuitBreaker, get_breaker, is_transient_error
+
+if TYPE_CHECKING:
+    from supabase import Client
+
 # Load environment variables
 load_dotenv()
 
@@ -10,14 +20,106 @@ load_dotenv()
 SUPABASE_URL = os.getenv("SUPABASE_URL")
 SUPABASE_KEY = os.getenv("SUPABASE_ANON_KEY")
 
+# Pool limits (per worker process)
+SUPABASE_MAX_WORKERS = int(os.getenv("SUPABASE_MAX_WORKERS", "16"))
+SUPABASE_MAX_CONNECTIONS = int(os.getenv("SUPABASE_MAX_CONNECTIONS", str(SUPABASE_MAX_WORKERS)))
+SUPABASE_MAX_KEEPALIVE = int(os.getenv("SUPABASE_MAX_KEEPALIVE", str(SUPABASE_MAX_CONNECTIONS)))
+SUPABASE_TIMEOUT = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+
 # Initialize Supabase client
-supabase: Optional[Client] = None
+supabase: Optional["Client"] = None
+_executor: Optional[ThreadPoolExecutor] = None
+_client_lock = threading.Lock()
+
 
-def get_supabase() -> Client:
+def _release_response(response: httpx.Response) -> None:
+    """
+    Read the body and detach the stream httpx binds to the response. The two reference each
+    other, so large PostgREST pages would otherwise stay in memory until a full GC pass.
+    """
+    response.read()
+    response.stream = httpx.ByteStream(response.content)
+
+
+def _configure_http_pool(client: "Client") -> None:
+    """Replace the PostgREST session with a pooled keep-alive client with explicit limits."""
+    session = client.postgrest.session
+    client.postgrest.session = httpx.Client(
+        base_url=session.base_url,
+        headers=session.headers,
+        timeout=SUPABASE_TIMEOUT,
+        limits=httpx.Limits(
+            max_connections=SUPABASE_MAX_CONNECTIONS,
+            max_keepalive_connections=SUPABASE_MAX_KEEPALIVE,
+        ),
+        event_hooks={"response": [_release_response]},
+    )
+    session.close()
+
+
+def get_supabase() -> "Client":
     """Get or create a Supabase client instance."""
     global supabase
     if supabase is None:
-        if not all([SUPABASE_URL, SUPABASE_KEY]):
-            raise ValueError("Missing required Supabase environment variables")
-        supabase = create_client(SUPABASE_URL, SUPABASE_KEY)
+        # DB threads can race here on a cold start. The client is only published once its
+        # session has been swapped, so no caller can use the session that gets closed.
+        with _client_lock:
+            if supabase is None:
+                if not all([SUPABASE_URL, SUPABASE_KEY]):
+                    raise ValueError("Missing required Supabase environment variables")
+                # Deferred import: supabase pulls in several SDKs and is only needed once a worker runs
+                from supabase import create_client
+
+                client = create_client(SUPABASE_URL, SUPABASE_KEY)
+                _configure_http_pool(client)
+                supabase = client
     return supabase
+
+
+def is_db_outage(exc: BaseException) -> bool:
+    """
+    Errors that mean Supabase itself is failing. PostgREST errors carry the HTTP status (non-JSON
+    bodies) or a SQLSTATE/PGRST code: only connection, resource and server classes count, not
+    constraint or query errors.
+    """
+    code = getattr(exc, "code", None)
+    if isinstance(code, int):
+        return code >= 500 or code in (408, 429)
+    if isinstance(code, str) and hasattr(exc, "hint"):
+        return code.startswith(("PGRST0", "08", "53", "57", "58", "XX"))
+    return is_transient_error(exc)
+
+
+def get_db_breaker() -> CircuitBreaker:
+    """Circuit breaker shared by every call that goes through `run_db`."""
+    return get_breaker("supabase", is_db_outage)
+
+
+def get_db_executor() -> ThreadPoolExecutor:
+    """Get or create the bounded thread pool used for blocking Supabase calls."""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=SUPABASE_MAX_WORKERS, thread_name_prefix="supabase")
+    return _executor
+
+
+async def run_db(func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Run a blocking Supabase call on the DB thread pool without blocking the event loop.
+    Raises CircuitOpenError right away while the Supabase circuit is open.
+    """
+    loop = asyncio.get_running_loop()
+    with get_db_breaker().guard():
+        return await loop.run_in_executor(get_db_executor(), functools.partial(func, *args, **kwargs))
+
+
+def close_db() -> None:
+    """Close the pooled HTTP session and the DB thread pool (worker shutdown)."""
+    global supabase, _executor
+    with _client_lock:
+        if supabase is not None:
+            supabase.postgrest.session.close()
+            supabase = None
+    if _executor is not None:
+        _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
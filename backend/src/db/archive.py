@@ -0,0 +1,247 @@
+"""
+Compactación del historial en dos niveles.
+
+  - Caliente: los últimos COMPACTION_HOT_MESSAGES mensajes siguen en el backend
+    configurado (conversations.messages o conversation_messages). Es lo único
+    que lee el webhook.
+  - Frío: los mensajes anteriores se mueven a conversation_archive en bloques de
+    COMPACTION_CHUNK_MESSAGES, serializados (ARCHIVE_PAYLOAD_CODEC) y comprimidos
+    con src/utils/codec.py, con el rango de tiempo de cada bloque indexado por
+    número (migrations/004_conversation_archive.sql). Los bloques json+zlib anteriores
+    al codec compacto se siguen leyendo.
+
+El archivo solo se lee cuando se pide de forma explícita (`load_archived`,
+`load_full_history`, `archive_blocks`). Solo se archivan bloques completos y
+cada bloque se identifica por el hash de su contenido, así que repetir una
+compactación interrumpida no duplica mensajes en el archivo.
+"""
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import zlib
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.db import get_supabase, run_db
+from src.db.checkpoint import ChangeScan
+from src.utils.codec import decode_payload, describe_payload, encode_payload, resolve_codec
+from src.utils.context import CONTEXT_MAX_MESSAGES
+from src.utils.conversation_cache import CACHE_MAX_MESSAGES
+from src.utils.loggers import logger
+from src.utils.ordering import conversation_lease
+
+load_dotenv()
+
+# El final caliente debe cubrir el contexto del modelo y la caché de Redis
+COMPACTION_HOT_MESSAGES = int(os.getenv("COMPACTION_HOT_MESSAGES", str(max(CONTEXT_MAX_MESSAGES, CACHE_MAX_MESSAGES))))
+COMPACTION_CHUNK_MESSAGES = int(os.getenv("COMPACTION_CHUNK_MESSAGES", "100"))
+# Conversaciones por página y compactaciones simultáneas
+COMPACTION_BATCH_SIZE = int(os.getenv("COMPACTION_BATCH_SIZE", "200"))
+COMPACTION_CONCURRENCY = int(os.getenv("COMPACTION_CONCURRENCY", "4"))
+
+# El archivo se lee poco: se prioriza el tamaño (msgpack) sobre el tiempo de decodificación
+ARCHIVE_PAYLOAD_CODEC = resolve_codec(os.getenv("ARCHIVE_PAYLOAD_CODEC", "msgpack"), "ARCHIVE_PAYLOAD_CODEC")
+
+ARCHIVE_TABLE = "conversation_archive"
+# Bloques escritos antes del codec compacto: JSON comprimido con zlib, sin cabecera
+LEGACY_ARCHIVE_CODEC = "json+zlib"
+# Bloques con la cabecera de src/utils/codec.py, p. ej. "packed:msgpack+zstd"
+PACKED_CODEC_PREFIX = "packed:"
+CHECKPOINT_KEY = "compaction:checkpoint"
+
+if COMPACTION_HOT_MESSAGES < CONTEXT_MAX_MESSAGES:
+    logger.warning(
+        f"⚠️ COMPACTION_HOT_MESSAGES ({COMPACTION_HOT_MESSAGES}) es menor que CONTEXT_MAX_MESSAGES "
+        f"({CONTEXT_MAX_MESSAGES}): el modelo verá menos historial"
+    )
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    """Convierte el timestamp de un mensaje a datetime con zona horaria (UTC si no la trae)."""
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return _aware(parsed)
+
+
+def _aware(value: Optional[datetime]) -> Optional[datetime]:
+    if value is None or value.tzinfo:
+        return value
+    return value.replace(tzinfo=timezone.utc)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[str]:
+    return value.astimezone(timezone.utc).isoformat() if value else None
+
+
+def encode_chunk(messages: List[Dict[str, Any]]) -> Dict[str, str]:
+    # El hash se calcula sobre el JSON canónico: cambiar de codec no duplica bloques ya archivados
+    raw = json.dumps(messages, ensure_ascii=False, separators=(",", ":")).encode()
+    payload = encode_payload(messages, ARCHIVE_PAYLOAD_CODEC, compress_min_bytes=0)
+    return {
+        "codec": f"{PACKED_CODEC_PREFIX}{describe_payload(payload)}",
+        "chunk_hash": hashlib.sha256(raw).hexdigest()[:32],
+        "payload": base64.b64encode(payload).decode(),
+    }
+
+
+def decode_chunk(row: Dict[str, Any]) -> List[Dict[str, Any]]:
+    codec = row.get("codec") or ""
+    if codec.startswith(PACKED_CODEC_PREFIX):
+        return decode_payload(base64.b64decode(row["payload"]))
+    if codec == LEGACY_ARCHIVE_CODEC:
+        return json.loads(zlib.decompress(base64.b64decode(row["payload"])))
+    raise ValueError(f"Codec de archivo desconocido: {codec}")
+
+
+def build_archive_rows(phone_number: str, messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Divide los mensajes en bloques de COMPACTION_CHUNK_MESSAGES listos para insertar."""
+    rows = []
+    for start in range(0, len(messages), COMPACTION_CHUNK_MESSAGES):
+        chunk = messages[start:start + COMPACTION_CHUNK_MESSAGES]
+        times = [t for t in (parse_timestamp(m.get("timestamp")) for m in chunk) if t is not None]
+        rows.append({
+            "phone_number": phone_number,
+            "first_at": _as_utc(min(times)) if times else None,
+            "last_at": _as_utc(max(times)) if times else None,
+            "message_count": len(chunk),
+            **encode_chunk(chunk),
+        })
+    return rows
+
+
+def _base_store():
+    from src.db.conversations import get_backing_store, get_conversation_store
+
+    # La caché de Redis envuelve al backend real; la compactación trabaja contra el backend
+    return get_backing_store(), get_conversation_store()
+
+
+def _insert_archive(rows: List[Dict[str, Any]]) -> None:
+    get_supabase().table(ARCHIVE_TABLE) \
+        .upsert(rows, on_conflict="phone_number,chunk_hash", ignore_duplicates=True) \
+        .execute()
+
+
+async def compact_conversation(redis_client, phone_number: str, dry_run: bool = False) -> int:
+    """Mueve al archivo los mensajes fuera del final caliente. Devuelve cuántos se archivaron."""
+    store, cached = _base_store()
+    # Mismo lease que el webhook: ningún mensaje nuevo se escribe mientras se recorta
+    async with conversation_lease(redis_client, phone_number):
+        messages, marker = await run_db(
+            store.archive_candidates, phone_number, COMPACTION_HOT_MESSAGES, COMPACTION_CHUNK_MESSAGES
+        )
+        if not messages or dry_run:
+            return len(messages)
+
+        await run_db(_insert_archive, build_archive_rows(phone_number, messages))
+        if not await run_db(store.trim_archived, phone_number, marker):
+            logger.warning(f"⚠️ La conversación de {phone_number} cambió durante la compactación; se reintentará")
+            return 0
+
+    if hasattr(cached, "invalidate"):
+        await run_db(cached.invalidate, phone_number)
+    return len(messages)
+
+
+async def compact_conversations(redis_client, dry_run: bool = False, full: bool = False,
+                                limit: Optional[int] = None) -> Dict[str, int]:
+    """
+    Compacta las conversaciones modificadas desde la última ejecución.
+
+    El punto de control (modified_at de la última conversación revisada) se guarda
+    en Redis; una conversación que no recibió mensajes no puede haber crecido, así
+    que no se vuelve a leer. `full` ignora el punto de control.
+    """
+    scan = ChangeScan(redis_client, CHECKPOINT_KEY, full=full, page_size=COMPACTION_BATCH_SIZE)
+    stats = {"conversations": 0, "compacted": 0, "messages": 0, "errors": 0}
+    semaphore = asyncio.Semaphore(COMPACTION_CONCURRENCY)
+
+    async def compact_one(phone_number: str) -> None:
+        async with semaphore:
+            try:
+                moved = await compact_conversation(redis_client, phone_number, dry_run=dry_run)
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"❌ Error compactando la conversación de {phone_number}: {str(e)}")
+                return
+        if moved:
+            stats["compacted"] += 1
+            stats["messages"] += moved
+
+    while limit is None or stats["conversations"] < limit:
+        rows = await scan.next_page(None if limit is None else limit - stats["conversations"])
+        if not rows:
+            break
+
+        errors_before = stats["errors"]
+        await asyncio.gather(*(compact_one(row["phone_number"]) for row in rows))
+        stats["conversations"] += len(rows)
+        # Tras un error el punto de control deja de avanzar: la próxima ejecución repite desde ahí
+        if not dry_run and stats["errors"] == errors_before == 0:
+            scan.save()
+
+    logger.info(
+        f"🗜️ Compactación{' (simulada)' if dry_run else ''}: {stats['conversations']} conversaciones revisadas, "
+        f"{stats['compacted']} compactadas, {stats['messages']} mensajes archivados, {stats['errors']} errores"
+    )
+    return stats
+
+
+def archive_blocks(phone_number: str, after_id: int = 0, since: Optional[datetime] = None,
+                   until: Optional[datetime] = None, limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    Página de bloques archivados de un número (id del bloque y sus mensajes) en
+    orden cronológico, a partir del bloque `after_id`. Solo se descargan los
+    bloques que se solapan con el rango [since, until].
+    """
+    since, until = _aware(since), _aware(until)
+    query = get_supabase().table(ARCHIVE_TABLE) \
+        .select('id,codec,payload') \
+        .eq('phone_number', phone_number) \
+        .gt('id', after_id)
+    if since:
+        query = query.gte('last_at', _as_utc(since))
+    if until:
+        query = query.lte('first_at', _as_utc(until))
+
+    rows = query.order('id').limit(limit).execute().data or []
+    return [{"id": row["id"], "messages": decode_chunk(row)} for row in rows]
+
+
+def load_archived(phone_number: str, since: Optional[datetime] = None,
+                  until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Mensajes archivados de un número en orden cronológico, opcionalmente solo los del rango [since, until]."""
+    since, until = _aware(since), _aware(until)
+    messages, after_id = [], 0
+    while blocks := archive_blocks(phone_number, after_id, since, until):
+        for block in blocks:
+            messages.extend(block["messages"])
+        after_id = blocks[-1]["id"]
+    if since or until:
+        messages = [m for m in messages if _in_range(parse_timestamp(m.get("timestamp")), since, until)]
+    return messages
+
+
+def load_full_history(phone_number: str, since: Optional[datetime] = None,
+                      until: Optional[datetime] = None) -> List[Dict[str, Any]]:
+    """Historial completo (archivo + final caliente) en orden cronológico."""
+    since, until = _aware(since), _aware(until)
+    store, _ = _base_store()
+    hot = store.recent(phone_number)
+    if since or until:
+        hot = [m for m in hot if _in_range(parse_timestamp(m.get("timestamp")), since, until)]
+    return load_archived(phone_number, since, until) + hot
+
+
+def _in_range(value: Optional[datetime], since: Optional[datetime], until: Optional[datetime]) -> bool:
+    if value is None:
+        return False
+    return (since is None or value >= since) and (until is None or value <= until)
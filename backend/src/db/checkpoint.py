@@ -0,0 +1,59 @@
+"""
+Recorrido incremental de conversations por modified_at con punto de control en Redis.
+
+Los trabajos por lotes (compact.py, enrich.py) lo usan para revisar solo las
+conversaciones modificadas desde su última ejecución y para retomar una
+ejecución interrumpida desde la última página guardada.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+from src.db import get_supabase, run_db
+from src.utils.loggers import logger
+
+
+def _changed_since(cursor: Optional[str], limit: int) -> List[Dict[str, Any]]:
+    query = get_supabase().table('conversations').select('phone_number,modified_at')
+    if cursor:
+        query = query.gte('modified_at', cursor)
+    return query.order('modified_at').limit(limit).execute().data or []
+
+
+class ChangeScan:
+    """
+    Páginas de conversaciones ordenadas por modified_at a partir del punto de control.
+
+    La consulta usa gte sobre el cursor, así que también se recuerdan los números ya
+    revisados con modified_at igual al cursor. `save()` guarda la posición actual;
+    el llamador decide cuándo (p. ej. solo si la página se procesó sin errores).
+    """
+
+    def __init__(self, redis_client, key: str, full: bool = False, page_size: int = 200):
+        self.redis = redis_client
+        self.key = key
+        self.page_size = page_size
+        state = None if full else redis_client.get(key)
+        state = json.loads(state) if state else {}
+        self.cursor: Optional[str] = state.get("modified_at")
+        self.seen = set(state.get("seen", []))
+
+    async def next_page(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        page = await run_db(_changed_since, self.cursor, self.page_size)
+        rows = [row for row in page if not (row["modified_at"] == self.cursor and row["phone_number"] in self.seen)]
+        if limit is not None:
+            rows = rows[:limit]
+        if not rows:
+            if len(page) == self.page_size:
+                logger.warning(f"⚠️ Más de {self.page_size} conversaciones con el mismo modified_at; "
+                               "aumente el tamaño de página")
+            return []
+
+        last = rows[-1]["modified_at"]
+        self.seen = (self.seen if last == self.cursor else set()) | {
+            row["phone_number"] for row in rows if row["modified_at"] == last
+        }
+        self.cursor = last
+        return rows
+
+    def save(self) -> None:
+        self.redis.set(self.key, json.dumps({"modified_at": self.cursor, "seen": sorted(self.seen)}))
@@ -0,0 +1,284 @@
+import os
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.db import get_supabase
+from src.utils.conversation_cache import CACHE_ENABLED, CachedConversationStore, configure_cache_memory_policy
+from src.utils.loggers import logger
+from src.utils.redis import redis_conn
+
+load_dotenv()
+
+# Backend de almacenamiento del historial:
+#   "legacy"   -> arreglo JSON en conversations.messages (lectura-modificación-escritura)
+#   "messages" -> una fila por mensaje en conversation_messages (solo inserciones)
+CONVERSATION_STORAGE = os.getenv("CONVERSATION_STORAGE", "legacy").lower()
+# Filas por consulta en las lecturas de varios números. PostgREST corta cada respuesta en
+# max-rows (1000 en Supabase) sin avisar: se pagina hasta recibir una página incompleta,
+# así que este valor no debe superar el max-rows del proyecto
+SUPABASE_PAGE_SIZE = int(os.getenv("SUPABASE_PAGE_SIZE", "1000"))
+
+
+class LegacyConversationStore:
+    """Historial guardado como un arreglo JSON en la columna conversations.messages."""
+
+    def recent(self, phone_number: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        response = get_supabase().table('conversations') \
+            .select('messages') \
+            .eq('phone_number', phone_number) \
+            .execute()
+
+        if not response.data:
+            return []
+        messages = response.data[0].get('messages') or []
+        return messages[-limit:] if limit else messages
+
+    def recent_many(self, phone_numbers: List[str]) -> Dict[str, List[Dict[str, str]]]:
+        """Historial completo de varios números (exportaciones), por páginas de números."""
+        history: Dict[str, List[Dict[str, str]]] = {}
+        after = None
+        while True:
+            query = get_supabase().table('conversations') \
+                .select('phone_number,messages') \
+                .in_('phone_number', phone_numbers)
+            if after is not None:
+                query = query.gt('phone_number', after)
+            rows = query.order('phone_number').limit(SUPABASE_PAGE_SIZE).execute().data or []
+            for row in rows:
+                history[row['phone_number']] = row.get('messages') or []
+            if len(rows) < SUPABASE_PAGE_SIZE:
+                return history
+            after = rows[-1]['phone_number']
+
+    def append(self, phone_number: str, message: Dict[str, str]) -> None:
+        # Una sola lectura y una sola escritura por mensaje
+        response = get_supabase().table('conversations') \
+            .select('messages') \
+            .eq('phone_number', phone_number) \
+            .execute()
+
+        if response.data:
+            messages = (response.data[0].get('messages') or []) + [message]
+            get_supabase().table('conversations') \
+                .update({'messages': messages, 'modified_at': 'now()'}) \
+                .eq('phone_number', phone_number) \
+                .execute()
+        else:
+            self._insert(phone_number, [message])
+
+    def replace(self, phone_number: str, messages: List[Dict[str, str]]) -> None:
+        existing = get_supabase().table('conversations') \
+            .select('phone_number') \
+            .eq('phone_number', phone_number) \
+            .execute()
+
+        if existing.data:
+            logger.info(f"🔄 Actualizando conversación existente para {phone_number}")
+            get_supabase().table('conversations') \
+                .update({'messages': messages, 'modified_at': 'now()'}) \
+                .eq('phone_number', phone_number) \
+                .execute()
+        else:
+            logger.info(f"🆕 Creando nueva conversación para {phone_number}")
+            self._insert(phone_number, messages)
+
+    def get_summary(self, phone_number: str) -> Dict[str, Optional[str]]:
+        response = get_supabase().table('conversations') \
+            .select('summary,summary_until') \
+            .eq('phone_number', phone_number) \
+            .execute()
+
+        row = response.data[0] if response.data else {}
+        return {"summary": row.get("summary"), "summary_until": row.get("summary_until")}
+
+    def save_summary(self, phone_number: str, summary: str, summary_until: Optional[str]) -> None:
+        get_supabase().table('conversations') \
+            .update({'summary': summary, 'summary_until': summary_until}) \
+            .eq('phone_number', phone_number) \
+            .execute()
+
+    def archive_candidates(self, phone_number: str, keep: int, chunk: int) -> Tuple[List[Dict[str, str]], Any]:
+        """
+        Mensajes más viejos que los últimos `keep`, en bloques completos de `chunk`.
+        Devuelve los mensajes a archivar y el marcador que recibe `trim_archived`.
+        """
+        response = get_supabase().table('conversations') \
+            .select('messages,modified_at') \
+            .eq('phone_number', phone_number) \
+            .execute()
+
+        if not response.data:
+            return [], None
+        messages = response.data[0].get('messages') or []
+        cold = (max(len(messages) - keep, 0) // chunk) * chunk
+        if not cold:
+            return [], None
+        return messages[:cold], {"remaining": messages[cold:], "modified_at": response.data[0].get('modified_at')}
+
+    def trim_archived(self, phone_number: str, marker: Any) -> bool:
+        # Si la fila cambió desde la lectura no se toca: la siguiente compactación la retoma
+        # (modified_at no se actualiza: la compactación no es actividad de la conversación)
+        response = get_supabase().table('conversations') \
+            .update({'messages': marker["remaining"]}) \
+            .eq('phone_number', phone_number) \
+            .eq('modified_at', marker["modified_at"]) \
+            .execute()
+        return bool(response.data)
+
+    def _insert(self, phone_number: str, messages: List[Dict[str, str]]) -> None:
+        get_supabase().table('conversations') \
+            .insert({
+                'phone_number': phone_number,
+                'messages': messages,
+                'created_at': 'now()',
+                'modified_at': 'now()'
+            }) \
+            .execute()
+
+
+class MessageTableStore:
+    """
+    Historial guardado como una fila por mensaje en conversation_messages.
+    Requiere la migración migrations/001_conversation_messages.sql.
+    """
+
+    def recent(self, phone_number: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        query = get_supabase().table('conversation_messages') \
+            .select('role,content,timestamp') \
+            .eq('phone_number', phone_number) \
+            .order('id', desc=True)
+        if limit:
+            query = query.limit(limit)
+
+        rows = query.execute().data or []
+        # Se leen del más nuevo al más viejo; el historial se devuelve en orden cronológico
+        return [
+            {"role": row["role"], "content": row["content"], "timestamp": row.get("timestamp")}
+            for row in reversed(rows)
+        ]
+
+    def recent_many(self, phone_numbers: List[str]) -> Dict[str, List[Dict[str, str]]]:
+        """Historial completo de varios números, por páginas (keyset sobre id, sin OFFSET)."""
+        history: Dict[str, List[Dict[str, str]]] = {}
+        after_id = 0
+        while True:
+            rows = get_supabase().table('conversation_messages') \
+                .select('id,phone_number,role,content,timestamp') \
+                .in_('phone_number', phone_numbers) \
+                .gt('id', after_id) \
+                .order('id') \
+                .limit(SUPABASE_PAGE_SIZE) \
+                .execute().data or []
+            # En orden de id los mensajes de cada número quedan en orden cronológico
+            for row in rows:
+                history.setdefault(row["phone_number"], []).append(
+                    {"role": row["role"], "content": row["content"], "timestamp": row.get("timestamp")}
+                )
+            if len(rows) < SUPABASE_PAGE_SIZE:
+                return history
+            after_id = rows[-1]["id"]
+
+    def append(self, phone_number: str, message: Dict[str, str]) -> None:
+        # La RPC inserta el mensaje y actualiza conversations.modified_at en una sola llamada
+        get_supabase().rpc('append_conversation_message', {
+            'p_phone_number': phone_number,
+            'p_role': message['role'],
+            'p_content': message['content'],
+            'p_timestamp': message.get('timestamp'),
+        }).execute()
+
+    def replace(self, phone_number: str, messages: List[Dict[str, str]]) -> None:
+        logger.warning(f"⚠️ Reescribiendo el historial completo de {phone_number}")
+        get_supabase().table('conversation_messages') \
+            .delete() \
+            .eq('phone_number', phone_number) \
+            .execute()
+        if messages:
+            get_supabase().table('conversation_messages') \
+                .insert([
+                    {
+                        'phone_number': phone_number,
+                        'role': message['role'],
+                        'content': message['content'],
+                        'timestamp': message.get('timestamp'),
+                    }
+                    for message in messages
+                ]) \
+                .execute()
+
+    def archive_candidates(self, phone_number: str, keep: int, chunk: int) -> Tuple[List[Dict[str, str]], Any]:
+        # Id del mensaje más nuevo fuera del final caliente
+        boundary = get_supabase().table('conversation_messages') \
+            .select('id') \
+            .eq('phone_number', phone_number) \
+            .order('id', desc=True) \
+            .offset(keep) \
+            .limit(1) \
+            .execute().data
+        if not boundary:
+            return [], None
+
+        rows = get_supabase().table('conversation_messages') \
+            .select('id,role,content,timestamp') \
+            .eq('phone_number', phone_number) \
+            .lte('id', boundary[0]['id']) \
+            .order('id') \
+            .execute().data or []
+        cold = (len(rows) // chunk) * chunk
+        if not cold:
+            return [], None
+        messages = [{"role": row["role"], "content": row["content"], "timestamp": row.get("timestamp")}
+                    for row in rows[:cold]]
+        return messages, rows[cold - 1]['id']
+
+    def trim_archived(self, phone_number: str, marker: Any) -> bool:
+        response = get_supabase().table('conversation_messages') \
+            .delete() \
+            .eq('phone_number', phone_number) \
+            .lte('id', marker) \
+            .execute()
+        return bool(response.data)
+
+    # El resumen vive en la fila de conversations, igual que en el backend legacy
+    get_summary = LegacyConversationStore.get_summary
+    save_summary = LegacyConversationStore.save_summary
+
+
+_store = None
+
+
+def get_conversation_store():
+    """Obtiene (o crea) el backend de almacenamiento configurado en CONVERSATION_STORAGE."""
+    global _store
+    if _store is None:
+        if CONVERSATION_STORAGE == "messages":
+            _store = MessageTableStore()
+        elif CONVERSATION_STORAGE == "legacy":
+            _store = LegacyConversationStore()
+        else:
+            raise ValueError(f"CONVERSATION_STORAGE desconocido: {CONVERSATION_STORAGE}")
+
+        if CACHE_ENABLED:
+            configure_cache_memory_policy(redis_conn)
+            _store = CachedConversationStore(_store, redis_conn)
+    return _store
+
+
+def get_backing_store():
+    """Backend configurado sin la caché de Redis (lecturas masivas y tareas de mantenimiento)."""
+    store = get_conversation_store()
+    return getattr(store, "store", store)
+
+
+def list_conversations(after: Optional[str] = None, limit: int = 100, modified_since: Optional[str] = None,
+                       modified_until: Optional[str] = None) -> List[Dict[str, Any]]:
+    """Página de conversaciones ordenada por número (keyset sobre phone_number, sin OFFSET)."""
+    query = get_supabase().table('conversations').select('phone_number,created_at,modified_at')
+    if after:
+        query = query.gt('phone_number', after)
+    if modified_since:
+        query = query.gte('modified_at', modified_since)
+    if modified_until:
+        query = query.lte('modified_at', modified_until)
+    return query.order('phone_number').limit(limit).execute().data or []
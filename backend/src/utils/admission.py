@@ -0,0 +1,309 @@
+"""
+Control de admisión delante del pipeline del webhook.
+
+  1. Límite por número (token bucket en Redis): un número que envía mensajes
+     más rápido que ADMISSION_RATE_PER_MINUTE se descarta sin llegar al modelo.
+  2. Descarte por carga: si la cola de RQ (modo queue) o los mensajes en curso
+     de este worker (modo inline) superan su límite, se responde con un aviso
+     barato de "estamos ocupados" en lugar de procesar el mensaje.
+  3. Concurrencia de llamadas al modelo: un semáforo por worker y otro global
+     en Redis (leases con expiración en un ZSET) acotan las llamadas
+     simultáneas; si no hay lugar en ADMISSION_LLM_WAIT_SECONDS se lanza
+     AdmissionRejected.
+
+Todo usa WATCH/MULTI o pipelines (sin Lua, compatible con fakeredis) y es
+fail-open: si Redis no responde se admite el mensaje o la llamada.
+"""
+import asyncio
+import os
+import time
+import uuid
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Dict, Iterator, Optional
+
+from dotenv import load_dotenv
+from redis.exceptions import WatchError
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.loggers import logger
+from src.utils.metrics import ADMISSION_DECISIONS, ADMISSION_LIMITS, LLM_SLOT_WAIT, LLM_SLOTS
+from src.utils.queue import QUEUE_SHARDS, get_queue, queue_enabled
+
+load_dotenv()
+
+ADMISSION_ENABLED = os.getenv("ADMISSION_ENABLED", "true").lower() in ("1", "true", "yes")
+# Token bucket por número: mensajes por minuto sostenidos y ráfaga permitida (0 desactiva)
+ADMISSION_RATE_PER_MINUTE = float(os.getenv("ADMISSION_RATE_PER_MINUTE", "12"))
+ADMISSION_RATE_BURST = int(os.getenv("ADMISSION_RATE_BURST", "6"))
+# Descarte por carga: trabajos en todas las colas (modo queue) o mensajes en curso por worker (inline)
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv("ADMISSION_MAX_QUEUE_DEPTH", "500"))
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", "100"))
+# La profundidad de las colas se lee de Redis como mucho una vez por este intervalo
+ADMISSION_DEPTH_CACHE_SECONDS = float(os.getenv("ADMISSION_DEPTH_CACHE_SECONDS", "1"))
+# Llamadas simultáneas al modelo por worker y entre todos los workers (0 desactiva)
+LLM_WORKER_CONCURRENCY = int(os.getenv("LLM_WORKER_CONCURRENCY", "16"))
+LLM_GLOBAL_CONCURRENCY = int(os.getenv("LLM_GLOBAL_CONCURRENCY", "64"))
+ADMISSION_LLM_WAIT_SECONDS = float(os.getenv("ADMISSION_LLM_WAIT_SECONDS", "15"))
+# Un lease global que no se libera (worker caído) expira tras este tiempo
+LLM_SLOT_TTL_SECONDS = float(os.getenv("LLM_SLOT_TTL_SECONDS", "90"))
+ADMISSION_POLL_SECONDS = float(os.getenv("ADMISSION_POLL_SECONDS", "0.05"))
+# Cada número recibe como mucho un aviso de ocupado o de límite por este intervalo
+ADMISSION_NOTICE_SECONDS = int(os.getenv("ADMISSION_NOTICE_SECONDS", "60"))
+
+BUSY_MESSAGE = os.getenv(
+    "ADMISSION_BUSY_MESSAGE",
+    "Estamos atendiendo muchos mensajes en este momento 🙏 Dame un momento y vuelve a escribirme, por favor.",
+)
+RATE_LIMITED_MESSAGE = os.getenv(
+    "ADMISSION_RATE_LIMITED_MESSAGE",
+    "Recibí varios mensajes tuyos muy seguidos ⏳ Espera un momento antes de enviar el siguiente, por favor.",
+)
+
+RATE_KEY_PREFIX = "admission:rate"
+NOTICE_KEY_PREFIX = "admission:notice"
+LLM_SLOTS_KEY = "admission:llm_slots"
+
+for _name, _value in (
+    ("rate_per_minute", ADMISSION_RATE_PER_MINUTE),
+    ("rate_burst", ADMISSION_RATE_BURST),
+    ("max_queue_depth", ADMISSION_MAX_QUEUE_DEPTH),
+    ("max_in_flight", ADMISSION_MAX_IN_FLIGHT),
+    ("llm_worker_concurrency", LLM_WORKER_CONCURRENCY),
+    ("llm_global_concurrency", LLM_GLOBAL_CONCURRENCY),
+):
+    ADMISSION_LIMITS.labels(_name).set(_value)
+
+
+class AdmissionRejected(Exception):
+    """No hubo lugar para la llamada al modelo dentro del tiempo de espera."""
+
+
+# --- Límite por número ---
+
+def _take_token(redis_client, key: str, now: float) -> bool:
+    rate = ADMISSION_RATE_PER_MINUTE / 60
+    # El bucket vuelve a estar lleno tras este tiempo sin mensajes: después puede expirar
+    ttl = int(ADMISSION_RATE_BURST / rate) + 1
+    for _ in range(3):
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                tokens, updated_at = pipe.hmget(key, "tokens", "updated_at")
+                if tokens is None:
+                    available = float(ADMISSION_RATE_BURST)
+                else:
+                    elapsed = max(0.0, now - float(updated_at))
+                    available = min(float(ADMISSION_RATE_BURST), float(tokens) + elapsed * rate)
+                if available < 1:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.hset(key, mapping={"tokens": available - 1, "updated_at": now})
+                pipe.expire(key, ttl)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
+    # Contención continua sobre el mismo número: se admite (fail-open)
+    return True
+
+
+async def allow_sender(redis_client, normalized_number: str) -> bool:
+    """
+    Consume un token del bucket del número. Devuelve False si el número superó
+    ADMISSION_RATE_PER_MINUTE (con ráfagas de hasta ADMISSION_RATE_BURST mensajes).
+    """
+    if not ADMISSION_ENABLED or ADMISSION_RATE_PER_MINUTE <= 0:
+        ADMISSION_DECISIONS.labels("rate_limit", "unchecked").inc()
+        return True
+    try:
+        allowed = await run_in_threadpool(
+            _take_token, redis_client, f"{RATE_KEY_PREFIX}:{normalized_number}", time.time()
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo verificar el límite de {normalized_number} en Redis: {str(e)}")
+        ADMISSION_DECISIONS.labels("rate_limit", "unchecked").inc()
+        return True
+    ADMISSION_DECISIONS.labels("rate_limit", "admitted" if allowed else "rejected").inc()
+    return allowed
+
+
+# --- Descarte por carga ---
+
+_in_flight = 0
+_queue_depth: Dict[str, float] = {"value": 0, "read_at": float("-inf")}
+
+
+@contextmanager
+def track_in_flight() -> Iterator[None]:
+    """Cuenta los mensajes que este worker está procesando (modo inline)."""
+    global _in_flight
+    _in_flight += 1
+    try:
+        yield
+    finally:
+        _in_flight -= 1
+
+
+def get_queue_depth(redis_client) -> int:
+    """Trabajos pendientes en todas las colas de RQ (una sola ida a Redis)."""
+    with redis_client.pipeline(transaction=False) as pipe:
+        for shard in range(QUEUE_SHARDS):
+            pipe.llen(get_queue(shard).key)
+        return sum(pipe.execute())
+
+
+async def should_shed(redis_client) -> bool:
+    """
+    Indica si el sistema está saturado y el mensaje debe recibir el aviso de
+    ocupado en lugar de procesarse.
+    """
+    if not ADMISSION_ENABLED:
+        return False
+    if queue_enabled():
+        if ADMISSION_MAX_QUEUE_DEPTH <= 0:
+            return False
+        now = time.monotonic()
+        if now - _queue_depth["read_at"] >= ADMISSION_DEPTH_CACHE_SECONDS:
+            try:
+                _queue_depth["value"] = await run_in_threadpool(get_queue_depth, redis_client)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo leer la profundidad de la cola: {str(e)}")
+                _queue_depth["value"] = 0
+            _queue_depth["read_at"] = now
+        overloaded = _queue_depth["value"] >= ADMISSION_MAX_QUEUE_DEPTH
+    else:
+        overloaded = 0 < ADMISSION_MAX_IN_FLIGHT <= _in_flight
+    ADMISSION_DECISIONS.labels("load", "shed" if overloaded else "admitted").inc()
+    return overloaded
+
+
+async def claim_notice(redis_client, normalized_number: str) -> bool:
+    """True si el número no recibió un aviso de admisión en los últimos ADMISSION_NOTICE_SECONDS."""
+    try:
+        return bool(await run_in_threadpool(
+            redis_client.set, f"{NOTICE_KEY_PREFIX}:{normalized_number}", 1, nx=True, ex=ADMISSION_NOTICE_SECONDS
+        ))
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo registrar el aviso para {normalized_number}: {str(e)}")
+        return True
+
+
+# --- Concurrencia de llamadas al modelo ---
+
+class WorkerLimiter:
+    """Semáforo por worker, recreado si cambia el event loop (los workers de RQ crean uno por trabajo)."""
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.limit)
+            self._loop = loop
+        return self._semaphore
+
+
+_worker_limiter = WorkerLimiter(LLM_WORKER_CONCURRENCY)
+
+
+def _try_global_slot(redis_client, token: str, now: float) -> bool:
+    # Los leases de workers caídos expiran; el conteo y el alta van en una
+    # transacción con WATCH: nunca se admiten más de LLM_GLOBAL_CONCURRENCY
+    redis_client.zremrangebyscore(LLM_SLOTS_KEY, "-inf", now - LLM_SLOT_TTL_SECONDS)
+    for _ in range(3):
+        with redis_client.pipeline() as pipe:
+            try:
+                pipe.watch(LLM_SLOTS_KEY)
+                if pipe.zcard(LLM_SLOTS_KEY) >= LLM_GLOBAL_CONCURRENCY:
+                    pipe.unwatch()
+                    return False
+                pipe.multi()
+                pipe.zadd(LLM_SLOTS_KEY, {token: now})
+                pipe.expire(LLM_SLOTS_KEY, int(LLM_SLOT_TTL_SECONDS) + 1)
+                pipe.execute()
+                return True
+            except WatchError:
+                continue
+    return False
+
+
+async def _acquire_global_slot(redis_client, token: str, deadline: float) -> bool:
+    """Espera un lugar global. Devuelve False si Redis falla (la llamada sigue sin lease)."""
+    delay = ADMISSION_POLL_SECONDS
+    while True:
+        try:
+            if await run_in_threadpool(_try_global_slot, redis_client, token, time.time()):
+                return True
+        except Exception as e:
+            logger.warning(f"⚠️ Límite global del modelo no disponible, se continúa sin él: {str(e)}")
+            return False
+        if time.monotonic() + delay > deadline:
+            raise AdmissionRejected("Sin lugar global para llamar al modelo")
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+@asynccontextmanager
+async def llm_slot(redis_client) -> AsyncIterator[None]:
+    """
+    Reserva un lugar para una llamada al modelo: primero en este worker y después
+    entre todos los workers. Lanza AdmissionRejected si no lo obtiene en
+    ADMISSION_LLM_WAIT_SECONDS.
+    """
+    if not ADMISSION_ENABLED:
+        yield
+        return
+
+    started = time.monotonic()
+    deadline = started + ADMISSION_LLM_WAIT_SECONDS
+    semaphore = _worker_limiter.semaphore if LLM_WORKER_CONCURRENCY > 0 else None
+    token = uuid.uuid4().hex
+    held_global = False
+
+    LLM_SLOTS.labels("waiting").inc()
+    try:
+        if semaphore is not None:
+            try:
+                await asyncio.wait_for(semaphore.acquire(), timeout=ADMISSION_LLM_WAIT_SECONDS)
+            except asyncio.TimeoutError:
+                raise AdmissionRejected("Sin lugar en el worker para llamar al modelo")
+        try:
+            if LLM_GLOBAL_CONCURRENCY > 0:
+                held_global = await _acquire_global_slot(redis_client, token, deadline)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+    except AdmissionRejected:
+        ADMISSION_DECISIONS.labels("llm_slot", "rejected").inc()
+        raise
+    finally:
+        LLM_SLOTS.labels("waiting").dec()
+        LLM_SLOT_WAIT.observe(time.monotonic() - started)
+
+    ADMISSION_DECISIONS.labels("llm_slot", "admitted").inc()
+    LLM_SLOTS.labels("in_use").inc()
+    try:
+        yield
+    finally:
+        LLM_SLOTS.labels("in_use").dec()
+        if semaphore is not None:
+            semaphore.release()
+        if held_global:
+            try:
+                await run_in_threadpool(redis_client.zrem, LLM_SLOTS_KEY, token)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo liberar el lugar global del modelo: {str(e)}")
+
+
+def get_admission_stats(redis_client) -> Dict[str, int]:
+    """Lugares globales del modelo ocupados y trabajos pendientes en las colas."""
+    return {
+        "llm_global_slots_in_use": redis_client.zcount(LLM_SLOTS_KEY, time.time() - LLM_SLOT_TTL_SECONDS, "+inf"),
+        "queue_depth": get_queue_depth(redis_client),
+    }
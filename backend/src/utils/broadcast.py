@@ -0,0 +1,376 @@
+import asyncio
+import codecs
+import csv
+import json
+import os
+import time
+import uuid
+from string import Template
+from typing import AsyncIterator, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.db import get_supabase, run_db
+from src.utils.circuit_breaker import CircuitOpenError
+from src.utils.loggers import logger
+from src.utils.whatsapp import RATE_KEY_PREFIX, SharedTokenBucket, WhatsAppSendError, get_whatsapp_sender
+
+load_dotenv()
+
+# Envíos simultáneos y ritmo máximo de las difusiones. Cada envío pasa además por el límite
+# del número emisor (TWILIO_MESSAGES_PER_SECOND, en Redis) que comparte con las respuestas;
+# el ritmo de difusión, también en Redis y común a todas las difusiones y workers, queda por
+# debajo para no frenar las conversaciones en curso
+BROADCAST_CONCURRENCY = int(os.getenv("BROADCAST_CONCURRENCY", "16"))
+BROADCAST_MESSAGES_PER_SECOND = float(os.getenv("BROADCAST_MESSAGES_PER_SECOND", "40"))
+# Estados por destinatario que se escriben en Supabase en cada lote
+BROADCAST_STATUS_BATCH = int(os.getenv("BROADCAST_STATUS_BATCH", "200"))
+BROADCAST_STATUS_FLUSH_SECONDS = float(os.getenv("BROADCAST_STATUS_FLUSH_SECONDS", "2"))
+# Destinatarios escritos/leídos por lote en la lista de Redis de la difusión
+BROADCAST_RECIPIENTS_BATCH = int(os.getenv("BROADCAST_RECIPIENTS_BATCH", "1000"))
+# Con el circuito de Twilio abierto la difusión espera; si sigue abierto este tiempo queda en "paused"
+BROADCAST_CIRCUIT_WAIT_SECONDS = float(os.getenv("BROADCAST_CIRCUIT_WAIT_SECONDS", "600"))
+BROADCAST_RETENTION_SECONDS = int(os.getenv("BROADCAST_RETENTION_SECONDS", str(7 * 24 * 3600)))
+
+KEY_PREFIX = "broadcast"
+PHONE_FIELDS = ("phone_number", "phone", "number", "to", "telefono")
+
+
+class BroadcastError(Exception):
+    """Difusión inexistente o datos de entrada inválidos."""
+
+
+def _keys(broadcast_id: str) -> Dict[str, str]:
+    return {
+        "meta": f"{KEY_PREFIX}:{broadcast_id}",
+        "stats": f"{KEY_PREFIX}:{broadcast_id}:stats",
+        # Números que ya se intentaron: garantiza como máximo un envío por número
+        "claimed": f"{KEY_PREFIX}:{broadcast_id}:claimed",
+        # Destinatarios normalizados con su mensaje: sobreviven a reinicios del contenedor
+        # y cualquier worker puede reanudar la difusión
+        "recipients": f"{KEY_PREFIX}:{broadcast_id}:recipients",
+    }
+
+
+def render(template: Template, fields: Dict[str, str]) -> Optional[str]:
+    """
+    Sustituye $campo / ${campo} con las columnas del destinatario. Devuelve None si
+    falta alguna variable, para no enviar la plantilla sin rellenar. Un "$" que no
+    forma una variable (p. ej. "$100") se deja tal cual.
+    """
+    if any(not fields.get(name) for name in template.get_identifiers()):
+        return None
+    return template.safe_substitute(fields).strip()
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Líneas de un cuerpo recibido por partes, sin cargarlo completo en memoria."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.strip():
+        yield pending.rstrip("\r")
+
+
+async def iter_records(chunks: AsyncIterator[bytes], fmt: str) -> AsyncIterator[Dict[str, str]]:
+    """Destinatarios de un CSV con encabezado o de un NDJSON (un objeto por línea)."""
+    header: Optional[List[str]] = None
+    async for line in iter_lines(chunks):
+        if not line.strip():
+            continue
+        if fmt == "ndjson":
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                yield {}
+                continue
+            yield {str(k): str(v) for k, v in record.items()} if isinstance(record, dict) else {}
+            continue
+        row = next(csv.reader([line]))
+        if header is None:
+            header = [column.strip().lower() for column in row]
+            continue
+        yield dict(zip(header, (value.strip() for value in row)))
+
+
+def _phone_of(record: Dict[str, str]) -> str:
+    for field in PHONE_FIELDS:
+        if record.get(field):
+            return record[field]
+    return ""
+
+
+async def create_broadcast(
+    redis_client,
+    chunks: AsyncIterator[bytes],
+    fmt: str,
+    template_text: str,
+    normalize: Callable[[str], str],
+) -> Dict[str, object]:
+    """
+    Lee los destinatarios en streaming, normaliza y deduplica los números y los
+    escribe por lotes en la lista de Redis de la difusión junto con su mensaje ya
+    renderizado.
+    """
+    if not template_text.strip():
+        raise BroadcastError("La plantilla está vacía")
+    template = Template(template_text)
+    broadcast_id = uuid.uuid4().hex
+    keys = _keys(broadcast_id)
+
+    def write(batch: List[str]) -> None:
+        pipe = redis_client.pipeline()
+        pipe.rpush(keys["recipients"], *batch)
+        pipe.expire(keys["recipients"], BROADCAST_RETENTION_SECONDS)
+        pipe.execute()
+
+    seen = set()
+    counts = {"total": 0, "invalid": 0, "duplicates": 0, "missing_fields": 0}
+    batch: List[str] = []
+    try:
+        async for record in iter_records(chunks, fmt):
+            digits = normalize(_phone_of(record))
+            # Números mexicanos: 52 + 10 dígitos (o 52 1 + 10 dígitos en el formato anterior)
+            if len(digits) not in (12, 13):
+                counts["invalid"] += 1
+                continue
+            if digits in seen:
+                counts["duplicates"] += 1
+                continue
+            seen.add(digits)
+            message = render(template, record)
+            if not message:
+                counts["missing_fields"] += 1
+                continue
+            batch.append(json.dumps({"phone_number": digits, "message": message}, ensure_ascii=False))
+            counts["total"] += 1
+            if len(batch) >= BROADCAST_RECIPIENTS_BATCH:
+                await run_in_threadpool(write, batch)
+                batch = []
+        if batch:
+            await run_in_threadpool(write, batch)
+    except Exception:
+        # Lista incompleta (cuerpo cortado o Redis caído): no dejar una difusión a medias
+        await run_in_threadpool(redis_client.delete, keys["recipients"])
+        raise
+
+    if not counts["total"]:
+        raise BroadcastError("La lista no contiene destinatarios válidos")
+
+    created_at = time.time()
+    pipe = redis_client.pipeline()
+    pipe.hset(keys["meta"], mapping={"status": "pending", "template": template_text, "created_at": created_at, **counts})
+    pipe.expire(keys["meta"], BROADCAST_RETENTION_SECONDS)
+    await run_in_threadpool(pipe.execute)
+    try:
+        await run_db(lambda: get_supabase().table("broadcasts").insert({
+            "id": broadcast_id, "template": template_text, "total": counts["total"], "status": "pending",
+        }).execute())
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo registrar la difusión {broadcast_id} en Supabase: {str(e)}")
+
+    logger.info(f"📣 Difusión {broadcast_id} creada: {counts['total']} destinatarios, "
+                f"{counts['invalid']} inválidos, {counts['duplicates']} duplicados, "
+                f"{counts['missing_fields']} sin las variables de la plantilla")
+    return {"broadcast_id": broadcast_id, **counts}
+
+
+class StatusWriter:
+    """Acumula el estado de cada destinatario y lo escribe en Supabase y Redis por lotes."""
+
+    def __init__(self, redis_client, broadcast_id: str):
+        self.redis = redis_client
+        self.broadcast_id = broadcast_id
+        self.pending: List[Dict[str, Optional[str]]] = []
+        self._lock = asyncio.Lock()
+        self._flushed_at = time.monotonic()
+
+    async def add(self, phone_number: str, status: str, message_sid: Optional[str] = None,
+                  error: Optional[str] = None) -> None:
+        self.pending.append({
+            "broadcast_id": self.broadcast_id, "phone_number": phone_number, "status": status,
+            "message_sid": message_sid, "error": error,
+        })
+        if (len(self.pending) >= BROADCAST_STATUS_BATCH
+                or time.monotonic() - self._flushed_at >= BROADCAST_STATUS_FLUSH_SECONDS):
+            await self.flush()
+
+    async def flush(self) -> None:
+        async with self._lock:
+            batch, self.pending = self.pending, []
+            self._flushed_at = time.monotonic()
+            if not batch:
+                return
+            counts: Dict[str, int] = {}
+            for row in batch:
+                counts[row["status"]] = counts.get(row["status"], 0) + 1
+            pipe = self.redis.pipeline()
+            for status, count in counts.items():
+                pipe.hincrby(_keys(self.broadcast_id)["stats"], status, count)
+            pipe.expire(_keys(self.broadcast_id)["stats"], BROADCAST_RETENTION_SECONDS)
+            await run_in_threadpool(pipe.execute)
+            try:
+                await run_db(lambda: get_supabase().table("broadcast_recipients")
+                             .upsert(batch, on_conflict="broadcast_id,phone_number").execute())
+            except Exception as e:
+                # Los contadores de Redis ya reflejan el lote; el detalle por número se pierde
+                logger.error(f"❌ No se pudo guardar el estado de {len(batch)} destinatarios: {str(e)}")
+
+
+def _read_recipients(redis_client, key: str, start: int) -> List[Dict[str, str]]:
+    return [json.loads(item) for item in redis_client.lrange(key, start, start + BROADCAST_RECIPIENTS_BATCH - 1)]
+
+
+async def run_broadcast(redis_client, broadcast_id: str, concurrency: int = BROADCAST_CONCURRENCY,
+                        messages_per_second: float = BROADCAST_MESSAGES_PER_SECOND) -> Dict[str, object]:
+    """
+    Envía la difusión con `concurrency` envíos simultáneos y un ritmo máximo común
+    a todas las difusiones en curso desde el mismo número (token bucket en Redis).
+
+    Antes de cada envío el número se agrega al conjunto `claimed` en Redis: si ya
+    estaba (otra ejecución o una anterior que se cayó), no se vuelve a enviar.
+    Reanudar es volver a llamar a esta función con el mismo id.
+
+    Si el circuito de Twilio está abierto el envío no se intenta: el número deja de
+    estar reclamado y se reintenta al cerrarse. Si sigue abierto durante
+    BROADCAST_CIRCUIT_WAIT_SECONDS la difusión termina como "paused".
+    """
+    keys = _keys(broadcast_id)
+    total = await run_in_threadpool(redis_client.llen, keys["recipients"])
+    if not total:
+        raise BroadcastError(f"No existen los destinatarios de la difusión {broadcast_id} (¿expiró?)")
+
+    await run_in_threadpool(redis_client.hset, keys["meta"], "status", "running")
+    claimed = {
+        member.decode() if isinstance(member, bytes) else member
+        for member in await run_in_threadpool(redis_client.smembers, keys["claimed"])
+    }
+    logger.info(f"📣 Difusión {broadcast_id}: {total - len(claimed)} pendientes, {len(claimed)} ya intentados")
+
+    sender = get_whatsapp_sender()
+    bucket = SharedTokenBucket(
+        redis_client, f"{RATE_KEY_PREFIX}:broadcast:{sender.from_number}",
+        messages_per_second, max(1, int(messages_per_second)),
+    )
+    writer = StatusWriter(redis_client, broadcast_id)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=concurrency * 2)
+
+    paused = asyncio.Event()
+    blocked: Dict[str, Optional[float]] = {"since": None}
+
+    async def deliver_one(recipient: Dict[str, str]) -> Optional[float]:
+        """Envía a un destinatario; con el circuito abierto devuelve cuánto esperar antes de reintentar."""
+        phone_number = recipient["phone_number"]
+        first_claim = await run_in_threadpool(redis_client.sadd, keys["claimed"], phone_number)
+        if not first_claim:
+            return None
+        await bucket.acquire()
+        try:
+            result = await sender.send(phone_number, message=recipient["message"])
+            await writer.add(phone_number, "sent", message_sid=result.get("sid"))
+        except CircuitOpenError as e:
+            # No llegó a Twilio: no es un fallo del número, vuelve a quedar pendiente
+            await run_in_threadpool(redis_client.srem, keys["claimed"], phone_number)
+            return max(e.retry_after, 1.0)
+        except WhatsAppSendError as e:
+            await writer.add(phone_number, "failed", error=str(e)[:500])
+        except Exception as e:
+            logger.error(f"❌ Error inesperado enviando la difusión a {phone_number}: {str(e)}")
+            await writer.add(phone_number, "failed", error=str(e)[:500])
+        return None
+
+    async def deliver() -> None:
+        while True:
+            recipient = await queue.get()
+            if recipient is None:
+                return
+            while not paused.is_set():
+                wait = await deliver_one(recipient)
+                if wait is None:
+                    blocked["since"] = None
+                    break
+                blocked["since"] = blocked["since"] or time.monotonic()
+                if time.monotonic() - blocked["since"] >= BROADCAST_CIRCUIT_WAIT_SECONDS:
+                    logger.warning(f"⏸️ Difusión {broadcast_id} en pausa: el circuito de Twilio sigue abierto")
+                    paused.set()
+                    break
+                await asyncio.sleep(wait)
+
+    workers = [asyncio.create_task(deliver()) for _ in range(concurrency)]
+    try:
+        for start in range(0, total, BROADCAST_RECIPIENTS_BATCH):
+            page = await run_in_threadpool(_read_recipients, redis_client, keys["recipients"], start)
+            if paused.is_set():
+                break
+            for recipient in page:
+                if recipient["phone_number"] not in claimed:
+                    await queue.put(recipient)
+        for _ in workers:
+            await queue.put(None)
+        await asyncio.gather(*workers)
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await writer.flush()
+
+    pipe = redis_client.pipeline()
+    pipe.expire(keys["claimed"], BROADCAST_RETENTION_SECONDS)
+    pipe.expire(keys["recipients"], BROADCAST_RETENTION_SECONDS)
+    await run_in_threadpool(pipe.execute)
+    status = await get_broadcast_status(redis_client, broadcast_id)
+    if paused.is_set():
+        final = "paused"
+    else:
+        final = "completed" if not status["unknown"] else "completed_with_unknown"
+    await run_in_threadpool(redis_client.hset, keys["meta"], "status", final)
+    try:
+        await run_db(lambda: get_supabase().table("broadcasts").update({"status": final})
+                     .eq("id", broadcast_id).execute())
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo actualizar la difusión {broadcast_id} en Supabase: {str(e)}")
+    logger.info(f"✅ Difusión {broadcast_id} {'en pausa' if paused.is_set() else 'terminada'}: "
+                f"{status['sent']} enviados, {status['failed']} fallidos, {status['pending']} pendientes")
+    return {**status, "status": final}
+
+
+async def get_broadcast_status(redis_client, broadcast_id: str) -> Dict[str, object]:
+    """
+    Progreso de la difusión. `unknown` son números marcados como intentados sin
+    estado final: durante el envío incluye los que están en curso; al terminar, los
+    de una ejecución que se cayó a mitad de un envío (no se reintentan).
+    """
+    keys = _keys(broadcast_id)
+
+    def read():
+        pipe = redis_client.pipeline()
+        pipe.hgetall(keys["meta"])
+        pipe.hgetall(keys["stats"])
+        pipe.scard(keys["claimed"])
+        return pipe.execute()
+
+    meta, stats, claimed = await run_in_threadpool(read)
+    if not meta:
+        raise BroadcastError(f"No existe la difusión {broadcast_id}")
+    decode = lambda value: value.decode() if isinstance(value, bytes) else value  # noqa: E731
+    meta = {decode(k): decode(v) for k, v in meta.items()}
+    stats = {decode(k): int(v) for k, v in stats.items()}
+    sent, failed = stats.get("sent", 0), stats.get("failed", 0)
+    total = int(meta.get("total", 0))
+    return {
+        "broadcast_id": broadcast_id,
+        "status": meta.get("status"),
+        "total": total,
+        "invalid": int(meta.get("invalid", 0)),
+        "duplicates": int(meta.get("duplicates", 0)),
+        "missing_fields": int(meta.get("missing_fields", 0)),
+        "sent": sent,
+        "failed": failed,
+        "unknown": max(0, claimed - sent - failed),
+        "pending": max(0, total - claimed),
+    }
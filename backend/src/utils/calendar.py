@@ -0,0 +1,361 @@
+"""
+Zona horaria del negocio y seguimientos programados ("te escribo mañana a las 10").
+
+Las horas se calculan con la base de datos IANA (zoneinfo): America/Mexico_City
+dejó el horario de verano en 2022 y otras zonas del país tienen reglas propias.
+
+Los seguimientos viven en Redis:
+  - `followups:due`: ZSET con la hora de envío (epoch UTC) de cada seguimiento.
+  - `followups:payload`: hash id -> JSON con el número, el mensaje y los intentos.
+  - `followups:inflight`: ZSET de los reclamados por un despachador, con su plazo.
+
+El despachador (followups.py) no recorre los pendientes uno a uno: reclama los
+vencidos por lotes con un script Lua que los saca de `due` y los agrega a
+`inflight` en un solo paso (cada seguimiento lo reclama un solo despachador y
+ninguno se pierde entre los dos comandos) y los envía con concurrencia y ritmo
+acotados. Si un despachador se cae a mitad de un lote, lo reclamado vuelve a la
+cola al vencer FOLLOWUP_VISIBILITY_SECONDS (entrega al menos una vez).
+Cancelar borra el payload: un seguimiento en curso ya no se reintenta.
+
+Fuera de la ventana de 24 h de WhatsApp, Twilio solo acepta plantillas
+aprobadas: esos envíos fallan como definitivos y no se reintentan.
+"""
+import asyncio
+import json
+import os
+import time
+import uuid
+from datetime import date, datetime, time as dt_time, timedelta, timezone
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.db import run_db
+from src.db.conversations import get_conversation_store
+from src.utils.loggers import logger
+from src.utils.metrics import FOLLOWUPS
+from src.utils.whatsapp import TokenBucket, WhatsAppSendError, get_whatsapp_sender
+
+load_dotenv()
+
+BUSINESS_TIMEZONE = os.getenv("BUSINESS_TIMEZONE", "America/Mexico_City")
+
+# Seguimientos reclamados por lote y envíos simultáneos; el ritmo queda por debajo
+# del límite del número emisor para no frenar las conversaciones en curso
+FOLLOWUP_BATCH_SIZE = int(os.getenv("FOLLOWUP_BATCH_SIZE", "500"))
+FOLLOWUP_CONCURRENCY = int(os.getenv("FOLLOWUP_CONCURRENCY", "16"))
+FOLLOWUP_MESSAGES_PER_SECOND = float(os.getenv("FOLLOWUP_MESSAGES_PER_SECOND", "20"))
+# Espera máxima del despachador sin seguimientos vencidos
+FOLLOWUP_POLL_SECONDS = float(os.getenv("FOLLOWUP_POLL_SECONDS", "1"))
+# Un seguimiento reclamado y sin confirmar vuelve a la cola tras este tiempo
+FOLLOWUP_VISIBILITY_SECONDS = float(os.getenv("FOLLOWUP_VISIBILITY_SECONDS", "300"))
+FOLLOWUP_MAX_ATTEMPTS = int(os.getenv("FOLLOWUP_MAX_ATTEMPTS", "3"))
+FOLLOWUP_RETRY_SECONDS = float(os.getenv("FOLLOWUP_RETRY_SECONDS", "60"))
+# Con más retraso que esto (despachador detenido) el seguimiento se descarta
+FOLLOWUP_MAX_LATENESS_SECONDS = float(os.getenv("FOLLOWUP_MAX_LATENESS_SECONDS", str(6 * 3600)))
+# Guardar el seguimiento enviado en el historial para que el modelo lo vea
+FOLLOWUP_RECORD_HISTORY = os.getenv("FOLLOWUP_RECORD_HISTORY", "true").lower() in ("1", "true", "yes")
+
+DUE_KEY = "followups:due"
+INFLIGHT_KEY = "followups:inflight"
+PAYLOAD_KEY = "followups:payload"
+SCHEDULE_CHUNK = 1000
+
+# KEYS: due, inflight, payload; ARGV: ahora, límite, plazo de visibilidad.
+# Devuelve [id1, payload1, id2, payload2, ...] (payload nil si se canceló)
+CLAIM_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, tonumber(ARGV[2]))
+local claimed = {}
+for i, id in ipairs(ids) do
+    redis.call('ZREM', KEYS[1], id)
+    redis.call('ZADD', KEYS[2], ARGV[3], id)
+    claimed[2 * i - 1] = id
+    claimed[2 * i] = redis.call('HGET', KEYS[3], id)
+end
+return claimed
+"""
+
+# KEYS: due, inflight, payload; ARGV: id, payload, hora del reintento.
+# Solo reprograma si el payload sigue existiendo (no se canceló durante el envío)
+RETRY_SCRIPT = """
+redis.call('ZREM', KEYS[2], ARGV[1])
+if redis.call('HEXISTS', KEYS[3], ARGV[1]) == 0 then
+    return 0
+end
+redis.call('HSET', KEYS[3], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+return 1
+"""
+
+
+class FollowupError(Exception):
+    """Seguimiento inexistente o datos de entrada inválidos."""
+
+
+# --- Zona horaria ---
+
+@lru_cache(maxsize=32)
+def get_timezone(name: Optional[str] = None) -> ZoneInfo:
+    """Zona IANA por nombre (la del negocio por defecto)."""
+    try:
+        return ZoneInfo(name or BUSINESS_TIMEZONE)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise FollowupError(f"Zona horaria desconocida: {name}")
+
+
+def now_local(tz_name: Optional[str] = None) -> datetime:
+    """Hora actual en la zona del negocio (o en `tz_name`), con su desplazamiento."""
+    return datetime.now(get_timezone(tz_name))
+
+
+def localize(value: datetime, tz_name: Optional[str] = None) -> datetime:
+    """Interpreta una hora sin zona como hora local de `tz_name`; las que traen zona no cambian."""
+    if value.tzinfo is not None:
+        return value
+    # Ida y vuelta por UTC: una hora inexistente (cambio de horario) pasa a la siguiente válida
+    return value.replace(tzinfo=get_timezone(tz_name)).astimezone(timezone.utc).astimezone(get_timezone(tz_name))
+
+
+def at_local_time(hour: int, minute: int = 0, days: int = 0, tz_name: Optional[str] = None,
+                  now: Optional[datetime] = None) -> datetime:
+    """
+    `days` días después de hoy a la hora local indicada: at_local_time(10, days=1)
+    es "mañana a las 10" en la zona del cliente.
+    """
+    today: date = (now or now_local(tz_name)).astimezone(get_timezone(tz_name)).date()
+    return localize(datetime.combine(today + timedelta(days=days), dt_time(hour, minute)), tz_name)
+
+
+# --- Seguimientos ---
+
+def _decode(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+async def schedule_followups(redis_client, followups: Iterable[Dict[str, Any]]) -> List[str]:
+    """
+    Programa seguimientos {"phone_number", "message", "due_at" (datetime con zona),
+    "id" opcional}. Reprogramar un id existente reemplaza su mensaje y su hora.
+    Se escriben en pipelines de SCHEDULE_CHUNK para cargas grandes.
+    """
+    ids: List[str] = []
+    pipe = redis_client.pipeline(transaction=False)
+    pending = 0
+    for followup in followups:
+        due_at: datetime = followup["due_at"]
+        if due_at.tzinfo is None:
+            raise FollowupError("due_at debe incluir zona horaria (usar localize)")
+        followup_id = followup.get("id") or uuid.uuid4().hex
+        payload = {
+            "id": followup_id,
+            "phone_number": followup["phone_number"],
+            "message": followup["message"],
+            "due_at": due_at.isoformat(),
+            "attempts": 0,
+        }
+        pipe.hset(PAYLOAD_KEY, followup_id, json.dumps(payload, ensure_ascii=False))
+        pipe.zadd(DUE_KEY, {followup_id: due_at.timestamp()})
+        ids.append(followup_id)
+        pending += 1
+        if pending >= SCHEDULE_CHUNK:
+            await run_in_threadpool(pipe.execute)
+            pending = 0
+    if pending:
+        await run_in_threadpool(pipe.execute)
+    return ids
+
+
+async def schedule_followup(redis_client, phone_number: str, message: str, due_at: datetime,
+                            followup_id: Optional[str] = None) -> str:
+    """Programa un seguimiento y devuelve su id."""
+    ids = await schedule_followups(redis_client, [
+        {"id": followup_id, "phone_number": phone_number, "message": message, "due_at": due_at}
+    ])
+    logger.info(f"⏰ Seguimiento {ids[0]} programado para {phone_number} el {due_at.isoformat()}")
+    return ids[0]
+
+
+async def get_followup(redis_client, followup_id: str) -> Dict[str, Any]:
+    def read():
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.hget(PAYLOAD_KEY, followup_id)
+        pipe.zscore(INFLIGHT_KEY, followup_id)
+        return pipe.execute()
+
+    raw, inflight = await run_in_threadpool(read)
+    if raw is None:
+        raise FollowupError(f"No existe el seguimiento {followup_id}")
+    return {**json.loads(raw), "status": "sending" if inflight is not None else "scheduled"}
+
+
+async def cancel_followup(redis_client, followup_id: str) -> bool:
+    """
+    Cancela un seguimiento. Devuelve False si no existía o ya se envió. Si está en
+    curso, el envío actual puede completarse pero ya no se reintenta.
+    """
+    def remove():
+        pipe = redis_client.pipeline()
+        pipe.zrem(DUE_KEY, followup_id)
+        pipe.hdel(PAYLOAD_KEY, followup_id)
+        return pipe.execute()
+
+    _, deleted = await run_in_threadpool(remove)
+    return bool(deleted)
+
+
+def _claim_due(redis_client, now: float, limit: int) -> List[Tuple[str, Optional[bytes]]]:
+    """Reclama hasta `limit` seguimientos vencidos en una sola ida a Redis (script atómico)."""
+    claim = redis_client.register_script(CLAIM_SCRIPT)
+    flat = claim(keys=[DUE_KEY, INFLIGHT_KEY, PAYLOAD_KEY], args=[now, limit, now + FOLLOWUP_VISIBILITY_SECONDS])
+    return [(_decode(flat[index]), flat[index + 1]) for index in range(0, len(flat), 2)]
+
+
+def _requeue_expired(redis_client, now: float, limit: int) -> int:
+    """Devuelve a la cola los seguimientos reclamados por un despachador que no los confirmó."""
+    expired = [_decode(m) for m in redis_client.zrangebyscore(INFLIGHT_KEY, "-inf", now, start=0, num=limit)]
+    if expired:
+        pipe = redis_client.pipeline()
+        pipe.zadd(DUE_KEY, {followup_id: now for followup_id in expired})
+        pipe.zrem(INFLIGHT_KEY, *expired)
+        pipe.execute()
+    return len(expired)
+
+
+def _finish(redis_client, followup_id: str) -> None:
+    pipe = redis_client.pipeline()
+    pipe.zrem(INFLIGHT_KEY, followup_id)
+    pipe.hdel(PAYLOAD_KEY, followup_id)
+    pipe.execute()
+
+
+def _retry(redis_client, payload: Dict[str, Any], due: float) -> bool:
+    """Reprograma un envío fallido; False si el seguimiento se canceló mientras estaba en curso."""
+    retry = redis_client.register_script(RETRY_SCRIPT)
+    return bool(retry(keys=[DUE_KEY, INFLIGHT_KEY, PAYLOAD_KEY],
+                      args=[payload["id"], json.dumps(payload, ensure_ascii=False), due]))
+
+
+async def _record_history(phone_number: str, message: str) -> None:
+    try:
+        await run_db(get_conversation_store().append, phone_number, {
+            "role": "assistant", "content": message, "timestamp": now_local().isoformat(),
+        })
+    except Exception as e:
+        logger.warning(f"⚠️ Seguimiento enviado a {phone_number} sin guardar en el historial: {str(e)}")
+
+
+async def deliver_followup(redis_client, followup_id: str, raw: Optional[bytes], now: float,
+                           bucket: Optional[TokenBucket] = None) -> str:
+    """Envía un seguimiento reclamado y devuelve el resultado: sent, failed, retry, expired o cancelled."""
+    if raw is None:
+        # Cancelado después de reclamarlo
+        await run_in_threadpool(redis_client.zrem, INFLIGHT_KEY, followup_id)
+        return "cancelled"
+    payload = json.loads(raw)
+    due = datetime.fromisoformat(payload["due_at"]).timestamp()
+    if now - due > FOLLOWUP_MAX_LATENESS_SECONDS and not payload["attempts"]:
+        logger.warning(f"⌛ Seguimiento {followup_id} descartado: vencía el {payload['due_at']}")
+        await run_in_threadpool(_finish, redis_client, followup_id)
+        return "expired"
+
+    if bucket is not None:
+        await bucket.acquire()
+    try:
+        await get_whatsapp_sender().send(payload["phone_number"], message=payload["message"])
+    except WhatsAppSendError as e:
+        logger.error(f"❌ Seguimiento {followup_id} rechazado por Twilio: {str(e)}")
+        await run_in_threadpool(_finish, redis_client, followup_id)
+        return "failed"
+    except Exception as e:
+        payload["attempts"] += 1
+        if payload["attempts"] >= FOLLOWUP_MAX_ATTEMPTS:
+            logger.error(f"❌ Seguimiento {followup_id} falló {payload['attempts']} veces: {str(e)}")
+            await run_in_threadpool(_finish, redis_client, followup_id)
+            return "failed"
+        retry_at = time.time() + FOLLOWUP_RETRY_SECONDS * 2 ** (payload["attempts"] - 1)
+        if not await run_in_threadpool(_retry, redis_client, payload, retry_at):
+            logger.info(f"🚫 Seguimiento {followup_id} cancelado durante el envío: no se reintenta")
+            return "cancelled"
+        logger.warning(f"⚠️ Seguimiento {followup_id} se reintentará: {str(e)}")
+        return "retry"
+
+    await run_in_threadpool(_finish, redis_client, followup_id)
+    if FOLLOWUP_RECORD_HISTORY:
+        await _record_history(payload["phone_number"], payload["message"])
+    return "sent"
+
+
+async def dispatch_due(redis_client, batch_size: int = FOLLOWUP_BATCH_SIZE, concurrency: int = FOLLOWUP_CONCURRENCY,
+                       bucket: Optional[TokenBucket] = None) -> Dict[str, int]:
+    """Reclama un lote de seguimientos vencidos y los envía con `concurrency` envíos simultáneos."""
+    now = time.time()
+    claimed = await run_in_threadpool(_claim_due, redis_client, now, batch_size)
+    stats = {"claimed": len(claimed)}
+    if not claimed:
+        return stats
+
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def deliver(followup_id: str, raw: Optional[bytes]) -> None:
+        async with semaphore:
+            try:
+                result = await deliver_followup(redis_client, followup_id, raw, now, bucket)
+            except Exception as e:
+                # Sin confirmar: vuelve a la cola al vencer su plazo de visibilidad
+                logger.error(f"❌ Error inesperado con el seguimiento {followup_id}: {str(e)}", exc_info=True)
+                result = "error"
+        stats[result] = stats.get(result, 0) + 1
+        FOLLOWUPS.labels(result).inc()
+
+    await asyncio.gather(*(deliver(*item) for item in claimed))
+    return stats
+
+
+def _next_due(redis_client) -> Optional[float]:
+    head = redis_client.zrange(DUE_KEY, 0, 0, withscores=True)
+    return head[0][1] if head else None
+
+
+async def run_dispatcher(redis_client, stop: asyncio.Event) -> None:
+    """
+    Envía los seguimientos a medida que vencen hasta que se active `stop`. Varios
+    despachadores pueden correr a la vez sobre el mismo Redis.
+    """
+    bucket = TokenBucket(FOLLOWUP_MESSAGES_PER_SECOND, max(1, int(FOLLOWUP_MESSAGES_PER_SECOND)))
+    logger.info(f"⏰ Despachador de seguimientos iniciado (lotes de {FOLLOWUP_BATCH_SIZE}, "
+                f"{FOLLOWUP_CONCURRENCY} envíos simultáneos, {FOLLOWUP_MESSAGES_PER_SECOND} msg/s)")
+    while not stop.is_set():
+        try:
+            requeued = await run_in_threadpool(_requeue_expired, redis_client, time.time(), FOLLOWUP_BATCH_SIZE)
+            if requeued:
+                logger.warning(f"🔁 {requeued} seguimientos sin confirmar devueltos a la cola")
+            stats = await dispatch_due(redis_client, bucket=bucket)
+            if stats["claimed"]:
+                logger.info(f"📨 Lote de seguimientos: {stats}")
+            if stats["claimed"] >= FOLLOWUP_BATCH_SIZE:
+                continue
+            next_due = await run_in_threadpool(_next_due, redis_client)
+        except Exception as e:
+            logger.error(f"❌ Error en el despachador de seguimientos: {str(e)}", exc_info=True)
+            next_due = None
+        # Se duerme hasta el siguiente vencimiento, como mucho FOLLOWUP_POLL_SECONDS
+        # (un seguimiento nuevo puede vencer antes)
+        delay = FOLLOWUP_POLL_SECONDS if next_due is None else min(FOLLOWUP_POLL_SECONDS, max(0.0, next_due - time.time()))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=delay)
+        except asyncio.TimeoutError:
+            pass
+    logger.info("⏰ Despachador de seguimientos detenido")
+
+
+def get_followup_stats(redis_client) -> Dict[str, int]:
+    """Seguimientos programados, vencidos sin enviar y en envío."""
+    pipe = redis_client.pipeline(transaction=False)
+    pipe.zcard(DUE_KEY)
+    pipe.zcount(DUE_KEY, "-inf", time.time())
+    pipe.zcard(INFLIGHT_KEY)
+    scheduled, overdue, inflight = pipe.execute()
+    return {"scheduled": scheduled, "overdue": overdue, "inflight": inflight}
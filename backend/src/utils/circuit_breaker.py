@@ -0,0 +1,253 @@
+"""
+Circuit breakers para las dependencias externas (Supabase, proveedores de modelos, Twilio).
+
+Cada breaker cuenta éxitos y fallos en una ventana deslizante de
+CIRCUIT_WINDOW_SECONDS. Con al menos CIRCUIT_MIN_CALLS llamadas y una tasa de
+fallos de CIRCUIT_FAILURE_RATE o más se abre: durante CIRCUIT_OPEN_SECONDS las
+llamadas fallan al instante con CircuitOpenError, sin esperar el timeout de la
+dependencia. Después pasa a semiabierto y deja pasar hasta CIRCUIT_HALF_OPEN_CALLS
+llamadas de prueba: si todas salen bien se cierra, y un fallo lo vuelve a abrir.
+
+Solo cuentan como fallo los errores de la dependencia (conexión, timeout, 5xx),
+según el `is_failure` de cada breaker; un 4xx significa que el servicio responde.
+El estado es por proceso. Cada valor admite un override por dependencia:
+CIRCUIT_<NOMBRE>_OPEN_SECONDS, p. ej. CIRCUIT_SUPABASE_OPEN_SECONDS o
+CIRCUIT_LLM_OPENAI_FAILURE_RATE.
+"""
+import asyncio
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, Deque, Dict, Iterator, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from src.utils.loggers import logger
+from src.utils.metrics import CIRCUIT_CALLS, CIRCUIT_STATE
+
+load_dotenv()
+
+CIRCUIT_BREAKERS_ENABLED = os.getenv("CIRCUIT_BREAKERS_ENABLED", "true").lower() in ("1", "true", "yes")
+CIRCUIT_FAILURE_RATE = float(os.getenv("CIRCUIT_FAILURE_RATE", "0.5"))
+CIRCUIT_MIN_CALLS = int(os.getenv("CIRCUIT_MIN_CALLS", "10"))
+CIRCUIT_WINDOW_SECONDS = int(os.getenv("CIRCUIT_WINDOW_SECONDS", "30"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "15"))
+CIRCUIT_HALF_OPEN_CALLS = int(os.getenv("CIRCUIT_HALF_OPEN_CALLS", "3"))
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Estados HTTP que indican un problema de la dependencia y no de la petición
+TRANSIENT_STATUS = {408, 429}
+
+
+class CircuitOpenError(Exception):
+    """La dependencia tiene el circuito abierto: la llamada se rechaza sin intentarla."""
+
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"Circuito '{name}' abierto, siguiente prueba en {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_transient_error(exc: BaseException) -> bool:
+    """Errores de red, timeouts y respuestas 5xx/408/429 (httpx o SDKs con `status_code`)."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status >= 500 or status in TRANSIENT_STATUS
+    return isinstance(exc, (httpx.TransportError, asyncio.TimeoutError, ConnectionError, TimeoutError))
+
+
+def _setting(name: str, key: str, default: float) -> float:
+    prefix = re.sub(r"[^A-Z0-9]+", "_", name.upper())
+    return float(os.getenv(f"CIRCUIT_{prefix}_{key}", str(default)))
+
+
+class CircuitBreaker:
+    """Breaker con ventana de tasa de fallos por segundos y estado semiabierto con pruebas limitadas."""
+
+    def __init__(
+        self,
+        name: str,
+        is_failure: Callable[[BaseException], bool] = is_transient_error,
+        failure_rate: float = CIRCUIT_FAILURE_RATE,
+        min_calls: int = CIRCUIT_MIN_CALLS,
+        window_seconds: int = CIRCUIT_WINDOW_SECONDS,
+        open_seconds: float = CIRCUIT_OPEN_SECONDS,
+        half_open_calls: int = CIRCUIT_HALF_OPEN_CALLS,
+    ):
+        self.name = name
+        self.is_failure = is_failure
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.changed_at = time.time()
+        # [segundo, éxitos, fallos] por segundo de la ventana
+        self._buckets: Deque[List[int]] = deque()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._lock = threading.Lock()
+        CIRCUIT_STATE.labels(name).set(STATE_VALUES[CLOSED])
+
+    @classmethod
+    def from_env(cls, name: str, is_failure: Callable[[BaseException], bool] = is_transient_error) -> "CircuitBreaker":
+        return cls(
+            name,
+            is_failure,
+            failure_rate=_setting(name, "FAILURE_RATE", CIRCUIT_FAILURE_RATE),
+            min_calls=int(_setting(name, "MIN_CALLS", CIRCUIT_MIN_CALLS)),
+            window_seconds=int(_setting(name, "WINDOW_SECONDS", CIRCUIT_WINDOW_SECONDS)),
+            open_seconds=_setting(name, "OPEN_SECONDS", CIRCUIT_OPEN_SECONDS),
+            half_open_calls=int(_setting(name, "HALF_OPEN_CALLS", CIRCUIT_HALF_OPEN_CALLS)),
+        )
+
+    def _transition(self, state: str) -> None:
+        previous, self.state = self.state, state
+        self.changed_at = time.time()
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        if state == OPEN:
+            self.opened_at = time.monotonic()
+        if state == CLOSED:
+            self._buckets.clear()
+        CIRCUIT_STATE.labels(self.name).set(STATE_VALUES[state])
+        icon = {OPEN: "🔴", HALF_OPEN: "🟡", CLOSED: "🟢"}[state]
+        logger.warning(f"{icon} Circuito '{self.name}': {previous} -> {state}")
+
+    def _counts(self, now: int) -> List[int]:
+        while self._buckets and self._buckets[0][0] <= now - self.window_seconds:
+            self._buckets.popleft()
+        return [sum(bucket[1] for bucket in self._buckets), sum(bucket[2] for bucket in self._buckets)]
+
+    def _add(self, ok: bool) -> None:
+        now = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != now:
+            self._buckets.append([now, 0, 0])
+        self._buckets[-1][1 if ok else 2] += 1
+        successes, failures = self._counts(now)
+        total = successes + failures
+        if not ok and total >= self.min_calls and failures / total >= self.failure_rate:
+            self._transition(OPEN)
+
+    def _retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def available(self) -> bool:
+        """Indica si una llamada se intentaría ahora (no reserva lugar de prueba)."""
+        if not CIRCUIT_BREAKERS_ENABLED:
+            return True
+        with self._lock:
+            if self.state == OPEN:
+                return self._retry_after() == 0
+            return self.state == CLOSED or self._probes_in_flight < self.half_open_calls
+
+    def acquire(self) -> bool:
+        """
+        Pide permiso para una llamada; CircuitOpenError si no se puede intentar.
+        Devuelve True si la llamada es una prueba del estado semiabierto.
+        """
+        if not CIRCUIT_BREAKERS_ENABLED:
+            return False
+        with self._lock:
+            if self.state == CLOSED:
+                return False
+            if self.state == OPEN:
+                retry_after = self._retry_after()
+                if retry_after > 0:
+                    CIRCUIT_CALLS.labels(self.name, "rejected").inc()
+                    raise CircuitOpenError(self.name, retry_after)
+                self._transition(HALF_OPEN)
+            if self._probes_in_flight >= self.half_open_calls:
+                CIRCUIT_CALLS.labels(self.name, "rejected").inc()
+                raise CircuitOpenError(self.name, 0.0)
+            self._probes_in_flight += 1
+            return True
+
+    def record(self, ok: bool, probe: bool) -> None:
+        """Registra el resultado de una llamada autorizada por `acquire`."""
+        if not CIRCUIT_BREAKERS_ENABLED:
+            return
+        CIRCUIT_CALLS.labels(self.name, "success" if ok else "failure").inc()
+        with self._lock:
+            if probe:
+                if self.state != HALF_OPEN:
+                    return
+                self._probes_in_flight -= 1
+                if not ok:
+                    self._transition(OPEN)
+                    return
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_calls:
+                    self._transition(CLOSED)
+            elif self.state == CLOSED:
+                # Los resultados de llamadas iniciadas antes de abrir el circuito no cuentan
+                self._add(ok)
+
+    def release(self, probe: bool) -> None:
+        """Libera el lugar de una llamada cancelada sin resultado."""
+        if probe and CIRCUIT_BREAKERS_ENABLED:
+            with self._lock:
+                if self.state == HALF_OPEN:
+                    self._probes_in_flight -= 1
+
+    @contextmanager
+    def guard(self) -> Iterator[None]:
+        """
+        Envuelve una llamada (síncrona o `await`) a la dependencia:
+        rechaza con CircuitOpenError si el circuito está abierto y registra el resultado.
+        """
+        probe = self.acquire()
+        try:
+            yield
+        except Exception as e:
+            self.record(not self.is_failure(e), probe)
+            raise
+        except BaseException:
+            self.release(probe)
+            raise
+        else:
+            self.record(True, probe)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            if self.state == OPEN and self._retry_after() == 0:
+                state = HALF_OPEN
+            else:
+                state = self.state
+            successes, failures = self._counts(int(time.monotonic()))
+            total = successes + failures
+            return {
+                "state": state,
+                "calls": total,
+                "failure_rate": round(failures / total, 3) if total else 0.0,
+                "retry_after_seconds": round(self._retry_after(), 1) if self.state == OPEN else 0.0,
+                "changed_at": self.changed_at,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name: str, is_failure: Optional[Callable[[BaseException], bool]] = None) -> CircuitBreaker:
+    """Obtiene (o crea) el breaker del proceso para una dependencia."""
+    if name not in _breakers:
+        with _registry_lock:
+            if name not in _breakers:
+                _breakers[name] = CircuitBreaker.from_env(name, is_failure or is_transient_error)
+    return _breakers[name]
+
+
+def get_breaker_states() -> Dict[str, Dict[str, object]]:
+    """Estado de todos los breakers creados en este proceso."""
+    return {name: breaker.snapshot() for name, breaker in sorted(_breakers.items())}
@@ -0,0 +1,252 @@
+"""
+Codificación compacta de los payloads de conversación (caché de Redis y archivo frío).
+
+Por encima de CODEC_COMPRESS_MIN_BYTES el resultado se comprime (zstd si el
+paquete `zstandard` está instalado, si no zlib) cuando así ocupa menos.
+
+CONVERSATION_CODEC elige la serialización de la caché caliente. El valor por
+defecto es json: con compresión ocupa casi lo mismo que msgpack (7.6% frente a
+6.3% del JSON plano en 200 mensajes) y se decodifica ~5 veces más rápido, y la
+caché se lee en cada mensaje. Con msgpack (el que usa el archivo frío, ver
+ARCHIVE_PAYLOAD_CODEC en src/db/archive.py) cada lista de mensajes se guarda
+como filas [rol, contenido, timestamp]:
+  - el rol como entero (ROLE_CODES)
+  - el timestamp como [microsegundos desde epoch, offset en minutos]
+  - claves adicionales, roles desconocidos o timestamps que no se pueden
+    reconstruir idénticos se guardan tal cual: decodificar devuelve siempre
+    exactamente los mismos mensajes
+
+Formato: byte MAGIC (0xc1, nunca válido al inicio de JSON ni de msgpack), byte
+de codec, byte de compresión y el cuerpo. `decode_payload` sigue leyendo el JSON
+plano escrito antes. Con CONVERSATION_CODEC=json y CODEC_COMPRESSION=none se
+escribe el formato anterior (para volver a una versión previa).
+"""
+import json
+import os
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Union
+
+from dotenv import load_dotenv
+
+from src.utils.loggers import logger
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover - depende del entorno
+    msgpack = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover - dependencia opcional
+    zstandard = None
+
+load_dotenv()
+
+# json (sin compresión es el formato anterior, sin cabecera) o msgpack
+CONVERSATION_CODEC = os.getenv("CONVERSATION_CODEC", "json").lower()
+# auto (zstd si está disponible, si no zlib), zstd, zlib o none
+CODEC_COMPRESSION = os.getenv("CODEC_COMPRESSION", "auto").lower()
+CODEC_COMPRESS_MIN_BYTES = int(os.getenv("CODEC_COMPRESS_MIN_BYTES", "1024"))
+CODEC_ZLIB_LEVEL = int(os.getenv("CODEC_ZLIB_LEVEL", "6"))
+CODEC_ZSTD_LEVEL = int(os.getenv("CODEC_ZSTD_LEVEL", "3"))
+
+MAGIC = b"\xc1"
+CODECS = {"json": 0, "msgpack": 1}
+COMPRESSIONS = {"none": 0, "zlib": 1, "zstd": 2}
+ROLE_CODES = {"user": 0, "assistant": 1, "system": 2, "tool": 3}
+ROLE_NAMES = {code: role for role, code in ROLE_CODES.items()}
+# Tipo de extensión msgpack para una lista de mensajes compactada
+MESSAGES_EXT = 1
+
+
+def resolve_codec(name: str, setting: str = "CONVERSATION_CODEC") -> str:
+    """Valida un codec configurado; msgpack sin el paquete instalado pasa a json."""
+    name = name.lower()
+    if name not in CODECS:
+        raise ValueError(f"{setting} desconocido: {name} (json o msgpack)")
+    if name == "msgpack" and msgpack is None:
+        logger.warning(f"⚠️ {setting}=msgpack requiere el paquete 'msgpack'; se usa json")
+        return "json"
+    return name
+
+
+CONVERSATION_CODEC = resolve_codec(CONVERSATION_CODEC)
+if CODEC_COMPRESSION == "auto":
+    CODEC_COMPRESSION = "zstd" if zstandard is not None else "zlib"
+elif CODEC_COMPRESSION == "zstd" and zstandard is None:
+    logger.warning("⚠️ CODEC_COMPRESSION=zstd requiere el paquete 'zstandard'; se usa zlib")
+    CODEC_COMPRESSION = "zlib"
+if CODEC_COMPRESSION not in COMPRESSIONS:
+    raise ValueError(f"CODEC_COMPRESSION desconocido: {CODEC_COMPRESSION} (auto, zstd, zlib o none)")
+
+
+# --- Timestamps y mensajes ---
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+EPOCH_NAIVE = datetime(1970, 1, 1)
+ONE_MICROSECOND = timedelta(microseconds=1)
+_timezones: Dict[int, timezone] = {}
+_MISSING = object()
+
+
+def pack_timestamp(value: Any) -> Any:
+    """ISO 8601 -> [µs desde epoch, offset en minutos o None]; cualquier otro valor queda igual."""
+    if not isinstance(value, str):
+        return value
+    try:
+        parsed = datetime.fromisoformat(value)
+    except ValueError:
+        return value
+    # Solo si isoformat() reconstruye el mismo texto ("Z", espacios o precisión distinta se guardan tal cual)
+    if parsed.isoformat() != value:
+        return value
+    offset = parsed.utcoffset()
+    if offset is None:
+        return [(parsed - EPOCH_NAIVE) // ONE_MICROSECOND, None]
+    minutes, seconds = divmod(int(offset.total_seconds()), 60)
+    if seconds:
+        return value
+    return [(parsed - EPOCH) // ONE_MICROSECOND, minutes]
+
+
+def unpack_timestamp(value: Any) -> Any:
+    if not isinstance(value, list):
+        return value
+    micros, minutes = value
+    if minutes is None:
+        return (EPOCH_NAIVE + timedelta(microseconds=micros)).isoformat()
+    tz = _timezones.get(minutes)
+    if tz is None:
+        tz = _timezones.setdefault(minutes, timezone(timedelta(minutes=minutes)))
+    return (EPOCH + timedelta(microseconds=micros)).astimezone(tz).isoformat()
+
+
+def _is_message_list(value: List[Any]) -> bool:
+    return bool(value) and all(isinstance(item, dict) and "role" in item and "content" in item for item in value)
+
+
+def pack_messages(messages: List[Dict[str, Any]]) -> List[Any]:
+    """Mensajes -> filas [rol, contenido(, timestamp(, extras))]; los atípicos quedan como dict."""
+    rows = []
+    for message in messages:
+        role, timestamp = message["role"], message.get("timestamp", _MISSING)
+        # Una lista en el timestamp se confundiría con uno compactado
+        if isinstance(timestamp, list):
+            rows.append(message)
+        elif len(message) == 3 and timestamp is not _MISSING:
+            rows.append([ROLE_CODES.get(role, role), message["content"], pack_timestamp(timestamp)])
+        else:
+            extras = {key: value for key, value in message.items() if key not in ("role", "content", "timestamp")}
+            if timestamp is _MISSING and extras:
+                rows.append(message)
+                continue
+            row = [ROLE_CODES.get(role, role), message["content"]]
+            if timestamp is not _MISSING:
+                row.append(pack_timestamp(timestamp))
+            if extras:
+                row.append(extras)
+            rows.append(row)
+    return rows
+
+
+def unpack_messages(rows: List[Any]) -> List[Dict[str, Any]]:
+    messages = []
+    for row in rows:
+        if isinstance(row, dict):
+            messages.append(row)
+            continue
+        message = {"role": ROLE_NAMES.get(row[0], row[0]), "content": row[1]}
+        if len(row) > 2:
+            message["timestamp"] = unpack_timestamp(row[2])
+        if len(row) > 3:
+            message.update(row[3])
+        messages.append(message)
+    return messages
+
+
+# --- msgpack ---
+
+def _compact(value: Any) -> Any:
+    if isinstance(value, dict):
+        return {key: _compact(item) for key, item in value.items()}
+    if isinstance(value, list):
+        if _is_message_list(value):
+            return msgpack.ExtType(MESSAGES_EXT, msgpack.packb(pack_messages(value), use_bin_type=True))
+        return [_compact(item) for item in value]
+    return value
+
+
+def _ext_hook(code: int, data: bytes) -> Any:
+    if code == MESSAGES_EXT:
+        return unpack_messages(msgpack.unpackb(data, raw=False, strict_map_key=False))
+    return msgpack.ExtType(code, data)
+
+
+# --- Compresión ---
+
+def _compress(body: bytes, compression: str) -> bytes:
+    if compression == "zstd":
+        return zstandard.ZstdCompressor(level=CODEC_ZSTD_LEVEL).compress(body)
+    return zlib.compress(body, CODEC_ZLIB_LEVEL)
+
+
+def _decompress(body: bytes, compression: int) -> bytes:
+    if compression == COMPRESSIONS["zstd"]:
+        if zstandard is None:
+            raise ValueError("El payload está comprimido con zstd y el paquete 'zstandard' no está instalado")
+        return zstandard.ZstdDecompressor().decompress(body)
+    if compression == COMPRESSIONS["zlib"]:
+        return zlib.decompress(body)
+    return body
+
+
+# --- API ---
+
+def encode_payload(value: Any, codec: Optional[str] = None, compression: Optional[str] = None,
+                   compress_min_bytes: Optional[int] = None) -> bytes:
+    """
+    Serializa un payload (dicts, listas, mensajes) con el codec y la compresión configurados.
+    Con codec json y sin compresión produce el JSON plano de siempre.
+    """
+    codec = codec or CONVERSATION_CODEC
+    compression = compression or CODEC_COMPRESSION
+    compress_min_bytes = CODEC_COMPRESS_MIN_BYTES if compress_min_bytes is None else compress_min_bytes
+    if codec == "msgpack":
+        body = msgpack.packb(_compact(value), use_bin_type=True)
+    else:
+        body = json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode()
+
+    used = "none"
+    if compression != "none" and len(body) >= compress_min_bytes:
+        compressed = _compress(body, compression)
+        if len(compressed) < len(body):
+            body, used = compressed, compression
+    if codec == "json" and used == "none":
+        return body
+    return MAGIC + bytes([CODECS[codec], COMPRESSIONS[used]]) + body
+
+
+def decode_payload(data: Union[bytes, str, None]) -> Any:
+    """Lee cualquier payload escrito por `encode_payload` o el JSON plano anterior."""
+    if data is None:
+        return None
+    if isinstance(data, str):
+        return json.loads(data)
+    if not data.startswith(MAGIC):
+        return json.loads(data)
+    codec, compression, body = data[1], data[2], _decompress(data[3:], data[2])
+    if codec == CODECS["msgpack"]:
+        if msgpack is None:
+            raise ValueError("El payload está en msgpack y el paquete 'msgpack' no está instalado")
+        return msgpack.unpackb(body, raw=False, ext_hook=_ext_hook, strict_map_key=False)
+    return json.loads(body)
+
+
+def describe_payload(data: bytes) -> str:
+    """Nombre del formato de un payload, p. ej. "msgpack+zstd" o "json"."""
+    if not data.startswith(MAGIC):
+        return "json"
+    codec = next(name for name, code in CODECS.items() if code == data[1])
+    compression = next(name for name, code in COMPRESSIONS.items() if code == data[2])
+    return codec if compression == "none" else f"{codec}+{compression}"
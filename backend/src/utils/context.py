@@ -0,0 +1,142 @@
+import os
+from datetime import datetime
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.utils.conversation_cache import CACHE_ENABLED, CACHE_MAX_MESSAGES
+from src.utils.loggers import logger
+
+load_dotenv()
+
+# Presupuesto de tokens para el historial (sin contar el system prompt)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "2000"))
+# Mensajes recientes que se leen del almacenamiento para armar el contexto
+CONTEXT_MAX_MESSAGES = int(os.getenv("CONTEXT_MAX_MESSAGES", "40"))
+# Mensajes fuera del presupuesto que se acumulan antes de actualizar el resumen
+SUMMARY_MIN_NEW_MESSAGES = int(os.getenv("CONTEXT_SUMMARY_MIN_MESSAGES", "4"))
+# Mensajes anteriores a la ventana de CONTEXT_MAX_MESSAGES que se leen para resumirlos
+# antes de que se pierdan (historiales de mensajes cortos que nunca llenan el presupuesto).
+# Con la ventana, no debe superar CONVERSATION_CACHE_MAX_MESSAGES: si no, cada lectura
+# de una conversación larga falla en la caché y va a Supabase
+SUMMARY_LOOKBACK_MESSAGES = int(os.getenv("CONTEXT_SUMMARY_LOOKBACK_MESSAGES", "10"))
+
+# Tokens de mensajes por llamada al resumir; los historiales más largos se resumen por partes
+SUMMARY_CHUNK_TOKENS = int(os.getenv("CONTEXT_SUMMARY_CHUNK_TOKENS", str(CONTEXT_TOKEN_BUDGET)))
+
+# Tokens fijos que añade el formato de chat por cada mensaje
+MESSAGE_TOKEN_OVERHEAD = 4
+
+SUMMARY_PREFIX = "Resumen de la conversación anterior: "
+
+if CACHE_ENABLED and CONTEXT_MAX_MESSAGES + SUMMARY_LOOKBACK_MESSAGES > CACHE_MAX_MESSAGES:
+    logger.warning(
+        f"⚠️ CONTEXT_MAX_MESSAGES + CONTEXT_SUMMARY_LOOKBACK_MESSAGES ({CONTEXT_MAX_MESSAGES + SUMMARY_LOOKBACK_MESSAGES}) "
+        f"supera CONVERSATION_CACHE_MAX_MESSAGES ({CACHE_MAX_MESSAGES}): el historial se leerá de Supabase"
+    )
+
+
+@lru_cache(maxsize=1)
+def get_encoder():
+    # tiktoken es opcional: sin él se usa una aproximación de ~4 caracteres por token.
+    # Se carga con el primer conteo o en el arranque (puede descargar el vocabulario)
+    try:
+        import tiktoken
+    except ImportError:
+        logger.info("tiktoken no está instalado; se estiman los tokens por longitud")
+        return None
+    try:
+        return tiktoken.encoding_for_model(os.getenv("LLM_MODEL", "gpt-3.5-turbo"))
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text: str) -> int:
+    """Cuenta los tokens de un texto localmente (con caché por contenido)."""
+    if not text:
+        return 0
+    encoder = get_encoder()
+    if encoder is not None:
+        return len(encoder.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message: Dict[str, str]) -> int:
+    return count_tokens(message.get("content") or "") + MESSAGE_TOKEN_OVERHEAD
+
+
+def build_context(
+    system_prompt: Dict[str, str],
+    history: List[Dict[str, str]],
+    summary: Optional[str] = None,
+    budget: int = CONTEXT_TOKEN_BUDGET,
+) -> Tuple[List[Dict[str, str]], List[Dict[str, str]]]:
+    """
+    Arma los mensajes para el modelo llenando el presupuesto del más nuevo al más viejo.
+
+    Args:
+        system_prompt: Mensaje de sistema
+        history: Historial en orden cronológico, con el mensaje actual al final
+        summary: Resumen acumulado de los mensajes anteriores, si existe
+        budget: Presupuesto de tokens para resumen + historial
+
+    Returns:
+        (mensajes para el modelo, mensajes que no cupieron en orden cronológico)
+    """
+    summary_message = {"role": "system", "content": SUMMARY_PREFIX + summary} if summary else None
+    used = message_tokens(summary_message) if summary_message else 0
+
+    selected: List[Dict[str, str]] = []
+    overflow: List[Dict[str, str]] = []
+    for index in range(len(history) - 1, -1, -1):
+        tokens = message_tokens(history[index])
+        # El mensaje actual siempre entra; el resto solo mientras quepa
+        if selected and used + tokens > budget:
+            overflow = history[:index + 1]
+            break
+        selected.append({"role": history[index]["role"], "content": history[index]["content"]})
+        used += tokens
+
+    messages = [system_prompt]
+    if summary_message:
+        messages.append(summary_message)
+    messages.extend(reversed(selected))
+    return messages, overflow
+
+
+def split_by_tokens(messages: List[Dict[str, str]], budget: int) -> List[List[Dict[str, str]]]:
+    """Parte los mensajes, en orden, en tramos de hasta `budget` tokens (al menos un mensaje por tramo)."""
+    chunks: List[List[Dict[str, str]]] = []
+    used = 0
+    for message in messages:
+        tokens = message_tokens(message)
+        if not chunks or (chunks[-1] and used + tokens > budget):
+            chunks.append([])
+            used = 0
+        chunks[-1].append(message)
+        used += tokens
+    return chunks
+
+
+def _parse_timestamp(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+
+def unsummarized(overflow: List[Dict[str, str]], summary_until: Optional[str]) -> List[Dict[str, str]]:
+    """Mensajes fuera del presupuesto que todavía no forman parte del resumen."""
+    until = _parse_timestamp(summary_until)
+    if until is None:
+        return overflow
+    pending = []
+    for message in overflow:
+        timestamp = _parse_timestamp(message.get("timestamp"))
+        if timestamp is None or timestamp > until:
+            pending.append(message)
+    return pending
@@ -0,0 +1,140 @@
+import os
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.utils.cookies import clear_cookies, get_cookies, set_cookies
+from src.utils.loggers import logger
+
+load_dotenv()
+
+# Configuración de la caché de historial en Redis
+CACHE_ENABLED = os.getenv("CONVERSATION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+CACHE_TTL = int(os.getenv("CONVERSATION_CACHE_TTL", "3600"))
+CACHE_MAX_MESSAGES = int(os.getenv("CONVERSATION_CACHE_MAX_MESSAGES", "50"))
+# Límite de memoria opcional para Redis (p. ej. "256mb"); vacío para no modificarlo
+CACHE_MAXMEMORY = os.getenv("CONVERSATION_CACHE_MAXMEMORY", "")
+
+CACHE_KEY_PREFIX = "conversation_cache"
+STATS_KEY = f"{CACHE_KEY_PREFIX}:stats"
+
+
+class CachedConversationStore:
+    """
+    Caché write-through del final del historial de cada conversación.
+
+    Cada entrada guarda como máximo CACHE_MAX_MESSAGES mensajes y expira tras
+    CACHE_TTL segundos sin actividad. `complete` indica si la entrada contiene
+    el historial entero (conversaciones cortas) o solo su final.
+    Cualquier fallo de Redis se registra y se resuelve contra Supabase. Si la caché
+    no se puede actualizar tras escribir en Supabase, la entrada se borra para que
+    la siguiente lectura no devuelva un historial antiguo.
+    """
+
+    def __init__(self, store, redis_client):
+        self.store = store
+        self.redis = redis_client
+
+    def recent(self, phone_number: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        entry = self._read(phone_number)
+        if entry is not None and (entry["complete"] or (limit and limit <= len(entry["messages"]))):
+            self._count("hits")
+            messages = entry["messages"]
+            return messages[-limit:] if limit else messages
+
+        self._count("misses")
+        # Leer siempre al menos el final que se guarda en caché
+        fetch_limit = None if limit is None or limit > CACHE_MAX_MESSAGES else CACHE_MAX_MESSAGES
+        messages = self.store.recent(phone_number, fetch_limit)
+        complete = fetch_limit is None or len(messages) < fetch_limit
+        self._write(phone_number, messages, complete)
+        return messages[-limit:] if limit else messages
+
+    def append(self, phone_number: str, message: Dict[str, str]) -> None:
+        self.store.append(phone_number, message)
+
+        try:
+            entry = get_cookies(self.redis, self._key(phone_number))
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo la caché de historial: {str(e)}")
+            self.invalidate(phone_number)
+            return
+        if entry is not None:
+            self._write(phone_number, entry["messages"] + [message], entry["complete"])
+
+    def replace(self, phone_number: str, messages: List[Dict[str, str]]) -> None:
+        self.store.replace(phone_number, messages)
+        self._write(phone_number, messages, True)
+
+    def get_summary(self, phone_number: str) -> Dict[str, Optional[str]]:
+        return self.store.get_summary(phone_number)
+
+    def save_summary(self, phone_number: str, summary: str, summary_until: Optional[str]) -> None:
+        self.store.save_summary(phone_number, summary, summary_until)
+
+    def invalidate(self, phone_number: str) -> None:
+        try:
+            clear_cookies(self.redis, self._key(phone_number))
+        except Exception as e:
+            logger.error(f"❌ No se pudo invalidar la caché de {phone_number}, puede quedar desactualizada hasta que expire: {str(e)}")
+
+    def _key(self, phone_number: str) -> str:
+        return f"{CACHE_KEY_PREFIX}:{phone_number}"
+
+    def _read(self, phone_number: str) -> Optional[Dict]:
+        try:
+            return get_cookies(self.redis, self._key(phone_number))
+        except Exception as e:
+            logger.warning(f"⚠️ Error leyendo la caché de historial: {str(e)}")
+            return None
+
+    def _write(self, phone_number: str, messages: List[Dict[str, str]], complete: bool) -> None:
+        # Conservar solo el final de la conversación para acotar la memoria
+        if len(messages) > CACHE_MAX_MESSAGES:
+            messages = messages[-CACHE_MAX_MESSAGES:]
+            complete = False
+        try:
+            set_cookies(
+                self.redis,
+                self._key(phone_number),
+                {"complete": complete, "messages": messages},
+                ttl=CACHE_TTL,
+            )
+        except Exception as e:
+            logger.warning(f"⚠️ Error escribiendo la caché de historial: {str(e)}")
+            self.invalidate(phone_number)
+
+    def _count(self, field: str) -> None:
+        try:
+            self.redis.hincrby(STATS_KEY, field, 1)
+        except Exception:
+            pass
+
+
+def configure_cache_memory_policy(redis_client) -> None:
+    """
+    Aplica un límite de memoria con expulsión LRU sobre las claves con TTL.
+    Algunos Redis gestionados no permiten CONFIG SET; en ese caso solo se avisa.
+    """
+    if not CACHE_MAXMEMORY:
+        return
+    try:
+        redis_client.config_set("maxmemory", CACHE_MAXMEMORY)
+        redis_client.config_set("maxmemory-policy", "volatile-lru")
+        logger.info(f"🧠 Redis limitado a {CACHE_MAXMEMORY} con política volatile-lru")
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo configurar la memoria de Redis: {str(e)}")
+
+
+def get_cache_stats(redis_client) -> Dict[str, float]:
+    """Devuelve los aciertos y fallos acumulados de la caché (todas las instancias)."""
+    raw = redis_client.hgetall(STATS_KEY) or {}
+    stats = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+    hits = stats.get("hits", 0)
+    misses = stats.get("misses", 0)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / total, 4) if total else 0.0,
+    }
@@ -1,19 +1,16 @@
-import json
-from typing import Any
+from typing import Any, Optional
 
+from src.utils.codec import decode_payload, encode_payload
 
-def set_cookies(redis_client, name: str, value: Any):
-    serialized_list = json.dumps(value)
-    redis_client.set(name, serialized_list)
+
+def set_cookies(redis_client, name: str, value: Any, ttl: Optional[int] = None):
+    # Codec de src/utils/codec.py (CONVERSATION_CODEC y compresión por encima de un umbral)
+    redis_client.set(name, encode_payload(value), ex=ttl)
 
 
 def get_cookies(redis_client, name: str):
-    serialized_list = redis_client.get(name)
-    if serialized_list:
-        my_list = json.loads(serialized_list)
-        return my_list
-    else:
-        return None
+    # Lee tanto el formato compacto como el JSON escrito por versiones anteriores
+    return decode_payload(redis_client.get(name))
 
 
 def clear_cookies(redis_client, name: str):
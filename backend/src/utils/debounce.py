@@ -0,0 +1,117 @@
+import asyncio
+import json
+import os
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.loggers import logger
+
+load_dotenv()
+
+# Ventana de agrupación de mensajes por número (compartida entre workers vía Redis)
+DEBOUNCE_ENABLED = os.getenv("WHATSAPP_DEBOUNCE_ENABLED", "false").lower() in ("1", "true", "yes")
+DEBOUNCE_QUIET_SECONDS = float(os.getenv("WHATSAPP_DEBOUNCE_QUIET_SECONDS", "2.5"))
+DEBOUNCE_MAX_WAIT_SECONDS = float(os.getenv("WHATSAPP_DEBOUNCE_MAX_WAIT_SECONDS", "8"))
+
+KEY_PREFIX = "debounce"
+STATS_KEY = f"{KEY_PREFIX}:stats"
+
+
+def _keys(phone_number: str) -> Dict[str, str]:
+    return {
+        "buffer": f"{KEY_PREFIX}:{phone_number}:buffer",
+        "first": f"{KEY_PREFIX}:{phone_number}:first",
+        "seq": f"{KEY_PREFIX}:{phone_number}:seq",
+    }
+
+
+def register_message(redis_client, phone_number: str, body: str,
+                     media: Optional[List[Dict[str, str]]] = None) -> Dict[str, float]:
+    """Añade el mensaje (y sus adjuntos sin procesar) a la ventana del número."""
+    keys = _keys(phone_number)
+    ttl = int(DEBOUNCE_MAX_WAIT_SECONDS * 2) + 60
+    pipe = redis_client.pipeline()
+    pipe.rpush(keys["buffer"], json.dumps({"body": body, "media": media or []}, ensure_ascii=False))
+    pipe.incr(keys["seq"])
+    pipe.set(keys["first"], time.time(), nx=True, ex=ttl)
+    pipe.get(keys["first"])
+    pipe.expire(keys["buffer"], ttl)
+    pipe.expire(keys["seq"], ttl)
+    pipe.hincrby(STATS_KEY, "messages", 1)
+    _, seq, _, first, *_ = pipe.execute()
+    return {"seq": int(seq), "first": float(first)}
+
+
+def quiet_delay(state: Dict[str, float]) -> float:
+    """Segundos hasta poder vaciar la ventana: el silencio o lo que quede de la espera máxima."""
+    return max(0.0, min(DEBOUNCE_QUIET_SECONDS, state["first"] + DEBOUNCE_MAX_WAIT_SECONDS - time.time()))
+
+
+def _parse_entry(raw: Any) -> Dict[str, Any]:
+    text = raw.decode() if isinstance(raw, bytes) else raw
+    try:
+        entry = json.loads(text)
+    except ValueError:
+        entry = None
+    # Entradas de texto plano escritas por versiones anteriores
+    return entry if isinstance(entry, dict) else {"body": text, "media": []}
+
+
+def take_burst(redis_client, phone_number: str, seq: int, first: float) -> Optional[Tuple[str, List[Dict[str, str]]]]:
+    """
+    Vacía la ventana si `seq` es el último mensaje registrado (o ya pasó la espera
+    máxima). Devuelve los textos unidos y los adjuntos de toda la ráfaga, o None si
+    otra llamada se encarga de ella.
+    """
+    keys = _keys(phone_number)
+    current_seq = int(redis_client.get(keys["seq"]) or 0)
+    # Si llegó otro mensaje durante la espera, esa llamada se encarga de la ráfaga,
+    # salvo que ya se haya superado la espera máxima
+    if current_seq != seq and time.time() < first + DEBOUNCE_MAX_WAIT_SECONDS:
+        return None
+    # Vaciar la ventana en una transacción MULTI/EXEC: solo una llamada recibe los mensajes
+    pipe = redis_client.pipeline(transaction=True)
+    pipe.lrange(keys["buffer"], 0, -1)
+    pipe.delete(keys["buffer"], keys["first"])
+    raw_entries, _ = pipe.execute()
+    if not raw_entries:
+        return None
+    redis_client.hincrby(STATS_KEY, "flushes", 1)
+    entries = [_parse_entry(raw) for raw in raw_entries]
+    if len(entries) > 1:
+        logger.info(f"🧺 {len(entries)} mensajes de {phone_number} agrupados en un solo turno")
+    body = "\n".join(entry["body"] for entry in entries if entry["body"])
+    return body, [item for entry in entries for item in entry["media"]]
+
+
+async def collect_burst(redis_client, phone_number: str, body: str) -> Optional[str]:
+    """
+    Añade el mensaje a la ventana del número y espera el periodo de silencio dentro
+    de la llamada (procesamiento en línea; en modo cola la espera es un trabajo
+    diferido, ver src/utils/queue.py).
+
+    Returns:
+        str: los mensajes de la ráfaga unidos, si esta llamada debe procesarla
+        None: si otra llamada (de este u otro worker) se encarga de la ráfaga
+    """
+    state = await run_in_threadpool(register_message, redis_client, phone_number, body)
+    await asyncio.sleep(quiet_delay(state))
+
+    burst = await run_in_threadpool(take_burst, redis_client, phone_number, state["seq"], state["first"])
+    return burst[0] if burst else None
+
+
+def get_debounce_stats(redis_client) -> Dict[str, float]:
+    """Mensajes recibidos frente a turnos del modelo (todas las instancias)."""
+    raw = redis_client.hgetall(STATS_KEY) or {}
+    stats = {k.decode() if isinstance(k, bytes) else k: int(v) for k, v in raw.items()}
+    messages = stats.get("messages", 0)
+    flushes = stats.get("flushes", 0)
+    return {
+        "messages": messages,
+        "llm_turns": flushes,
+        "llm_turns_per_message": round(flushes / messages, 4) if messages else 0.0,
+    }
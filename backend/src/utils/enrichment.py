@@ -0,0 +1,206 @@
+"""
+Análisis por lotes de las conversaciones: resumen, intención, etiquetas y
+puntuación de lead en conversation_insights (migrations/005_conversation_insights.sql).
+
+Cada ejecución recorre las conversaciones modificadas desde la anterior
+(src/db/checkpoint.py) por páginas:
+  1. Una consulta por número trae los últimos ENRICHMENT_MAX_MESSAGES mensajes; una
+     consulta por página trae el resumen acumulado y otra el último análisis de cada número.
+  2. Las conversaciones cuyo hash de contenido no cambió se saltan sin llamar al modelo.
+     Si un historial tiene menos mensajes de los que ya se analizaron (una lectura
+     incompleta), la conversación no se toca y el punto de control no avanza.
+  3. El resto se analiza con ENRICHMENT_CONCURRENCY llamadas simultáneas, cada una
+     con reintentos y backoff exponencial.
+  4. Los resultados de la página se escriben con un solo upsert y se guarda el
+     punto de control: una ejecución interrumpida retoma desde la última página.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.db import get_supabase, run_db
+from src.db.archive import COMPACTION_HOT_MESSAGES
+from src.db.checkpoint import ChangeScan
+from src.db.conversations import get_backing_store
+from src.utils.loggers import logger
+from src.utils.model import MODEL_NAME, analyse_conversation
+
+load_dotenv()
+
+ENRICHMENT_CONCURRENCY = int(os.getenv("ENRICHMENT_CONCURRENCY", "4"))
+ENRICHMENT_BATCH_SIZE = int(os.getenv("ENRICHMENT_BATCH_SIZE", "100"))
+ENRICHMENT_MAX_ATTEMPTS = int(os.getenv("ENRICHMENT_MAX_ATTEMPTS", "3"))
+ENRICHMENT_RETRY_BACKOFF = float(os.getenv("ENRICHMENT_RETRY_BACKOFF", "2.0"))
+# Mensajes más recientes que se envían al modelo (el resumen acumulado cubre los anteriores)
+ENRICHMENT_MAX_MESSAGES = int(os.getenv("ENRICHMENT_MAX_MESSAGES", "60"))
+# Cambiarla vuelve a analizar todas las conversaciones (p. ej. al modificar el prompt)
+ENRICHMENT_VERSION = os.getenv("ENRICHMENT_VERSION", "1")
+
+INSIGHTS_TABLE = "conversation_insights"
+CHECKPOINT_KEY = "enrichment:checkpoint"
+
+
+def content_hash(messages: List[Dict[str, Any]], summary: Optional[str]) -> str:
+    """Hash de todo lo que recibe el modelo, más el modelo y la versión del análisis."""
+    payload = {
+        "version": ENRICHMENT_VERSION,
+        "model": MODEL_NAME,
+        "summary": summary,
+        "messages": [[m.get("role"), m.get("content"), m.get("timestamp")] for m in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, ensure_ascii=False, sort_keys=True).encode()).hexdigest()
+
+
+async def with_retry(operation: Callable[[], Awaitable[Any]], description: str) -> Any:
+    """Ejecuta `operation` hasta ENRICHMENT_MAX_ATTEMPTS veces con backoff exponencial y jitter."""
+    for attempt in range(ENRICHMENT_MAX_ATTEMPTS):
+        try:
+            return await operation()
+        except Exception as e:
+            if attempt + 1 == ENRICHMENT_MAX_ATTEMPTS:
+                raise
+            delay = ENRICHMENT_RETRY_BACKOFF * (2 ** attempt) + random.uniform(0, ENRICHMENT_RETRY_BACKOFF)
+            logger.warning(f"⚠️ {description}: intento {attempt + 1}/{ENRICHMENT_MAX_ATTEMPTS} falló "
+                           f"({str(e)}), reintento en {delay:.1f}s")
+            await asyncio.sleep(delay)
+
+
+def _previous_insights(phone_numbers: List[str]) -> Dict[str, Dict[str, Any]]:
+    rows = get_supabase().table(INSIGHTS_TABLE) \
+        .select('phone_number,content_hash,message_count') \
+        .in_('phone_number', phone_numbers) \
+        .execute().data or []
+    return {row['phone_number']: row for row in rows}
+
+
+def _rolling_summaries(phone_numbers: List[str]) -> Dict[str, Optional[str]]:
+    rows = get_supabase().table('conversations') \
+        .select('phone_number,summary') \
+        .in_('phone_number', phone_numbers) \
+        .execute().data or []
+    return {row['phone_number']: row.get('summary') for row in rows}
+
+
+def _write_insights(rows: List[Dict[str, Any]]) -> None:
+    get_supabase().table(INSIGHTS_TABLE).upsert(rows, on_conflict="phone_number").execute()
+
+
+def looks_incomplete(messages: List[Dict[str, Any]], previous: Optional[Dict[str, Any]]) -> bool:
+    """
+    El final del historial no se achica: como mucho la compactación lo deja en
+    COMPACTION_HOT_MESSAGES. Menos mensajes que en el análisis anterior es una lectura
+    incompleta, no una conversación vacía o sin cambios.
+    """
+    if not previous or previous.get("message_count") is None:
+        return False
+    return len(messages) < min(previous["message_count"], COMPACTION_HOT_MESSAGES)
+
+
+async def _recent_tails(phone_numbers: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+    """Últimos ENRICHMENT_MAX_MESSAGES mensajes de cada número, con una consulta acotada por número."""
+    store = get_backing_store()
+    tails = await asyncio.gather(*(
+        run_db(store.recent, phone_number, ENRICHMENT_MAX_MESSAGES) for phone_number in phone_numbers
+    ))
+    return dict(zip(phone_numbers, tails))
+
+
+async def enrich_page(phone_numbers: List[str], stats: Dict[str, int], dry_run: bool = False) -> bool:
+    """
+    Analiza una página de conversaciones. Devuelve False si alguna no se pudo leer
+    completa, analizar o guardar.
+    """
+    histories, summaries, previous = await asyncio.gather(
+        _recent_tails(phone_numbers),
+        run_db(_rolling_summaries, phone_numbers),
+        run_db(_previous_insights, phone_numbers),
+    )
+
+    pending, complete = [], True
+    for phone_number in phone_numbers:
+        messages = histories.get(phone_number) or []
+        if looks_incomplete(messages, previous.get(phone_number)):
+            stats["incomplete"] += 1
+            complete = False
+            logger.warning(f"⚠️ Historial de {phone_number} con {len(messages)} mensajes, menos que los "
+                           f"{previous[phone_number]['message_count']} ya analizados: se reintenta en la próxima ejecución")
+            continue
+        if not messages:
+            stats["empty"] += 1
+            continue
+        digest = content_hash(messages, summaries.get(phone_number))
+        if previous.get(phone_number, {}).get("content_hash") == digest:
+            stats["unchanged"] += 1
+            continue
+        pending.append((phone_number, messages, digest))
+
+    if dry_run:
+        stats["analysed"] += len(pending)
+        return complete
+
+    semaphore = asyncio.Semaphore(ENRICHMENT_CONCURRENCY)
+
+    async def analyse(phone_number: str, messages: List[Dict[str, Any]], digest: str) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                insight = await with_retry(
+                    lambda: analyse_conversation(messages, summaries.get(phone_number)),
+                    f"Análisis de {phone_number}",
+                )
+            except Exception as e:
+                stats["errors"] += 1
+                logger.error(f"❌ No se pudo analizar la conversación de {phone_number}: {str(e)}")
+                return None
+        return {
+            "phone_number": phone_number,
+            **insight,
+            "message_count": len(messages),
+            "content_hash": digest,
+            "analyzed_at": "now()",
+        }
+
+    results = [row for row in await asyncio.gather(*(analyse(*item) for item in pending)) if row]
+    if results:
+        try:
+            await with_retry(lambda: run_db(_write_insights, results), "Escritura de análisis")
+        except Exception as e:
+            stats["errors"] += len(results)
+            logger.error(f"❌ No se pudieron guardar {len(results)} análisis: {str(e)}")
+            return False
+    stats["analysed"] += len(results)
+    return complete and len(results) == len(pending)
+
+
+async def enrich_conversations(redis_client, full: bool = False, limit: Optional[int] = None,
+                               dry_run: bool = False) -> Dict[str, int]:
+    """
+    Analiza las conversaciones modificadas desde la última ejecución. `full` ignora el
+    punto de control; las conversaciones sin cambios se siguen saltando por su hash.
+    """
+    scan = ChangeScan(redis_client, CHECKPOINT_KEY, full=full, page_size=ENRICHMENT_BATCH_SIZE)
+    stats = {"conversations": 0, "analysed": 0, "unchanged": 0, "empty": 0, "incomplete": 0, "errors": 0}
+    checkpoint_ok = True
+
+    while limit is None or stats["conversations"] < limit:
+        rows = await scan.next_page(None if limit is None else limit - stats["conversations"])
+        if not rows:
+            break
+        page_ok = await enrich_page([row["phone_number"] for row in rows], stats, dry_run=dry_run)
+        stats["conversations"] += len(rows)
+        # Tras una página con errores o lecturas incompletas el punto de control deja de
+        # avanzar: la próxima ejecución la repite y el hash evita volver a analizar las que sí se guardaron
+        checkpoint_ok = checkpoint_ok and page_ok
+        if checkpoint_ok and not dry_run:
+            scan.save()
+
+    logger.info(
+        f"🏷️ Análisis de conversaciones{' (simulado)' if dry_run else ''}: {stats['conversations']} revisadas, "
+        f"{stats['analysed']} analizadas, {stats['unchanged']} sin cambios, {stats['empty']} vacías, "
+        f"{stats['incomplete']} incompletas, {stats['errors']} errores"
+    )
+    return stats
@@ -0,0 +1,98 @@
+import os
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.loggers import logger
+from src.utils.metrics import WEBHOOK_DEDUP
+
+load_dotenv()
+
+# Twilio reintenta el webhook si tardamos en responder: cada MessageSid se procesa una sola vez
+WEBHOOK_DEDUP_ENABLED = os.getenv("WEBHOOK_DEDUP_ENABLED", "true").lower() in ("1", "true", "yes")
+WEBHOOK_DEDUP_TTL_SECONDS = int(os.getenv("WEBHOOK_DEDUP_TTL_SECONDS", "86400"))
+# Caché local delante de Redis: los reintentos que llegan al mismo worker no salen del proceso
+WEBHOOK_DEDUP_LOCAL_SIZE = int(os.getenv("WEBHOOK_DEDUP_LOCAL_SIZE", "10000"))
+
+KEY_PREFIX = "webhook_dedup"
+
+
+class RecentIds:
+    """LRU acotado con expiración para los MessageSid vistos por este proceso."""
+
+    def __init__(self, max_size: int, ttl_seconds: float):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._expires_at: "OrderedDict[str, float]" = OrderedDict()
+
+    def __contains__(self, message_sid: str) -> bool:
+        expires_at = self._expires_at.get(message_sid)
+        if expires_at is None:
+            return False
+        if expires_at < time.monotonic():
+            del self._expires_at[message_sid]
+            return False
+        self._expires_at.move_to_end(message_sid)
+        return True
+
+    def add(self, message_sid: str) -> None:
+        self._expires_at[message_sid] = time.monotonic() + self.ttl_seconds
+        self._expires_at.move_to_end(message_sid)
+        while len(self._expires_at) > self.max_size:
+            self._expires_at.popitem(last=False)
+
+    def discard(self, message_sid: str) -> None:
+        self._expires_at.pop(message_sid, None)
+
+
+_recent = RecentIds(WEBHOOK_DEDUP_LOCAL_SIZE, WEBHOOK_DEDUP_TTL_SECONDS)
+
+
+def _key(message_sid: str) -> str:
+    return f"{KEY_PREFIX}:{message_sid}"
+
+
+async def claim_message(redis_client, message_sid: Optional[str]) -> bool:
+    """
+    Registra el MessageSid y devuelve True si es la primera entrega; False si es
+    un reintento ya procesado (o en proceso) por cualquier worker.
+
+    Sin MessageSid o con Redis caído se procesa el mensaje (fail-open): un
+    duplicado ocasional es preferible a perder un mensaje.
+    """
+    if not WEBHOOK_DEDUP_ENABLED or not message_sid:
+        WEBHOOK_DEDUP.labels("unchecked").inc()
+        return True
+    if message_sid in _recent:
+        WEBHOOK_DEDUP.labels("duplicate_local").inc()
+        return False
+
+    try:
+        claimed = await run_in_threadpool(
+            redis_client.set, _key(message_sid), int(time.time()), nx=True, ex=WEBHOOK_DEDUP_TTL_SECONDS
+        )
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo verificar el MessageSid {message_sid} en Redis: {str(e)}")
+        WEBHOOK_DEDUP.labels("unchecked").inc()
+        return True
+
+    _recent.add(message_sid)
+    if not claimed:
+        WEBHOOK_DEDUP.labels("duplicate_redis").inc()
+        return False
+    WEBHOOK_DEDUP.labels("new").inc()
+    return True
+
+
+async def release_message(redis_client, message_sid: Optional[str]) -> None:
+    """Libera un MessageSid cuyo procesamiento falló para que el reintento de Twilio sí se procese."""
+    if not WEBHOOK_DEDUP_ENABLED or not message_sid:
+        return
+    _recent.discard(message_sid)
+    try:
+        await run_in_threadpool(redis_client.delete, _key(message_sid))
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo liberar el MessageSid {message_sid}: {str(e)}")
@@ -0,0 +1,345 @@
+import asyncio
+import os
+import statistics
+import time
+from collections import deque
+from typing import TYPE_CHECKING, Any, AsyncIterator, Deque, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from src.utils.circuit_breaker import CircuitBreaker, get_breaker, is_transient_error
+from src.utils.loggers import logger
+
+if TYPE_CHECKING:
+    from openai import AsyncOpenAI
+
+load_dotenv()
+
+# Lista ordenada de rutas "proveedor:modelo"; la primera es la preferida
+LLM_FALLBACK_MODELS = os.getenv("LLM_FALLBACK_MODELS", "")
+# Plazo total por llamada, incluidos reintentos con otros modelos
+LLM_DEADLINE_SECONDS = float(os.getenv("LLM_DEADLINE_SECONDS", "20"))
+# Peticiones duplicadas (hedging) cuando la ruta actual supera su p95 reciente
+LLM_HEDGING_ENABLED = os.getenv("LLM_HEDGING_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "4"))
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.5"))
+# Ventana de latencias recientes por ruta y muestras mínimas para usarlas
+LLM_LATENCY_WINDOW = int(os.getenv("LLM_LATENCY_WINDOW", "200"))
+LLM_LATENCY_MIN_SAMPLES = int(os.getenv("LLM_LATENCY_MIN_SAMPLES", "20"))
+# Una ruta pasa al frente si su p50 es este factor más rápido que el de la preferida
+LLM_LATENCY_SWITCH_RATIO = float(os.getenv("LLM_LATENCY_SWITCH_RATIO", "1.5"))
+# Streaming: espera máxima entre eventos y duración máxima de la respuesta completa
+LLM_STREAM_IDLE_SECONDS = float(os.getenv("LLM_STREAM_IDLE_SECONDS", "10"))
+LLM_STREAM_DEADLINE_SECONDS = float(os.getenv("LLM_STREAM_DEADLINE_SECONDS", "60"))
+LLM_DEFAULT_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+
+
+class LLMRouteError(Exception):
+    """Ninguna ruta del router pudo completar la llamada."""
+
+
+def is_provider_failure(exc: BaseException) -> bool:
+    """Conexión, timeout, 5xx o 429 del proveedor; un 400 (p. ej. contexto demasiado largo) no cuenta."""
+    from openai import APIConnectionError
+
+    return isinstance(exc, APIConnectionError) or is_transient_error(exc)
+
+
+class Provider:
+    """
+    Endpoint compatible con la API de OpenAI, su límite de concurrencia y su circuit breaker.
+    El cliente y el semáforo quedan ligados a su event loop (los workers de RQ
+    crean uno por trabajo), así que se recrean si el loop cambia.
+    """
+
+    def __init__(self, name: str, base_url: str, api_key: str, max_concurrency: int):
+        self.name = name
+        self.base_url = base_url
+        self.api_key = api_key
+        self.max_concurrency = max_concurrency
+        self._client: Optional["AsyncOpenAI"] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.breaker: CircuitBreaker = get_breaker(f"llm:{name}", is_provider_failure)
+
+    def _bind(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._client is not None:
+                logger.warning(f"⚠️ Cliente del proveedor {self.name} de otro event loop sin cerrar: se reemplaza")
+            # El SDK de OpenAI tarda más de un segundo en importarse: se carga con el primer cliente
+            # (o antes del fork con gunicorn --preload, ver src/core/lifespan.py)
+            from openai import AsyncOpenAI
+
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, max_retries=0)
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+
+    @property
+    def client(self) -> "AsyncOpenAI":
+        self._bind()
+        return self._client
+
+    @property
+    def semaphore(self) -> asyncio.Semaphore:
+        self._bind()
+        return self._semaphore
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+            self._loop = None
+
+
+class Route:
+    """Combinación proveedor + modelo con su historial de latencias recientes."""
+
+    def __init__(self, provider: Provider, model: str):
+        self.provider = provider
+        self.model = model
+        self.latencies: Deque[float] = deque(maxlen=LLM_LATENCY_WINDOW)
+
+    @property
+    def name(self) -> str:
+        return f"{self.provider.name}:{self.model}"
+
+    def p50(self) -> Optional[float]:
+        if len(self.latencies) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        return statistics.median(self.latencies)
+
+    def p95(self) -> Optional[float]:
+        if len(self.latencies) < LLM_LATENCY_MIN_SAMPLES:
+            return None
+        return statistics.quantiles(self.latencies, n=20)[-1]
+
+
+def load_provider(name: str) -> Provider:
+    """Lee LLM_PROVIDER_<NOMBRE>_BASE_URL / _API_KEY / _MAX_CONCURRENCY (openai usa OPENAI_*)."""
+    prefix = f"LLM_PROVIDER_{name.upper()}_"
+    if name == "openai":
+        base_url = os.getenv(prefix + "BASE_URL", os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"))
+        api_key = os.getenv(prefix + "API_KEY", os.getenv("OPENAI_API_KEY", ""))
+    else:
+        base_url = os.getenv(prefix + "BASE_URL")
+        api_key = os.getenv(prefix + "API_KEY", "")
+        if not base_url:
+            raise ValueError(f"Falta {prefix}BASE_URL para el proveedor '{name}'")
+    max_concurrency = int(os.getenv(prefix + "MAX_CONCURRENCY", str(LLM_DEFAULT_MAX_CONCURRENCY)))
+    return Provider(name, base_url, api_key.strip(), max_concurrency)
+
+
+class LLMRouter:
+    """
+    Enruta las llamadas de chat entre varios modelos/proveedores:
+    plazo por llamada, peticiones duplicadas tras el p95 de la ruta en curso,
+    paso inmediato a la siguiente ruta ante un error, límite de concurrencia
+    por proveedor y selección de la ruta más rápida según latencias recientes.
+    """
+
+    def __init__(self, routes: List[Route]):
+        if not routes:
+            raise ValueError("El router de modelos necesita al menos una ruta")
+        self.routes = routes
+
+    @classmethod
+    def from_env(cls, default_model: str) -> "LLMRouter":
+        spec = LLM_FALLBACK_MODELS or f"openai:{default_model}"
+        providers: Dict[str, Provider] = {}
+        routes = []
+        for item in spec.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            provider_name, _, model = item.partition(":") if ":" in item else ("openai", "", item)
+            if provider_name not in providers:
+                providers[provider_name] = load_provider(provider_name)
+            routes.append(Route(providers[provider_name], model))
+        logger.info(f"🧭 Rutas de modelos: {', '.join(route.name for route in routes)}")
+        return cls(routes)
+
+    def ordered_routes(self, preferred_model: Optional[str] = None) -> List[Route]:
+        routes = list(self.routes)
+        if preferred_model:
+            routes.sort(key=lambda route: route.model != preferred_model)
+
+        # Selección por latencia: adelantar la ruta más rápida si la preferida es claramente más lenta
+        measured = [route for route in routes if route.p50() is not None]
+        if measured and routes[0].p50() is not None:
+            fastest = min(measured, key=lambda route: route.p50())
+            if fastest is not routes[0] and routes[0].p50() > fastest.p50() * LLM_LATENCY_SWITCH_RATIO:
+                routes.remove(fastest)
+                routes.insert(0, fastest)
+
+        # Las rutas con el circuito abierto pasan al final: fallan al instante si se llega a ellas
+        routes.sort(key=lambda route: not route.provider.breaker.available())
+        return routes
+
+    async def _attempt(self, route: Route, messages: List[Dict[str, str]], **params: Any) -> Any:
+        with route.provider.breaker.guard():
+            async with route.provider.semaphore:
+                started = time.perf_counter()
+                try:
+                    response = await route.provider.client.chat.completions.create(
+                        model=route.model, messages=messages, **params
+                    )
+                except asyncio.CancelledError:
+                    # Perdió la carrera contra un duplicado o se acabó el plazo: habría tardado
+                    # al menos esto. Sin registrarlo el p95 solo vería las respuestas rápidas
+                    route.latencies.append(time.perf_counter() - started)
+                    raise
+                route.latencies.append(time.perf_counter() - started)
+                return response
+
+    def _hedge_delay(self, route: Route) -> float:
+        return max(LLM_HEDGE_MIN_DELAY, route.p95() or LLM_HEDGE_DEFAULT_DELAY)
+
+    async def complete(
+        self,
+        messages: List[Dict[str, str]],
+        preferred_model: Optional[str] = None,
+        deadline: float = LLM_DEADLINE_SECONDS,
+        hedge: bool = True,
+        **params: Any,
+    ) -> Any:
+        """
+        Devuelve la primera respuesta correcta de las rutas; LLMRouteError si todas fallan.
+        `hedge=False` desactiva las peticiones duplicadas (trabajos por lotes sin prisa).
+        """
+        routes = self.ordered_routes(preferred_model)
+        return await asyncio.wait_for(self._race(routes, messages, deadline, hedge, **params), timeout=deadline)
+
+    async def _race(self, routes: List[Route], messages: List[Dict[str, str]], deadline: float,
+                    hedge: bool = True, **params: Any) -> Any:
+        pending: Dict[asyncio.Task, Route] = {}
+        next_index = 0
+        last_error: Optional[BaseException] = None
+        # Con una sola ruta el duplicado va a la misma (una vez): con otra conexión
+        # suele esquivar una petición atascada del proveedor
+        hedged_same_route = False
+
+        def launch(route: Optional[Route] = None) -> Route:
+            nonlocal next_index
+            if route is None:
+                route = routes[next_index]
+                next_index += 1
+            task = asyncio.create_task(self._attempt(route, messages, timeout=deadline, **params))
+            pending[task] = route
+            return route
+
+        def hedge_target() -> Optional[Route]:
+            if next_index < len(routes):
+                return routes[next_index]
+            if len(routes) == 1 and not hedged_same_route:
+                return routes[0]
+            return None
+
+        current = launch()
+        try:
+            while pending:
+                target = hedge_target() if hedge and LLM_HEDGING_ENABLED else None
+                done, _ = await asyncio.wait(
+                    pending.keys(),
+                    timeout=self._hedge_delay(current) if target is not None else None,
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+
+                if not done:
+                    # La ruta en curso superó su p95: lanzar una petición duplicada a la siguiente
+                    logger.info(f"⏱️ {current.name} tarda más que su p95, duplicando en {target.name}")
+                    if next_index < len(routes):
+                        current = launch()
+                    else:
+                        hedged_same_route = True
+                        current = launch(target)
+                    continue
+
+                for task in done:
+                    route = pending.pop(task)
+                    if task.exception() is None:
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"⚠️ Falló {route.name}: {str(last_error)}")
+
+                # Ante un error, pasar de inmediato a la siguiente ruta
+                if next_index < len(routes) and len(pending) == 0:
+                    current = launch()
+        finally:
+            for task in pending:
+                task.cancel()
+
+        raise LLMRouteError(f"Todas las rutas de modelos fallaron: {str(last_error)}")
+
+    async def stream(self, messages: List[Dict[str, str]], preferred_model: Optional[str] = None,
+                     **params: Any) -> AsyncIterator[Any]:
+        """
+        Eventos del stream de la primera ruta disponible. Solo se cambia de ruta si falla
+        la apertura: una vez recibidos tokens no se puede duplicar sin repetir texto.
+        El lugar en el límite de concurrencia del proveedor se mantiene hasta cerrar el
+        stream; cada evento debe llegar en LLM_STREAM_IDLE_SECONDS y la respuesta
+        completa en LLM_STREAM_DEADLINE_SECONDS (si no, asyncio.TimeoutError).
+        """
+        last_error: Optional[BaseException] = None
+        for route in self.ordered_routes(preferred_model):
+            async with route.provider.semaphore:
+                try:
+                    with route.provider.breaker.guard():
+                        stream = await asyncio.wait_for(
+                            route.provider.client.chat.completions.create(
+                                model=route.model, messages=messages, stream=True, **params
+                            ),
+                            timeout=LLM_DEADLINE_SECONDS,
+                        )
+                except Exception as e:
+                    last_error = e
+                    logger.warning(f"⚠️ No se pudo abrir el stream en {route.name}: {str(e)}")
+                    continue
+
+                deadline = time.monotonic() + LLM_STREAM_DEADLINE_SECONDS
+                events = stream.__aiter__()
+                try:
+                    while True:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0:
+                            raise asyncio.TimeoutError(
+                                f"El stream de {route.name} superó {LLM_STREAM_DEADLINE_SECONDS:.0f}s"
+                            )
+                        try:
+                            event = await asyncio.wait_for(
+                                events.__anext__(), timeout=min(LLM_STREAM_IDLE_SECONDS, remaining)
+                            )
+                        except StopAsyncIteration:
+                            return
+                        yield event
+                finally:
+                    await stream.close()
+        raise LLMRouteError(f"Todas las rutas de modelos fallaron: {str(last_error)}")
+
+
+_router: Optional[LLMRouter] = None
+
+
+def get_llm_router(default_model: str) -> LLMRouter:
+    """Obtiene (o crea) el router de modelos del proceso."""
+    global _router
+    if _router is None:
+        _router = LLMRouter.from_env(default_model)
+    return _router
+
+
+async def close_llm_clients() -> None:
+    """
+    Cierra los clientes HTTP de los proveedores y conserva el router (y sus latencias):
+    el siguiente uso abre clientes nuevos en el event loop que corra.
+    """
+    if _router is not None:
+        for provider in {route.provider for route in _router.routes}:
+            await provider.aclose()
+
+
+async def close_llm_router() -> None:
+    """Cierra los clientes HTTP de los proveedores al apagar el worker."""
+    global _router
+    await close_llm_clients()
+    _router = None
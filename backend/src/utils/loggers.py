@@ -1,22 +1,124 @@
+import atexit
+import json
 import logging
-from logging.handlers import RotatingFileHandler
+import os
+import queue
+import random
+import sys
+from contextvars import ContextVar
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from typing import Any, Optional
+
+# Configuración desde el entorno
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()  # "json" o "text"
+LOG_FILE = os.getenv("LOG_FILE", "./logs/aws-log.log")  # vacío para no escribir a archivo
+LOG_CONSOLE = os.getenv("LOG_CONSOLE", "true").lower() in ("1", "true", "yes")
+# Volcado de payloads (headers, formularios): fracción muestreada y tamaño máximo
+LOG_PAYLOAD_SAMPLE_RATE = float(os.getenv("LOG_PAYLOAD_SAMPLE_RATE", "0.01"))
+LOG_PAYLOAD_MAX_CHARS = int(os.getenv("LOG_PAYLOAD_MAX_CHARS", "512"))
+
+# ID de la petición en curso, añadido a cada registro
+request_id_var: ContextVar[str] = ContextVar("request_id", default="-")
+
+
+class RequestIdFilter(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.request_id = request_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """Un objeto JSON por línea."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "pid": record.process,
+            "src": f"{record.filename}:{record.lineno}",
+            "request_id": getattr(record, "request_id", "-"),
+            "msg": record.getMessage(),
+        }
+        payload = getattr(record, "payload", None)
+        if payload is not None:
+            entry["payload"] = payload
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def _build_handlers() -> list:
+    if LOG_FORMAT == "json":
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(
+            fmt='%(asctime)s pid/%(process)d [%(filename)s:%(lineno)d] [%(request_id)s] %(message)s'
+        )
+
+    handlers = []
+    if LOG_FILE:
+        # File handler: Guardar logs en un archivo con rotación
+        file_handler = RotatingFileHandler(LOG_FILE, maxBytes=1024 * 1024, backupCount=10)
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    if LOG_CONSOLE:
+        # Console handler: Mostrar logs en la consola
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+    return handlers
+
+
+# La escritura a disco/consola ocurre en un hilo aparte: el event loop solo encola el registro
+_log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+_listener: Optional[QueueListener] = None
+
+
+def start_log_listener() -> None:
+    """Arranca el hilo escritor de logs del proceso actual."""
+    global _listener
+    _listener = QueueListener(_log_queue, *_build_handlers(), respect_handler_level=True)
+    _listener.start()
+
+
+def stop_log_listener() -> None:
+    """Vacía la cola y detiene el hilo escritor."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def flush_logs() -> None:
+    """
+    Escribe todo lo pendiente antes de que el proceso termine con os._exit
+    (p. ej. el proceso hijo que ejecuta cada trabajo de RQ).
+    """
+    stop_log_listener()
+    start_log_listener()
+
 
 # Configuración del logger
 logger = logging.getLogger('logtest')
-logger.setLevel(logging.DEBUG)  # Establecer el nivel global a DEBUG
-
-# Formato del log
-formatter = logging.Formatter(fmt='%(asctime)s pid/%(process)d [%(filename)s:%(lineno)d] %(message)s')
+logger.setLevel(LOG_LEVEL)
+logger.propagate = False
+queue_handler = QueueHandler(_log_queue)
+queue_handler.addFilter(RequestIdFilter())
+logger.addHandler(queue_handler)
 
-# File handler: Guardar logs en un archivo con rotación
-file_handler = RotatingFileHandler('./logs/aws-log.log', maxBytes=1024 * 1024, backupCount=10)
-file_handler.setLevel(logging.DEBUG)  # Nivel de logs en archivo
-file_handler.setFormatter(formatter)
-logger.addHandler(file_handler)
+start_log_listener()
+atexit.register(stop_log_listener)
+# Tras un fork (gunicorn --preload, workers de RQ) el hilo escritor no existe en el hijo
+os.register_at_fork(after_in_child=start_log_listener)
 
-# Console handler: Mostrar logs en la consola
-console_handler = logging.StreamHandler()
-console_handler.setLevel(logging.DEBUG)  # Nivel de logs en consola
-console_handler.setFormatter(formatter)
-logger.addHandler(console_handler)
 
+def log_payload(label: str, payload: Any, level: int = logging.DEBUG) -> None:
+    """
+    Registra un payload grande (headers, formularios) solo para una fracción muestreada
+    de las peticiones y recortado a LOG_PAYLOAD_MAX_CHARS.
+    """
+    if not logger.isEnabledFor(level) or random.random() >= LOG_PAYLOAD_SAMPLE_RATE:
+        return
+    text = payload if isinstance(payload, str) else json.dumps(payload, ensure_ascii=False, default=str)
+    if len(text) > LOG_PAYLOAD_MAX_CHARS:
+        text = text[:LOG_PAYLOAD_MAX_CHARS] + f"… (+{len(text) - LOG_PAYLOAD_MAX_CHARS} chars)"
+    logger.log(level, label, extra={"payload": text})
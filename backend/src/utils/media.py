@@ -0,0 +1,319 @@
+"""
+Adjuntos de los mensajes entrantes (imágenes, notas de voz, PDFs).
+
+Twilio envía NumMedia y un MediaUrl<N>/MediaContentType<N> por archivo. El
+webhook solo extrae las URLs; la descarga y el procesamiento corren fuera de la
+petición (tarea en segundo plano o worker de RQ) antes de llamar al modelo:
+
+  1. Descarga en streaming a un archivo temporal en MEDIA_SPOOL_DIR, por
+     fragmentos de MEDIA_CHUNK_BYTES: la memoria no depende del tamaño del
+     archivo. Se corta al superar MEDIA_MAX_BYTES o MEDIA_DOWNLOAD_TIMEOUT_SECONDS.
+  2. El sha256 se calcula mientras se descarga. Los resultados de los procesadores
+     se guardan en Redis por hash: un archivo repetido (el mismo PDF reenviado por
+     muchos clientes) se procesa una sola vez, y una URL ya vista (reintento del
+     trabajo) no se vuelve a descargar.
+  3. Cada procesador registrado para el tipo de contenido (register_processor)
+     recibe el archivo y devuelve texto para el modelo. Los incluidos son un
+     descriptor genérico y, con MEDIA_TRANSCRIPTION_MODEL, la transcripción de
+     notas de voz.
+"""
+import asyncio
+import hashlib
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.core.settings import get_settings
+from src.utils.loggers import logger
+from src.utils.metrics import MEDIA_BYTES, MEDIA_DOWNLOADS, MEDIA_PROCESSED, track_stage
+
+load_dotenv()
+
+MEDIA_ENABLED = os.getenv("MEDIA_ENABLED", "true").lower() in ("1", "true", "yes")
+# WhatsApp admite hasta 16 MB en imágenes, audio y video (100 MB en documentos)
+MEDIA_MAX_BYTES = int(os.getenv("MEDIA_MAX_BYTES", str(16 * 1024 * 1024)))
+MEDIA_DOWNLOAD_TIMEOUT_SECONDS = float(os.getenv("MEDIA_DOWNLOAD_TIMEOUT_SECONDS", "30"))
+MEDIA_CHUNK_BYTES = int(os.getenv("MEDIA_CHUNK_BYTES", str(64 * 1024)))
+MEDIA_SPOOL_DIR = os.getenv("MEDIA_SPOOL_DIR", os.path.join(tempfile.gettempdir(), "media"))
+# Descargas simultáneas por worker
+MEDIA_CONCURRENCY = int(os.getenv("MEDIA_CONCURRENCY", "4"))
+MEDIA_PROCESS_TIMEOUT_SECONDS = float(os.getenv("MEDIA_PROCESS_TIMEOUT_SECONDS", "60"))
+MEDIA_DEDUP_TTL_SECONDS = int(os.getenv("MEDIA_DEDUP_TTL_SECONDS", str(7 * 24 * 3600)))
+# Modelo de transcripción de notas de voz (p. ej. whisper-1); vacío desactiva la transcripción
+MEDIA_TRANSCRIPTION_MODEL = os.getenv("MEDIA_TRANSCRIPTION_MODEL", "")
+# Twilio permite hasta 10 adjuntos por mensaje
+MEDIA_MAX_ITEMS = 10
+
+URL_KEY_PREFIX = "media:url"
+RESULT_KEY_PREFIX = "media:result"
+
+
+class MediaError(Exception):
+    """El adjunto no se pudo descargar (demasiado grande, lento o con error HTTP)."""
+
+
+@dataclass
+class MediaFile:
+    path: str
+    sha256: str
+    size: int
+    content_type: str
+
+
+MediaProcessor = Callable[[MediaFile], Awaitable[Optional[str]]]
+
+# (nombre, prefijos de content-type, procesador) en orden de registro
+_processors: List[Tuple[str, Tuple[str, ...], MediaProcessor]] = []
+
+
+def register_processor(name: str, content_types: Tuple[str, ...], processor: MediaProcessor) -> None:
+    """
+    Registra un procesador para los adjuntos cuyo content-type empieza por alguno
+    de `content_types` ("" para todos). Devuelve el texto que verá el modelo o None.
+    """
+    _processors[:] = [entry for entry in _processors if entry[0] != name]
+    _processors.append((name, content_types, processor))
+
+
+def processors_for(content_type: str) -> List[Tuple[str, MediaProcessor]]:
+    return [(name, processor) for name, prefixes, processor in _processors
+            if any(content_type.startswith(prefix) for prefix in prefixes)]
+
+
+def extract_media(form) -> List[Dict[str, str]]:
+    """Adjuntos del formulario de Twilio: [{"url", "content_type"}]."""
+    try:
+        count = min(int(form.get("NumMedia") or 0), MEDIA_MAX_ITEMS)
+    except ValueError:
+        return []
+    media = []
+    for index in range(count):
+        url = form.get(f"MediaUrl{index}")
+        if url:
+            media.append({"url": url, "content_type": form.get(f"MediaContentType{index}") or ""})
+    return media
+
+
+# --- Descarga ---
+
+class MediaDownloader:
+    """Cliente HTTP de descargas con las credenciales de Twilio, ligado a su event loop."""
+
+    def __init__(self):
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _bind(self) -> None:
+        # Los trabajos de RQ cierran el cliente al terminar (close_job_clients en src/utils/queue.py):
+        # un cliente de un loop ya cerrado no se puede cerrar desde otro
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            if self._client is not None:
+                logger.warning("⚠️ Cliente de descargas de otro event loop sin cerrar: se reemplaza")
+            settings = get_settings()
+            auth = (settings.twilio_account_sid, settings.twilio_auth_token) if settings.twilio_account_sid else None
+            # Twilio redirige a una URL firmada de otro dominio: httpx no reenvía ahí la autenticación
+            self._client = httpx.AsyncClient(auth=auth, follow_redirects=True, timeout=MEDIA_DOWNLOAD_TIMEOUT_SECONDS)
+            self._semaphore = asyncio.Semaphore(MEDIA_CONCURRENCY)
+            self._loop = loop
+
+    async def _stream_to(self, url: str, handle, digest) -> Tuple[int, Optional[str]]:
+        size = 0
+        async with self._client.stream("GET", url) as response:
+            if response.status_code >= 400:
+                raise MediaError(f"HTTP {response.status_code}")
+            declared = int(response.headers.get("content-length") or 0)
+            if declared > MEDIA_MAX_BYTES:
+                raise MediaError(f"demasiado grande ({declared} bytes)")
+            async for chunk in response.aiter_bytes(MEDIA_CHUNK_BYTES):
+                size += len(chunk)
+                # Sin Content-Length (o si miente) se corta al pasar el límite
+                if size > MEDIA_MAX_BYTES:
+                    raise MediaError(f"demasiado grande (más de {MEDIA_MAX_BYTES} bytes)")
+                digest.update(chunk)
+                handle.write(chunk)
+            return size, response.headers.get("content-type")
+
+    async def download(self, url: str, content_type: str = "") -> MediaFile:
+        """Descarga `url` a un archivo temporal. Quien la llama debe borrar `path`."""
+        self._bind()
+        async with self._semaphore:
+            os.makedirs(MEDIA_SPOOL_DIR, exist_ok=True)
+            fd, path = tempfile.mkstemp(dir=MEDIA_SPOOL_DIR, suffix=".part")
+            digest = hashlib.sha256()
+            try:
+                with os.fdopen(fd, "wb") as handle, track_stage("media_download"):
+                    size, served_type = await asyncio.wait_for(
+                        self._stream_to(url, handle, digest), timeout=MEDIA_DOWNLOAD_TIMEOUT_SECONDS
+                    )
+            except asyncio.TimeoutError:
+                os.remove(path)
+                raise MediaError(f"la descarga superó {MEDIA_DOWNLOAD_TIMEOUT_SECONDS:.0f}s")
+            except httpx.HTTPError as e:
+                os.remove(path)
+                raise MediaError(str(e) or type(e).__name__)
+            except BaseException:
+                os.remove(path)
+                raise
+        MEDIA_BYTES.inc(size)
+        return MediaFile(path, digest.hexdigest(), size, (content_type or served_type or "").split(";")[0].strip())
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+_downloader: Optional[MediaDownloader] = None
+
+
+def get_media_downloader() -> MediaDownloader:
+    """Obtiene (o crea) el cliente de descargas del proceso."""
+    global _downloader
+    if _downloader is None:
+        _downloader = MediaDownloader()
+    return _downloader
+
+
+async def close_media_downloader() -> None:
+    global _downloader
+    if _downloader is not None:
+        await _downloader.aclose()
+        _downloader = None
+
+
+# --- Procesadores incluidos ---
+
+def _human_size(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MB" if size >= 1024 * 1024 else f"{max(1, size // 1024)} KB"
+
+
+MEDIA_KINDS = {"image/": "Imagen", "audio/": "Nota de voz", "video/": "Video", "application/pdf": "Documento PDF"}
+
+
+async def describe_media(media: MediaFile) -> Optional[str]:
+    """Descripción mínima para que el modelo sepa qué envió el cliente."""
+    kind = next((label for prefix, label in MEDIA_KINDS.items() if media.content_type.startswith(prefix)), "Archivo")
+    return f"[{kind} adjunto: {media.content_type or 'tipo desconocido'}, {_human_size(media.size)}]"
+
+
+async def transcribe_audio(media: MediaFile) -> Optional[str]:
+    """Transcribe una nota de voz con el primer proveedor del router de modelos."""
+    from src.utils.llm_router import get_llm_router
+    from src.utils.model import MODEL_NAME
+
+    client = get_llm_router(MODEL_NAME).routes[0].provider.client
+    extension = media.content_type.split("/")[-1] or "ogg"
+    with open(media.path, "rb") as handle:
+        result = await client.audio.transcriptions.create(
+            model=MEDIA_TRANSCRIPTION_MODEL, file=(f"nota.{extension}", handle, media.content_type)
+        )
+    text = (getattr(result, "text", "") or "").strip()
+    return f"[Transcripción de la nota de voz: {text}]" if text else None
+
+
+register_processor("describe", ("",), describe_media)
+if MEDIA_TRANSCRIPTION_MODEL:
+    register_processor("transcribe", ("audio/",), transcribe_audio)
+
+
+# --- Ingesta ---
+
+def _cached_results(redis_client, url: str) -> Tuple[Optional[str], Dict[str, str]]:
+    url_key = f"{URL_KEY_PREFIX}:{hashlib.sha1(url.encode()).hexdigest()}"
+    sha256 = redis_client.get(url_key)
+    if sha256 is None:
+        return None, {}
+    sha256 = sha256.decode() if isinstance(sha256, bytes) else sha256
+    return sha256, _results_for(redis_client, sha256)
+
+
+def _results_for(redis_client, sha256: str) -> Dict[str, str]:
+    raw = redis_client.hgetall(f"{RESULT_KEY_PREFIX}:{sha256}") or {}
+    return {(k.decode() if isinstance(k, bytes) else k): (v.decode() if isinstance(v, bytes) else v)
+            for k, v in raw.items()}
+
+
+def _save_results(redis_client, url: str, sha256: str, results: Dict[str, str]) -> None:
+    pipe = redis_client.pipeline()
+    pipe.set(f"{URL_KEY_PREFIX}:{hashlib.sha1(url.encode()).hexdigest()}", sha256, ex=MEDIA_DEDUP_TTL_SECONDS)
+    if results:
+        pipe.hset(f"{RESULT_KEY_PREFIX}:{sha256}", mapping=results)
+    pipe.expire(f"{RESULT_KEY_PREFIX}:{sha256}", MEDIA_DEDUP_TTL_SECONDS)
+    pipe.execute()
+
+
+async def _run_processor(name: str, processor: MediaProcessor, media: MediaFile) -> Optional[str]:
+    started = time.perf_counter()
+    try:
+        text = await asyncio.wait_for(processor(media), timeout=MEDIA_PROCESS_TIMEOUT_SECONDS)
+        MEDIA_PROCESSED.labels(name, "ok").inc()
+        return text or ""
+    except Exception as e:
+        MEDIA_PROCESSED.labels(name, "error").inc()
+        logger.error(f"❌ El procesador de adjuntos '{name}' falló: {str(e) or type(e).__name__}")
+        return None
+    finally:
+        logger.debug(f"🧩 Procesador '{name}' en {(time.perf_counter() - started) * 1000:.0f} ms")
+
+
+async def ingest_one(redis_client, item: Dict[str, str]) -> str:
+    """Descarga y procesa un adjunto; devuelve el texto combinado de sus procesadores."""
+    url, content_type = item["url"], item.get("content_type", "")
+    expected = [name for name, _ in processors_for(content_type)] if content_type else None
+
+    try:
+        sha256, results = await run_in_threadpool(_cached_results, redis_client, url)
+    except Exception as e:
+        logger.warning(f"⚠️ No se pudo consultar la caché de adjuntos: {str(e)}")
+        sha256, results = None, {}
+    if sha256 and expected is not None and all(name in results for name in expected):
+        MEDIA_DOWNLOADS.labels("cached_url").inc()
+        return "\n".join(results[name] for name in expected if results[name])
+
+    try:
+        media = await get_media_downloader().download(url, content_type)
+    except MediaError as e:
+        MEDIA_DOWNLOADS.labels("rejected").inc()
+        logger.warning(f"⚠️ Adjunto descartado ({content_type or 'tipo desconocido'}): {str(e)}")
+        return f"[Adjunto no disponible: {str(e)}]"
+
+    try:
+        try:
+            results = await run_in_threadpool(_results_for, redis_client, media.sha256)
+        except Exception:
+            results = {}
+        selected = processors_for(media.content_type)
+        missing = [(name, processor) for name, processor in selected if name not in results]
+        MEDIA_DOWNLOADS.labels("processed" if missing else "duplicate").inc()
+        for (name, _), text in zip(missing, await asyncio.gather(
+            *(_run_processor(name, processor, media) for name, processor in missing)
+        )):
+            if text is not None:
+                results[name] = text
+        try:
+            await run_in_threadpool(_save_results, redis_client, url, media.sha256,
+                                    {name: results[name] for name, _ in missing if name in results})
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo guardar el resultado del adjunto: {str(e)}")
+        logger.info(f"📎 Adjunto {media.content_type} de {_human_size(media.size)} "
+                    f"({'procesado' if missing else 'repetido'}, sha256 {media.sha256[:12]})")
+        return "\n".join(results[name] for name, _ in selected if results.get(name))
+    finally:
+        await run_in_threadpool(os.remove, media.path)
+
+
+async def attach_media(redis_client, body: str, media: List[Dict[str, str]]) -> str:
+    """Texto del mensaje con el resultado de cada adjunto, en orden, para el historial y el modelo."""
+    if not MEDIA_ENABLED or not media:
+        return body
+    texts = await asyncio.gather(*(ingest_one(redis_client, item) for item in media))
+    return "\n".join(part for part in [body, *texts] if part).strip()
@@ -0,0 +1,215 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Iterator, Tuple
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+)
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from src.utils.loggers import logger
+
+# Con varios workers de gunicorn, PROMETHEUS_MULTIPROC_DIR debe apuntar a un directorio
+# compartido y vacío al arrancar (ver gunicorn.conf.py); cada proceso escribe ahí sus valores
+MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+if MULTIPROC_DIR:
+    # El worker de RQ y los scripts heredan la variable del Dockerfile sin pasar por
+    # gunicorn.conf.py: las métricas sin etiquetas crean su archivo al definirse
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Etapas del webhook: form_parse, history_read, history_append, llm, llm_stream, whatsapp_send
+STAGE_LATENCY = Histogram(
+    "whatsapp_stage_latency_seconds",
+    "Latencia de cada etapa del pipeline del webhook",
+    ["stage"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30),
+)
+STAGE_ERRORS = Counter(
+    "whatsapp_stage_errors_total",
+    "Errores por etapa del pipeline del webhook",
+    ["stage"],
+)
+STAGE_IN_FLIGHT = Gauge(
+    "whatsapp_stage_in_flight",
+    "Operaciones en curso por etapa",
+    ["stage"],
+    multiprocess_mode="livesum",
+)
+# Entregas del webhook según el MessageSid: new, duplicate_local, duplicate_redis, unchecked
+WEBHOOK_DEDUP = Counter(
+    "webhook_dedup_requests_total",
+    "Peticiones del webhook clasificadas por la deduplicación de MessageSid",
+    ["result"],
+)
+# Decisiones del control de admisión (src/utils/admission.py):
+# rate_limit y llm_slot -> admitted/rejected/unchecked; load -> admitted/shed
+ADMISSION_DECISIONS = Counter(
+    "admission_decisions_total",
+    "Decisiones del control de admisión por verificación",
+    ["check", "result"],
+)
+ADMISSION_LIMITS = Gauge(
+    "admission_limit",
+    "Límites configurados del control de admisión",
+    ["limit"],
+    multiprocess_mode="max",
+)
+# Llamadas al modelo esperando lugar (waiting) o en curso (in_use)
+LLM_SLOTS = Gauge(
+    "llm_slots",
+    "Llamadas al modelo por estado en el limitador de concurrencia",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+LLM_SLOT_WAIT = Histogram(
+    "llm_slot_wait_seconds",
+    "Espera para obtener lugar en el limitador de concurrencia del modelo",
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 15),
+)
+# Seguimientos programados (src/utils/calendar.py): sent, failed, retry, expired, cancelled, error
+FOLLOWUPS = Counter(
+    "followups_total",
+    "Seguimientos programados procesados por el despachador",
+    ["result"],
+)
+# Adjuntos entrantes (src/utils/media.py): processed, duplicate, cached_url, rejected
+MEDIA_DOWNLOADS = Counter(
+    "media_downloads_total",
+    "Adjuntos de mensajes entrantes por resultado de la ingesta",
+    ["result"],
+)
+MEDIA_BYTES = Counter(
+    "media_download_bytes_total",
+    "Bytes descargados de adjuntos de mensajes entrantes",
+)
+MEDIA_PROCESSED = Counter(
+    "media_processed_total",
+    "Ejecuciones de los procesadores de adjuntos",
+    ["processor", "result"],
+)
+# Circuit breakers (src/utils/circuit_breaker.py): 0 cerrado, 1 semiabierto, 2 abierto
+CIRCUIT_STATE = Gauge(
+    "circuit_breaker_state",
+    "Estado del circuit breaker de cada dependencia",
+    ["breaker"],
+    multiprocess_mode="max",
+)
+# success, failure o rejected (rechazada con el circuito abierto)
+CIRCUIT_CALLS = Counter(
+    "circuit_breaker_calls_total",
+    "Llamadas a dependencias externas por resultado en su circuit breaker",
+    ["breaker", "result"],
+)
+LLM_TOKENS = Counter(
+    "llm_tokens_total",
+    "Tokens consumidos por el modelo",
+    ["model", "kind"],
+)
+
+
+@contextmanager
+def track_stage(stage: str) -> Iterator[None]:
+    """Mide la latencia de una etapa, cuenta sus errores y las operaciones en curso."""
+    STAGE_IN_FLIGHT.labels(stage).inc()
+    started = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_LATENCY.labels(stage).observe(time.perf_counter() - started)
+        STAGE_IN_FLIGHT.labels(stage).dec()
+
+
+def record_token_usage(model: str, usage) -> None:
+    """Acumula los tokens de prompt y de respuesta de una llamada al modelo."""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(model, "prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(model, "completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+
+class RedisStatsCollector:
+    """
+    Exporta los contadores que ya viven en Redis (caché de historial, ventana de
+    agrupación, caché de respuestas, lugares globales del modelo, profundidad de
+    las colas y seguimientos pendientes). Al estar en Redis ya son globales a todos
+    los workers, así que se leen una vez por scrape.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    def collect(self):
+        from src.utils.admission import get_admission_stats
+        from src.utils.calendar import get_followup_stats
+        from src.utils.conversation_cache import get_cache_stats
+        from src.utils.debounce import get_debounce_stats
+        from src.utils.response_cache import get_response_cache_stats
+
+        try:
+            cache = get_cache_stats(self.redis)
+            debounce = get_debounce_stats(self.redis)
+            responses = get_response_cache_stats(self.redis)
+            admission = get_admission_stats(self.redis)
+            followups = get_followup_stats(self.redis)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron leer las estadísticas de Redis: {str(e)}")
+            return
+
+        lookups = CounterMetricFamily("conversation_cache_lookups", "Lecturas de la caché de historial", labels=["result"])
+        lookups.add_metric(["hit"], cache["hits"])
+        lookups.add_metric(["miss"], cache["misses"])
+        yield lookups
+
+        inbound = CounterMetricFamily("debounce_messages", "Mensajes entrantes que pasaron por la ventana de agrupación")
+        inbound.add_metric([], debounce["messages"])
+        yield inbound
+        turns = CounterMetricFamily("debounce_llm_turns", "Turnos del modelo tras agrupar mensajes")
+        turns.add_metric([], debounce["llm_turns"])
+        yield turns
+
+        response_lookups = CounterMetricFamily("llm_response_cache_lookups", "Consultas a la caché de respuestas", labels=["result"])
+        response_lookups.add_metric(["hit"], responses["hits"])
+        response_lookups.add_metric(["near_hit"], responses["near_hits"])
+        response_lookups.add_metric(["miss"], responses["misses"])
+        yield response_lookups
+        saved = GaugeMetricFamily("llm_response_cache_saved_seconds", "Latencia del modelo ahorrada por la caché de respuestas")
+        saved.add_metric([], responses["saved_ms"] / 1000)
+        yield saved
+
+        slots = GaugeMetricFamily("llm_global_slots_in_use", "Lugares ocupados en el límite global de llamadas al modelo")
+        slots.add_metric([], admission["llm_global_slots_in_use"])
+        yield slots
+        depth = GaugeMetricFamily("whatsapp_queue_depth", "Trabajos pendientes en todas las colas de RQ")
+        depth.add_metric([], admission["queue_depth"])
+        yield depth
+
+        pending = GaugeMetricFamily("followups_pending", "Seguimientos por estado", labels=["state"])
+        for state in ("scheduled", "overdue", "inflight"):
+            pending.add_metric([state], followups[state])
+        yield pending
+
+
+def render_metrics(redis_client) -> Tuple[bytes, str]:
+    """Serializa las métricas en formato Prometheus, agregando todos los workers."""
+    if MULTIPROC_DIR:
+        from prometheus_client import multiprocess
+
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        output = generate_latest(registry)
+    else:
+        output = generate_latest(REGISTRY)
+
+    redis_registry = CollectorRegistry()
+    redis_registry.register(RedisStatsCollector(redis_client))
+    return output + generate_latest(redis_registry), CONTENT_TYPE_LATEST
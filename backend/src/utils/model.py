@@ -1,59 +1,39 @@
 import os
 import json
-from typing import List, Dict, Any, Optional
-from openai import AsyncOpenAI
-import logging
+from typing import List, Dict, Any, AsyncIterator, Optional
 from dotenv import load_dotenv
-from pathlib import Path
+from src.utils.admission import BUSY_MESSAGE, AdmissionRejected, llm_slot
+from src.utils.context import SUMMARY_CHUNK_TOKENS, split_by_tokens
+from src.utils.llm_router import get_llm_router
 from src.utils.loggers import logger
+from src.utils.metrics import record_token_usage, track_stage
+from src.utils.redis import redis_conn
 
-# Configurar logger
-logger = logging.getLogger(__name__)
+# Cargar variables de entorno (sin sobrescribir las del proceso)
+load_dotenv()
 
-# Cargar variables de entorno desde la raíz del proyecto
-env_path = Path(__file__).parent.parent.parent.parent / '.env'
-logger.info(f"Cargando .env desde: {env_path}")
+# Configuración de OpenAI. La API key la lee el router al crear el cliente de cada
+# proveedor; importar este módulo no valida credenciales ni abre conexiones.
+MODEL_NAME = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
 
-# Cargar el archivo .env manualmente
-load_dotenv(env_path, override=True)
+# Streaming: tamaño de los fragmentos que se envían por WhatsApp
+STREAM_MIN_CHUNK_CHARS = int(os.getenv("LLM_STREAM_MIN_CHUNK_CHARS", "80"))
+# WhatsApp admite hasta 1600 caracteres por mensaje
+STREAM_MAX_CHUNK_CHARS = int(os.getenv("LLM_STREAM_MAX_CHUNK_CHARS", "1500"))
 
-# Configuración de OpenAI
-MODEL_NAME = os.getenv("LLM_MODEL", "gpt-3.5-turbo")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "").strip()
-
-# Logging detallado
-logger.info(f"Modelo configurado: {MODEL_NAME}")
-logger.info(f"OPENAI_API_KEY configurada: {'Sí' if OPENAI_API_KEY else 'No'}")
-if OPENAI_API_KEY:
-    logger.info(f"Longitud de la API key: {len(OPENAI_API_KEY)} caracteres")
-    logger.info(f"Prefijo de la API key: {OPENAI_API_KEY[:8]}...{OPENAI_API_KEY[-4:] if len(OPENAI_API_KEY) > 12 else ''}")
-    
-    # Verificar que la clave no tenga caracteres no deseados
-    if '\n' in OPENAI_API_KEY or '\r' in OPENAI_API_KEY:
-        logger.warning("¡La API key contiene saltos de línea! Limpiando...")
-        OPENAI_API_KEY = OPENAI_API_KEY.strip()
-
-# Verificar que la clave de API esté configurada
-if not OPENAI_API_KEY:
-    error_msg = "ERROR: OPENAI_API_KEY no está configurada en las variables de entorno"
-    logger.error(error_msg)
-    raise ValueError(error_msg)
-
-# Inicializar el cliente de OpenAI
-try:
-    client = AsyncOpenAI(
-        api_key=OPENAI_API_KEY,
-        # Asegurarse de usar la URL base correcta
-        base_url="https://api.openai.com/v1"
-    )
-    logger.info("Cliente de OpenAI inicializado correctamente")
-except Exception as e:
-    logger.error(f"Error al inicializar el cliente de OpenAI: {str(e)}")
-    raise
+# Respuestas de respaldo cuando el modelo no puede contestar
+NO_MESSAGES_RESPONSE = "Lo siento, no recibí ningún mensaje para procesar."
+EMPTY_RESPONSE = "Lo siento, no pude generar una respuesta en este momento. Por favor, inténtalo de nuevo."
+ERROR_RESPONSE = "Lo siento, estoy teniendo problemas para procesar tu solicitud. Por favor, inténtalo de nuevo más tarde."
+# Sin lugar en el límite de llamadas simultáneas al modelo (src/utils/admission.py)
+BUSY_RESPONSE = BUSY_MESSAGE
+SUMMARY_ERROR_RESPONSE = "No se pudo generar un resumen de la conversación."
+FALLBACK_RESPONSES = {NO_MESSAGES_RESPONSE, EMPTY_RESPONSE, ERROR_RESPONSE, BUSY_RESPONSE, SUMMARY_ERROR_RESPONSE}
 
 async def gpt_without_functions(model: str = None, messages: List[Dict[str, str]] = None) -> str:
     """
     Función para interactuar con la API de OpenAI sin funciones.
+    Las llamadas pasan por el router de modelos (src/utils/llm_router.py).
     
     Args:
         model: Nombre del modelo a utilizar
@@ -65,64 +45,227 @@ async def gpt_without_functions(model: str = None, messages: List[Dict[str, str]
     try:
         if not messages:
             logger.warning("No se proporcionaron mensajes para el modelo")
-            return "Lo siento, no recibí ningún mensaje para procesar."
+            return NO_MESSAGES_RESPONSE
             
-        # Usar el modelo especificado o el predeterminado
-        model_name = model or MODEL_NAME
-        logger.info(f"Usando modelo: {model_name}")
-        
-        # Realizar la llamada a la API
-        response = await client.chat.completions.create(
-            model=model_name,
-            messages=messages,
-            temperature=0.7,
-            max_tokens=1000
-        )
+        # Usar el modelo especificado como ruta preferida; el router aplica plazo,
+        # peticiones duplicadas y modelos de respaldo
+        async with llm_slot(redis_conn):
+            with track_stage("llm"):
+                response = await get_llm_router(MODEL_NAME).complete(
+                    messages,
+                    preferred_model=model,
+                    temperature=0.7,
+                    max_tokens=1000
+                )
+        record_token_usage(response.model, response.usage)
+        logger.info(f"Respuesta generada por el modelo: {response.model}")
         
         # Extraer la respuesta
         if response.choices and len(response.choices) > 0:
             return response.choices[0].message.content
         
         logger.error("No se pudo extraer la respuesta del modelo")
-        return "Lo siento, no pude generar una respuesta en este momento. Por favor, inténtalo de nuevo."
+        return EMPTY_RESPONSE
         
+    except AdmissionRejected as e:
+        logger.warning(f"🚦 Llamada al modelo rechazada por el control de admisión: {str(e)}")
+        return BUSY_RESPONSE
     except Exception as e:
         logger.error(f"Error en gpt_without_functions: {str(e)}", exc_info=True)
-        return "Lo siento, estoy teniendo problemas para procesar tu solicitud. Por favor, inténtalo de nuevo más tarde."
+        return ERROR_RESPONSE
+
+def find_chunk_boundary(text: str) -> Optional[int]:
+    """
+    Posición donde cortar el texto acumulado del stream, o None si hay que seguir esperando.
+    Prefiere fin de párrafo, luego fin de oración; solo corta en un espacio si el
+    fragmento supera el máximo permitido por WhatsApp.
+    """
+    if len(text) < STREAM_MIN_CHUNK_CHARS:
+        return None
+
+    paragraph = text.rfind("\n\n", STREAM_MIN_CHUNK_CHARS - 1, STREAM_MAX_CHUNK_CHARS)
+    if paragraph != -1:
+        return paragraph + 2
+
+    # Un signo de puntuación seguido de espacio: el token siguiente ya llegó
+    sentence_end = -1
+    for index in range(STREAM_MIN_CHUNK_CHARS - 1, min(len(text) - 1, STREAM_MAX_CHUNK_CHARS)):
+        if text[index] in ".!?…\n" and text[index + 1].isspace():
+            sentence_end = index + 1
+    if sentence_end != -1:
+        return sentence_end
+
+    if len(text) > STREAM_MAX_CHUNK_CHARS:
+        space = text.rfind(" ", 0, STREAM_MAX_CHUNK_CHARS)
+        return space if space > 0 else STREAM_MAX_CHUNK_CHARS
+    return None
+
+async def gpt_stream_chunks(model: str = None, messages: List[Dict[str, str]] = None) -> AsyncIterator[str]:
+    """
+    Consume la respuesta del modelo en streaming y la entrega en fragmentos
+    cortados en límites de párrafo u oración, listos para enviarse por WhatsApp.
+    
+    Args:
+        model: Nombre del modelo a utilizar
+        messages: Lista de mensajes en formato de chat
+        
+    Yields:
+        str: Fragmentos de la respuesta en orden
+    """
+    if not messages:
+        logger.warning("No se proporcionaron mensajes para el modelo")
+        yield NO_MESSAGES_RESPONSE
+        return
+
+    buffer = ""
+    yielded = False
+    try:
+        # El lugar en el limitador se mantiene durante toda la generación
+        async with llm_slot(redis_conn):
+            stream = get_llm_router(MODEL_NAME).stream(
+                messages,
+                preferred_model=model,
+                temperature=0.7,
+                max_tokens=1000
+            )
+            async for event in stream:
+                if not event.choices:
+                    continue
+                buffer += event.choices[0].delta.content or ""
+                while (boundary := find_chunk_boundary(buffer)) is not None:
+                    chunk, buffer = buffer[:boundary].strip(), buffer[boundary:]
+                    if chunk:
+                        yielded = True
+                        yield chunk
+    except AdmissionRejected as e:
+        logger.warning(f"🚦 Llamada al modelo rechazada por el control de admisión: {str(e)}")
+        yield BUSY_RESPONSE
+        return
+    except Exception as e:
+        logger.error(f"Error en gpt_stream_chunks: {str(e)}", exc_info=True)
+        # Si ya se envió parte de la respuesta no se añade una disculpa a mitad del texto
+        if not yielded and not buffer.strip():
+            yield ERROR_RESPONSE
+            return
+
+    if buffer.strip():
+        yield buffer.strip()
+    elif not yielded:
+        yield EMPTY_RESPONSE
 
-async def summarise_conversation(history: List[Dict[str, str]]) -> str:
+async def summarise_conversation(history: List[Dict[str, str]], previous_summary: Optional[str] = None) -> str:
     """
     Resumir el historial de conversación en una sola frase.
+    Con `previous_summary` el resumen se actualiza de forma incremental con los
+    mensajes nuevos en lugar de recalcularse desde cero. Todos los mensajes entran
+    en el resumen: si no caben en SUMMARY_CHUNK_TOKENS se resumen por tramos, cada
+    uno incorporado al resumen del anterior.
     
     Args:
-        history: Historial de la conversación
+        history: Historial de la conversación (o solo los mensajes nuevos)
+        previous_summary: Resumen acumulado hasta ahora
         
     Returns:
-        str: Resumen de la conversación
+        str: Resumen de la conversación (una respuesta de respaldo si algún tramo falla)
     """
     try:
         if not history:
-            return "No hay historial de conversación para resumir."
-            
-        # Tomar solo los últimos 10 mensajes para evitar exceder el límite de tokens
-        recent_history = history[-10:]
-        
-        # Crear mensaje de sistema para el resumen
-        system_message = {
-            "role": "system",
-            "content": "Eres un asistente útil que resume conversaciones. Proporciona un resumen conciso de la conversación."
-        }
-        
-        # Crear mensaje de usuario con el historial
-        user_message = {
-            "role": "user",
-            "content": f"Por favor, resume la siguiente conversación en una o dos frases: {recent_history}"
-        }
-        
-        # Llamar al modelo para generar el resumen
-        response = await gpt_without_functions(messages=[system_message, user_message])
-        return response
+            return previous_summary or "No hay historial de conversación para resumir."
+
+        summary = previous_summary
+        for chunk in split_by_tokens(history, SUMMARY_CHUNK_TOKENS):
+            summary = await _summarise_chunk(chunk, summary)
+            # Un resumen parcial no se guarda: los mensajes quedarían marcados como resumidos
+            if summary in FALLBACK_RESPONSES:
+                return summary
+        return summary
         
     except Exception as e:
         logger.error(f"Error en summarise_conversation: {str(e)}")
-        return "No se pudo generar un resumen de la conversación."
+        return SUMMARY_ERROR_RESPONSE
+
+async def _summarise_chunk(history: List[Dict[str, str]], previous_summary: Optional[str]) -> str:
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
+
+    # Crear mensaje de sistema para el resumen
+    system_message = {
+        "role": "system",
+        "content": "Eres un asistente útil que resume conversaciones. Proporciona un resumen conciso de la conversación."
+    }
+
+    # Crear mensaje de usuario con el historial
+    if previous_summary:
+        content = (
+            f"Resumen actual: {previous_summary}\n\n"
+            f"Mensajes nuevos:\n{transcript}\n\n"
+            "Actualiza el resumen incorporando los mensajes nuevos. Conserva datos clave "
+            "del cliente (nombre, negocio, correo, intereses) en no más de cinco frases."
+        )
+    else:
+        content = f"Por favor, resume la siguiente conversación en una o dos frases:\n{transcript}"
+    user_message = {
+        "role": "user",
+        "content": content
+    }
+
+    # Llamar al modelo para generar el resumen
+    return await gpt_without_functions(messages=[system_message, user_message])
+
+
+# Intenciones que puede asignar el análisis de conversaciones (enrich.py)
+CONVERSATION_INTENTS = ("compra", "cotizacion", "informacion", "soporte", "queja", "agenda", "otro")
+INSIGHTS_MAX_TAGS = 5
+
+
+async def analyse_conversation(history: List[Dict[str, str]], previous_summary: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Resumen, intención, etiquetas y puntuación de lead (0-100) de una conversación.
+
+    A diferencia de las demás funciones de este módulo no devuelve una respuesta
+    de respaldo: los errores del modelo (o un JSON inválido) se propagan para que
+    el trabajo por lotes decida si reintentar.
+    """
+    transcript = "\n".join(f"{msg['role']}: {msg['content']}" for msg in history)
+    context = f"Resumen de la conversación anterior: {previous_summary}\n\n" if previous_summary else ""
+    messages = [
+        {
+            "role": "system",
+            "content": (
+                "Analizas conversaciones de WhatsApp entre un cliente (user) y un agente de ventas (assistant). "
+                "Responde solo con un objeto JSON con las claves: "
+                "\"summary\" (resumen en no más de tres frases), "
+                f"\"intent\" (una de: {', '.join(CONVERSATION_INTENTS)}), "
+                f"\"tags\" (hasta {INSIGHTS_MAX_TAGS} etiquetas cortas en minúsculas) y "
+                "\"lead_score\" (entero de 0 a 100: probabilidad de que el cliente compre)."
+            ),
+        },
+        {"role": "user", "content": f"{context}Conversación:\n{transcript}"},
+    ]
+
+    # Sin peticiones duplicadas: el análisis no tiene prisa y cada duplicado cuesta tokens
+    async with llm_slot(redis_conn):
+        response = await get_llm_router(MODEL_NAME).complete(
+            messages,
+            hedge=False,
+            temperature=0,
+            max_tokens=400,
+            response_format={"type": "json_object"},
+        )
+    record_token_usage(response.model, response.usage)
+    if not response.choices or not response.choices[0].message.content:
+        raise ValueError("El modelo no devolvió contenido")
+
+    data = json.loads(response.choices[0].message.content)
+    intent = str(data.get("intent", "")).strip().lower()
+    try:
+        lead_score = min(max(int(data.get("lead_score", 0)), 0), 100)
+    except (TypeError, ValueError):
+        lead_score = 0
+    tags = data.get("tags") if isinstance(data.get("tags"), list) else []
+    return {
+        "summary": str(data.get("summary", "")).strip(),
+        "intent": intent if intent in CONVERSATION_INTENTS else "otro",
+        "tags": [str(tag).strip().lower()[:40] for tag in tags if str(tag).strip()][:INSIGHTS_MAX_TAGS],
+        "lead_score": lead_score,
+        "model": response.model,
+    }
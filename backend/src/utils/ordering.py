@@ -0,0 +1,115 @@
+import asyncio
+import os
+import time
+import uuid
+import zlib
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.loggers import logger
+
+load_dotenv()
+
+# Lease por conversación: exclusión mutua entre workers para un mismo número
+LEASE_ENABLED = os.getenv("CONVERSATION_LEASE_ENABLED", "true").lower() in ("1", "true", "yes")
+# El lease se renueva cada LEASE_TTL_SECONDS / 3 mientras el trabajo sigue vivo: el TTL solo
+# limita cuánto tarda en liberarse el de un worker caído, no la duración del trabajo
+LEASE_TTL_SECONDS = float(os.getenv("CONVERSATION_LEASE_TTL_SECONDS", "30"))
+LEASE_WAIT_SECONDS = float(os.getenv("CONVERSATION_LEASE_WAIT_SECONDS", "60"))
+LEASE_POLL_SECONDS = float(os.getenv("CONVERSATION_LEASE_POLL_SECONDS", "0.05"))
+
+KEY_PREFIX = "conversation_lease"
+
+
+def shard_for(phone_number: str, shards: int) -> int:
+    """Shard estable para un número: todos sus mensajes caen en la misma cola."""
+    return zlib.crc32(phone_number.encode()) % shards
+
+
+def _try_acquire(redis_client, key: str, token: str) -> bool:
+    return bool(redis_client.set(key, token, nx=True, px=int(LEASE_TTL_SECONDS * 1000)))
+
+
+def _release(redis_client, key: str, token: str) -> None:
+    # Borrar solo si el lease sigue siendo nuestro (WATCH/MULTI, compatible con fakeredis)
+    with redis_client.pipeline() as pipe:
+        pipe.watch(key)
+        current = pipe.get(key)
+        if current is not None and (current.decode() if isinstance(current, bytes) else current) == token:
+            pipe.multi()
+            pipe.delete(key)
+            pipe.execute()
+        else:
+            pipe.unwatch()
+
+
+def _renew(redis_client, key: str, token: str) -> bool:
+    """Extiende el lease si sigue siendo nuestro; False si expiró o lo tomó otro worker."""
+    with redis_client.pipeline() as pipe:
+        pipe.watch(key)
+        current = pipe.get(key)
+        if current is None or (current.decode() if isinstance(current, bytes) else current) != token:
+            pipe.unwatch()
+            return False
+        pipe.multi()
+        pipe.pexpire(key, int(LEASE_TTL_SECONDS * 1000))
+        pipe.execute()
+        return True
+
+
+async def _keep_alive(redis_client, key: str, token: str, phone_number: str) -> None:
+    while True:
+        await asyncio.sleep(LEASE_TTL_SECONDS / 3)
+        try:
+            if not await run_in_threadpool(_renew, redis_client, key, token):
+                logger.warning(f"⚠️ El lease de {phone_number} expiró mientras se procesaba el mensaje")
+                return
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo renovar el lease de {phone_number}: {str(e)}")
+
+
+@asynccontextmanager
+async def conversation_lease(redis_client, phone_number: str) -> AsyncIterator[None]:
+    """
+    Serializa el procesamiento de un mismo número entre todos los workers.
+    Números distintos nunca compiten por el mismo lease.
+
+    Si Redis no está disponible se continúa sin lease (fail-open) para no
+    detener el bot; si el lease no se obtiene en LEASE_WAIT_SECONDS se lanza
+    TimeoutError para que el trabajo pueda reintentarse. Mientras se tiene, una
+    tarea lo renueva para que un trabajo lento no lo pierda.
+    """
+    if not LEASE_ENABLED:
+        yield
+        return
+
+    key = f"{KEY_PREFIX}:{phone_number}"
+    token = uuid.uuid4().hex
+    deadline = time.monotonic() + LEASE_WAIT_SECONDS
+    acquired = False
+    try:
+        delay = LEASE_POLL_SECONDS
+        while not (acquired := await run_in_threadpool(_try_acquire, redis_client, key, token)):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"No se obtuvo el lease de la conversación {phone_number}")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 1.0)
+    except TimeoutError:
+        raise
+    except Exception as e:
+        logger.warning(f"⚠️ Lease de conversación no disponible, se continúa sin él: {str(e)}")
+
+    keep_alive = asyncio.create_task(_keep_alive(redis_client, key, token, phone_number)) if acquired else None
+    try:
+        yield
+    finally:
+        if keep_alive is not None:
+            keep_alive.cancel()
+        if acquired:
+            try:
+                await run_in_threadpool(_release, redis_client, key, token)
+            except Exception as e:
+                logger.warning(f"⚠️ No se pudo liberar el lease de {phone_number}: {str(e)}")
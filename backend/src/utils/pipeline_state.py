@@ -0,0 +1,90 @@
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.utils.loggers import logger
+
+load_dotenv()
+
+# Pasos ya hechos del pipeline de un mensaje, por id de trabajo de RQ o MessageSid.
+# RQ reintenta el trabajo completo (y Twilio reenvía el webhook si el modo en línea
+# falla): el reintento salta lo ya hecho y no duplica el mensaje del usuario en el
+# historial, ni llama otra vez al modelo, ni envía una segunda respuesta
+PIPELINE_CHECKPOINT_TTL_SECONDS = int(os.getenv("PIPELINE_CHECKPOINT_TTL_SECONDS", "86400"))
+
+KEY_PREFIX = "pipeline_checkpoint"
+
+# Pasos: mensaje del usuario guardado, respuesta generada, respuesta guardada,
+# respuesta enviada y fragmentos ya enviados (respuesta por streaming)
+USER_MESSAGE = "user_message"
+RESPONSE = "response"
+RESPONSE_SAVED = "response_saved"
+SENT = "sent"
+SENT_CHUNKS = "sent_chunks"
+
+
+class PipelineCheckpoint:
+    """
+    Registro en Redis de los pasos con efectos de un mensaje entrante. Sin id (o con
+    Redis caído) no se registra nada y el pipeline se ejecuta completo.
+    """
+
+    def __init__(self, redis_client, pipeline_id: Optional[str]):
+        self.redis = redis_client
+        self.key = f"{KEY_PREFIX}:{pipeline_id}" if pipeline_id else None
+        self.done: Dict[str, Any] = {}
+
+    async def load(self) -> Dict[str, Any]:
+        if self.key is None:
+            return self.done
+        try:
+            raw = await run_in_threadpool(self.redis.hgetall, self.key)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudieron leer los pasos hechos de {self.key}: {str(e)}")
+            return self.done
+        self.done = {
+            (k.decode() if isinstance(k, bytes) else k): json.loads(v) for k, v in (raw or {}).items()
+        }
+        if self.done:
+            logger.info(f"♻️ Reintento del pipeline {self.key}: se saltan {', '.join(sorted(self.done))}")
+        return self.done
+
+    async def mark(self, step: str, value: Any = True) -> None:
+        self.done[step] = value
+        if self.key is None:
+            return
+
+        def write():
+            pipe = self.redis.pipeline()
+            pipe.hset(self.key, step, json.dumps(value, ensure_ascii=False))
+            pipe.expire(self.key, PIPELINE_CHECKPOINT_TTL_SECONDS)
+            pipe.execute()
+
+        try:
+            await run_in_threadpool(write)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo registrar el paso {step} de {self.key}: {str(e)}")
+
+    async def clear(self) -> None:
+        """Borra el registro cuando el mensaje terminó de procesarse."""
+        if self.key is None:
+            return
+        try:
+            await run_in_threadpool(self.redis.delete, self.key)
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo borrar el registro {self.key}: {str(e)}")
+
+
+def history_before(history: List[Dict[str, str]], message: Dict[str, str]) -> List[Dict[str, str]]:
+    """
+    Historial anterior a un mensaje ya guardado por un intento previo: en el reintento
+    la lectura ya lo incluye (y quizá la respuesta), y no debe repetirse en el contexto.
+    """
+    for index in range(len(history) - 1, -1, -1):
+        candidate = history[index]
+        if all(candidate.get(field) == message.get(field) for field in ("role", "content", "timestamp")):
+            return history[:index]
+    return history
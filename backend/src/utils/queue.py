@@ -0,0 +1,165 @@
+import asyncio
+import os
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from dotenv import load_dotenv
+from rq import Queue, Retry, get_current_job
+
+from src.utils.debounce import DEBOUNCE_ENABLED, quiet_delay, register_message, take_burst
+from src.utils.loggers import flush_logs, logger, request_id_var
+from src.utils.ordering import shard_for
+from src.utils.redis import REDIS_FAKE, redis_conn
+
+load_dotenv()
+
+# Modo de procesamiento del webhook: "inline" (todo dentro de la petición) o "queue" (RQ)
+PROCESSING_MODE = os.getenv("WHATSAPP_PROCESSING_MODE", "inline").lower()
+
+# Configuración de la cola y de los workers
+QUEUE_NAME = os.getenv("WHATSAPP_QUEUE_NAME", "whatsapp")
+WORKER_CONCURRENCY = int(os.getenv("WHATSAPP_WORKER_CONCURRENCY", "4"))
+# Cada shard es una cola con un único worker: los mensajes de un mismo número
+# se procesan en orden y números distintos se reparten entre todos los workers
+QUEUE_SHARDS = int(os.getenv("WHATSAPP_QUEUE_SHARDS", str(WORKER_CONCURRENCY)))
+JOB_TIMEOUT = int(os.getenv("WHATSAPP_JOB_TIMEOUT", "120"))
+JOB_MAX_RETRIES = int(os.getenv("WHATSAPP_JOB_MAX_RETRIES", "3"))
+JOB_RETRY_INTERVALS: List[int] = [
+    int(value) for value in os.getenv("WHATSAPP_JOB_RETRY_INTERVALS", "5,30,120").split(",") if value.strip()
+]
+
+# Con fakeredis no hay workers externos que compartan la memoria, así que los
+# trabajos se ejecutan de forma síncrona en el proceso que los encola.
+QUEUE_SYNC = os.getenv("WHATSAPP_QUEUE_SYNC", "true" if REDIS_FAKE else "false").lower() in ("1", "true", "yes")
+
+_queues: Dict[int, Queue] = {}
+
+
+def queue_enabled() -> bool:
+    """Indica si el webhook debe encolar los mensajes en lugar de procesarlos en línea."""
+    return PROCESSING_MODE == "queue"
+
+
+def shard_queue_name(shard: int) -> str:
+    """Nombre de la cola RQ de un shard."""
+    return f"{QUEUE_NAME}:{shard}"
+
+
+def get_queue(shard: int = 0) -> Queue:
+    """Obtiene (o crea) la cola RQ de mensajes de WhatsApp de un shard."""
+    if shard not in _queues:
+        _queues[shard] = Queue(
+            shard_queue_name(shard),
+            connection=redis_conn,
+            is_async=not QUEUE_SYNC,
+            default_timeout=JOB_TIMEOUT,
+        )
+    return _queues[shard]
+
+
+def _retry() -> Optional[Retry]:
+    return Retry(max=JOB_MAX_RETRIES, interval=JOB_RETRY_INTERVALS) if JOB_MAX_RETRIES > 0 else None
+
+
+def enqueue_whatsapp_message(normalized_number: str, body: str,
+                             media: Optional[List[Dict[str, str]]] = None, merged: bool = False) -> str:
+    """
+    Encola un mensaje entrante para que lo procese un worker.
+    Los adjuntos viajan como URLs; el worker los descarga.
+
+    Con la ventana de agrupación activa el mensaje se registra aquí y se programa
+    un trabajo diferido (`flush_whatsapp_burst`) al final del periodo de silencio:
+    el worker del shard no duerme esperando la ráfaga y los mensajes siguientes del
+    número se agregan a la ventana en cuanto llegan. `merged` indica una ráfaga ya
+    agrupada.
+
+    Returns:
+        str: ID del trabajo en RQ
+    """
+    queue = get_queue(shard_for(normalized_number, QUEUE_SHARDS))
+    # En modo síncrono (fakeredis) no hay scheduler: la espera se hace en línea
+    if DEBOUNCE_ENABLED and not merged and not QUEUE_SYNC:
+        state = register_message(redis_conn, normalized_number, body, media)
+        job = queue.enqueue_in(
+            timedelta(seconds=quiet_delay(state)),
+            flush_whatsapp_burst,
+            normalized_number,
+            state["seq"],
+            state["first"],
+            retry=_retry(),
+            job_timeout=JOB_TIMEOUT,
+        )
+        logger.info(f"🧺 Mensaje de {normalized_number} en la ventana de agrupación (job {job.id})")
+        return job.id
+
+    job = queue.enqueue(
+        process_whatsapp_job,
+        normalized_number,
+        body,
+        media or None,
+        merged,
+        retry=_retry(),
+        job_timeout=JOB_TIMEOUT,
+    )
+    logger.info(f"📥 Mensaje encolado para {normalized_number} (job {job.id})")
+    return job.id
+
+
+def flush_whatsapp_burst(normalized_number: str, seq: int, first: float) -> Dict[str, Any]:
+    """
+    Trabajo diferido del final del periodo de silencio. Solo el del último mensaje
+    de la ráfaga (o el primero que supera la espera máxima) vacía la ventana y
+    encola la ráfaga completa; el procesamiento conserva sus reintentos.
+    """
+    burst = take_burst(redis_conn, normalized_number, seq, first)
+    if burst is None:
+        return {"status": "success", "message": "Message merged into pending burst"}
+    body, media = burst
+    job_id = enqueue_whatsapp_message(normalized_number, body, media, merged=True)
+    return {"status": "accepted", "message": "Burst queued", "job_id": job_id}
+
+
+def process_whatsapp_job(normalized_number: str, body: str,
+                         media: Optional[List[Dict[str, str]]] = None, merged: bool = False) -> Dict[str, Any]:
+    """
+    Punto de entrada de los workers de RQ.
+    Ejecuta el pipeline asíncrono del webhook; cualquier excepción se propaga
+    para que RQ reintente el trabajo. El id del trabajo se conserva entre reintentos:
+    el pipeline lo usa para saltar los pasos que ya hizo.
+    """
+    # Importación diferida para evitar el ciclo webhook -> queue -> webhook
+    from src.api.v1.endpoints.webhook import handle_inbound_message
+
+    job = get_current_job()
+    request_id_var.set(job.id if job else "-")
+
+    async def run() -> Dict[str, Any]:
+        try:
+            return await handle_inbound_message(
+                normalized_number, body, media, debounce=not merged, pipeline_id=job.id if job else None
+            )
+        finally:
+            await close_job_clients()
+
+    try:
+        return asyncio.run(run())
+    finally:
+        flush_logs()
+
+
+async def close_job_clients() -> None:
+    """
+    Cierra los clientes HTTP que el trabajo abrió en su event loop (Twilio, descargas
+    de adjuntos y proveedores de modelos). asyncio.run cierra el loop al terminar y
+    un cliente ligado a un loop cerrado ya no se puede cerrar desde el siguiente
+    trabajo: sus conexiones quedarían abiertas hasta que el worker termine.
+    """
+    from src.utils.llm_router import close_llm_clients
+    from src.utils.media import close_media_downloader
+    from src.utils.whatsapp import close_whatsapp_sender
+
+    for close in (close_whatsapp_sender, close_media_downloader, close_llm_clients):
+        try:
+            await close()
+        except Exception as e:
+            logger.warning(f"⚠️ No se pudo cerrar un cliente HTTP del trabajo: {str(e)}")
@@ -0,0 +1,155 @@
+"""
+Readiness del worker: sondeos de las dependencias en caché y estado de los circuit breakers.
+
+`/api/v1/health` sigue siendo el liveness (el proceso responde). `/api/v1/health/ready`
+usa `get_readiness`: los sondeos (Redis, Supabase, cada proveedor de modelos y
+Twilio) se ejecutan como mucho una vez cada READINESS_CACHE_SECONDS por proceso,
+en paralelo y con READINESS_PROBE_TIMEOUT_SECONDS cada uno. Los health checks
+frecuentes del balanceador no generan tráfico hacia las dependencias.
+
+Un sondeo HTTP es correcto con cualquier respuesta por debajo de 500: solo
+comprueba que el servicio contesta, no las credenciales. El worker no está listo
+si falla alguna dependencia de READINESS_REQUIRED; el resto, caídas o con el
+circuito abierto, lo dejan "degraded" (responde con los respaldos).
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import httpx
+from dotenv import load_dotenv
+from starlette.concurrency import run_in_threadpool
+
+from src.core.settings import get_settings
+from src.utils.circuit_breaker import OPEN, get_breaker_states
+from src.utils.loggers import logger
+
+load_dotenv()
+
+READINESS_CACHE_SECONDS = float(os.getenv("READINESS_CACHE_SECONDS", "10"))
+READINESS_PROBE_TIMEOUT_SECONDS = float(os.getenv("READINESS_PROBE_TIMEOUT_SECONDS", "2"))
+# Sin Redis no hay deduplicación, cola ni límites: el worker no debe recibir tráfico
+READINESS_REQUIRED = {
+    name.strip() for name in os.getenv("READINESS_REQUIRED", "redis").split(",") if name.strip()
+}
+
+_cache: Dict[str, object] = {}
+_lock: Optional[asyncio.Lock] = None
+_lock_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+async def _probe_http(client: httpx.AsyncClient, url: str, **kwargs) -> str:
+    response = await client.get(url, **kwargs)
+    if response.status_code >= 500:
+        raise RuntimeError(f"HTTP {response.status_code}")
+    return f"HTTP {response.status_code}"
+
+
+async def _probe_redis(client: httpx.AsyncClient) -> str:
+    from src.utils.redis import redis_conn
+
+    await run_in_threadpool(redis_conn.ping)
+    return "PONG"
+
+
+async def _probe_supabase(client: httpx.AsyncClient) -> str:
+    settings = get_settings()
+    settings.require("SUPABASE_URL", "SUPABASE_ANON_KEY")
+    # Una fila de una tabla pequeña por índice: la raíz /rest/v1/ devuelve el esquema OpenAPI completo
+    return await _probe_http(client, f"{settings.supabase_url.rstrip('/')}/rest/v1/conversations",
+                             params={"select": "phone_number", "limit": "1"},
+                             headers={"apikey": settings.supabase_anon_key,
+                                      "Authorization": f"Bearer {settings.supabase_anon_key}"})
+
+
+async def _probe_twilio(client: httpx.AsyncClient) -> str:
+    from src.utils.whatsapp import TWILIO_API_BASE_URL
+
+    settings = get_settings()
+    settings.require("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN")
+    return await _probe_http(client, f"{TWILIO_API_BASE_URL}/2010-04-01/Accounts/{settings.twilio_account_sid}.json",
+                             auth=(settings.twilio_account_sid, settings.twilio_auth_token))
+
+
+def _llm_probes() -> Dict[str, Callable[[httpx.AsyncClient], Awaitable[str]]]:
+    from src.utils.llm_router import get_llm_router
+    from src.utils.model import MODEL_NAME
+
+    providers = {route.provider.name: route.provider for route in get_llm_router(MODEL_NAME).routes}
+    return {
+        f"llm:{name}": (lambda client, provider=provider: _probe_http(
+            client, f"{provider.base_url.rstrip('/')}/models", headers={"Authorization": f"Bearer {provider.api_key}"}
+        ))
+        for name, provider in providers.items()
+    }
+
+
+async def _run_probe(name: str, probe, client: httpx.AsyncClient) -> Dict[str, object]:
+    started = time.perf_counter()
+    try:
+        detail = await asyncio.wait_for(probe(client), timeout=READINESS_PROBE_TIMEOUT_SECONDS)
+        ok = True
+    except asyncio.TimeoutError:
+        ok, detail = False, f"sin respuesta en {READINESS_PROBE_TIMEOUT_SECONDS:.0f}s"
+    except Exception as e:
+        ok, detail = False, str(e) or type(e).__name__
+    if not ok:
+        logger.warning(f"🩺 Sondeo de {name} fallido: {detail}")
+    return {"ok": ok, "detail": detail, "latency_ms": round((time.perf_counter() - started) * 1000, 1)}
+
+
+async def run_probes() -> Dict[str, Dict[str, object]]:
+    """Sondea todas las dependencias en paralelo (sin caché)."""
+    probes = {"redis": _probe_redis, "supabase": _probe_supabase, "twilio": _probe_twilio}
+    try:
+        probes.update(_llm_probes())
+    except Exception as e:
+        logger.warning(f"🩺 No se pudo crear el router de modelos para sondearlo: {str(e)}")
+    async with httpx.AsyncClient(timeout=READINESS_PROBE_TIMEOUT_SECONDS) as client:
+        results = await asyncio.gather(*(_run_probe(name, probe, client) for name, probe in probes.items()))
+    return dict(zip(probes, results))
+
+
+def _get_lock() -> asyncio.Lock:
+    global _lock, _lock_loop
+    loop = asyncio.get_running_loop()
+    if _lock is None or _lock_loop is not loop:
+        _lock, _lock_loop = asyncio.Lock(), loop
+    return _lock
+
+
+async def get_probes() -> Dict[str, object]:
+    """Resultados de los sondeos, renovados como mucho una vez cada READINESS_CACHE_SECONDS."""
+    if _cache and time.time() - _cache["checked_at"] < READINESS_CACHE_SECONDS:
+        return _cache
+    # Una sola ronda de sondeos a la vez: las peticiones concurrentes esperan su resultado
+    async with _get_lock():
+        if not _cache or time.time() - _cache["checked_at"] >= READINESS_CACHE_SECONDS:
+            _cache.update({"probes": await run_probes(), "checked_at": time.time()})
+    return _cache
+
+
+async def get_readiness() -> Dict[str, object]:
+    """Estado del worker: ready, degraded (respaldos activos) o unavailable."""
+    cached = await get_probes()
+    breakers = get_breaker_states()
+    dependencies = {}
+    for name, probe in cached["probes"].items():
+        circuit = breakers.get(name, {}).get("state")
+        dependencies[name] = {**probe, "circuit": circuit, "up": probe["ok"] and circuit != OPEN}
+
+    down = {name for name, dependency in dependencies.items() if not dependency["up"]}
+    if down & READINESS_REQUIRED:
+        status = "unavailable"
+    elif down:
+        status = "degraded"
+    else:
+        status = "ready"
+    return {
+        "status": status,
+        "dependencies": dependencies,
+        "breakers": breakers,
+        "checked_at": cached["checked_at"],
+        "age_seconds": round(time.time() - cached["checked_at"], 1),
+    }
@@ -8,8 +8,24 @@ REDIS_PASSWORD = os.getenv("REDIS_PASSWORD")
 REDIS_HOST = os.getenv("REDIS_HOST")
 REDIS_PORT = os.getenv("REDIS_PORT")
 
-redis_conn = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    password=REDIS_PASSWORD,
-    db=0)
+# Modo local: usar fakeredis en memoria en lugar de un servidor real
+REDIS_FAKE = os.getenv("REDIS_FAKE", "false").lower() in ("1", "true", "yes")
+
+
+def create_redis_connection() -> redis.Redis:
+    """Crea una conexión a Redis (o a fakeredis si REDIS_FAKE está activo)."""
+    if REDIS_FAKE:
+        try:
+            import fakeredis
+        except ImportError as e:
+            raise ImportError("REDIS_FAKE requiere el paquete 'fakeredis' (pip install 'fakeredis[lua]')") from e
+        return fakeredis.FakeStrictRedis()
+
+    return redis.Redis(
+        host=REDIS_HOST,
+        port=REDIS_PORT,
+        password=REDIS_PASSWORD,
+        db=0)
+
+
+redis_conn = create_redis_connection()
@@ -0,0 +1,215 @@
+"""
+Caché de respuestas del modelo compartida entre conversaciones y workers (Redis).
+
+Límite: una respuesta solo se comparte si el modelo la generó sin nada propio de la
+conversación (`is_context_free`): el system prompt, como mucho la bienvenida y la
+pregunta. En la práctica solo la primera pregunta de cada conversación consulta y
+alimenta la caché; desde el segundo turno el contexto incluye mensajes del usuario y
+la respuesta podría depender de ellos (un nombre, un pedido), así que nunca se busca.
+La tasa de aciertos sobre todos los turnos es por eso mucho menor que la tasa sobre
+los turnos elegibles: benchmarks/bench_response_cache.py mide ambas.
+"""
+import hashlib
+import json
+import os
+import re
+import time
+import unicodedata
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+from src.utils.loggers import logger
+
+load_dotenv()
+
+# Caché de respuestas del modelo compartida entre workers (Redis)
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", "86400"))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "500"))
+# Similitud mínima (Jaccard de trigramas de caracteres) para aceptar una pregunta casi igual
+LLM_CACHE_SIMILARITY = float(os.getenv("LLM_CACHE_SIMILARITY", "0.8"))
+# Mensajes más cortos dependen demasiado del contexto ("sí", "ok", "gracias")
+LLM_CACHE_MIN_CHARS = int(os.getenv("LLM_CACHE_MIN_CHARS", "12"))
+# Cada cuánto se refresca la copia local del índice de preguntas
+LLM_CACHE_INDEX_REFRESH_SECONDS = float(os.getenv("LLM_CACHE_INDEX_REFRESH_SECONDS", "30"))
+
+KEY_PREFIX = "llm_cache"
+STATS_KEY = f"{KEY_PREFIX}:stats"
+
+
+def normalize_message(text: str) -> str:
+    """Minúsculas, sin acentos, sin puntuación ni emojis y con espacios colapsados."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+def char_ngrams(text: str, n: int = 3) -> FrozenSet[str]:
+    padded = f" {text} "
+    if len(padded) <= n:
+        return frozenset([padded])
+    return frozenset(padded[i:i + n] for i in range(len(padded) - n + 1))
+
+
+def similarity(a: FrozenSet[str], b: FrozenSet[str]) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def is_context_free(messages: List[Dict[str, str]], static_replies: Iterable[str] = ()) -> bool:
+    """
+    Indica si la respuesta del modelo solo depende del system prompt y de la pregunta:
+    sin resumen ni mensajes previos del usuario, solo respuestas fijas (la bienvenida).
+    Solo esas respuestas se pueden compartir entre conversaciones.
+    """
+    static = set(static_replies)
+    return all(m["role"] == "assistant" and m["content"] in static for m in messages[1:-1])
+
+
+def prompt_version(system_prompt: str) -> str:
+    """Versión del system prompt: SYSTEM_PROMPT_VERSION o un hash de su contenido."""
+    return os.getenv("SYSTEM_PROMPT_VERSION") or hashlib.sha1(system_prompt.encode()).hexdigest()[:12]
+
+
+class ResponseCache:
+    """
+    Caché de respuestas por pregunta normalizada y versión del system prompt.
+
+    Redis guarda las entradas (hash), las preguntas normalizadas (hash) y el orden
+    de uso (sorted set) para la expulsión LRU. Cada worker mantiene una copia
+    local de las preguntas para buscar casi-duplicados sin leer toda la caché.
+
+    La caché es compartida entre conversaciones: solo se deben guardar respuestas
+    generadas sin contexto del usuario (ver `is_context_free`).
+    """
+
+    def __init__(self, redis_client, version: str):
+        self.redis = redis_client
+        self.version = version
+        self.entries_key = f"{KEY_PREFIX}:{version}:entries"
+        self.questions_key = f"{KEY_PREFIX}:{version}:questions"
+        self.lru_key = f"{KEY_PREFIX}:{version}:lru"
+        self._index: Dict[str, FrozenSet[str]] = {}
+        self._index_loaded_at = 0.0
+
+    def lookup(self, message: str) -> Optional[str]:
+        normalized = normalize_message(message)
+        if len(normalized) < LLM_CACHE_MIN_CHARS:
+            return None
+
+        key = self._key(normalized)
+        entry = self._get_entry(key)
+        score = 1.0
+        if entry is None:
+            key, score = self._nearest(normalized)
+            entry = self._get_entry(key) if key else None
+            if entry is not None and self._mentions_other_words(key, normalized, entry["r"]):
+                entry = None
+
+        if entry is None:
+            self.redis.hincrby(STATS_KEY, "misses", 1)
+            return None
+
+        pipe = self.redis.pipeline()
+        pipe.zadd(self.lru_key, {key: time.time()})
+        pipe.hincrby(STATS_KEY, "hits" if score == 1.0 else "near_hits", 1)
+        pipe.hincrbyfloat(STATS_KEY, "saved_ms", entry.get("ms", 0))
+        pipe.execute()
+        logger.info(f"♻️ Respuesta desde caché (similitud {score:.2f})")
+        return entry["r"]
+
+    def store(self, message: str, response: str, latency_ms: float) -> None:
+        normalized = normalize_message(message)
+        if len(normalized) < LLM_CACHE_MIN_CHARS:
+            return
+
+        key = self._key(normalized)
+        now = time.time()
+        pipe = self.redis.pipeline()
+        pipe.hset(self.entries_key, key, json.dumps({"r": response, "t": now, "ms": round(latency_ms, 1)}))
+        pipe.hset(self.questions_key, key, normalized)
+        pipe.zadd(self.lru_key, {key: now})
+        for name in (self.entries_key, self.questions_key, self.lru_key):
+            pipe.expire(name, LLM_CACHE_TTL)
+        pipe.zcard(self.lru_key)
+        size = pipe.execute()[-1]
+        self._index[key] = char_ngrams(normalized)
+
+        # Expulsión LRU de las entradas menos usadas
+        if size > LLM_CACHE_MAX_ENTRIES:
+            evicted = [k for k, _ in self.redis.zpopmin(self.lru_key, size - LLM_CACHE_MAX_ENTRIES)]
+            if evicted:
+                self.redis.hdel(self.entries_key, *evicted)
+                self.redis.hdel(self.questions_key, *evicted)
+                for evicted_key in evicted:
+                    self._index.pop(self._decode(evicted_key), None)
+
+    def _key(self, normalized: str) -> str:
+        return hashlib.sha1(normalized.encode()).hexdigest()
+
+    @staticmethod
+    def _decode(value) -> str:
+        return value.decode() if isinstance(value, bytes) else value
+
+    def _get_entry(self, key: str) -> Optional[Dict]:
+        raw = self.redis.hget(self.entries_key, key)
+        if raw is None:
+            return None
+        entry = json.loads(raw)
+        if time.time() - entry["t"] > LLM_CACHE_TTL:
+            self.redis.hdel(self.entries_key, key)
+            self.redis.hdel(self.questions_key, key)
+            self.redis.zrem(self.lru_key, key)
+            self._index.pop(key, None)
+            return None
+        return entry
+
+    def _mentions_other_words(self, key: str, normalized: str, response: str) -> bool:
+        """
+        Un casi-duplicado no sirve si la respuesta repite palabras de la pregunta original
+        que no están en la nueva ("soy Juan" frente a "soy Ana"). Los números cuentan
+        aunque sean cortos ("pedido 12" frente a "pedido 13").
+        """
+        question = self._decode(self.redis.hget(self.questions_key, key) or b"")
+        other_words = {
+            w for w in set(question.split()) - set(normalized.split())
+            if len(w) >= 3 or any(ch.isdigit() for ch in w)
+        }
+        return bool(other_words & set(normalize_message(response).split()))
+
+    def _nearest(self, normalized: str) -> Tuple[Optional[str], float]:
+        if time.time() - self._index_loaded_at > LLM_CACHE_INDEX_REFRESH_SECONDS:
+            questions = self.redis.hgetall(self.questions_key) or {}
+            self._index = {self._decode(k): char_ngrams(self._decode(v)) for k, v in questions.items()}
+            self._index_loaded_at = time.time()
+
+        grams = char_ngrams(normalized)
+        best_key, best_score = None, 0.0
+        for key, candidate in self._index.items():
+            score = similarity(grams, candidate)
+            if score > best_score:
+                best_key, best_score = key, score
+        if best_score >= LLM_CACHE_SIMILARITY:
+            return best_key, best_score
+        return None, best_score
+
+
+def get_response_cache_stats(redis_client) -> Dict[str, float]:
+    """Aciertos, fallos y latencia ahorrada por la caché de respuestas (todas las instancias)."""
+    raw = redis_client.hgetall(STATS_KEY) or {}
+    stats = {(k.decode() if isinstance(k, bytes) else k): float(v) for k, v in raw.items()}
+    hits = int(stats.get("hits", 0))
+    near_hits = int(stats.get("near_hits", 0))
+    misses = int(stats.get("misses", 0))
+    total = hits + near_hits + misses
+    return {
+        "hits": hits,
+        "near_hits": near_hits,
+        "misses": misses,
+        "hit_rate": round((hits + near_hits) / total, 4) if total else 0.0,
+        "saved_ms": round(stats.get("saved_ms", 0.0), 1),
+        "similarity_threshold": LLM_CACHE_SIMILARITY,
+    }
@@ -1,78 +1,305 @@
 # app/whatsapp_utils.py
-from twilio.rest import Client
+import asyncio
 import os
-from src.utils.loggers import logger
+import random
+import time
+from typing import Dict, Optional
 
+import httpx
 from dotenv import load_dotenv
-import os
-from pathlib import Path
-
-# Cargar variables de entorno desde la raíz del proyecto
-env_path = Path(__file__).parent.parent.parent.parent / '.env'
-logger.info(f"Cargando .env desde: {env_path}")
-
-# Intentar cargar el archivo .env
-try:
-    load_dotenv(env_path)
-    logger.info("Archivo .env cargado exitosamente")
-except Exception as e:
-    logger.error(f"Error cargando .env: {str(e)}")
-    raise ValueError(f"Error cargando .env: {str(e)}")
-
-# Verificar que las variables de entorno existen
-required_env_vars = [
-    "TWILIO_ACCOUNT_SID",
-    "TWILIO_AUTH_TOKEN",
-    "TWILIO_WHATSAPP_NUMBER"
-]
-
-# Verificar cada variable y levantar error si falta
-for var in required_env_vars:
-    value = os.getenv(var)
-    logger.info(f"{var}: {'***' if value else 'None'}")
-    if not value:
-        logger.error(f"Variable de entorno {var} no está configurada")
-        raise ValueError(f"Variable de entorno {var} no está configurada")
-
-# Cargar variables de entorno
-TWILIO_ACCOUNT_SID = os.getenv("TWILIO_ACCOUNT_SID")
-TWILIO_AUTH_TOKEN = os.getenv("TWILIO_AUTH_TOKEN")
-TWILIO_WHATSAPP_NUMBER = os.getenv("TWILIO_WHATSAPP_NUMBER")
-
-# Validar formato del número de WhatsApp
-if TWILIO_WHATSAPP_NUMBER and not (TWILIO_WHATSAPP_NUMBER.startswith('+1') or TWILIO_WHATSAPP_NUMBER.startswith('+52')):
-    logger.error(f"Formato incorrecto en TWILIO_WHATSAPP_NUMBER: {TWILIO_WHATSAPP_NUMBER}")
-    raise ValueError("El número de Twilio para WhatsApp debe comenzar con +1 o +52")
+from starlette.concurrency import run_in_threadpool
+
+from src.core.settings import get_settings
+from src.utils.circuit_breaker import get_breaker
+from src.utils.loggers import logger
+from src.utils.metrics import track_stage
+from src.utils.redis import redis_conn
+
+load_dotenv()
+
+# Las credenciales de Twilio se leen y validan al crear el emisor (get_whatsapp_sender),
+# no al importar el módulo
+TWILIO_REQUIRED = ("TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_WHATSAPP_NUMBER")
+
+# Configuración del envío asíncrono
+TWILIO_API_BASE_URL = os.getenv("TWILIO_API_BASE_URL", "https://api.twilio.com").rstrip("/")
+TWILIO_TIMEOUT = float(os.getenv("TWILIO_TIMEOUT", "10"))
+TWILIO_MAX_CONNECTIONS = int(os.getenv("TWILIO_MAX_CONNECTIONS", "20"))
+TWILIO_MAX_RETRIES = int(os.getenv("TWILIO_MAX_RETRIES", "4"))
+TWILIO_RETRY_BACKOFF = float(os.getenv("TWILIO_RETRY_BACKOFF", "0.5"))
+# Límite de mensajes por segundo por número emisor (WhatsApp Business: 80 MPS por defecto),
+# compartido en Redis por todos los procesos que envían desde el número
+TWILIO_MESSAGES_PER_SECOND = float(os.getenv("TWILIO_MESSAGES_PER_SECOND", "80"))
+TWILIO_BURST = int(os.getenv("TWILIO_BURST", str(max(1, int(TWILIO_MESSAGES_PER_SECOND)))))
+
+RATE_KEY_PREFIX = "whatsapp_rate"
+
+# KEYS: bucket; ARGV: ahora, tokens por segundo, capacidad.
+# Reserva un token (el saldo puede quedar negativo) y devuelve los segundos que hay
+# que esperar para usarlo: una sola ida a Redis por mensaje, sin sondeos
+RESERVE_SCRIPT = """
+local now = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local capacity = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(state[1]) or capacity
+local updated_at = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate) - 1
+local wait = 0
+if tokens < 0 then
+    wait = -tokens / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(wait + capacity / rate) + 1)
+return tostring(wait)
+"""
+
+
+class WhatsAppSendError(Exception):
+    """Error definitivo al enviar un mensaje por WhatsApp (sin más reintentos)."""
+
+
+def format_whatsapp_number(to_number: str) -> str:
+    """Limpia el número destino y lo devuelve con el formato whatsapp:+52..."""
+    to_number = to_number.replace("whatsapp:", "").lstrip("+")
+    to_number = "".join(to_number.split())
+    if not to_number.startswith("52"):
+        to_number = f"52{to_number}"
+    return f"whatsapp:+{to_number}"
+
+
+class TokenBucket:
+    """Token bucket asíncrono: `rate` tokens por segundo con ráfagas de hasta `capacity`."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SharedTokenBucket:
+    """
+    Token bucket en Redis: un mismo límite para todos los procesos (workers de
+    gunicorn, shards de RQ, difusiones) que usan la misma clave. Sin Redis, o si
+    Redis falla, se aplica un bucket local del proceso.
+    """
+
+    def __init__(self, redis_client, key: str, rate: float, capacity: int):
+        self.redis = redis_client
+        self.key = key
+        self.rate = rate
+        self.capacity = capacity
+        self._reserve = redis_client.register_script(RESERVE_SCRIPT) if redis_client is not None else None
+        self._local: Optional[TokenBucket] = None
+        self._local_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _local_bucket(self) -> TokenBucket:
+        # El lock del bucket local queda ligado a su event loop (un loop por trabajo de RQ)
+        loop = asyncio.get_running_loop()
+        if self._local is None or self._local_loop is not loop:
+            self._local = TokenBucket(self.rate, self.capacity)
+            self._local_loop = loop
+        return self._local
+
+    async def acquire(self) -> None:
+        if self._reserve is None:
+            await self._local_bucket().acquire()
+            return
+        try:
+            wait = float(await run_in_threadpool(
+                self._reserve, keys=[self.key], args=[time.time(), self.rate, self.capacity]
+            ))
+        except Exception as e:
+            logger.warning(f"⚠️ Límite compartido {self.key} no disponible, se aplica el del proceso: {str(e)}")
+            await self._local_bucket().acquire()
+            return
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+class WhatsAppSender:
+    """
+    Envío de mensajes a la API REST de Twilio con una sesión HTTP keep-alive reutilizada,
+    reintentos con backoff exponencial ante 429/5xx, un token bucket por número emisor
+    compartido en Redis (`redis_client`; sin él, uno por proceso) y un circuit breaker: con Twilio caído, `send` falla al instante con CircuitOpenError
+    (un error transitorio: la cola y el despachador de seguimientos lo reintentan).
+    """
+
+    RETRY_STATUS = {429, 500, 502, 503, 504}
+    # Un 429 es el límite de la cuenta, no una caída: lo absorben los reintentos y el token bucket
+    FAILURE_STATUS = RETRY_STATUS - {429}
+
+    def __init__(
+        self,
+        account_sid: str,
+        auth_token: str,
+        from_number: str,
+        base_url: str = TWILIO_API_BASE_URL,
+        messages_per_second: float = TWILIO_MESSAGES_PER_SECOND,
+        burst: int = TWILIO_BURST,
+        max_retries: int = TWILIO_MAX_RETRIES,
+        retry_backoff: float = TWILIO_RETRY_BACKOFF,
+        redis_client=None,
+    ):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.base_url = base_url.rstrip("/")
+        self.messages_per_second = messages_per_second
+        self.burst = burst
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.redis = redis_client
+        self._buckets: Dict[str, SharedTokenBucket] = {}
+        self._client: Optional[httpx.AsyncClient] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self.breaker = get_breaker("twilio")
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # El cliente queda ligado a su event loop (los workers de RQ crean uno por trabajo
+        # y lo cierran al terminar con close_job_clients, ver src/utils/queue.py)
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._loop is not loop:
+            if self._client is not None:
+                logger.warning("⚠️ Cliente de Twilio de otro event loop sin cerrar: se reemplaza")
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                auth=(self.account_sid, self.auth_token),
+                timeout=TWILIO_TIMEOUT,
+                limits=httpx.Limits(
+                    max_connections=TWILIO_MAX_CONNECTIONS,
+                    max_keepalive_connections=TWILIO_MAX_CONNECTIONS,
+                ),
+            )
+            self._loop = loop
+        return self._client
+
+    def _bucket(self, from_number: str) -> SharedTokenBucket:
+        if from_number not in self._buckets:
+            self._buckets[from_number] = SharedTokenBucket(
+                self.redis, f"{RATE_KEY_PREFIX}:{from_number}", self.messages_per_second, self.burst
+            )
+        return self._buckets[from_number]
+
+    def _retry_delay(self, attempt: int, response: Optional[httpx.Response]) -> float:
+        if response is not None and response.headers.get("Retry-After"):
+            try:
+                return float(response.headers["Retry-After"])
+            except ValueError:
+                pass
+        return self.retry_backoff * (2 ** attempt) + random.uniform(0, self.retry_backoff)
+
+    async def send(self, to_number: str, message: str = "", media_url: str = None) -> Dict:
+        client = self._get_client()
+        from_number = f"whatsapp:{self.from_number}"
+        data = {"From": from_number, "To": format_whatsapp_number(to_number)}
+        if media_url:
+            data["MediaUrl"] = media_url
+        else:
+            data["Body"] = message
+
+        url = f"/2010-04-01/Accounts/{self.account_sid}/Messages.json"
+        for attempt in range(self.max_retries + 1):
+            await self._bucket(from_number).acquire()
+            probe = self.breaker.acquire()
+            response = None
+            try:
+                response = await client.post(url, data=data)
+                self.breaker.record(response.status_code not in self.FAILURE_STATUS, probe)
+                if response.status_code not in self.RETRY_STATUS:
+                    response.raise_for_status()
+                    logger.debug(f"Mensaje enviado a {data['To']}")
+                    return response.json()
+                error = f"HTTP {response.status_code}"
+            except httpx.TransportError as e:
+                self.breaker.record(False, probe)
+                error = str(e) or type(e).__name__
+            except asyncio.CancelledError:
+                self.breaker.release(probe)
+                raise
+            except httpx.HTTPStatusError as e:
+                raise WhatsAppSendError(f"Twilio rechazó el mensaje: {e.response.status_code} {e.response.text}")
+
+            if attempt < self.max_retries:
+                delay = self._retry_delay(attempt, response)
+                logger.warning(f"⚠️ Reintento {attempt + 1}/{self.max_retries} hacia {data['To']} en {delay:.2f}s ({error})")
+                await asyncio.sleep(delay)
+
+        raise WhatsAppSendError(f"No se pudo enviar el mensaje por WhatsApp tras {self.max_retries + 1} intentos: {error}")
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._loop = None
+
+
+_sender: Optional[WhatsAppSender] = None
+
+
+def get_whatsapp_sender() -> WhatsAppSender:
+    """Obtiene (o crea) el emisor compartido del proceso."""
+    global _sender
+    if _sender is None:
+        settings = get_settings()
+        settings.require(*TWILIO_REQUIRED)
+        if not settings.twilio_whatsapp_number.startswith(("+1", "+52")):
+            raise ValueError("El número de Twilio para WhatsApp debe comenzar con +1 o +52")
+        _sender = WhatsAppSender(settings.twilio_account_sid, settings.twilio_auth_token,
+                                 settings.twilio_whatsapp_number, redis_client=redis_conn)
+    return _sender
+
+
+async def close_whatsapp_sender() -> None:
+    """Cierra la sesión HTTP del emisor al apagar el worker."""
+    global _sender
+    if _sender is not None:
+        await _sender.aclose()
+        _sender = None
+
+
+async def send_message(to_number: str, message: str = "", media_url: str = None) -> Dict:
+    """Envía un mensaje por WhatsApp sin bloquear el event loop."""
+    with track_stage("whatsapp_send"):
+        return await get_whatsapp_sender().send(to_number, message=message, media_url=media_url)
 
 def respond(to_number, message: str = "", media_url: str = None) -> None:
-    """Función para enviar un mensaje por WhatsApp utilizando Twilio"""
+    """
+    Función para enviar un mensaje por WhatsApp utilizando Twilio (síncrona).
+    Desde código asíncrono usar `send_message`.
+    """
     logger.info(f"Intentando enviar mensaje a (antes de limpieza): {to_number}")
     
     # Verificar que las credenciales de Twilio existan
-    if not TWILIO_ACCOUNT_SID:
-        logger.error("TWILIO_ACCOUNT_SID no está configurado")
-        raise ValueError("TWILIO_ACCOUNT_SID no está configurado")
-    if not TWILIO_AUTH_TOKEN:
-        logger.error("TWILIO_AUTH_TOKEN no está configurado")
-        raise ValueError("TWILIO_AUTH_TOKEN no está configurado")
-    if not TWILIO_WHATSAPP_NUMBER:
-        logger.error("TWILIO_WHATSAPP_NUMBER no está configurado")
-        raise ValueError("TWILIO_WHATSAPP_NUMBER no está configurado")
-    
+    settings = get_settings()
+    settings.require(*TWILIO_REQUIRED)
+
+    # El SDK de Twilio solo se usa en esta ruta síncrona: se importa aquí para no cargarlo al arrancar
+    from twilio.rest import Client
+
     try:
         # Limpiar y formatear el número destino
-        to_number = to_number.replace("whatsapp:", "").lstrip("+")
-        to_number = "".join(to_number.split())
-        if not to_number.startswith("52"):
-            to_number = f"52{to_number}"
-        formatted_to_number = f"whatsapp:+{to_number}"
+        formatted_to_number = format_whatsapp_number(to_number)
         logger.info(f"Número destino formateado: {formatted_to_number}")
 
         # Formatear el número de Twilio
-        TWILIO_WHATSAPP_PHONE_NUMBER = f"whatsapp:{TWILIO_WHATSAPP_NUMBER}"
+        TWILIO_WHATSAPP_PHONE_NUMBER = f"whatsapp:{settings.twilio_whatsapp_number}"
         logger.info(f"Usando número Twilio: {TWILIO_WHATSAPP_PHONE_NUMBER}")
         
-        twilio_client = Client(TWILIO_ACCOUNT_SID, TWILIO_AUTH_TOKEN)
+        twilio_client = Client(settings.twilio_account_sid, settings.twilio_auth_token)
 
         message_data = {
             "from_": TWILIO_WHATSAPP_PHONE_NUMBER,
@@ -1,6 +1,6 @@
 """Script para probar la función gpt_without_functions."""
+import asyncio
 import sys
-import os
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -11,38 +11,36 @@ load_dotenv(env_path)
 # Añadir el directorio src al path para poder importar los módulos
 sys.path.append(str(Path(__file__).parent / 'src'))
 
-from src.utils.model import gpt_without_functions
-from langchain_core.messages import SystemMessage, HumanMessage
 
-def main():
+async def main():
+    # Importación diferida: el módulo del modelo requiere OPENAI_API_KEY al importarse
+    from src.utils.model import FALLBACK_RESPONSES, gpt_without_functions
+
     print("🚀 Iniciando prueba de gpt_without_functions")
     print("-" * 60)
-    
-    # Mensaje del sistema
-    system_message = SystemMessage(content="Eres un asistente útil que responde de manera concisa.")
-    
-    # Mensaje del usuario
-    user_message = HumanMessage(content="Hola, ¿cómo estás?")
-    
-    # Llamar a la función
-    response = gpt_without_functions(
-        messages=[system_message, user_message],
+
+    messages = [
+        # Mensaje del sistema
+        {"role": "system", "content": "Eres un asistente útil que responde de manera concisa."},
+        # Mensaje del usuario
+        {"role": "user", "content": "Hola, ¿cómo estás?"},
+    ]
+
+    # Llamar a la función (devuelve el texto de la respuesta)
+    response = await gpt_without_functions(
         model="gpt-3.5-turbo",  # Usando 3.5 para pruebas rápidas
-        temperature=0.7,
-        max_tokens=100
+        messages=messages,
     )
-    
+
     print("\n" + "=" * 60)
     print("📋 RESULTADO FINAL")
     print("=" * 60)
-    
-    if response["success"]:
+
+    if response not in FALLBACK_RESPONSES:
         print(f"✅ Éxito!")
-        print(f"📝 Respuesta: {response['content']}")
-        print(f"🤖 Modelo: {response['model']}")
-        print(f"🪙 Tokens usados: {response['tokens_used']['total_tokens']}")
+        print(f"📝 Respuesta: {response}")
     else:
-        print(f"❌ Error: {response['error']}")
+        print(f"❌ Error: {response}")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
@@ -0,0 +1,50 @@
+"""
+Configuración común de las pruebas: Redis en memoria (fakeredis con Lua) y
+registros sin consola ni archivo. Las variables se fijan antes de importar `src`.
+"""
+import os
+import sys
+from pathlib import Path
+
+os.environ.setdefault("REDIS_FAKE", "true")
+os.environ.setdefault("LOG_CONSOLE", "false")
+os.environ.setdefault("LOG_FILE", "")
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import fakeredis  # noqa: E402
+import pytest  # noqa: E402
+
+
+@pytest.fixture
+def redis_client():
+    """Un Redis vacío por prueba."""
+    client = fakeredis.FakeStrictRedis()
+    yield client
+    client.flushall()
+
+
+@pytest.fixture(scope="session")
+def postgrest_server():
+    from benchmarks.fakes import create_fake_postgrest_app, serve_in_thread
+
+    server = serve_in_thread(create_fake_postgrest_app())
+    yield server
+    server.should_exit = True
+
+
+@pytest.fixture
+def supabase_tables(postgrest_server, monkeypatch):
+    """Supabase apuntando al PostgREST en memoria de benchmarks/fakes.py; tablas vacías en cada prueba."""
+    from src import db
+
+    state = postgrest_server.config.app.state
+    tables = state.tables
+    tables.clear()
+    # Sin max-rows salvo que la prueba lo fije con monkeypatch
+    monkeypatch.setattr(state, "max_rows", None)
+    monkeypatch.setattr(db, "SUPABASE_URL", postgrest_server.base_url)
+    monkeypatch.setattr(db, "SUPABASE_KEY", "pruebas")
+    monkeypatch.setattr(db, "supabase", None)
+    yield tables
+    db.close_db()
@@ -0,0 +1,74 @@
+import asyncio
+
+import pytest
+
+from src.utils import admission
+
+
+def test_rate_limit_allows_burst_then_rejects(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_RATE_BURST", 3)
+    monkeypatch.setattr(admission, "ADMISSION_RATE_PER_MINUTE", 6.0)
+
+    async def send(count):
+        return [await admission.allow_sender(redis_client, "5215512345678") for _ in range(count)]
+
+    assert asyncio.run(send(4)) == [True, True, True, False]
+    # Otro número tiene su propio bucket
+    assert asyncio.run(admission.allow_sender(redis_client, "5215587654321"))
+
+
+def test_rate_limit_refills_over_time(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "ADMISSION_RATE_BURST", 1)
+    monkeypatch.setattr(admission, "ADMISSION_RATE_PER_MINUTE", 60.0)
+    key = f"{admission.RATE_KEY_PREFIX}:5215512345678"
+
+    assert admission._take_token(redis_client, key, 1000.0)
+    assert not admission._take_token(redis_client, key, 1000.5)
+    assert admission._take_token(redis_client, key, 1001.5)
+
+
+def test_rate_limit_fails_open_without_redis(monkeypatch):
+    class BrokenRedis:
+        def pipeline(self):
+            raise ConnectionError("Redis caído")
+
+    assert asyncio.run(admission.allow_sender(BrokenRedis(), "5215512345678"))
+
+
+def test_inline_load_shedding(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "queue_enabled", lambda: False)
+    monkeypatch.setattr(admission, "ADMISSION_MAX_IN_FLIGHT", 2)
+
+    assert not asyncio.run(admission.should_shed(redis_client))
+    with admission.track_in_flight(), admission.track_in_flight():
+        assert asyncio.run(admission.should_shed(redis_client))
+    assert not asyncio.run(admission.should_shed(redis_client))
+
+
+def test_notice_sent_once_per_window(redis_client):
+    assert asyncio.run(admission.claim_notice(redis_client, "5215512345678"))
+    assert not asyncio.run(admission.claim_notice(redis_client, "5215512345678"))
+
+
+def test_global_llm_slots_are_bounded_and_released(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "LLM_GLOBAL_CONCURRENCY", 1)
+    monkeypatch.setattr(admission, "ADMISSION_LLM_WAIT_SECONDS", 0.2)
+
+    async def scenario():
+        async with admission.llm_slot(redis_client):
+            assert redis_client.zcard(admission.LLM_SLOTS_KEY) == 1
+            with pytest.raises(admission.AdmissionRejected):
+                async with admission.llm_slot(redis_client):
+                    pass
+        assert redis_client.zcard(admission.LLM_SLOTS_KEY) == 0
+        async with admission.llm_slot(redis_client):
+            pass
+
+    asyncio.run(scenario())
+
+
+def test_expired_global_slots_are_reclaimed(redis_client, monkeypatch):
+    monkeypatch.setattr(admission, "LLM_GLOBAL_CONCURRENCY", 1)
+    redis_client.zadd(admission.LLM_SLOTS_KEY, {"worker-caido": 0})
+
+    assert admission._try_global_slot(redis_client, "nuevo", admission.LLM_SLOT_TTL_SECONDS + 1)
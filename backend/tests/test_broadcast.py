@@ -0,0 +1,137 @@
+import asyncio
+import time
+
+import pytest
+
+from src.utils import broadcast
+from src.utils.circuit_breaker import CircuitOpenError
+from src.utils.whatsapp import WhatsAppSendError
+
+CSV = (
+    "telefono,nombre\n"
+    "55 1234 5678,Ana\n"
+    "5512345678,Ana repetida\n"
+    "123,Inválido\n"
+    "5587654321,\n"
+    "5511112222,Luis\n"
+    "5533334444,Eva\n"
+)
+
+
+class FakeSender:
+    from_number = "+15550000000"
+
+    def __init__(self, fail_numbers=(), circuit_open=False):
+        self.fail_numbers = set(fail_numbers)
+        self.circuit_open = circuit_open
+        self.sent = []
+
+    async def send(self, to_number, message=""):
+        if self.circuit_open:
+            raise CircuitOpenError("twilio", 0.01)
+        if to_number in self.fail_numbers:
+            raise WhatsAppSendError("Número no válido en WhatsApp")
+        self.sent.append((to_number, message))
+        return {"sid": f"SM{len(self.sent)}"}
+
+
+@pytest.fixture(autouse=True)
+def no_supabase(monkeypatch):
+    async def run_db(*args, **kwargs):
+        return None
+
+    monkeypatch.setattr(broadcast, "run_db", run_db)
+
+
+@pytest.fixture
+def sender(monkeypatch):
+    fake = FakeSender()
+    monkeypatch.setattr(broadcast, "get_whatsapp_sender", lambda: fake)
+    return fake
+
+
+async def _chunks(text: str, size: int = 7):
+    data = text.encode()
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def _create(redis_client, text: str = CSV) -> str:
+    created = asyncio.run(broadcast.create_broadcast(
+        redis_client, _chunks(text), "csv", "Hola $nombre, tenemos novedades",
+        lambda phone: "52" + "".join(filter(str.isdigit, phone)),
+    ))
+    return created
+
+
+def test_create_normalizes_deduplicates_and_renders(redis_client):
+    created = _create(redis_client)
+    assert {k: created[k] for k in ("total", "invalid", "duplicates", "missing_fields")} == {
+        "total": 3, "invalid": 1, "duplicates": 1, "missing_fields": 1,
+    }
+    keys = broadcast._keys(created["broadcast_id"])
+    recipients = broadcast._read_recipients(redis_client, keys["recipients"], 0)
+    assert recipients[0] == {"phone_number": "525512345678", "message": "Hola Ana, tenemos novedades"}
+    assert redis_client.ttl(keys["recipients"]) > 0
+
+
+def test_template_leaves_unknown_dollars():
+    template = broadcast.Template("Hola $nombre, promoción de $100")
+    assert broadcast.render(template, {"nombre": "Ana"}) == "Hola Ana, promoción de $100"
+    assert broadcast.render(template, {}) is None
+
+
+def test_each_number_is_sent_at_most_once(redis_client, sender):
+    broadcast_id = _create(redis_client)["broadcast_id"]
+    sender.fail_numbers = {"525511112222"}
+
+    result = asyncio.run(broadcast.run_broadcast(redis_client, broadcast_id, concurrency=2, messages_per_second=1000))
+    assert (result["status"], result["sent"], result["failed"], result["pending"]) == ("completed", 2, 1, 0)
+
+    # Reanudar no repite envíos ni reintenta los rechazados por Twilio
+    result = asyncio.run(broadcast.run_broadcast(redis_client, broadcast_id, concurrency=2, messages_per_second=1000))
+    assert (result["sent"], result["failed"]) == (2, 1)
+    assert len(sender.sent) == 2
+
+
+def test_claimed_numbers_are_skipped(redis_client, sender):
+    broadcast_id = _create(redis_client)["broadcast_id"]
+    # Otra ejecución ya reclamó este número
+    redis_client.sadd(broadcast._keys(broadcast_id)["claimed"], "525512345678")
+
+    result = asyncio.run(broadcast.run_broadcast(redis_client, broadcast_id, concurrency=2, messages_per_second=1000))
+    assert "525512345678" not in {number for number, _ in sender.sent}
+    assert (result["sent"], result["unknown"]) == (2, 1)
+
+
+def test_open_circuit_pauses_without_losing_recipients(redis_client, sender, monkeypatch):
+    monkeypatch.setattr(broadcast, "BROADCAST_CIRCUIT_WAIT_SECONDS", 0.01)
+    broadcast_id = _create(redis_client)["broadcast_id"]
+    sender.circuit_open = True
+
+    result = asyncio.run(broadcast.run_broadcast(redis_client, broadcast_id, concurrency=2, messages_per_second=1000))
+    assert (result["status"], result["sent"], result["failed"], result["pending"]) == ("paused", 0, 0, 3)
+    assert redis_client.scard(broadcast._keys(broadcast_id)["claimed"]) == 0
+
+    sender.circuit_open = False
+    result = asyncio.run(broadcast.run_broadcast(redis_client, broadcast_id, concurrency=2, messages_per_second=1000))
+    assert (result["status"], result["sent"], result["pending"]) == ("completed", 3, 0)
+
+
+def test_rate_is_shared_through_redis(redis_client, sender):
+    broadcast_id = _create(redis_client)["broadcast_id"]
+    # Otro worker ya agotó el ritmo de difusión del número
+    key = f"whatsapp_rate:broadcast:{FakeSender.from_number}"
+    redis_client.hset(key, mapping={"tokens": 0, "updated_at": time.time()})
+
+    start = time.perf_counter()
+    result = asyncio.run(broadcast.run_broadcast(redis_client, broadcast_id, concurrency=3, messages_per_second=20))
+    assert result["sent"] == 3
+    # Sin ráfaga disponible, 3 envíos a 20/s tardan al menos 0.15 s
+    assert time.perf_counter() - start >= 0.14
+    assert float(redis_client.hget(key, "tokens")) < 0.5
+
+
+def test_missing_broadcast(redis_client):
+    with pytest.raises(broadcast.BroadcastError):
+        asyncio.run(broadcast.run_broadcast(redis_client, "no-existe"))
@@ -0,0 +1,122 @@
+import asyncio
+import json
+import time
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.utils import calendar
+
+
+class FakeSender:
+    def __init__(self, error: Exception = None):
+        self.error = error
+        self.sent = []
+
+    async def send(self, to_number, message=""):
+        if self.error is not None:
+            raise self.error
+        self.sent.append((to_number, message))
+        return {"sid": f"SM{len(self.sent)}"}
+
+
+@pytest.fixture(autouse=True)
+def no_history(monkeypatch):
+    monkeypatch.setattr(calendar, "FOLLOWUP_RECORD_HISTORY", False)
+
+
+def _schedule(redis_client, count: int, minutes_ago: int = 1):
+    due_at = datetime.now(timezone.utc) - timedelta(minutes=minutes_ago)
+    return asyncio.run(calendar.schedule_followups(redis_client, [
+        {"phone_number": f"52155{index:08d}", "message": f"Recordatorio {index}", "due_at": due_at}
+        for index in range(count)
+    ]))
+
+
+def test_naive_datetimes_are_rejected(redis_client):
+    with pytest.raises(calendar.FollowupError):
+        asyncio.run(calendar.schedule_followup(redis_client, "5215512345678", "hola", datetime.now()))
+
+
+def test_claim_moves_due_items_to_inflight_once(redis_client):
+    ids = _schedule(redis_client, 3)
+    later = datetime.now(timezone.utc) + timedelta(hours=1)
+    asyncio.run(calendar.schedule_followup(redis_client, "5215500000099", "después", later, followup_id="futuro"))
+
+    claimed = calendar._claim_due(redis_client, time.time(), 10)
+    assert sorted(followup_id for followup_id, _ in claimed) == sorted(ids)
+    assert all(json.loads(raw)["id"] == followup_id for followup_id, raw in claimed)
+    assert redis_client.zcard(calendar.INFLIGHT_KEY) == 3
+    assert redis_client.zrange(calendar.DUE_KEY, 0, -1) == [b"futuro"]
+    # Un segundo despachador no recibe los mismos seguimientos
+    assert calendar._claim_due(redis_client, time.time(), 10) == []
+
+
+def test_claim_respects_limit(redis_client):
+    _schedule(redis_client, 5)
+    assert len(calendar._claim_due(redis_client, time.time(), 2)) == 2
+    assert redis_client.zcard(calendar.DUE_KEY) == 3
+
+
+def test_expired_claims_are_requeued(redis_client):
+    _schedule(redis_client, 2)
+    now = time.time()
+    calendar._claim_due(redis_client, now, 10)
+
+    assert calendar._requeue_expired(redis_client, now, 10) == 0
+    assert calendar._requeue_expired(redis_client, now + calendar.FOLLOWUP_VISIBILITY_SECONDS + 1, 10) == 2
+    assert redis_client.zcard(calendar.DUE_KEY) == 2
+    assert redis_client.zcard(calendar.INFLIGHT_KEY) == 0
+
+
+def test_dispatch_sends_and_removes(redis_client, monkeypatch):
+    sender = FakeSender()
+    monkeypatch.setattr(calendar, "get_whatsapp_sender", lambda: sender)
+    _schedule(redis_client, 4)
+
+    stats = asyncio.run(calendar.dispatch_due(redis_client, batch_size=10, concurrency=2))
+    assert stats == {"claimed": 4, "sent": 4}
+    assert len(sender.sent) == 4
+    assert redis_client.hlen(calendar.PAYLOAD_KEY) == 0
+    assert redis_client.zcard(calendar.INFLIGHT_KEY) == 0
+
+
+def test_transient_failure_is_retried_with_attempts(redis_client, monkeypatch):
+    monkeypatch.setattr(calendar, "get_whatsapp_sender", lambda: FakeSender(ConnectionError("sin conexión")))
+    [followup_id] = _schedule(redis_client, 1)
+
+    stats = asyncio.run(calendar.dispatch_due(redis_client))
+    assert stats == {"claimed": 1, "retry": 1}
+    assert redis_client.zscore(calendar.DUE_KEY, followup_id) > time.time()
+    assert json.loads(redis_client.hget(calendar.PAYLOAD_KEY, followup_id))["attempts"] == 1
+
+
+def test_cancelled_while_sending_is_not_retried(redis_client, monkeypatch):
+    [followup_id] = _schedule(redis_client, 1)
+    [(_, raw)] = calendar._claim_due(redis_client, time.time(), 10)
+    assert asyncio.run(calendar.cancel_followup(redis_client, followup_id))
+
+    monkeypatch.setattr(calendar, "get_whatsapp_sender", lambda: FakeSender(ConnectionError("sin conexión")))
+    result = asyncio.run(calendar.deliver_followup(redis_client, followup_id, raw, time.time()))
+    assert result == "cancelled"
+    assert redis_client.zscore(calendar.DUE_KEY, followup_id) is None
+    assert redis_client.hget(calendar.PAYLOAD_KEY, followup_id) is None
+    assert redis_client.zcard(calendar.INFLIGHT_KEY) == 0
+
+
+def test_cancel_unknown_or_sent(redis_client, monkeypatch):
+    assert not asyncio.run(calendar.cancel_followup(redis_client, "no-existe"))
+
+    monkeypatch.setattr(calendar, "get_whatsapp_sender", lambda: FakeSender())
+    [followup_id] = _schedule(redis_client, 1)
+    asyncio.run(calendar.dispatch_due(redis_client))
+    assert not asyncio.run(calendar.cancel_followup(redis_client, followup_id))
+
+
+def test_stale_followups_expire(redis_client, monkeypatch):
+    sender = FakeSender()
+    monkeypatch.setattr(calendar, "get_whatsapp_sender", lambda: sender)
+    _schedule(redis_client, 1, minutes_ago=int(calendar.FOLLOWUP_MAX_LATENESS_SECONDS / 60) + 5)
+
+    assert asyncio.run(calendar.dispatch_due(redis_client)) == {"claimed": 1, "expired": 1}
+    assert sender.sent == []
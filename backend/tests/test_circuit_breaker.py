@@ -0,0 +1,79 @@
+import time
+
+import httpx
+import pytest
+
+from src.utils.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, CircuitOpenError, is_transient_error
+
+
+def _breaker(**overrides) -> CircuitBreaker:
+    settings = {"failure_rate": 0.5, "min_calls": 4, "window_seconds": 30, "open_seconds": 0.05, "half_open_calls": 2}
+    settings.update(overrides)
+    return CircuitBreaker("pruebas", **settings)
+
+
+def _fail(breaker: CircuitBreaker, exc: Exception) -> None:
+    with pytest.raises(type(exc)):
+        with breaker.guard():
+            raise exc
+
+
+def _succeed(breaker: CircuitBreaker) -> None:
+    with breaker.guard():
+        pass
+
+
+def test_opens_after_failure_rate_with_min_calls():
+    breaker = _breaker()
+    _succeed(breaker)
+    _fail(breaker, ConnectionError("sin conexión"))
+    _succeed(breaker)
+    assert breaker.state == CLOSED
+    _fail(breaker, ConnectionError("sin conexión"))
+    assert breaker.state == OPEN
+
+    with pytest.raises(CircuitOpenError) as info:
+        with breaker.guard():
+            pytest.fail("la llamada no debe intentarse con el circuito abierto")
+    assert info.value.retry_after > 0
+
+
+def test_non_transient_errors_do_not_open():
+    breaker = _breaker()
+    for _ in range(6):
+        _fail(breaker, ValueError("error del cliente"))
+    assert breaker.state == CLOSED
+
+
+def test_half_open_probes_close_the_circuit():
+    breaker = _breaker()
+    for _ in range(4):
+        _fail(breaker, ConnectionError("sin conexión"))
+    time.sleep(0.06)
+
+    assert breaker.acquire()
+    assert breaker.state == HALF_OPEN
+    assert breaker.acquire()
+    # Sin más lugares de prueba hasta que terminen las dos
+    with pytest.raises(CircuitOpenError):
+        breaker.acquire()
+    breaker.record(True, probe=True)
+    breaker.record(True, probe=True)
+    assert breaker.state == CLOSED
+
+
+def test_failed_probe_reopens():
+    breaker = _breaker()
+    for _ in range(4):
+        _fail(breaker, ConnectionError("sin conexión"))
+    time.sleep(0.06)
+    _fail(breaker, TimeoutError("sin respuesta"))
+    assert breaker.state == OPEN
+
+
+def test_transient_error_classification():
+    request = httpx.Request("POST", "https://api.twilio.com")
+    assert is_transient_error(httpx.ConnectError("sin conexión", request=request))
+    for status, transient in ((503, True), (429, True), (400, False), (404, False)):
+        error = httpx.HTTPStatusError("error", request=request, response=httpx.Response(status, request=request))
+        assert is_transient_error(error) is transient
@@ -0,0 +1,56 @@
+import json
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.utils import codec
+
+MESSAGES = [
+    {"role": "assistant", "content": "¡Hola! ¿En qué puedo ayudarte? 😊",
+     "timestamp": datetime(2024, 5, 1, 9, 30, 15, 123456, tzinfo=timezone(timedelta(hours=-6))).isoformat()},
+    {"role": "user", "content": "Quiero agendar una cita " * 80, "timestamp": "2024-05-01T15:31:00+00:00"},
+    {"role": "tool", "content": "ok", "timestamp": "no es una fecha", "name": "agenda"},
+    {"role": "moderador", "content": "rol desconocido"},
+]
+
+
+@pytest.mark.parametrize("codec_name", ["json", "msgpack"])
+@pytest.mark.parametrize("compression", ["none", "zlib", None])
+def test_round_trip_returns_identical_messages(codec_name, compression):
+    value = {"complete": True, "messages": MESSAGES}
+    data = codec.encode_payload(value, codec_name, compression, compress_min_bytes=0)
+    assert codec.decode_payload(data) == value
+
+
+def test_plain_json_is_the_previous_format():
+    value = {"messages": MESSAGES[:1]}
+    data = codec.encode_payload(value, "json", "none")
+    assert json.loads(data) == value
+    assert codec.describe_payload(data) == "json"
+
+
+def test_reads_legacy_plain_json():
+    assert codec.decode_payload(json.dumps(MESSAGES)) == MESSAGES
+    assert codec.decode_payload(json.dumps(MESSAGES).encode()) == MESSAGES
+    assert codec.decode_payload(None) is None
+
+
+def test_small_payloads_are_not_compressed():
+    data = codec.encode_payload({"messages": MESSAGES[:1]}, "msgpack", "zlib", compress_min_bytes=1024)
+    assert codec.describe_payload(data) == "msgpack"
+
+
+def test_large_payloads_are_compressed():
+    data = codec.encode_payload({"messages": MESSAGES * 20}, "json", "zlib", compress_min_bytes=0)
+    assert codec.describe_payload(data) == "json+zlib"
+
+
+def test_unknown_codec_is_rejected():
+    assert codec.resolve_codec("MsgPack") == "msgpack"
+    with pytest.raises(ValueError):
+        codec.resolve_codec("protobuf")
+
+
+def test_msgpack_without_package_falls_back_to_json(monkeypatch):
+    monkeypatch.setattr(codec, "msgpack", None)
+    assert codec.resolve_codec("msgpack") == "json"
@@ -0,0 +1,147 @@
+import asyncio
+import importlib
+
+from src.utils import context
+from src.utils.context import SUMMARY_PREFIX, build_context, message_tokens, unsummarized
+
+webhook = importlib.import_module("src.api.v1.endpoints.webhook")
+
+SYSTEM = {"role": "system", "content": "Eres un asistente"}
+
+
+def _message(index: int, content: str = None, role: str = "user"):
+    return {"role": role, "content": content or f"mensaje {index}", "timestamp": f"2024-05-01T10:{index:02d}:00-06:00"}
+
+
+def test_everything_fits_within_the_budget():
+    history = [_message(i) for i in range(3)]
+    messages, overflow = build_context(SYSTEM, history, budget=1000)
+    assert messages == [SYSTEM] + [{"role": "user", "content": m["content"]} for m in history]
+    assert overflow == []
+
+
+def test_oldest_messages_overflow_in_order():
+    history = [_message(i) for i in range(6)]
+    budget = sum(message_tokens(m) for m in history[-2:])
+
+    messages, overflow = build_context(SYSTEM, history, budget=budget)
+
+    assert [m["content"] for m in messages[1:]] == ["mensaje 4", "mensaje 5"]
+    assert overflow == history[:4]
+
+
+def test_current_message_always_enters():
+    history = [_message(0), _message(1, "largo " * 500)]
+    messages, overflow = build_context(SYSTEM, history, budget=10)
+    assert messages[-1]["content"] == history[-1]["content"]
+    assert overflow == history[:1]
+
+
+def test_summary_uses_part_of_the_budget():
+    history = [_message(i) for i in range(3)]
+    summary = "Quiere una cita el lunes"
+    budget = sum(message_tokens(m) for m in history)
+
+    messages, overflow = build_context(SYSTEM, history, summary, budget=budget)
+
+    assert messages[1] == {"role": "system", "content": SUMMARY_PREFIX + summary}
+    assert overflow
+
+
+def test_unsummarized_skips_messages_already_in_the_summary():
+    overflow = [_message(0), _message(1), {"role": "user", "content": "sin hora"}, _message(2)]
+    assert unsummarized(overflow, None) == overflow
+    assert unsummarized(overflow, _message(1)["timestamp"]) == overflow[2:]
+
+
+class SummaryStore:
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.reads = []
+        self.summaries = []
+
+    def recent(self, phone_number, limit=None):
+        self.reads.append(limit)
+        return list(self.messages[-limit:] if limit else self.messages)
+
+    def append(self, phone_number, message):
+        self.messages.append(message)
+
+    def get_summary(self, phone_number):
+        return {"summary": None, "summary_until": None}
+
+    def save_summary(self, phone_number, summary, summary_until):
+        self.summaries.append((summary, summary_until))
+
+
+def test_messages_leaving_the_window_are_summarised_without_another_read(redis_client, monkeypatch):
+    store = SummaryStore([_message(i, role="user" if i % 2 else "assistant") for i in range(45)])
+    summarised = []
+
+    async def model(model, messages):
+        return "respuesta"
+
+    async def summarise(history, previous_summary=None):
+        summarised.append(history)
+        return "resumen"
+
+    async def send(to_number, message=""):
+        return {"sid": "SM1"}
+
+    monkeypatch.setattr(webhook, "redis_conn", redis_client)
+    monkeypatch.setattr(webhook, "get_conversation_store", lambda: store)
+    monkeypatch.setattr(webhook, "gpt_without_functions", model)
+    monkeypatch.setattr(webhook, "summarise_conversation", summarise)
+    monkeypatch.setattr(webhook, "send_whatsapp_message", send)
+    monkeypatch.setattr(webhook, "LLM_STREAMING_ENABLED", False)
+
+    asyncio.run(webhook.process_whatsapp_message("5215512345678", "¿tienen citas?"))
+
+    # Una sola lectura, dentro del tamaño de la caché de historial
+    assert store.reads == [context.CONTEXT_MAX_MESSAGES + context.SUMMARY_LOOKBACK_MESSAGES]
+    # Leídos 45 + usuario + respuesta: salen de la ventana de 40 los 7 más viejos
+    assert [m["content"] for m in summarised[0]] == [f"mensaje {i}" for i in range(7)]
+    assert store.summaries == [("resumen", _message(6)["timestamp"])]
+
+
+def test_split_by_tokens_keeps_order_and_oversized_messages():
+    messages = [_message(0), _message(1, "largo " * 100), _message(2), _message(3)]
+    budget = message_tokens(messages[0]) * 2
+
+    chunks = context.split_by_tokens(messages, budget)
+
+    assert [m for chunk in chunks for m in chunk] == messages
+    assert chunks[0] == messages[:1] and chunks[1] == messages[1:2] and chunks[2] == messages[2:]
+
+
+def test_summary_covers_every_message_in_chunks(monkeypatch):
+    from src.utils import model
+
+    prompts = []
+
+    async def fake_model(messages=None, **kwargs):
+        prompts.append(messages[-1]["content"])
+        return f"resumen {len(prompts)}"
+
+    monkeypatch.setattr(model, "gpt_without_functions", fake_model)
+    monkeypatch.setattr(model, "SUMMARY_CHUNK_TOKENS", message_tokens(_message(0)) * 10)
+    history = [_message(i) for i in range(25)]
+
+    summary = asyncio.run(model.summarise_conversation(history))
+
+    # 25 mensajes en tramos de 10: cada tramo se incorpora al resumen del anterior
+    assert summary == "resumen 3"
+    transcripts = "\n".join(prompts) + "\n"
+    assert all(f"user: mensaje {i}\n" in transcripts for i in range(25))
+    assert "Resumen actual: resumen 2" in prompts[2]
+
+
+def test_failed_chunk_returns_a_fallback(monkeypatch):
+    from src.utils import model
+
+    async def fake_model(messages=None, **kwargs):
+        return model.ERROR_RESPONSE
+
+    monkeypatch.setattr(model, "gpt_without_functions", fake_model)
+
+    assert asyncio.run(model.summarise_conversation([_message(0)], "anterior")) in model.FALLBACK_RESPONSES
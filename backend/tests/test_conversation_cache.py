@@ -0,0 +1,76 @@
+import pytest
+
+from src.utils import conversation_cache
+from src.utils.conversation_cache import CachedConversationStore
+
+
+class MemoryStore:
+    def __init__(self):
+        self.messages = []
+        self.reads = 0
+
+    def recent(self, phone_number, limit=None):
+        self.reads += 1
+        return list(self.messages[-limit:] if limit else self.messages)
+
+    def append(self, phone_number, message):
+        self.messages.append(message)
+
+    def replace(self, phone_number, messages):
+        self.messages = list(messages)
+
+
+def _message(index: int):
+    return {"role": "user", "content": f"mensaje {index}", "timestamp": f"2024-05-01T10:{index:02d}:00"}
+
+
+@pytest.fixture
+def cached(redis_client):
+    return CachedConversationStore(MemoryStore(), redis_client)
+
+
+def test_write_through_serves_reads_from_cache(cached):
+    cached.recent("5215512345678")
+    cached.append("5215512345678", _message(1))
+    cached.append("5215512345678", _message(2))
+
+    assert cached.recent("5215512345678") == [_message(1), _message(2)]
+    assert cached.store.reads == 1
+
+
+def test_only_the_tail_is_cached(cached, monkeypatch):
+    monkeypatch.setattr(conversation_cache, "CACHE_MAX_MESSAGES", 3)
+    cached.store.messages = [_message(i) for i in range(5)]
+
+    assert cached.recent("5215512345678", limit=2) == [_message(3), _message(4)]
+    assert cached.recent("5215512345678", limit=3) == [_message(2), _message(3), _message(4)]
+    assert cached.store.reads == 1
+    # Más de lo que hay en caché: se lee Supabase
+    assert len(cached.recent("5215512345678", limit=5)) == 5
+    assert cached.store.reads == 2
+
+
+def test_failed_cache_write_drops_the_entry(cached, monkeypatch):
+    cached.recent("5215512345678")
+    cached.append("5215512345678", _message(1))
+
+    def broken(*args, **kwargs):
+        raise ConnectionError("Redis sin memoria")
+
+    monkeypatch.setattr(conversation_cache, "set_cookies", broken)
+    cached.append("5215512345678", _message(2))
+    assert not cached.redis.exists(cached._key("5215512345678"))
+
+    monkeypatch.undo()
+    assert cached.recent("5215512345678") == [_message(1), _message(2)]
+
+
+def test_failed_cache_read_drops_the_entry(cached, monkeypatch):
+    cached.recent("5215512345678")
+
+    def corrupted(*args, **kwargs):
+        raise ValueError("payload corrupto")
+
+    monkeypatch.setattr(conversation_cache, "get_cookies", corrupted)
+    cached.append("5215512345678", _message(1))
+    assert not cached.redis.exists(cached._key("5215512345678"))
@@ -0,0 +1,76 @@
+import pytest
+
+from src.db.conversations import LegacyConversationStore, MessageTableStore
+
+
+def _message(index: int, role: str = "user"):
+    return {"role": role, "content": f"mensaje {index}", "timestamp": f"2024-05-01T10:{index:02d}:00-06:00"}
+
+
+@pytest.fixture(params=[LegacyConversationStore, MessageTableStore], ids=["legacy", "messages"])
+def store(request, supabase_tables):
+    return request.param()
+
+
+def test_append_and_read_in_order(store):
+    assert store.recent("5215512345678") == []
+    for index in range(5):
+        store.append("5215512345678", _message(index, "user" if index % 2 else "assistant"))
+    store.append("5215587654321", _message(9))
+
+    assert store.recent("5215512345678") == [_message(i, "user" if i % 2 else "assistant") for i in range(5)]
+    assert store.recent("5215512345678", limit=2) == [_message(3), _message(4, "assistant")]
+
+
+def test_append_creates_the_conversation_row(store, supabase_tables):
+    store.append("5215512345678", _message(0))
+    assert [row["phone_number"] for row in supabase_tables["conversations"]] == ["5215512345678"]
+
+
+def test_replace_rewrites_the_history(store):
+    store.append("5215512345678", _message(0))
+    store.replace("5215512345678", [_message(7), _message(8)])
+    assert store.recent("5215512345678") == [_message(7), _message(8)]
+
+
+def test_summary_round_trip(store):
+    store.append("5215512345678", _message(0))
+    assert store.get_summary("5215512345678") == {"summary": None, "summary_until": None}
+    store.save_summary("5215512345678", "Pidió una cita", _message(0)["timestamp"])
+    assert store.get_summary("5215512345678") == {"summary": "Pidió una cita", "summary_until": _message(0)["timestamp"]}
+
+
+def test_archive_candidates_keep_the_hot_tail(store):
+    for index in range(12):
+        store.append("5215512345678", _message(index))
+
+    cold, marker = store.archive_candidates("5215512345678", keep=4, chunk=3)
+    assert cold == [_message(i) for i in range(6)]
+    assert store.trim_archived("5215512345678", marker)
+    assert store.recent("5215512345678") == [_message(i) for i in range(6, 12)]
+
+
+def test_recent_many_reads_several_numbers(store):
+    store.append("5215512345678", _message(0))
+    store.append("5215512345678", _message(1))
+    store.append("5215587654321", _message(2))
+    assert store.recent_many(["5215512345678", "5215587654321", "5210000000000"]) == {
+        "5215512345678": [_message(0), _message(1)],
+        "5215587654321": [_message(2)],
+    }
+
+
+def test_recent_many_pages_past_max_rows(store, postgrest_server, monkeypatch):
+    from src.db import conversations
+
+    # PostgREST corta cada respuesta en max-rows: sin paginar se perderían mensajes
+    monkeypatch.setattr(postgrest_server.config.app.state, "max_rows", 3)
+    monkeypatch.setattr(conversations, "SUPABASE_PAGE_SIZE", 3)
+    numbers = [f"52155000000{index:02d}" for index in range(5)]
+    for position, number in enumerate(numbers):
+        for index in range(position + 1):
+            store.append(number, _message(index))
+
+    assert store.recent_many(numbers) == {
+        number: [_message(i) for i in range(position + 1)] for position, number in enumerate(numbers)
+    }
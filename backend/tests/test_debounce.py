@@ -0,0 +1,39 @@
+import time
+
+from src.utils import debounce
+
+
+def test_only_the_last_message_flushes_the_burst(redis_client):
+    first = debounce.register_message(redis_client, "5215512345678", "hola")
+    debounce.register_message(redis_client, "5215512345678", "", media=[{"url": "https://x/1.jpg", "type": "image/jpeg"}])
+    last = debounce.register_message(redis_client, "5215512345678", "¿tienen citas mañana?")
+
+    assert debounce.take_burst(redis_client, "5215512345678", first["seq"], first["first"]) is None
+    body, media = debounce.take_burst(redis_client, "5215512345678", last["seq"], last["first"])
+    assert body == "hola\n¿tienen citas mañana?"
+    assert media == [{"url": "https://x/1.jpg", "type": "image/jpeg"}]
+    # La ventana se vacía una sola vez
+    assert debounce.take_burst(redis_client, "5215512345678", last["seq"], last["first"]) is None
+
+
+def test_max_wait_flushes_an_ongoing_burst(redis_client, monkeypatch):
+    first = debounce.register_message(redis_client, "5215512345678", "uno")
+    debounce.register_message(redis_client, "5215512345678", "dos")
+    monkeypatch.setattr(debounce, "DEBOUNCE_MAX_WAIT_SECONDS", 0.0)
+
+    assert debounce.take_burst(redis_client, "5215512345678", first["seq"], first["first"]) == ("uno\ndos", [])
+
+
+def test_quiet_delay_is_capped_by_max_wait(monkeypatch):
+    monkeypatch.setattr(debounce, "DEBOUNCE_QUIET_SECONDS", 2.0)
+    monkeypatch.setattr(debounce, "DEBOUNCE_MAX_WAIT_SECONDS", 8.0)
+    now = time.time()
+    assert 1.9 < debounce.quiet_delay({"first": now}) <= 2.0
+    assert 0.9 < debounce.quiet_delay({"first": now - 7}) <= 1.0
+    assert debounce.quiet_delay({"first": now - 20}) == 0.0
+
+
+def test_reads_legacy_plain_text_entries(redis_client):
+    state = debounce.register_message(redis_client, "5215512345678", "nuevo")
+    redis_client.lpush(debounce._keys("5215512345678")["buffer"], "anterior")
+    assert debounce.take_burst(redis_client, "5215512345678", state["seq"], state["first"]) == ("anterior\nnuevo", [])
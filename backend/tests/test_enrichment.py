@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from src.db.conversations import MessageTableStore
+from src.utils import enrichment
+
+
+def _message(index: int):
+    return {"role": "user", "content": f"mensaje {index}", "timestamp": f"2024-05-01T10:{index:02d}:00+00:00"}
+
+
+@pytest.fixture
+def analysed(supabase_tables, monkeypatch):
+    """Historiales en conversation_messages y un modelo falso que registra lo que recibe."""
+    calls = []
+
+    async def analyse_conversation(messages, summary=None):
+        calls.append([m["content"] for m in messages])
+        return {"summary": "resumen", "intent": "otro", "tags": [], "lead_score": 10, "model": "modelo-pruebas"}
+
+    monkeypatch.setattr(enrichment, "analyse_conversation", analyse_conversation)
+    monkeypatch.setattr(enrichment, "get_backing_store", MessageTableStore)
+    monkeypatch.setattr(enrichment, "ENRICHMENT_RETRY_BACKOFF", 0)
+    return calls
+
+
+def _insights(tables):
+    return {row["phone_number"]: row for row in tables.get(enrichment.INSIGHTS_TABLE, [])}
+
+
+def test_only_the_tail_is_analysed_and_unchanged_ones_are_skipped(analysed, supabase_tables, redis_client, monkeypatch):
+    monkeypatch.setattr(enrichment, "ENRICHMENT_MAX_MESSAGES", 3)
+    store = MessageTableStore()
+    for index in range(5):
+        store.append("5215512345678", _message(index))
+    store.append("5215587654321", _message(0))
+
+    stats = asyncio.run(enrichment.enrich_conversations(redis_client))
+    assert (stats["analysed"], stats["errors"]) == (2, 0)
+    assert ["mensaje 2", "mensaje 3", "mensaje 4"] in analysed
+    assert _insights(supabase_tables)["5215512345678"]["message_count"] == 3
+    assert redis_client.get(enrichment.CHECKPOINT_KEY) is not None
+
+    # --full revisa todas, pero el hash evita volver a llamar al modelo
+    stats = asyncio.run(enrichment.enrich_conversations(redis_client, full=True))
+    assert (stats["conversations"], stats["unchanged"], stats["analysed"]) == (2, 2, 0)
+    assert len(analysed) == 2
+
+
+def test_incomplete_history_holds_the_checkpoint(analysed, supabase_tables, redis_client):
+    store = MessageTableStore()
+    store.append("5215512345678", _message(0))
+    store.append("5215587654321", _message(0))
+    # Un análisis anterior vio más mensajes de los que devuelve la lectura
+    supabase_tables[enrichment.INSIGHTS_TABLE] = [
+        {"phone_number": "5215512345678", "content_hash": "anterior", "message_count": 8},
+    ]
+
+    stats = asyncio.run(enrichment.enrich_conversations(redis_client))
+
+    assert (stats["incomplete"], stats["analysed"]) == (1, 1)
+    assert _insights(supabase_tables)["5215512345678"]["content_hash"] == "anterior"
+    assert redis_client.get(enrichment.CHECKPOINT_KEY) is None
+
+
+def test_failed_analysis_holds_the_checkpoint(analysed, supabase_tables, redis_client, monkeypatch):
+    MessageTableStore().append("5215512345678", _message(0))
+
+    async def failing(messages, summary=None):
+        raise ValueError("JSON inválido")
+
+    monkeypatch.setattr(enrichment, "analyse_conversation", failing)
+    stats = asyncio.run(enrichment.enrich_conversations(redis_client))
+
+    assert (stats["errors"], stats["analysed"]) == (1, 0)
+    assert redis_client.get(enrichment.CHECKPOINT_KEY) is None
+
+
+def test_incomplete_allows_compaction_of_the_hot_tail(monkeypatch):
+    monkeypatch.setattr(enrichment, "COMPACTION_HOT_MESSAGES", 50)
+    previous = {"message_count": 60}
+    # La compactación deja al menos COMPACTION_HOT_MESSAGES en el final caliente
+    assert not enrichment.looks_incomplete([_message(0)] * 50, previous)
+    assert enrichment.looks_incomplete([_message(0)] * 49, previous)
+    assert not enrichment.looks_incomplete([], None)
@@ -0,0 +1,78 @@
+import json
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.v1.endpoints import conversations as endpoint
+from src.db import conversations
+from src.db.conversations import LegacyConversationStore, MessageTableStore
+
+HEADERS = {"Authorization": "Bearer secreto"}
+
+
+@pytest.fixture(params=[LegacyConversationStore, MessageTableStore], ids=["legacy", "messages"])
+def store(request, supabase_tables, monkeypatch):
+    store = request.param()
+    monkeypatch.setenv("CONVERSATIONS_API_TOKEN", "secreto")
+    monkeypatch.setattr(endpoint, "get_backing_store", lambda: store)
+    return store
+
+
+@pytest.fixture
+def client():
+    app = FastAPI()
+    app.include_router(endpoint.router)
+    return TestClient(app)
+
+
+def _fill(store, counts):
+    numbers = [f"52155000000{index:02d}" for index in range(len(counts))]
+    for number, count in zip(numbers, counts):
+        for index in range(count):
+            store.append(number, {"role": "user", "content": f"{number} #{index}",
+                                  "timestamp": f"2024-05-01T10:{index:02d}:00+00:00"})
+    return numbers
+
+
+def test_export_returns_every_message_across_pages(store, client, postgrest_server, monkeypatch):
+    # Supabase corta en max-rows: páginas de conversaciones y de mensajes más chicas que el total
+    monkeypatch.setattr(postgrest_server.config.app.state, "max_rows", 4)
+    monkeypatch.setattr(conversations, "SUPABASE_PAGE_SIZE", 4)
+    monkeypatch.setattr(endpoint, "EXPORT_PAGE_SIZE", 2)
+    numbers = _fill(store, [5, 1, 7, 3, 6])
+
+    response = client.get("/conversations/export", headers=HEADERS)
+
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert len(lines) == 22
+    for number, count in zip(numbers, [5, 1, 7, 3, 6]):
+        assert [line["content"] for line in lines if line["phone_number"] == number] == \
+            [f"{number} #{index}" for index in range(count)]
+
+
+def test_export_filters_by_message_time(store, client):
+    _fill(store, [4])
+
+    response = client.get("/conversations/export", headers=HEADERS, params={
+        "since": "2024-05-01T10:01:00+00:00", "until": "2024-05-01T10:02:00+00:00",
+    })
+
+    assert [json.loads(line)["timestamp"] for line in response.text.splitlines()] == [
+        "2024-05-01T10:01:00+00:00", "2024-05-01T10:02:00+00:00",
+    ]
+
+
+def test_conversation_pages_follow_the_cursor(store, client):
+    numbers = _fill(store, [1, 1, 1])
+
+    first = client.get("/conversations", headers=HEADERS, params={"limit": 2}).json()
+    second = client.get("/conversations", headers=HEADERS, params={"limit": 2, "cursor": first["next_cursor"]}).json()
+
+    assert [row["phone_number"] for row in first["conversations"] + second["conversations"]] == numbers
+    assert second["next_cursor"] is None
+
+
+def test_export_requires_the_token(store, client):
+    assert client.get("/conversations/export").status_code == 401
@@ -0,0 +1,19 @@
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from src.api.v1.endpoints import health
+
+app = FastAPI()
+app.include_router(health.router)
+client = TestClient(app)
+
+
+def test_stats_endpoints_read_redis(redis_client, monkeypatch):
+    monkeypatch.setattr(health, "redis_conn", redis_client)
+    redis_client.hset("conversation_cache:stats", mapping={"hits": 3, "misses": 1})
+    redis_client.hset("debounce:stats", mapping={"messages": 4, "flushes": 2})
+    redis_client.hset("llm_cache:stats", mapping={"hits": 1, "misses": 3, "saved_ms": 800})
+
+    assert client.get("/health/conversation-cache").json()["hit_rate"] == 0.75
+    assert client.get("/health/debounce").json()["llm_turns_per_message"] == 0.5
+    assert client.get("/health/llm-cache").json()["hit_rate"] == 0.25
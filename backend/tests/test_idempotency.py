@@ -0,0 +1,47 @@
+import asyncio
+import uuid
+
+from src.utils import idempotency
+
+
+def _sid() -> str:
+    return f"SM{uuid.uuid4().hex}"
+
+
+def test_message_is_claimed_once(redis_client):
+    sid = _sid()
+    assert asyncio.run(idempotency.claim_message(redis_client, sid))
+    assert not asyncio.run(idempotency.claim_message(redis_client, sid))
+
+
+def test_duplicate_detected_across_workers(redis_client):
+    sid = _sid()
+    assert asyncio.run(idempotency.claim_message(redis_client, sid))
+    # Otro worker: sin la caché local, la clave de Redis decide
+    idempotency._recent.discard(sid)
+    assert not asyncio.run(idempotency.claim_message(redis_client, sid))
+
+
+def test_released_message_can_be_retried(redis_client):
+    sid = _sid()
+    assert asyncio.run(idempotency.claim_message(redis_client, sid))
+    asyncio.run(idempotency.release_message(redis_client, sid))
+    assert redis_client.get(idempotency._key(sid)) is None
+    assert asyncio.run(idempotency.claim_message(redis_client, sid))
+
+
+def test_claim_fails_open(redis_client):
+    class BrokenRedis:
+        def set(self, *args, **kwargs):
+            raise ConnectionError("Redis caído")
+
+    assert asyncio.run(idempotency.claim_message(redis_client, None))
+    assert asyncio.run(idempotency.claim_message(BrokenRedis(), _sid()))
+
+
+def test_recent_ids_are_bounded():
+    recent = idempotency.RecentIds(max_size=2, ttl_seconds=60)
+    for sid in ("a", "b", "c"):
+        recent.add(sid)
+    assert "a" not in recent
+    assert "b" in recent and "c" in recent
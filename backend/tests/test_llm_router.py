@@ -0,0 +1,111 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import llm_router
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.llm_router import LLMRouteError, LLMRouter, Route
+
+
+class FakeProvider:
+    """Proveedor con la interfaz que usa el router y respuestas de latencia fija por modelo."""
+
+    def __init__(self, name, delays, failures=()):
+        self.name = name
+        self.delays = delays
+        self.failures = set(failures)
+        self.calls = []
+        self.breaker = CircuitBreaker(f"llm:pruebas-{name}")
+        self.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=self.create)))
+
+    @property
+    def semaphore(self):
+        return asyncio.Semaphore(10)
+
+    async def create(self, model, messages, **params):
+        self.calls.append(model)
+        await asyncio.sleep(self.delays[model])
+        if model in self.failures:
+            raise ConnectionError(f"{model} caído")
+        return {"model": model}
+
+
+@pytest.fixture(autouse=True)
+def hedging(monkeypatch):
+    monkeypatch.setattr(llm_router, "LLM_HEDGING_ENABLED", True)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_MIN_DELAY", 0.01)
+    monkeypatch.setattr(llm_router, "LLM_HEDGE_DEFAULT_DELAY", 0.05)
+    monkeypatch.setattr(llm_router, "LLM_LATENCY_MIN_SAMPLES", 3)
+
+
+def _complete(router, **kwargs):
+    return asyncio.run(router.complete([{"role": "user", "content": "hola"}], **kwargs))
+
+
+def test_slow_route_is_hedged_to_the_next_one():
+    provider = FakeProvider("uno", {"lento": 0.5, "rapido": 0.01})
+    router = LLMRouter([Route(provider, "lento"), Route(provider, "rapido")])
+
+    assert _complete(router) == {"model": "rapido"}
+    assert provider.calls == ["lento", "rapido"]
+
+
+def test_hedging_can_be_disabled():
+    provider = FakeProvider("uno", {"lento": 0.1, "rapido": 0.01})
+    router = LLMRouter([Route(provider, "lento"), Route(provider, "rapido")])
+
+    assert _complete(router, hedge=False) == {"model": "lento"}
+    assert provider.calls == ["lento"]
+
+
+def test_single_route_hedges_once_on_itself():
+    provider = FakeProvider("uno", {"unico": 0.2})
+    router = LLMRouter([Route(provider, "unico")])
+
+    assert _complete(router) == {"model": "unico"}
+    assert provider.calls == ["unico", "unico"]
+
+
+def test_failure_falls_back_immediately():
+    provider = FakeProvider("uno", {"roto": 0.0, "respaldo": 0.0}, failures={"roto"})
+    router = LLMRouter([Route(provider, "roto"), Route(provider, "respaldo")])
+
+    assert _complete(router, hedge=False) == {"model": "respaldo"}
+
+
+def test_all_routes_failing_raises():
+    provider = FakeProvider("uno", {"roto": 0.0}, failures={"roto"})
+
+    with pytest.raises(LLMRouteError):
+        _complete(LLMRouter([Route(provider, "roto")]))
+
+
+def test_hedged_out_attempts_still_count_towards_latency():
+    provider = FakeProvider("uno", {"lento": 0.3, "rapido": 0.01})
+    slow, fast = Route(provider, "lento"), Route(provider, "rapido")
+
+    _complete(LLMRouter([slow, fast]))
+
+    # El intento lento se canceló tras el retraso del duplicado: queda su tiempo como cota inferior
+    assert len(slow.latencies) == 1
+    assert slow.latencies[0] >= llm_router.LLM_HEDGE_DEFAULT_DELAY
+    assert len(fast.latencies) == 1
+
+
+def test_deadline_records_the_cancelled_attempt():
+    provider = FakeProvider("uno", {"atascado": 1.0})
+    route = Route(provider, "atascado")
+
+    with pytest.raises(asyncio.TimeoutError):
+        _complete(LLMRouter([route]), deadline=0.05, hedge=False)
+    assert len(route.latencies) == 1 and route.latencies[0] >= 0.04
+
+
+def test_clearly_faster_route_moves_to_the_front():
+    provider = FakeProvider("uno", {})
+    preferred, other = Route(provider, "preferido"), Route(provider, "otro")
+    preferred.latencies.extend([2.0, 2.1, 2.2])
+    other.latencies.extend([0.5, 0.6, 0.7])
+
+    assert LLMRouter([preferred, other]).ordered_routes()[0] is other
@@ -0,0 +1,120 @@
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+from src.utils import media
+
+CHUNK = 64 * 1024
+
+
+@pytest.fixture(scope="module")
+def media_server():
+    from benchmarks.fakes import create_fake_media_app, serve_in_thread
+
+    server = serve_in_thread(create_fake_media_app())
+    yield server
+    server.should_exit = True
+
+
+@pytest.fixture(autouse=True)
+def spool(tmp_path, monkeypatch):
+    monkeypatch.setattr(media, "MEDIA_SPOOL_DIR", str(tmp_path))
+    monkeypatch.setattr(media, "MEDIA_MAX_BYTES", 256 * 1024)
+    monkeypatch.setattr(media, "_downloader", None)
+    return tmp_path
+
+
+def _served(name: str, size: int) -> bytes:
+    """Contenido que genera el servidor falso para `name` y `size`."""
+    block = (name.encode() * (CHUNK // len(name) + 1))[:CHUNK]
+    return (block * (size // CHUNK + 1))[:size]
+
+
+def _download(url: str, content_type: str = "") -> media.MediaFile:
+    async def run():
+        try:
+            return await media.get_media_downloader().download(url, content_type)
+        finally:
+            await media.close_media_downloader()
+
+    return asyncio.run(run())
+
+
+def test_download_streams_to_disk_following_the_redirect(media_server, spool):
+    size = 200 * 1024
+    result = _download(f"{media_server.base_url}/redirect/foto?size={size}&content_type=image/png")
+
+    with open(result.path, "rb") as handle:
+        content = handle.read()
+    assert content == _served("foto", size)
+    assert result.size == size
+    assert result.sha256 == hashlib.sha256(content).hexdigest()
+    assert result.content_type == "image/png"
+    assert os.path.dirname(result.path) == str(spool)
+
+
+@pytest.mark.parametrize("chunked", [False, True])
+def test_oversized_file_is_rejected_without_leaving_a_partial_file(media_server, spool, chunked):
+    # Con Content-Length se rechaza antes de leer; sin él, al pasar el límite durante la descarga
+    url = f"{media_server.base_url}/media/grande?size={300 * 1024}&chunked={str(chunked).lower()}"
+    with pytest.raises(media.MediaError, match="demasiado grande"):
+        _download(url)
+    assert os.listdir(spool) == []
+
+
+def test_http_error_is_a_media_error(media_server, spool):
+    with pytest.raises(media.MediaError, match="HTTP 404"):
+        _download(f"{media_server.base_url}/no-existe")
+    assert os.listdir(spool) == []
+
+
+def test_client_is_replaced_per_event_loop_and_closed_by_aclose(media_server):
+    downloader = media.MediaDownloader()
+    url = f"{media_server.base_url}/media/nota?size=1024"
+    clients = []
+
+    async def job():
+        try:
+            result = await downloader.download(url)
+            os.remove(result.path)
+            clients.append(downloader._client)
+        finally:
+            await downloader.aclose()
+
+    asyncio.run(job())
+    asyncio.run(job())
+    assert clients[0] is not clients[1]
+    assert all(client.is_closed for client in clients)
+    assert downloader._client is None
+
+
+def test_repeated_file_and_url_are_processed_once(media_server, redis_client, monkeypatch):
+    monkeypatch.setattr(media, "_processors", [])
+    calls = []
+
+    async def size_processor(item: media.MediaFile):
+        calls.append(item.sha256)
+        return f"{item.size} bytes"
+
+    media.register_processor("tamaño", ("image/",), size_processor)
+    app = media_server.config.app
+    first = {"url": f"{media_server.base_url}/media/ticket?size=2048&v=1", "content_type": "image/jpeg"}
+    # El mismo archivo en otra URL (otro cliente lo reenvía)
+    second = {"url": f"{media_server.base_url}/media/ticket?size=2048&v=2", "content_type": "image/jpeg"}
+
+    async def run(item):
+        try:
+            return await media.ingest_one(redis_client, item)
+        finally:
+            await media.close_media_downloader()
+
+    assert asyncio.run(run(first)) == "2048 bytes"
+    assert asyncio.run(run(second)) == "2048 bytes"
+    assert len(calls) == 1
+
+    # La misma URL (reintento del trabajo) ni siquiera se descarga
+    requests = app.state.requests
+    assert asyncio.run(run(first)) == "2048 bytes"
+    assert app.state.requests == requests
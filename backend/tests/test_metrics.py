@@ -0,0 +1,83 @@
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from prometheus_client import CollectorRegistry, generate_latest
+
+from src.api.v1.endpoints import metrics as metrics_endpoint
+from src.utils import metrics
+
+
+def sample(name, labels=None):
+    return metrics.REGISTRY.get_sample_value(name, labels or {}) or 0.0
+
+
+def test_track_stage_records_latency_errors_and_in_flight():
+    count = sample("whatsapp_stage_latency_seconds_count", {"stage": "pruebas"})
+    errors = sample("whatsapp_stage_errors_total", {"stage": "pruebas"})
+
+    with metrics.track_stage("pruebas"):
+        assert sample("whatsapp_stage_in_flight", {"stage": "pruebas"}) == 1
+    with pytest.raises(ValueError):
+        with metrics.track_stage("pruebas"):
+            raise ValueError("falla")
+
+    assert sample("whatsapp_stage_latency_seconds_count", {"stage": "pruebas"}) == count + 2
+    assert sample("whatsapp_stage_errors_total", {"stage": "pruebas"}) == errors + 1
+    assert sample("whatsapp_stage_in_flight", {"stage": "pruebas"}) == 0
+
+
+def test_record_token_usage_counts_prompt_and_completion():
+    prompt = sample("llm_tokens_total", {"model": "modelo-pruebas", "kind": "prompt"})
+
+    metrics.record_token_usage("modelo-pruebas", SimpleNamespace(prompt_tokens=120, completion_tokens=None))
+    metrics.record_token_usage("modelo-pruebas", None)
+
+    assert sample("llm_tokens_total", {"model": "modelo-pruebas", "kind": "prompt"}) == prompt + 120
+    assert sample("llm_tokens_total", {"model": "modelo-pruebas", "kind": "completion"}) == 0
+
+
+def collect(redis_client) -> CollectorRegistry:
+    registry = CollectorRegistry()
+    registry.register(metrics.RedisStatsCollector(redis_client))
+    return registry
+
+
+def test_redis_stats_collector_exports_shared_counters(redis_client):
+    redis_client.hset("conversation_cache:stats", mapping={"hits": 7, "misses": 3})
+    redis_client.hset("debounce:stats", mapping={"messages": 10, "flushes": 4})
+    redis_client.hset("llm_cache:stats", mapping={"hits": 2, "near_hits": 1, "misses": 5, "saved_ms": 1500})
+
+    registry = collect(redis_client)
+
+    assert registry.get_sample_value("conversation_cache_lookups_total", {"result": "hit"}) == 7
+    assert registry.get_sample_value("conversation_cache_lookups_total", {"result": "miss"}) == 3
+    assert registry.get_sample_value("debounce_llm_turns_total") == 4
+    assert registry.get_sample_value("llm_response_cache_lookups_total", {"result": "near_hit"}) == 1
+    assert registry.get_sample_value("llm_response_cache_saved_seconds") == 1.5
+    assert registry.get_sample_value("followups_pending", {"state": "scheduled"}) == 0
+
+
+def test_redis_stats_collector_skips_when_redis_fails():
+    class BrokenRedis:
+        def __getattr__(self, name):
+            raise ConnectionError("Redis caído")
+
+    assert generate_latest(collect(BrokenRedis())) == b""
+
+
+def test_metrics_endpoint_serves_process_and_redis_metrics(redis_client, monkeypatch):
+    monkeypatch.setattr(metrics_endpoint, "redis_conn", redis_client)
+    redis_client.hset("conversation_cache:stats", mapping={"hits": 1})
+    app = FastAPI()
+    app.include_router(metrics_endpoint.router)
+
+    with metrics.track_stage("pruebas"):
+        pass
+    response = TestClient(app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'whatsapp_stage_latency_seconds_count{stage="pruebas"}' in response.text
+    assert 'conversation_cache_lookups_total{result="hit"} 1.0' in response.text
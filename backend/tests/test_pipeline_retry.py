@@ -0,0 +1,131 @@
+import asyncio
+import importlib
+
+import pytest
+
+from src.utils import pipeline_state
+from src.utils.whatsapp import WhatsAppSendError
+
+webhook = importlib.import_module("src.api.v1.endpoints.webhook")
+
+NUMBER = "5215512345678"
+
+
+class MemoryStore:
+    def __init__(self, messages=None):
+        self.messages = list(messages or [])
+
+    def recent(self, phone_number, limit=None):
+        return list(self.messages[-limit:] if limit else self.messages)
+
+    def append(self, phone_number, message):
+        self.messages.append(message)
+
+    def get_summary(self, phone_number):
+        return {"summary": None, "summary_until": None}
+
+
+class FlakySender:
+    def __init__(self, failures: int):
+        self.failures = failures
+        self.sent = []
+
+    async def __call__(self, to_number, message=""):
+        if self.failures:
+            self.failures -= 1
+            raise WhatsAppSendError("Twilio no disponible")
+        self.sent.append(message)
+        return {"sid": f"SM{len(self.sent)}"}
+
+
+@pytest.fixture
+def pipeline(redis_client, monkeypatch):
+    store = MemoryStore([{"role": "assistant", "content": webhook.WELCOME_MESSAGE, "timestamp": "2024-05-01T10:00:00"}])
+    calls = []
+
+    async def model(model, messages):
+        calls.append(messages)
+        return f"respuesta {len(calls)}"
+
+    monkeypatch.setattr(webhook, "redis_conn", redis_client)
+    monkeypatch.setattr(webhook, "get_conversation_store", lambda: store)
+    monkeypatch.setattr(webhook, "gpt_without_functions", model)
+    monkeypatch.setattr(webhook, "LLM_STREAMING_ENABLED", False)
+    return store, calls
+
+
+def test_retry_after_failed_send_only_resends(pipeline, monkeypatch):
+    store, calls = pipeline
+    sender = FlakySender(failures=1)
+    monkeypatch.setattr(webhook, "send_whatsapp_message", sender)
+
+    with pytest.raises(WhatsAppSendError):
+        asyncio.run(webhook.process_whatsapp_message(NUMBER, "¿Tienen citas mañana?", "job-1"))
+    result = asyncio.run(webhook.process_whatsapp_message(NUMBER, "¿Tienen citas mañana?", "job-1"))
+
+    assert result["status"] == "success"
+    assert len(calls) == 1
+    assert sender.sent == ["respuesta 1"]
+    assert [m["role"] for m in store.messages] == ["assistant", "user", "assistant"]
+
+
+def test_retry_after_failed_model_call_keeps_one_user_message(pipeline, monkeypatch):
+    store, calls = pipeline
+    sender = FlakySender(failures=0)
+    monkeypatch.setattr(webhook, "send_whatsapp_message", sender)
+    attempts = []
+
+    async def model(model, messages):
+        attempts.append(messages)
+        if len(attempts) == 1:
+            raise TimeoutError("el modelo no respondió")
+        return "respuesta"
+
+    monkeypatch.setattr(webhook, "gpt_without_functions", model)
+    with pytest.raises(TimeoutError):
+        asyncio.run(webhook.process_whatsapp_message(NUMBER, "hola", "job-2"))
+    asyncio.run(webhook.process_whatsapp_message(NUMBER, "hola", "job-2"))
+
+    assert [m["role"] for m in store.messages] == ["assistant", "user", "assistant"]
+    # El contexto del reintento no repite el mensaje del usuario
+    assert [m["content"] for m in attempts[1] if m["role"] == "user"] == ["hola"]
+    assert sender.sent == ["respuesta"]
+
+
+def test_partial_stream_is_not_resent(pipeline, monkeypatch):
+    store, _ = pipeline
+    sender = FlakySender(failures=0)
+    monkeypatch.setattr(webhook, "send_whatsapp_message", sender)
+    monkeypatch.setattr(webhook, "LLM_STREAMING_ENABLED", True)
+
+    async def stream(model, messages):
+        yield "Primer fragmento."
+        raise ConnectionError("se cortó el stream")
+
+    monkeypatch.setattr(webhook, "gpt_stream_chunks", stream)
+    with pytest.raises(ConnectionError):
+        asyncio.run(webhook.process_whatsapp_message(NUMBER, "cuéntame de sus planes", "job-3"))
+    asyncio.run(webhook.process_whatsapp_message(NUMBER, "cuéntame de sus planes", "job-3"))
+
+    assert sender.sent == ["Primer fragmento."]
+    assert store.messages[-1]["content"] == "Primer fragmento."
+
+
+def test_checkpoint_is_cleared_after_success(pipeline, redis_client, monkeypatch):
+    monkeypatch.setattr(webhook, "send_whatsapp_message", FlakySender(failures=0))
+    asyncio.run(webhook.process_whatsapp_message(NUMBER, "hola", "job-4"))
+    assert not redis_client.exists(f"{pipeline_state.KEY_PREFIX}:job-4")
+
+
+def test_without_id_nothing_is_recorded(pipeline, redis_client, monkeypatch):
+    monkeypatch.setattr(webhook, "send_whatsapp_message", FlakySender(failures=0))
+    asyncio.run(webhook.process_whatsapp_message(NUMBER, "hola"))
+    assert redis_client.keys(f"{pipeline_state.KEY_PREFIX}:*") == []
+
+
+def test_history_before_drops_previous_attempt():
+    user = {"role": "user", "content": "hola", "timestamp": "t2"}
+    history = [{"role": "assistant", "content": "bienvenida", "timestamp": "t1"}, dict(user, id=7),
+               {"role": "assistant", "content": "respuesta", "timestamp": "t3"}]
+    assert pipeline_state.history_before(history, user) == history[:1]
+    assert pipeline_state.history_before(history[:1], user) == history[:1]
@@ -0,0 +1,83 @@
+import importlib
+
+import pytest
+from rq.registry import ScheduledJobRegistry
+
+from src.utils import debounce, queue
+from src.utils.redis import redis_conn
+
+webhook = importlib.import_module("src.api.v1.endpoints.webhook")
+
+
+@pytest.fixture(autouse=True)
+def fresh_queues(monkeypatch):
+    monkeypatch.setattr(queue, "_queues", {})
+    yield
+    redis_conn.flushall()
+
+
+@pytest.fixture
+def handled(monkeypatch):
+    calls = []
+
+    async def handle(number, body, media=None, debounce=True, pipeline_id=None):
+        calls.append({"number": number, "body": body, "media": media, "debounce": debounce, "pipeline_id": pipeline_id})
+        return {"status": "success"}
+
+    monkeypatch.setattr(webhook, "handle_inbound_message", handle)
+    return calls
+
+
+def test_same_number_always_uses_the_same_shard():
+    shards = {queue.shard_for("5215512345678", 8) for _ in range(5)}
+    assert len(shards) == 1
+    assert len({queue.shard_for(f"52155{i:08d}", 8) for i in range(200)}) == 8
+
+
+def test_job_runs_with_its_id_as_pipeline_id(handled):
+    job_id = queue.enqueue_whatsapp_message("5215512345678", "hola")
+    job = queue.get_queue(queue.shard_for("5215512345678", queue.QUEUE_SHARDS)).fetch_job(job_id)
+
+    assert handled == [{"number": "5215512345678", "body": "hola", "media": None, "debounce": True,
+                        "pipeline_id": job_id}]
+    assert job.retries_left == queue.JOB_MAX_RETRIES
+
+
+def test_debounced_messages_wait_in_a_delayed_job(handled, monkeypatch):
+    monkeypatch.setattr(queue, "QUEUE_SYNC", False)
+    monkeypatch.setattr(queue, "DEBOUNCE_ENABLED", True)
+    first = queue.enqueue_whatsapp_message("5215512345678", "hola")
+    second = queue.enqueue_whatsapp_message("5215512345678", "¿tienen citas?")
+
+    registry = ScheduledJobRegistry(queue=queue.get_queue(queue.shard_for("5215512345678", queue.QUEUE_SHARDS)))
+    assert set(registry.get_job_ids()) == {first, second}
+    assert handled == []
+
+    state = debounce._keys("5215512345678")
+    seq = int(redis_conn.get(state["seq"]))
+    started = float(redis_conn.get(state["first"]))
+    # El trabajo del primer mensaje no vacía la ventana; el del último encola la ráfaga
+    assert queue.flush_whatsapp_burst("5215512345678", seq - 1, started)["status"] == "success"
+    result = queue.flush_whatsapp_burst("5215512345678", seq, started)
+    assert result["status"] == "accepted"
+    merged = queue.get_queue(queue.shard_for("5215512345678", queue.QUEUE_SHARDS)).fetch_job(result["job_id"])
+    assert merged.args == ("5215512345678", "hola\n¿tienen citas?", None, True)
+
+
+def test_each_job_closes_its_http_clients_in_its_own_loop(monkeypatch):
+    from src.utils import media
+
+    clients = []
+
+    async def handle(number, body, media_items=None, debounce=True, pipeline_id=None):
+        downloader = media.get_media_downloader()
+        downloader._bind()
+        clients.append(downloader._client)
+        return {"status": "success"}
+
+    monkeypatch.setattr(webhook, "handle_inbound_message", handle)
+    queue.enqueue_whatsapp_message("5215512345678", "hola")
+    queue.enqueue_whatsapp_message("5215512345678", "¿siguen ahí?")
+
+    assert len(clients) == 2 and clients[0] is not clients[1]
+    assert all(client.is_closed for client in clients)
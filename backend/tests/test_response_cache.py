@@ -0,0 +1,40 @@
+from src.utils.response_cache import ResponseCache, is_context_free
+
+WELCOME = "¡Hola! ¿En qué puedo ayudarte?"
+
+
+def test_exact_and_near_duplicate_hits(redis_client):
+    cache = ResponseCache(redis_client, "v1")
+    cache.store("¿Cuáles son sus horarios de atención?", "De 9 a 18 h.", 900)
+
+    assert cache.lookup("cuales son sus horarios de atencion") == "De 9 a 18 h."
+    assert cache.lookup("¿Cuáles son sus horarios de atención??") == "De 9 a 18 h."
+    assert cache.lookup("¿Cuánto cuesta el plan básico?") is None
+    assert cache.lookup("ok") is None
+
+
+def test_versions_do_not_share_entries(redis_client):
+    ResponseCache(redis_client, "v1").store("¿Cuáles son sus horarios?", "De 9 a 18 h.", 900)
+    assert ResponseCache(redis_client, "v2").lookup("¿Cuáles son sus horarios?") is None
+
+
+def test_near_duplicate_does_not_leak_other_details(redis_client):
+    cache = ResponseCache(redis_client, "v1")
+    cache.store("hola soy juan que servicios ofrecen", "¡Hola Juan! Ofrecemos asistentes virtuales.", 900)
+    assert cache.lookup("hola soy ana que servicios ofrecen") is None
+
+
+def test_near_duplicate_does_not_leak_short_numbers(redis_client):
+    cache = ResponseCache(redis_client, "v1")
+    cache.store("quiero cambiar la cita del dia 5", "Listo, movimos tu cita del día 5.", 900)
+    assert cache.lookup("quiero cambiar la cita del dia 6") is None
+
+
+def test_only_context_free_turns_are_cacheable():
+    system = {"role": "system", "content": "prompt"}
+    question = {"role": "user", "content": "¿Qué servicios ofrecen?"}
+    assert is_context_free([system, question])
+    assert is_context_free([system, {"role": "assistant", "content": WELCOME}, question], (WELCOME,))
+    assert not is_context_free([system, {"role": "user", "content": "Soy Ana"},
+                                {"role": "assistant", "content": "Hola Ana"}, question], (WELCOME,))
+    assert not is_context_free([system, {"role": "system", "content": "Resumen: Ana tiene cita"}, question], (WELCOME,))
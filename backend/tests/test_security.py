@@ -0,0 +1,29 @@
+from fastapi import Depends, FastAPI
+from fastapi.testclient import TestClient
+
+from src.core.security import bearer_token
+
+app = FastAPI()
+
+
+@app.get("/privado", dependencies=[Depends(bearer_token("PRUEBAS_API_TOKEN"))])
+def privado():
+    return {"ok": True}
+
+
+client = TestClient(app)
+
+
+def test_unconfigured_token_fails_closed(monkeypatch):
+    monkeypatch.delenv("PRUEBAS_API_TOKEN", raising=False)
+    assert client.get("/privado").status_code == 503
+    assert client.get("/privado", headers={"Authorization": "Bearer "}).status_code == 503
+
+
+def test_token_is_required(monkeypatch):
+    monkeypatch.setenv("PRUEBAS_API_TOKEN", "secreto")
+    assert client.get("/privado").status_code == 401
+    response = client.get("/privado", headers={"Authorization": "Bearer otro"})
+    assert response.status_code == 401
+    assert response.headers["WWW-Authenticate"] == "Bearer"
+    assert client.get("/privado", headers={"Authorization": "Bearer secreto"}).json() == {"ok": True}
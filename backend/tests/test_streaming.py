@@ -0,0 +1,123 @@
+import asyncio
+import contextlib
+import importlib
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils import model
+from src.utils.pipeline_state import SENT_CHUNKS, PipelineCheckpoint
+
+webhook = importlib.import_module("src.api.v1.endpoints.webhook")
+
+
+@pytest.fixture(autouse=True)
+def chunk_limits(monkeypatch):
+    monkeypatch.setattr(model, "STREAM_MIN_CHUNK_CHARS", 10)
+    monkeypatch.setattr(model, "STREAM_MAX_CHUNK_CHARS", 40)
+
+
+def test_short_text_waits_for_more_tokens():
+    assert model.find_chunk_boundary("Hola. Sí.") is None
+
+
+def test_paragraph_end_is_preferred_over_sentence_end():
+    text = "Claro que sí. Tenemos citas.\n\nEl lunes"
+    assert text[:model.find_chunk_boundary(text)] == "Claro que sí. Tenemos citas.\n\n"
+
+
+def test_cuts_after_the_last_complete_sentence():
+    text = "Claro que sí. Tenemos citas el lunes. Y"
+    assert text[:model.find_chunk_boundary(text)] == "Claro que sí. Tenemos citas el lunes."
+
+
+def test_punctuation_without_the_next_token_is_not_a_sentence_end():
+    # "3." puede seguir como "3.50": hasta que llegue el espacio no se corta
+    assert model.find_chunk_boundary("Cuesta unos 3.") is None
+
+
+def test_long_text_without_punctuation_is_cut_at_a_space():
+    text = "palabra " * 8
+    boundary = model.find_chunk_boundary(text)
+    assert boundary <= 40 and text[boundary] == " "
+    assert model.find_chunk_boundary("x" * 50) == 40
+
+
+class FakeRouter:
+    """Router con un stream de texto fijo, fragmentado como los deltas del modelo."""
+
+    def __init__(self, tokens, error=None):
+        self.tokens = tokens
+        self.error = error
+
+    async def stream(self, messages, **kwargs):
+        for token in self.tokens:
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=token))])
+        if self.error:
+            raise self.error
+
+
+@pytest.fixture
+def router(monkeypatch):
+    @contextlib.asynccontextmanager
+    async def free_slot(redis_client):
+        yield
+
+    monkeypatch.setattr(model, "llm_slot", free_slot)
+
+    def use(tokens, error=None):
+        monkeypatch.setattr(model, "get_llm_router", lambda name: FakeRouter(tokens, error))
+
+    return use
+
+
+def _chunks(messages=None):
+    async def collect():
+        return [chunk async for chunk in model.gpt_stream_chunks(
+            messages=messages or [{"role": "user", "content": "hola"}]
+        )]
+
+    return asyncio.run(collect())
+
+
+def test_stream_is_delivered_as_soon_as_each_sentence_ends(router):
+    router(["Claro que ", "sí. Tenemos ", "citas el lunes", ". ¿Te ", "aparto una?"])
+    assert _chunks() == ["Claro que sí.", "Tenemos citas el lunes.", "¿Te aparto una?"]
+
+
+def test_error_midway_keeps_what_was_generated_without_an_apology(router):
+    router(["Claro que sí. Tenemos citas. ", "El lunes"], error=ConnectionError("corte"))
+    assert _chunks() == ["Claro que sí. Tenemos citas.", "El lunes"]
+
+
+def test_error_before_any_text_returns_the_error_response(router):
+    router([], error=ConnectionError("corte"))
+    assert _chunks() == [model.ERROR_RESPONSE]
+
+
+def test_empty_stream_returns_the_empty_response(router):
+    router(["", "  "])
+    assert _chunks() == [model.EMPTY_RESPONSE]
+
+
+def test_chunks_are_sent_and_recorded_as_they_arrive(monkeypatch, redis_client):
+    sent = []
+
+    async def chunks(model=None, messages=None):
+        for chunk in ("Claro que sí.", "¿Te aparto una cita?"):
+            yield chunk
+
+    async def send(to_number, message):
+        # Cada envío ocurre después de registrar los anteriores en el checkpoint
+        sent.append((message, list(checkpoint.done.get(SENT_CHUNKS, []))))
+
+    monkeypatch.setattr(webhook, "gpt_stream_chunks", chunks)
+    monkeypatch.setattr(webhook, "send_whatsapp_message", send)
+    checkpoint = PipelineCheckpoint(redis_client, "job-1")
+
+    response = asyncio.run(webhook.stream_response_to_whatsapp("5215512345678", [], checkpoint))
+
+    assert response == "Claro que sí.\n\n¿Te aparto una cita?"
+    assert sent == [("Claro que sí.", []), ("¿Te aparto una cita?", ["Claro que sí."])]
+    restored = PipelineCheckpoint(redis_client, "job-1")
+    assert asyncio.run(restored.load())[SENT_CHUNKS] == ["Claro que sí.", "¿Te aparto una cita?"]
@@ -0,0 +1,95 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+
+from src.utils.circuit_breaker import CircuitBreaker
+from src.utils.whatsapp import SharedTokenBucket, WhatsAppSender, WhatsAppSendError, format_whatsapp_number
+
+
+def test_format_whatsapp_number():
+    assert format_whatsapp_number("55 1234 5678") == "whatsapp:+525512345678"
+    assert format_whatsapp_number("whatsapp:+5215512345678") == "whatsapp:+5215512345678"
+
+
+def _elapsed(coroutine) -> float:
+    started = time.perf_counter()
+    asyncio.run(coroutine)
+    return time.perf_counter() - started
+
+
+def test_bucket_is_shared_between_processes(redis_client):
+    # Dos emisores (p. ej. dos workers) con la misma clave: 4 de ráfaga y 20 por segundo entre ambos
+    first = SharedTokenBucket(redis_client, "whatsapp_rate:pruebas", rate=20, capacity=4)
+    second = SharedTokenBucket(redis_client, "whatsapp_rate:pruebas", rate=20, capacity=4)
+
+    async def send(count):
+        await asyncio.gather(*((first if i % 2 else second).acquire() for i in range(count)))
+
+    assert _elapsed(send(4)) < 0.1
+    # Agotada la ráfaga, 6 tokens más a 20 por segundo tardan ~0.3 s
+    assert 0.25 < _elapsed(send(6)) < 0.6
+
+
+def test_bucket_falls_back_to_the_process_without_redis():
+    class BrokenRedis:
+        def register_script(self, script):
+            def run(**kwargs):
+                raise ConnectionError("Redis caído")
+            return run
+
+    bucket = SharedTokenBucket(BrokenRedis(), "whatsapp_rate:pruebas", rate=20, capacity=2)
+
+    async def send(count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    assert 0.1 < _elapsed(send(4)) < 0.4
+
+
+def _sender(redis_client) -> WhatsAppSender:
+    sender = WhatsAppSender("ACpruebas", "token", "+15550000000", base_url="https://twilio.test",
+                            messages_per_second=1000, burst=1000, max_retries=2, retry_backoff=0.01,
+                            redis_client=redis_client)
+    sender.breaker = CircuitBreaker("twilio-pruebas")
+    return sender
+
+
+async def _send(sender: WhatsAppSender, handler, *args):
+    # Twilio simulado con un transporte de httpx, en el event loop de la prueba
+    sender._client = httpx.AsyncClient(base_url=sender.base_url, transport=httpx.MockTransport(handler))
+    sender._loop = asyncio.get_running_loop()
+    try:
+        return await sender.send(*args)
+    finally:
+        await sender.aclose()
+
+
+def test_send_retries_transient_errors(redis_client):
+    statuses = [503, 429]
+
+    def handler(request):
+        if statuses:
+            return httpx.Response(statuses.pop(0), headers={"Retry-After": "0"})
+        assert b"Body=hola" in request.content
+        return httpx.Response(201, json={"sid": "SM1"})
+
+    assert asyncio.run(_send(_sender(redis_client), handler, "5512345678", "hola")) == {"sid": "SM1"}
+
+
+def test_send_gives_up_after_max_retries(redis_client):
+    with pytest.raises(WhatsAppSendError):
+        asyncio.run(_send(_sender(redis_client), lambda request: httpx.Response(503), "5512345678", "hola"))
+
+
+def test_client_errors_are_not_retried(redis_client):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        return httpx.Response(400, json={"message": "número inválido"})
+
+    with pytest.raises(WhatsAppSendError):
+        asyncio.run(_send(_sender(redis_client), handler, "5512345678", "hola"))
+    assert len(calls) == 1
@@ -0,0 +1,47 @@
+"""Pool de workers de RQ que procesan los mensajes de WhatsApp encolados por el webhook."""
+import multiprocessing
+
+from dotenv import load_dotenv
+from rq import Worker
+
+load_dotenv()
+
+from src.utils.loggers import logger
+from src.utils.queue import QUEUE_SHARDS, shard_queue_name
+from src.utils.redis import REDIS_FAKE, create_redis_connection
+
+
+def run_worker(shard: int) -> None:
+    """Ejecuta el worker de RQ de un shard con su propia conexión a Redis."""
+    connection = create_redis_connection()
+    queue_name = shard_queue_name(shard)
+    worker = Worker([queue_name], connection=connection)
+    logger.info(f"👷 Worker {shard} escuchando la cola '{queue_name}'")
+    # El scheduler es necesario para los reintentos con intervalo
+    worker.work(with_scheduler=True)
+
+
+def main() -> None:
+    if REDIS_FAKE:
+        raise SystemExit("REDIS_FAKE está activo: los trabajos se ejecutan en línea, no se necesitan workers")
+
+    # RQ ejecuta cada trabajo en un proceso hijo: cargar antes del fork los módulos
+    # y el estado inmutable para que cada trabajo no vuelva a importarlos
+    from src.core.lifespan import preload_shared_state
+
+    preload_shared_state()
+
+    # Un worker por shard: orden por número y paralelismo entre números
+    logger.info(f"🚀 Iniciando {QUEUE_SHARDS} workers de RQ (uno por shard)")
+    processes = []
+    for shard in range(QUEUE_SHARDS):
+        process = multiprocessing.Process(target=run_worker, args=(shard,), daemon=False)
+        process.start()
+        processes.append(process)
+
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    main()
@@ -9,4 +9,6 @@ set -e
 #echo "Database migrations applied successfully!"
 
 echo "Starting Gunicorn..."
-exec gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app  --bind 0.0.0.0:8080 --timeout 120
+# --preload: la app se importa una vez en el master y los workers la comparten (copy-on-write);
+# cada worker crea sus propios clientes de red en el lifespan
+exec gunicorn -w 4 -k uvicorn.workers.UvicornWorker main:app --preload --bind 0.0.0.0:8080 --timeout 120